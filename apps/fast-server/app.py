@@ -1,18 +1,38 @@
-from fastapi import FastAPI, File, UploadFile
-from fastapi.responses import JSONResponse
+from fastapi import Depends, FastAPI, File, Form, Request, UploadFile
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
 import cv2
-import numpy as np
+import asyncio
 import base64
-import io
+import functools
+import json
 import logging
-from detection_code.garbage_detection import GarbageDetector
-from detection_code.fallentree import FallenTreeDetector
-from detection_code.brokensignage import BrokenSignageDetector
-from detection_code.pothole_detector import PotholeDetector
-from detection_code.streetlight_detector import StreetlightDetector
-import torch # Ensure torch is imported for device checks
-from datetime import datetime
+import os
+import secrets
+import shutil
+import tarfile
+import tempfile
+import time
+import uuid
+import zipfile
+from typing import List, Optional
+from detection_code.base_detector import BaseDetector, InferenceOptionError
+from detection_code.export import exported_path, serving_model_path
+from detection_code.registry import DETECTOR_SPECS, MODEL_DIR
+from detection_code.video import ObjectTracker, open_video, sample_frames, take, video_info
+from serving.executor import DetectorExecutor, ExecutorSaturated
+from serving.loader import FAILED, LOADING, READY, ModelLoader
+from serving.batching import MicroBatcher
+from serving.result_log import ResultLogger, summarize_detections
+from serving.annotated_cache import AnnotatedImageCache
+from serving.result_cache import ResultCache, content_key, model_version
+from serving.images import ImageTooLarge, decode_image, read_upload, scale_detections
+from serving.dedup import DuplicateIndex, fingerprint, geohash_encode, normalize_geohash
+from serving.jobs import JobQueue, MemoryJobStore, SQLiteJobStore, callback_url_error, new_job, public_view
+from serving.inference_config import InferenceConfig
+from serving.model_registry import Deployment, ModelRegistry, compare_outputs
+from serving import metrics
 
 app = FastAPI()
 
@@ -29,169 +49,1642 @@ app.add_middleware(
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Model paths
-POTHOLE_MODEL_PATH = "models/Pothole-Detector.pt"
-FALLEN_TREE_MODEL_PATH = "models/fallenTree.onnx"
-BROKEN_SIGNAGE_MODEL_PATH = "models/bad_sign_detector.onnx"
-GARBAGE_MODEL_PATH = "models/garbage_detection.pt"
-STREETLIGHT_MODEL_PATH = "models/streetlight.pt"
-
-# Load models
-pothole_model = None
-fallen_tree_model = None
-broken_signage_model = None
-garbage_detector = None
-fallen_tree_detector = None
-broken_signage_detector = None
-streetlight_detector = None
-
-def load_models():
-    global pothole_model, fallen_tree_detector, broken_signage_detector, garbage_detector, streetlight_detector
-    try:
-        # Try to load pothole detector
-        try:
-            logger.info("Loading pothole detector...")
-            pothole_model = PotholeDetector(POTHOLE_MODEL_PATH)
-            logger.info("Pothole detector loaded.")
-        except Exception as e:
-            logger.warning(f"Pothole model failed to load: {str(e)[:100]}... POTHOLE DETECTION WILL BE DISABLED")
-            logger.warning("Ensure the model file exists and try upgrading ultralytics if using .pt format: pip install ultralytics --upgrade")
-            pothole_model = None
+# .pt models are served from their ONNX exports (prepare_models.py) when available:
+# MODEL_FORMAT=auto|onnx|pt, MODEL_PRECISION=fp32|int8
+MODEL_FORMAT = os.environ.get("MODEL_FORMAT", "auto")
+MODEL_PRECISION = os.environ.get("MODEL_PRECISION", "fp32")
 
-        try:
-            logger.info("Loading fallen tree detector...")
-            fallen_tree_detector = FallenTreeDetector(FALLEN_TREE_MODEL_PATH)
-            logger.info("Fallen tree detector loaded.")
-        except Exception as e:
-            logger.warning(f"Fallen tree model failed to load: {str(e)[:100]}... FALLEN TREE DETECTION WILL BE DISABLED")
-            fallen_tree_detector = None
+# Detectors loaded in background threads at startup (MODEL_EAGER=all, none or a comma list);
+# the rest load on their first request, which waits up to MODEL_LOAD_WAIT seconds.
+MODEL_EAGER = os.environ.get("MODEL_EAGER", "all")
+MODEL_LOAD_WAIT_SECONDS = float(os.environ.get("MODEL_LOAD_WAIT", "30"))
+MODEL_LOAD_WORKERS = int(os.environ.get("MODEL_LOAD_WORKERS", "0")) or None
+
+# Seconds clients are told to wait (Retry-After) when a detector queue is full
+RETRY_AFTER_SECONDS = int(os.environ.get("INFERENCE_RETRY_AFTER", "2"))
+
+# Batch uploads: accepted image extensions inside archives and the per-request file cap
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp", ".tif", ".tiff")
+BATCH_MAX_FILES = int(os.environ.get("BATCH_UPLOAD_MAX_FILES", "500"))
+
+# Image uploads over IMAGE_UPLOAD_MAX_BYTES, or whose header reports more than IMAGE_MAX_PIXELS,
+# get 413. Images over IMAGE_DECODE_MAX_PIXELS are decoded at reduced resolution: inference and
+# annotation run on that smaller image and boxes are scaled back to original pixels. 0 = no limit.
+IMAGE_MAX_BYTES = int(os.environ.get("IMAGE_UPLOAD_MAX_BYTES", str(50 * 1024 * 1024)))
+IMAGE_MAX_PIXELS = int(os.environ.get("IMAGE_MAX_PIXELS", str(200_000_000)))
+IMAGE_DECODE_MAX_PIXELS = int(os.environ.get("IMAGE_DECODE_MAX_PIXELS", str(16_000_000)))
+
+# Video uploads are spooled to a temporary file in chunks; larger bodies get 413
+VIDEO_MAX_BYTES = int(os.environ.get("VIDEO_UPLOAD_MAX_BYTES", str(2 * 1024 * 1024 * 1024)))
+VIDEO_CHUNK_BYTES = 1024 * 1024
+
+# Background jobs (POST /jobs, GET /jobs/{id}): uploads are spooled to JOB_DIR and jobs are kept in
+# JOB_STORE (sqlite at JOB_DB_PATH, so queued work survives a restart, or memory). Finished jobs
+# are removed after JOB_RETENTION_HOURS; priorities and concurrency come from job_settings().
+# Workers sharing the sqlite file claim each job once and renew the claim every
+# JOB_LEASE_SECONDS / 3; a job whose worker died is run again once its lease has expired.
+# Job callbacks only go to public addresses, or with JOB_CALLBACK_ALLOWED_HOSTS set (comma-separated
+# host names) only to those hosts.
+JOB_DIR = os.environ.get("JOB_DIR", "jobs")
+JOB_STORE = os.environ.get("JOB_STORE", "sqlite")
+JOB_DB_PATH = os.environ.get("JOB_DB_PATH", os.path.join(JOB_DIR, "jobs.sqlite3"))
+JOB_UPLOAD_MAX_BYTES = int(os.environ.get("JOB_UPLOAD_MAX_BYTES", str(VIDEO_MAX_BYTES)))
+JOB_RETENTION_SECONDS = float(os.environ.get("JOB_RETENTION_HOURS", "24")) * 3600
+JOB_LEASE_SECONDS = float(os.environ.get("JOB_LEASE_SECONDS", "60"))
+JOB_CALLBACK_ALLOWED_HOSTS = frozenset(
+    host.strip().lower() for host in os.environ.get("JOB_CALLBACK_ALLOWED_HOSTS", "").split(",") if host.strip()
+)
+
+# Versioned models (serving/model_registry.py) are recorded in MODEL_REGISTRY_PATH and managed
+# through /admin/models, which needs "Authorization: Bearer <ADMIN_TOKEN>" (disabled when unset).
+# Every MODEL_WATCH_SECONDS the registry file and the serving model files are checked: changes
+# made by other workers are applied and a model file replaced in place is reloaded (0 = off).
+# Uploaded versions are stored under MODEL_UPLOAD_DIR, up to MODEL_UPLOAD_MAX_BYTES each.
+MODEL_REGISTRY_PATH = os.environ.get("MODEL_REGISTRY_PATH", os.path.join(MODEL_DIR, "registry.json"))
+MODEL_WATCH_SECONDS = float(os.environ.get("MODEL_WATCH_SECONDS", "5"))
+MODEL_UPLOAD_DIR = os.environ.get("MODEL_UPLOAD_DIR", os.path.join(MODEL_DIR, "versions"))
+MODEL_UPLOAD_MAX_BYTES = int(os.environ.get("MODEL_UPLOAD_MAX_BYTES", str(1024 * 1024 * 1024)))
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+# Shadow runs that disagree on priority or match fewer than SHADOW_MATCH_AGREEMENT of the
+# serving version's detections count as mismatches
+SHADOW_MATCH_AGREEMENT = float(os.environ.get("SHADOW_MATCH_AGREEMENT", "0.9"))
+
+# Structured result log (JSON lines), written by a background thread
+result_log = ResultLogger(
+    os.environ.get("RESULT_LOG_PATH", "logs/model_outputs.jsonl"),
+    max_bytes=int(os.environ.get("RESULT_LOG_MAX_BYTES", str(50 * 1024 * 1024))),
+    rotate_seconds=float(os.environ.get("RESULT_LOG_ROTATE_HOURS", "24")) * 3600,
+    backup_count=int(os.environ.get("RESULT_LOG_BACKUPS", "5")),
+    sample_rate=float(os.environ.get("RESULT_LOG_SAMPLE_RATE", "1.0")),
+)
+
+# Per-detector inference defaults (conf, iou, imgsz, max_det, variant) from the JSON file at
+# INFERENCE_CONFIG, re-read within INFERENCE_CONFIG_RELOAD seconds of a change (see
+# serving/inference_config.py). Requests override them with InferenceOptions. A variant whose
+# model fails to load is answered with 503 for VARIANT_RETRY_SECONDS before it is tried again.
+inference_config = InferenceConfig(
+    os.environ.get("INFERENCE_CONFIG") or None,
+    check_interval=float(os.environ.get("INFERENCE_CONFIG_RELOAD", "2")),
+)
+VARIANT_RETRY_SECONDS = float(os.environ.get("VARIANT_RETRY_SECONDS", "30"))
+
+# Results keyed by upload hash, detector, model version and request options.
+# RESULT_CACHE_ENABLED=0 turns it off; RESULT_CACHE_DIR adds an on-disk tier.
+result_cache = None
+if os.environ.get("RESULT_CACHE_ENABLED", "1") != "0":
+    result_cache = ResultCache(
+        ttl=float(os.environ.get("RESULT_CACHE_TTL", "600")),
+        max_items=int(os.environ.get("RESULT_CACHE_MAX_ITEMS", "1024")),
+        max_bytes=int(os.environ.get("RESULT_CACHE_MAX_BYTES", str(128 * 1024 * 1024))),
+        directory=os.environ.get("RESULT_CACHE_DIR") or None,
+    )
+
+# Near-duplicate reports (serving/dedup.py). DEDUP_MODE=flag marks single-image responses whose
+# image is within DEDUP_MAX_DISTANCE hash bits of an earlier report (in the same or a neighbouring
+# geohash cell when both carry a location) with duplicate=true and the earlier report_id;
+# DEDUP_MODE=reuse also answers them with the earlier result instead of running the model.
+# DEDUP_MODE=off (default) disables the index.
+DEDUP_MODE = os.environ.get("DEDUP_MODE", "off")
+duplicate_index = None
+if DEDUP_MODE in ("flag", "reuse"):
+    duplicate_index = DuplicateIndex(
+        max_distance=int(os.environ.get("DEDUP_MAX_DISTANCE", "6")),
+        max_items=int(os.environ.get("DEDUP_MAX_ITEMS", "1000000")),
+        max_results=int(os.environ.get("DEDUP_MAX_RESULTS", "10000")),
+        ttl=float(os.environ.get("DEDUP_TTL_HOURS", "0")) * 3600,
+        precision=int(os.environ.get("DEDUP_GEOHASH_PRECISION", "7")),
+    )
+elif DEDUP_MODE != "off":
+    raise ValueError(f"Unsupported DEDUP_MODE: {DEDUP_MODE}. Supported: off, flag, reuse")
+
+# Annotated images fetched later through GET /annotated/{image_id} (image_format=ref)
+annotated_cache = AnnotatedImageCache(
+    ttl=float(os.environ.get("ANNOTATED_CACHE_TTL", "120")),
+    max_items=int(os.environ.get("ANNOTATED_CACHE_MAX_ITEMS", "256")),
+    max_bytes=int(os.environ.get("ANNOTATED_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+)
+
+# Ranking used to merge per-detector priorities ('High' / 'medium' / ...) in /analyze
+PRIORITY_RANK = {"low": 0, "medium": 1, "high": 2}
+
+# Model variants other than "full", loaded on their first request: (name, variant) -> Deployment,
+# and the last failed load of each: (name, variant) -> (path, error, failed_at)
+variants = {}
+variant_locks = {}
+variant_failures = {}
+# InferenceConfig.loaded_at when the loaded variants were last checked against it
+variants_checked_at = None
+# Background shadow comparisons still running
+shadow_tasks = set()
+
+def executor_settings(name, model_path):
+    """
+    Per-detector executor configuration, overridable through environment variables,
+    e.g. POTHOLE_EXECUTOR=thread, POTHOLE_WORKERS=2, POTHOLE_MAX_QUEUE=16.
+    """
+    prefix = name.upper()
+    # ultralytics models hold the GIL, so they default to their own processes
+    default_kind = "process" if model_path.endswith(".pt") else "thread"
+    return {
+        "kind": os.environ.get(f"{prefix}_EXECUTOR", default_kind),
+        "workers": int(os.environ.get(f"{prefix}_WORKERS", "1")),
+        "max_queue": int(os.environ.get(f"{prefix}_MAX_QUEUE", "8")),
+        "retry_after": RETRY_AFTER_SECONDS,
+    }
+
+def batcher_settings(name):
+    """
+    Micro-batching window and size per detector, e.g. POTHOLE_BATCH_WINDOW_MS=5,
+    POTHOLE_BATCH_MAX_SIZE=16. BATCH_WINDOW_MS / BATCH_MAX_SIZE set the defaults;
+    a max size of 1 disables batching.
+    """
+    prefix = name.upper()
+    return {
+        "window_ms": float(os.environ.get(f"{prefix}_BATCH_WINDOW_MS", os.environ.get("BATCH_WINDOW_MS", "10"))),
+        "max_batch": int(os.environ.get(f"{prefix}_BATCH_MAX_SIZE", os.environ.get("BATCH_MAX_SIZE", "8"))),
+    }
+
+def job_settings(name):
+    """
+    Background job priority (lower runs first) and how many jobs may run at once per detector,
+    e.g. GARBAGE_JOB_PRIORITY=1, POTHOLE_JOB_CONCURRENCY=2. JOB_CONCURRENCY sets the default
+    concurrency; priorities default to the registry's job_priority.
+    """
+    prefix = name.upper()
+    return {
+        "priority": int(os.environ.get(f"{prefix}_JOB_PRIORITY", str(DETECTOR_SPECS[name]["job_priority"]))),
+        "concurrency": int(os.environ.get(f"{prefix}_JOB_CONCURRENCY", os.environ.get("JOB_CONCURRENCY", "1"))),
+    }
 
+def build_deployment(name, version, source):
+    """Loads one model file of a detector behind its own executor and micro-batcher; raises if it cannot be loaded."""
+    spec = DETECTOR_SPECS[name]
+    model_path = serving_model_path(source, MODEL_FORMAT, MODEL_PRECISION)
+    logger.info(f"Loading {spec['label']} model {version} from {model_path}...")
+    executor = DetectorExecutor(
+        name, spec["cls"], model_path,
+        stage_observer=functools.partial(metrics.observe_stages, name),
+        **executor_settings(name, model_path),
+    )
+    metrics.MODEL_LOAD_SECONDS.set(executor.load_seconds, detector=name)
+    return Deployment(name, version, source, model_path, executor, MicroBatcher(executor, **batcher_settings(name)), model_version(model_path))
+
+model_registry = ModelRegistry({name: spec["model_path"] for name, spec in DETECTOR_SPECS.items()}, build_deployment, MODEL_REGISTRY_PATH)
+
+def active_model_source(name):
+    """Model file of the version the registry says `name` should serve."""
+    return model_registry.version_path(name, model_registry.active_version(name))
+
+def load_model(name):
+    """Loads the registry's active version of one detector; raises if the model cannot be loaded."""
+    spec = DETECTOR_SPECS[name]
+    version = model_registry.active_version(name)
+    source = spec["model_path"]
+    try:
+        source = active_model_source(name)
+        deployment = build_deployment(name, version, source)
+    except Exception as e:
+        logger.warning(f"{spec['label']} model failed to load: {str(e)[:100]}... {spec['label'].upper()} WILL BE DISABLED")
+        if source.endswith(".pt"):
+            logger.warning("Ensure the model file exists and try upgrading ultralytics: pip install ultralytics --upgrade")
+        raise
+
+    model_registry.install(name, deployment)
+    logger.info(f"{spec['label']} model loaded ({version}).")
+
+def eager_detectors():
+    if MODEL_EAGER.strip() == "all":
+        return list(DETECTOR_SPECS)
+    return [name.strip() for name in MODEL_EAGER.split(",") if name.strip() in DETECTOR_SPECS]
+
+model_loader = ModelLoader(DETECTOR_SPECS, load_model, MODEL_LOAD_WORKERS)
+
+@app.on_event("startup")
+async def start_model_loading():
+    """Starts the eager detectors loading in parallel; the server accepts connections meanwhile."""
+    names = eager_detectors()
+    if not names:
+        logger.info("🎯 No eager models; detectors load on their first request")
+        return
+
+    async def report():
+        await asyncio.gather(*(asyncio.wrap_future(model_loader.load(name)) for name in names))
+        logger.info("🎯 Model loading completed! Available detections:")
+        for name in names:
+            spec = DETECTOR_SPECS[name]
+            if model_loader.state(name) == READY: logger.info(f"   ✅ {spec['label']}")
+            else: logger.info(f"   🚫 {spec['label']} (disabled)")
+
+    model_loader.start(names)
+    asyncio.get_running_loop().create_task(report())
+
+@app.on_event("startup")
+async def start_model_watch():
+    """Starts applying registry changes and reloading replaced model files (MODEL_WATCH_SECONDS)."""
+    model_registry.start(MODEL_WATCH_SECONDS)
+
+async def wait_for_model(name):
+    """
+    Waits for a detector to be loaded (starting a lazy one) and returns an error
+    (content, status_code, headers) tuple when it is not usable, else None.
+    """
+    state = await model_loader.wait(name, MODEL_LOAD_WAIT_SECONDS)
+    label = DETECTOR_SPECS[name]["label"]
+    if state == LOADING:
+        return {"error": f"{label} model is still loading"}, 503, {"Retry-After": str(RETRY_AFTER_SECONDS)}
+    if state == FAILED:
+        return {"error": f"{label} model not loaded"}, 500, None
+    return None
+
+def variant_model_path(name, variant):
+    """
+    Model file of a variant: one configured for the detector in INFERENCE_CONFIG, or "fast" for
+    the int8 ONNX export of its model (prepare_models.py). Raises InferenceOptionError when there is none.
+    """
+    path = inference_config.variant_path(name, variant)
+    if path is None and variant == "fast":
+        path = exported_path(DETECTOR_SPECS[name]["model_path"], "int8")
+    if path is None:
+        raise InferenceOptionError(f"Unknown model variant for {name}: {variant}")
+    if not os.path.exists(path):
+        raise InferenceOptionError(f"Model variant {variant} of {name} is not available: {path} not found")
+    return path
+
+class VariantUnavailable(Exception):
+    """A configured model variant whose model could not be loaded (answered with 503)."""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+def retire_stale_variants():
+    """Unloads variants that INFERENCE_CONFIG no longer maps to the model file they were loaded from."""
+    for key, deployment in list(variants.items()):
         try:
-            logger.info("Loading broken signage detector...")
-            broken_signage_detector = BrokenSignageDetector(BROKEN_SIGNAGE_MODEL_PATH)
-            logger.info("Broken signage detector loaded.")
-        except Exception as e:
-            logger.warning(f"Broken signage model failed to load: {str(e)[:100]}... BROKEN SIGNAGE DETECTION WILL BE DISABLED")
-            broken_signage_detector = None
+            path = variant_model_path(*key)
+        except InferenceOptionError:
+            path = None
+        if path != deployment.source:
+            logger.info(f"{key[0]}: model variant {key[1]} changed in the inference config, unloading {deployment.source}")
+            del variants[key]
+            deployment.retire()
 
-        logger.info("Loading garbage detection model...")
+async def load_variant(name, variant):
+    """
+    Loads a model variant other than "full" on its first use, behind its own executor and
+    batcher, and again (draining the old one) when the inference config points it at a new
+    file. Raises InferenceOptionError for a variant that does not exist, VariantUnavailable for one
+    whose model failed to load within the last VARIANT_RETRY_SECONDS.
+    """
+    global variants_checked_at
+    if inference_config.loaded_at != variants_checked_at:
+        variants_checked_at = inference_config.loaded_at
+        retire_stale_variants()
+    if variant == "full":
+        return
+    key = (name, variant)
+    path = variant_model_path(name, variant)
+    if key in variants and variants[key].source == path:
+        return
+    async with variant_locks.setdefault(key, asyncio.Lock()):
+        if key in variants and variants[key].source == path:
+            return
+        failure = variant_failures.get(key)
+        if failure is not None and failure[0] == path and time.monotonic() - failure[2] < VARIANT_RETRY_SECONDS:
+            retry_after = max(1, int(failure[2] + VARIANT_RETRY_SECONDS - time.monotonic()))
+            raise VariantUnavailable(f"Model variant {variant} of {name} failed to load: {failure[1]}", retry_after)
         try:
-            garbage_detector = GarbageDetector(GARBAGE_MODEL_PATH)
-            logger.info("Garbage model loaded.")
+            deployment = await run_in_threadpool(build_deployment, name, variant, path)
         except Exception as e:
-            logger.warning(f"Garbage model failed to load: {str(e)[:100]}... GARBAGE DETECTION WILL BE DISABLED")
-            logger.warning("Consider upgrading ultralytics: pip install ultralytics --upgrade")
-            garbage_detector = None
+            logger.error(f"❌ {name}: model variant {variant} failed to load from {path}: {e}")
+            variant_failures[key] = (path, str(e), time.monotonic())
+            raise VariantUnavailable(f"Model variant {variant} of {name} failed to load: {e}", int(VARIANT_RETRY_SECONDS))
+        variant_failures.pop(key, None)
+        previous = variants.get(key)
+        variants[key] = deployment
+        if previous is not None:
+            previous.retire()
+
+def variant_unavailable_response(error):
+    return JSONResponse(content={"error": str(error)}, status_code=503, headers={"Retry-After": str(error.retry_after)})
+
+def lease_model(name, variant="full"):
+    """
+    (deployment, role) to run one request of a loaded detector on, leased until
+    deployment.release(). "full" is the serving version, or a canary for its share of traffic
+    (model_registry.route); other variants must have been load_variant()ed.
+    """
+    if variant == "full":
+        deployment, role = model_registry.route(name)
+        return deployment.acquire(), role
+    deployment = variants.get((name, variant))
+    if deployment is None:
+        # Dropped from the inference config since load_variant()
+        raise InferenceOptionError(f"Unknown model variant for {name}: {variant}")
+    return deployment.acquire(), "variant"
+
+@app.on_event("shutdown")
+def shutdown_executors():
+    model_loader.shutdown()
+    model_registry.shutdown()
+    for deployment in variants.values():
+        deployment.retire()
+    job_queue.shutdown()
+    result_log.close()
+
+def elapsed_ms(started):
+    return round((time.perf_counter() - started) * 1000, 2)
 
+def record_request(names, status_code):
+    """Counts a finished request in REQUESTS (and ERRORS when it failed) for each known detector in `names`."""
+    for name in names:
+        if name in DETECTOR_SPECS:
+            metrics.REQUESTS.inc(detector=name, status=status_code)
+            if status_code >= 400:
+                metrics.ERRORS.inc(detector=name)
+
+async def tracked(names, handler):
+    """
+    Awaits `handler`, a coroutine returning a response, counted in IN_FLIGHT meanwhile and then
+    in REQUESTS/ERRORS for every detector it ran, like single-image requests. Raising counts as 500.
+    """
+    names = [name for name in dict.fromkeys(names) if name in DETECTOR_SPECS]
+    for name in names:
+        metrics.IN_FLIGHT.inc(detector=name)
+    status_code = 500
+    try:
+        response = await handler
+        status_code = response.status_code
+        return response
+    finally:
+        for name in names:
+            metrics.IN_FLIGHT.dec(detector=name)
+        record_request(names, status_code)
+
+def decode_upload(contents):
+    """(image, scale) for uploaded bytes under the IMAGE_* pixel limits; raises ImageTooLarge."""
+    return decode_image(contents, IMAGE_DECODE_MAX_PIXELS, IMAGE_MAX_PIXELS)
+
+def decode_batch_item(contents):
+    """(image, scale, error) for one image of a batch; contents is None when the upload was too large."""
+    if contents is None:
+        return None, None, f"Image larger than {IMAGE_MAX_BYTES} bytes"
+    try:
+        image, scale = decode_upload(contents)
+    except ImageTooLarge as e:
+        return None, None, str(e)
+    return image, scale, None if image is not None else "Invalid image file"
+
+def find_report(contents, cell):
+    """
+    (report_id, duplicate_distance, (width, height), image_hash) for an upload, or None when it
+    does not decode. report_id and duplicate_distance are None unless it duplicates an earlier report.
+    """
+    fingerprinted = fingerprint(contents)
+    if fingerprinted is None:
+        return None
+    image_hash, size = fingerprinted
+    report_id, distance = duplicate_index.lookup(image_hash, cell) or (None, None)
+    return report_id, distance, size, image_hash
+
+def reuse_result(stored, size):
+    """An earlier report's (priority, detections, None), boxes rescaled from its image size to `size`."""
+    priority, detections, stored_size = stored
+    detections = [dict(detection) for detection in detections]
+    return priority, scale_detections(detections, (size[0] / stored_size[0], size[1] / stored_size[1])), None
+
+def encode_jpeg(image, quality=95, max_dimension=0):
+    """JPEG bytes of `image`, downscaled first so its longest side is at most max_dimension (0 = no limit)."""
+    h, w = image.shape[:2]
+    if max_dimension and max(h, w) > max_dimension:
+        scale = max_dimension / max(h, w)
+        image = cv2.resize(image, (max(1, round(w * scale)), max(1, round(h * scale))), interpolation=cv2.INTER_AREA)
+    success, buffer = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not success:
+        return None
+    return buffer.tobytes()
+
+def encode_image(image, quality=95, max_dimension=0):
+    jpeg = encode_jpeg(image, quality, max_dimension)
+    if jpeg is None:
+        return None
+    return base64.b64encode(jpeg).decode('utf-8')
+
+def multipart_response(content, image, status_code=200, headers=None):
+    """multipart/mixed response: the JSON result first, then the annotated JPEG as a binary part."""
+    boundary = uuid.uuid4().hex
+    parts = [
+        f"--{boundary}\r\nContent-Type: application/json\r\n\r\n".encode(),
+        json.dumps(content).encode(),
+        b"\r\n",
+    ]
+    if image is not None:
+        parts += [
+            f"--{boundary}\r\nContent-Type: image/jpeg\r\nContent-Disposition: attachment; filename=\"annotated.jpg\"\r\n\r\n".encode(),
+            image,
+            b"\r\n",
+        ]
+    parts.append(f"--{boundary}--\r\n".encode())
+    return Response(b"".join(parts), status_code=status_code, headers=headers, media_type=f"multipart/mixed; boundary={boundary}")
+
+class DeliveryOptions:
+    """
+    How a single-image endpoint returns the annotated image:
+    - annotate=false skips drawing entirely (annotated_image is null)
+    - image_format=base64 (default) embeds the JPEG in the JSON
+    - image_format=multipart returns multipart/mixed with the JSON and a binary image/jpeg part
+    - image_format=ref stores the JPEG briefly and returns annotated_image_url (GET /annotated/{id})
+    """
+    FORMATS = ("base64", "multipart", "ref")
+
+    def __init__(
+        self,
+        annotate: bool = Form(True),
+        image_format: str = Form("base64"),
+        jpeg_quality: int = Form(95),
+        max_dimension: int = Form(0),
+    ):
+        self.annotate = annotate
+        self.image_format = image_format
+        self.jpeg_quality = min(100, max(1, jpeg_quality))
+        self.max_dimension = max(0, max_dimension)
+
+class ReportLocation:
+    """Where a report was taken, for duplicate detection: a geohash, or latitude and longitude."""
+
+    def __init__(
+        self,
+        geohash: Optional[str] = Form(None),
+        latitude: Optional[float] = Form(None),
+        longitude: Optional[float] = Form(None),
+    ):
+        self.geohash = geohash
+        self.latitude = latitude
+        self.longitude = longitude
+
+    def cell(self, precision):
+        """The geohash cell of `precision` characters, None without a location; raises ValueError."""
+        if self.geohash:
+            return normalize_geohash(self.geohash, precision)
+        if self.latitude is None or self.longitude is None:
+            return None
+        if not (-90 <= self.latitude <= 90 and -180 <= self.longitude <= 180):
+            raise ValueError(f"Invalid coordinates: {self.latitude}, {self.longitude}")
+        return geohash_encode(self.latitude, self.longitude, precision)
+
+class InferenceOptions:
+    """
+    Per-request inference settings; anything left unset uses the detector's defaults from
+    INFERENCE_CONFIG:
+    - conf: confidence threshold, iou: NMS IoU threshold, both in (0, 1]
+    - imgsz: model input size, a multiple of 32 (fixed-size ONNX exports only take their own)
+    - max_det: detections kept per image
+    - variant: "full" (the served model), "fast" (its int8 export) or a variant configured
+      for the detector, e.g. a nano model for quick triage
+    """
+
+    def __init__(
+        self,
+        conf: Optional[float] = Form(None),
+        iou: Optional[float] = Form(None),
+        imgsz: Optional[int] = Form(None),
+        max_det: Optional[int] = Form(None),
+        variant: Optional[str] = Form(None),
+    ):
+        self.conf = conf
+        self.iou = iou
+        self.imgsz = imgsz
+        self.max_det = max_det
+        self.variant = variant
+
+    def resolve(self, name):
+        """The settings to run detector `name` with; raises InferenceOptionError for invalid values."""
+        return inference_config.resolve(
+            name, conf=self.conf, iou=self.iou, imgsz=self.imgsz, max_det=self.max_det, variant=self.variant,
+        )
+
+def resolve_inference(name, inference=None):
+    """Settings for detector `name`: its defaults, with the request's InferenceOptions applied; raises InferenceOptionError."""
+    return inference.resolve(name) if inference is not None else inference_config.resolve(name)
+
+def predict_options(options):
+    """Detector keyword arguments (besides conf) for resolved inference settings."""
+    return {"iou_threshold": options["iou"], "max_det": options["max_det"], "imgsz": options["imgsz"]}
+
+async def process_request(
+    file: UploadFile, name: str, delivery: DeliveryOptions, tiled: bool = False,
+    location: Optional[ReportLocation] = None, inference: Optional[InferenceOptions] = None,
+):
+    """
+    Generic function to process an image upload and run detection.
+    tiled=true runs large images as overlapping tiles (see BaseDetector.predict_tiled).
+    With DEDUP_MODE set, `location` narrows the near-duplicate lookup to nearby reports.
+    `inference` overrides the detector's default thresholds, input size and model variant.
+    """
+    spec = DETECTOR_SPECS[name]
+    model_name, priority_key = spec["label"], spec["priority_key"]
+    started = time.perf_counter()
+    stages = {}
+    deployment = None
+    record = {"model": model_name, "filename": file.filename}
+    if tiled:
+        record["tiled"] = True
+    metrics.IN_FLIGHT.inc(detector=name)
+
+    def finish(content, status_code=200, headers=None, image=None):
+        stage_started = time.perf_counter()
+        if delivery.image_format == "multipart" and status_code == 200:
+            response = multipart_response(content, image, headers=headers)
+        else:
+            response = JSONResponse(content=content, status_code=status_code, headers=headers)
+        stages["serialize"] = time.perf_counter() - stage_started
+        metrics.observe_stages(name, stages)
+        record_request([name], status_code)
+        if status_code >= 400:
+            record["status"] = status_code
+        record["timings"] = {f"{stage}_ms": round(seconds * 1000, 2) for stage, seconds in stages.items()}
+        record["timings"]["total_ms"] = elapsed_ms(started)
+        result_log.log(record)
+        return response
+
+    try:
+        if delivery.image_format not in DeliveryOptions.FORMATS:
+            record["error"] = f"Unsupported image_format: {delivery.image_format}. Supported: {', '.join(DeliveryOptions.FORMATS)}"
+            return finish({"error": record["error"]}, 400)
+
+        unavailable = await wait_for_model(name)
+        if unavailable is not None:
+            content, status_code, headers = unavailable
+            record["error"] = content["error"]
+            return finish(content, status_code, headers)
         try:
-            logger.info("Loading streetlight detector...")
-            streetlight_detector = StreetlightDetector(STREETLIGHT_MODEL_PATH)
-            logger.info("Streetlight detector loaded.")
-        except Exception as e:
-            logger.warning(f"Streetlight model failed to load: {str(e)[:100]}... STREETLIGHT DETECTION WILL BE DISABLED")
-            streetlight_detector = None
+            options = resolve_inference(name, inference)
+            await load_variant(name, options["variant"])
+        except InferenceOptionError as e:
+            record["error"] = str(e)
+            return finish({"error": record["error"]}, 400)
+        except VariantUnavailable as e:
+            record["error"] = str(e)
+            return finish({"error": record["error"]}, 503, {"Retry-After": str(e.retry_after)})
+        deployment, role = lease_model(name, options["variant"])
+        record["inference"] = options
+        record["model_version"] = deployment.version
+        if role == "canary":
+            record["canary"] = True
 
-        logger.info("🎯 Model loading completed! Available detections:")
-        if pothole_model: logger.info("   ✅ Pothole Detection")
-        else: logger.info("   🚫 Pothole Detection (disabled)")
-        if fallen_tree_detector: logger.info("   ✅ Fallen Tree Detection")
-        else: logger.info("   🚫 Fallen Tree Detection (disabled)")
-        if broken_signage_detector: logger.info("   ✅ Broken Signage Detection")
-        else: logger.info("   🚫 Broken Signage Detection (disabled)")
-        if garbage_detector: logger.info("   ✅ Garbage Detection")
-        else: logger.info("   🚫 Garbage Detection (disabled)")
-        if streetlight_detector: logger.info("   ✅ Streetlight Detection")
-        else: logger.info("   🚫 Streetlight Detection (disabled)")
+        stage_started = time.perf_counter()
+        contents = await read_upload(file, IMAGE_MAX_BYTES)
+        stages["read"] = time.perf_counter() - stage_started
+        if contents is None:
+            record["error"] = f"Image upload larger than {IMAGE_MAX_BYTES} bytes"
+            return finish({"error": record["error"]}, 413)
 
-    except Exception as e:
-        logger.error(f"Error loading models: {e}")
-        # In a production environment, you might want to handle this more gracefully
-        # For now, we raise to ensure it's clear that model loading failed
-        raise
+        report, reused = None, None
+        if duplicate_index is not None:
+            try:
+                cell = location.cell(duplicate_index.precision) if location is not None else None
+            except ValueError as e:
+                record["error"] = str(e)
+                return finish({"error": record["error"]}, 400)
+            stage_started = time.perf_counter()
+            report = await run_in_threadpool(find_report, contents, cell)
+            if report is not None and report[1] is not None and DEDUP_MODE == "reuse":
+                stored = duplicate_index.get_result(report[0], name)
+                if stored is not None:
+                    # Near-duplicate of an earlier report: answer with its result, no decode or inference
+                    reused = reuse_result(stored, report[2])
+            stages["dedup"] = time.perf_counter() - stage_started
+            if report is not None:
+                record["duplicate"] = report[1] is not None
+                outcome = "reused" if reused is not None else "duplicate" if report[1] is not None else "new"
+                metrics.DUPLICATE_LOOKUPS.inc(detector=name, result=outcome)
 
-load_models()
-
-async def process_request(file: UploadFile, detector, model_name: str, priority_key: str):
-    """Generic function to process an image upload and run detection."""
-    # Log request details
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    with open("model_outputs.txt", "a", encoding="utf-8") as f:
-        f.write(f"\n[{timestamp}] {model_name} - File: {file.filename}\n")
-
-    try:
-        if detector is None:
-            error_msg = f"{model_name} model not loaded"
-            with open("model_outputs.txt", "a", encoding="utf-8") as f:
-                f.write(f"ERROR: {error_msg}\n")
-            return JSONResponse(content={"error": error_msg}, status_code=500)
-
-        contents = await file.read()
-        nparr = np.frombuffer(contents, np.uint8)
-        image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-
-        if image is None:
-            error_msg = "Invalid image file"
-            with open("model_outputs.txt", "a", encoding="utf-8") as f:
-                f.write(f"ERROR: {error_msg}\n")
-            return JSONResponse(content={"error": error_msg}, status_code=400)
-
-        with open("model_outputs.txt", "a", encoding="utf-8") as f:
-            f.write(f"Input image size: {image.shape}\n")
-
-        annotated_image, overall_priority, detections = detector.predict_array(image)
-
-        # Log results
-        with open("model_outputs.txt", "a", encoding="utf-8") as f:
-            f.write(f"Overall priority: {overall_priority}\n")
-            f.write(f"Total detections: {len(detections)}\n")
-            for det in detections:
-                f.write(f"  - {det['class']} (conf: {det.get('confidence', 'N/A'):.3f}) - bbox: {det['bbox']}\n")
-            f.write("=" * 50 + "\n")
-
-        # Encode image to base64
-        success, buffer = cv2.imencode('.jpg', annotated_image)
-        if not success:
-            with open("model_outputs.txt", "a", encoding="utf-8") as f:
-                f.write("ERROR: Failed to encode annotated image\n")
-            img_base64 = None
+        cached, cache_key = None, None
+        if result_cache is not None and reused is None:
+            stage_started = time.perf_counter()
+            cache_key = await run_in_threadpool(
+                content_key, contents, name, deployment.fingerprint, sorted(options.items()),
+                delivery.annotate, delivery.jpeg_quality, delivery.max_dimension, tiled, IMAGE_DECODE_MAX_PIXELS,
+            )
+            cached = await run_in_threadpool(result_cache.get, cache_key)
+            stages["cache_lookup"] = time.perf_counter() - stage_started
+            record["cache"] = "hit" if cached is not None else "miss"
+            metrics.RESULT_CACHE_LOOKUPS.inc(detector=name, result=record["cache"])
+
+        if reused is not None:
+            overall_priority, detections, jpeg = reused
+        elif cached is not None:
+            # Same bytes, model version and options as an earlier request: skip decode and inference
+            overall_priority, detections, jpeg = cached
         else:
-            img_base64 = base64.b64encode(buffer.tobytes()).decode('utf-8')
+            stage_started = time.perf_counter()
+            image, scale = await run_in_threadpool(decode_upload, contents)
+            stages["decode"] = time.perf_counter() - stage_started
+
+            if image is None:
+                record["error"] = "Invalid image file"
+                return finish({"error": record["error"]}, 400)
+
+            record["shape"] = list(image.shape)
+            if scale != (1.0, 1.0):
+                record["decode_scale"] = round(max(scale), 3)
+
+            stage_started = time.perf_counter()
+            annotated_image, overall_priority, detections = await deployment.batcher.predict(
+                image, options["conf"], delivery.annotate, tiled, **predict_options(options),
+            )
+            stages["inference"] = time.perf_counter() - stage_started
+            metrics.INFERENCE_SECONDS.observe(stages["inference"], detector=name, version=deployment.version, role=role)
+            if role == "primary":
+                shadow = model_registry.shadow(name)
+                if shadow is not None:
+                    start_shadow(shadow.acquire(), deployment, image, options, tiled, (overall_priority, detections), stages["inference"])
+            detections = scale_detections(detections, scale)
+
+            jpeg = None
+            if annotated_image is not None:
+                stage_started = time.perf_counter()
+                jpeg = await run_in_threadpool(encode_jpeg, annotated_image, delivery.jpeg_quality, delivery.max_dimension)
+                stages["encode"] = time.perf_counter() - stage_started
+                if jpeg is None:
+                    record["warning"] = "Failed to encode annotated image"
+
+            if result_cache is not None:
+                await run_in_threadpool(result_cache.put, cache_key, (overall_priority, detections, jpeg))
+
+        if report is not None and report[1] is None:
+            # Indexed only once it has a result, so a failed request never marks later uploads as duplicates
+            report = (await run_in_threadpool(duplicate_index.add, report[3], cell), *report[1:])
+        if report is not None:
+            record["report_id"] = report[0]
+            if reused is None and DEDUP_MODE == "reuse":
+                duplicate_index.put_result(report[0], name, (overall_priority, detections, report[2]))
 
         result = {
             "detections": detections,
             priority_key: overall_priority,
             "total_detections": len(detections),
-            "annotated_image": img_base64
+            "annotated_image": None
         }
-        return JSONResponse(content=result)
+        if report is not None:
+            result["report_id"] = report[0]
+            result["duplicate"] = report[1] is not None
+            if report[1] is not None:
+                result["duplicate_distance"] = report[1]
+            if reused is not None:
+                result["reused_result"] = True
+        if jpeg is not None:
+            if delivery.image_format == "base64":
+                result["annotated_image"] = base64.b64encode(jpeg).decode('utf-8')
+            elif delivery.image_format == "ref":
+                del result["annotated_image"]
+                result["annotated_image_url"] = f"/annotated/{annotated_cache.put(jpeg)}"
+
+        record.update({
+            "priority": overall_priority,
+            "total_detections": len(detections),
+            "detections": summarize_detections(detections),
+        })
+        headers = {"X-Model-Version": deployment.version}
+        if "cache" in record:
+            headers["X-Result-Cache"] = record["cache"]
+        return finish(result, headers=headers, image=jpeg)
+
+    except ImageTooLarge as e:
+        record["error"] = str(e)
+        return finish({"error": str(e)}, 413)
+
+    except InferenceOptionError as e:
+        # An option the model cannot run with, e.g. another imgsz for a fixed-size export
+        record["error"] = str(e)
+        return finish({"error": str(e)}, 400)
+
+    except ExecutorSaturated as e:
+        logger.warning(f"{model_name} rejected: {e}")
+        record["error"] = str(e)
+        return finish({"error": str(e)}, 503, {"Retry-After": str(e.retry_after)})
 
     except Exception as e:
         logger.error(f"{model_name} error: {e}")
-        with open("model_outputs.txt", "a", encoding="utf-8") as f:
-            f.write(f"EXCEPTION: {str(e)}\n")
-            f.write("=" * 50 + "\n")
-        return JSONResponse(content={"error": str(e)}, status_code=500)
+        record["error"] = str(e)
+        return finish({"error": str(e)}, 500)
+
+    finally:
+        metrics.IN_FLIGHT.dec(detector=name)
+        if deployment is not None:
+            deployment.release()
+
+def start_shadow(shadow, primary, image, options, tiled, primary_output, primary_seconds):
+    """
+    Runs a request's image through a shadow version (leased) in the background and records its
+    latency and how its output compares with the serving version's. Best effort: a busy or
+    failing shadow never affects the response.
+    """
+    name = primary.name
+
+    async def run():
+        started = time.perf_counter()
+        try:
+            _, priority, detections = await shadow.batcher.predict(image, options["conf"], False, tiled, **predict_options(options))
+            seconds = time.perf_counter() - started
+            comparison = await run_in_threadpool(compare_outputs, primary_output, (priority, detections))
+        except Exception as e:
+            logger.warning(f"{name} shadow version {shadow.version} failed: {e}")
+            metrics.SHADOW_COMPARISONS.inc(detector=name, result="error")
+            return
+        finally:
+            shadow.release()
+
+        metrics.INFERENCE_SECONDS.observe(seconds, detector=name, version=shadow.version, role="shadow")
+        matched = comparison["priority_match"] and comparison["agreement"] >= SHADOW_MATCH_AGREEMENT
+        metrics.SHADOW_COMPARISONS.inc(detector=name, result="match" if matched else "mismatch")
+        result_log.log({
+            "model": DETECTOR_SPECS[name]["label"],
+            "shadow": {"version": shadow.version, "serving_version": primary.version, **comparison},
+            "timings": {"serving_ms": round(primary_seconds * 1000, 2), "shadow_ms": round(seconds * 1000, 2)},
+        })
+
+    task = asyncio.get_running_loop().create_task(run())
+    shadow_tasks.add(task)
+    task.add_done_callback(shadow_tasks.discard)
 
 @app.post("/pothole")
-async def pothole_detection(file: UploadFile = File(...)):
-    return await process_request(file, pothole_model, "Pothole detection", "road_priority")
+async def pothole_detection(
+    file: UploadFile = File(...), delivery: DeliveryOptions = Depends(), tiled: bool = Form(False), location: ReportLocation = Depends(),
+    inference: InferenceOptions = Depends(),
+):
+    return await process_request(file, "pothole", delivery, tiled, location, inference)
 
 @app.post("/fallentree")
-async def fallen_tree_detection(file: UploadFile = File(...)):
-    return await process_request(file, fallen_tree_detector, "Fallen tree detection", "fallentree_priority")
+async def fallen_tree_detection(
+    file: UploadFile = File(...), delivery: DeliveryOptions = Depends(), tiled: bool = Form(False), location: ReportLocation = Depends(),
+    inference: InferenceOptions = Depends(),
+):
+    return await process_request(file, "fallentree", delivery, tiled, location, inference)
 
 @app.post("/brokensignage")
-async def broken_signage_detection(file: UploadFile = File(...)):
-    return await process_request(file, broken_signage_detector, "Broken signage detection", "brokensignage_priority")
+async def broken_signage_detection(
+    file: UploadFile = File(...), delivery: DeliveryOptions = Depends(), tiled: bool = Form(False), location: ReportLocation = Depends(),
+    inference: InferenceOptions = Depends(),
+):
+    return await process_request(file, "brokensignage", delivery, tiled, location, inference)
 
 @app.post("/garbage")
-async def garbage_detection(file: UploadFile = File(...)):
-    return await process_request(file, garbage_detector, "Garbage detection", "garbage_priority")
+async def garbage_detection(
+    file: UploadFile = File(...), delivery: DeliveryOptions = Depends(), tiled: bool = Form(False), location: ReportLocation = Depends(),
+    inference: InferenceOptions = Depends(),
+):
+    return await process_request(file, "garbage", delivery, tiled, location, inference)
 
 @app.post("/streetlight")
-async def streetlight_detection(file: UploadFile = File(...)):
-    return await process_request(file, streetlight_detector, "Streetlight detection", "streetlight_priority")
+async def streetlight_detection(
+    file: UploadFile = File(...), delivery: DeliveryOptions = Depends(), tiled: bool = Form(False), location: ReportLocation = Depends(),
+    inference: InferenceOptions = Depends(),
+):
+    return await process_request(file, "streetlight", delivery, tiled, location, inference)
+
+def read_archive(archive_file):
+    """
+    Returns [(member_name, bytes)] for the images inside a zip or tar (optionally compressed)
+    archive; bytes is None for members over IMAGE_UPLOAD_MAX_BYTES, which are not extracted.
+    """
+    items = []
+    if zipfile.is_zipfile(archive_file):
+        archive_file.seek(0)
+        with zipfile.ZipFile(archive_file) as zf:
+            for info in zf.infolist():
+                if not info.is_dir() and info.filename.lower().endswith(IMAGE_EXTENSIONS):
+                    if len(items) >= BATCH_MAX_FILES:
+                        break
+                    too_large = IMAGE_MAX_BYTES and info.file_size > IMAGE_MAX_BYTES
+                    items.append((info.filename, None if too_large else zf.read(info)))
+    else:
+        archive_file.seek(0)
+        with tarfile.open(fileobj=archive_file, mode="r:*") as tf:
+            for member in tf:
+                if member.isfile() and member.name.lower().endswith(IMAGE_EXTENSIONS):
+                    if len(items) >= BATCH_MAX_FILES:
+                        break
+                    too_large = IMAGE_MAX_BYTES and member.size > IMAGE_MAX_BYTES
+                    items.append((member.name, None if too_large else tf.extractfile(member).read()))
+    return items
+
+async def detect_batch(deployment, name, images, options, annotate=True, tiled=False):
+    """
+    Runs decoded images through one leased detector deployment in chunks of its micro-batch size,
+    with resolved inference `options` (InferenceOptions.resolve). Returns one (annotated_image,
+    overall_priority, detections) tuple or exception per image.
+    """
+    executor = deployment.executor
+    size = max(1, deployment.batcher.max_batch)
+    slots = asyncio.Semaphore(executor.workers)
+
+    async def run_chunk(chunk):
+        async with slots:
+            try:
+                metrics.BATCH_SIZE.observe(len(chunk), detector=name)
+                return await executor.submit(
+                    "predict_batch", chunk, options["conf"], annotate=annotate, tiled=tiled, **predict_options(options),
+                )
+            except Exception as e:
+                logger.error(f"{name} batch error: {e}")
+                return [e] * len(chunk)
+
+    chunks = [images[i:i + size] for i in range(0, len(images), size)]
+    results = await asyncio.gather(*(run_chunk(chunk) for chunk in chunks))
+    return [result for chunk_results in results for result in chunk_results]
+
+async def process_batch_request(names, files, archive, include_images, tiled=False, inference=None):
+    """Runs a batch request (see run_batch_request), counted in the request metrics of each detector in `names`."""
+    return await tracked(names, run_batch_request(names, files, archive, include_images, tiled, inference))
+
+async def run_batch_request(names, files, archive, include_images, tiled=False, inference=None):
+    """
+    Runs a set of uploaded images through every detector in `names`, decoding each image once.
+    Images are read, decoded and scored a slice at a time (one micro-batch per executor worker
+    of the widest detector), so only that slice is held in memory as pixels.
+    """
+    started = time.perf_counter()
+    files = files or []
+    if len(files) > BATCH_MAX_FILES:
+        return JSONResponse(content={"error": f"Too many images: at most {BATCH_MAX_FILES} per request"}, status_code=413)
+    for name in names:
+        if name not in DETECTOR_SPECS:
+            return JSONResponse(content={"error": f"Unknown detector: {name}"}, status_code=404)
+    for unavailable in await asyncio.gather(*(wait_for_model(name) for name in names)):
+        if unavailable is not None:
+            content, status_code, headers = unavailable
+            return JSONResponse(content=content, status_code=status_code, headers=headers)
+    try:
+        options = {name: resolve_inference(name, inference) for name in names}
+        for name in names:
+            await load_variant(name, options[name]["variant"])
+    except InferenceOptionError as e:
+        return JSONResponse(content={"error": str(e)}, status_code=400)
+    except VariantUnavailable as e:
+        return variant_unavailable_response(e)
+
+    # Uploaded files are read when their slice is scored; archive members are already bytes
+    items = [(f.filename, f) for f in files]
+    if archive is not None:
+        try:
+            items.extend(await run_in_threadpool(read_archive, archive.file))
+        except (tarfile.TarError, zipfile.BadZipFile) as e:
+            return JSONResponse(content={"error": f"Unreadable archive {archive.filename}: {e}"}, status_code=400)
+
+    if not items:
+        return JSONResponse(content={"error": "No images provided"}, status_code=400)
+    if len(items) > BATCH_MAX_FILES:
+        return JSONResponse(content={"error": f"Too many images: at most {BATCH_MAX_FILES} per request"}, status_code=413)
+
+    results = [{"index": i, "filename": filename} for i, (filename, _) in enumerate(items)]
+    failed = 0
+    # The whole batch runs on the versions it started with, even if a swap happens meanwhile
+    deployments = []
+    try:
+        for name in names:
+            deployments.append(lease_model(name, options[name]["variant"])[0])
+        step = max(max(1, d.batcher.max_batch) * d.executor.workers for d in deployments)
+        for start in range(0, len(items), step):
+            chunk = [
+                data if data is None or isinstance(data, bytes) else await read_upload(data, IMAGE_MAX_BYTES)
+                for _, data in items[start:start + step]
+            ]
+            decoded = await asyncio.gather(*(run_in_threadpool(decode_batch_item, data) for data in chunk))
+            del chunk
+            valid = [i for i, (image, _, _) in enumerate(decoded) if image is not None]
+            failed += len(decoded) - len(valid)
+            for i, (_, _, error) in enumerate(decoded):
+                if error is not None:
+                    results[start + i]["error"] = error
+            outputs = await asyncio.gather(*(
+                detect_batch(deployment, name, [decoded[i][0] for i in valid], options[name], include_images, tiled)
+                for deployment, name in zip(deployments, names)
+            ))
+            for name, detector_outputs in zip(names, outputs):
+                priority_key = DETECTOR_SPECS[name]["priority_key"]
+                for i, output in zip(valid, detector_outputs):
+                    if isinstance(output, Exception):
+                        entry = {"error": str(output)}
+                    else:
+                        annotated_image, overall_priority, detections = output
+                        entry = {
+                            "detections": scale_detections(detections, decoded[i][1]),
+                            priority_key: overall_priority,
+                            "total_detections": len(detections),
+                        }
+                        if include_images:
+                            entry["annotated_image"] = await run_in_threadpool(encode_image, annotated_image)
+                    if len(names) == 1:
+                        results[start + i].update(entry)
+                    else:
+                        results[start + i].setdefault("results", {})[name] = entry
+            del decoded, outputs
+    finally:
+        for deployment in deployments:
+            deployment.release()
+
+    result_log.log({
+        "model": "batch",
+        "detectors": names,
+        "images": len(items),
+        "undecodable": failed,
+        "timings": {"total_ms": elapsed_ms(started)},
+    })
+
+    return JSONResponse(content={"results": results, "total": len(items), "failed": failed})
+
+@app.post("/batch")
+async def multi_detector_batch(
+    detectors: str = Form(...),
+    files: Optional[List[UploadFile]] = File(None),
+    archive: Optional[UploadFile] = File(None),
+    include_images: bool = Form(False),
+    tiled: bool = Form(False),
+    inference: InferenceOptions = Depends(),
+):
+    """Runs every uploaded image through each detector in the comma-separated `detectors` list ("all" for every loaded one)."""
+    return await process_batch_request(parse_detector_names(detectors), files, archive, include_images, tiled, inference)
+
+@app.post("/{detector}/batch")
+async def detector_batch(
+    detector: str,
+    files: Optional[List[UploadFile]] = File(None),
+    archive: Optional[UploadFile] = File(None),
+    include_images: bool = Form(False),
+    tiled: bool = Form(False),
+    inference: InferenceOptions = Depends(),
+):
+    """Runs many images (files and/or a zip/tar archive) through one detector; results keep upload order."""
+    return await process_batch_request([detector], files, archive, include_images, tiled, inference)
+
+def parse_detector_names(detectors):
+    if detectors.strip() == "all":
+        return [name for name in DETECTOR_SPECS if model_loader.state(name) != FAILED]
+    return [name.strip() for name in detectors.split(",") if name.strip()]
+
+@app.post("/analyze")
+async def analyze(
+    file: UploadFile = File(...),
+    detectors: str = Form("all"),
+    include_images: bool = Form(False),
+    tiled: bool = Form(False),
+    inference: InferenceOptions = Depends(),
+):
+    """
+    Runs one image through several detectors concurrently. The image is decoded once and
+    ONNX detectors running at the same input size share one preprocessed tensor per size (not
+    with tiled=true, where each detector slices the image itself). `inference` options apply
+    to every detector, over each one's own defaults.
+    """
+    names = parse_detector_names(detectors)
+    return await tracked(names, analyze_image(file, names, include_images, tiled, inference))
+
+async def analyze_image(file, names, include_images=False, tiled=False, inference=None):
+    """The /analyze response for an upload and a list of detector names."""
+    started = time.perf_counter()
+    for name in names:
+        if name not in DETECTOR_SPECS:
+            return JSONResponse(content={"error": f"Unknown detector: {name}"}, status_code=404)
+    if not names:
+        return JSONResponse(content={"error": "No detectors loaded"}, status_code=500)
+    try:
+        options = {name: resolve_inference(name, inference) for name in names}
+    except InferenceOptionError as e:
+        return JSONResponse(content={"error": str(e)}, status_code=400)
+
+    contents = await read_upload(file, IMAGE_MAX_BYTES)
+    if contents is None:
+        return JSONResponse(content={"error": f"Image upload larger than {IMAGE_MAX_BYTES} bytes"}, status_code=413)
+    try:
+        image, scale = await run_in_threadpool(decode_upload, contents)
+    except ImageTooLarge as e:
+        return JSONResponse(content={"error": str(e)}, status_code=413)
+    if image is None:
+        return JSONResponse(content={"error": "Invalid image file"}, status_code=400)
+
+    unavailable = dict(zip(names, await asyncio.gather(*(wait_for_model(name) for name in names))))
+    try:
+        for name in names:
+            if unavailable[name] is None:
+                await load_variant(name, options[name]["variant"])
+    except InferenceOptionError as e:
+        return JSONResponse(content={"error": str(e)}, status_code=400)
+    except VariantUnavailable as e:
+        return variant_unavailable_response(e)
+    deployments = {name: lease_model(name, options[name]["variant"])[0] for name in names if unavailable[name] is None}
+
+    def shared_size(name):
+        """Input size at which an ONNX detector can take a shared preprocessed batch, else None."""
+        if name not in deployments or not deployments[name].path.endswith(".onnx"):
+            return None
+        return options[name]["imgsz"] or deployments[name].executor.input_size
+
+    async def run_detector(name):
+        if unavailable[name] is not None:
+            raise RuntimeError(unavailable[name][0]["error"])
+        batch = shared_batches.get(shared_size(name))
+        return (await deployments[name].executor.submit(
+            "predict_batch", [image], options[name]["conf"], batch, annotate=include_images, tiled=tiled,
+            **predict_options(options[name]),
+        ))[0]
+
+    try:
+        # One preprocessed batch per input size, shared by the detectors that run at it
+        shared_batches = {}
+        if not tiled:
+            for size in {shared_size(name) for name in names} - {None}:
+                shared_batches[size] = await run_in_threadpool(BaseDetector.preprocess, [image], size)
+        outputs = await asyncio.gather(*(run_detector(name) for name in names), return_exceptions=True)
+    finally:
+        for deployment in deployments.values():
+            deployment.release()
+
+    results, priorities = {}, {}
+    overall_priority = "low"
+    total_detections = 0
+    for name, output in zip(names, outputs):
+        if isinstance(output, Exception):
+            logger.error(f"{DETECTOR_SPECS[name]['label']} error: {output}")
+            results[name] = {"error": str(output)}
+            continue
+        annotated_image, priority, detections = output
+        results[name] = {
+            "detections": scale_detections(detections, scale),
+            "priority": priority,
+            "total_detections": len(detections),
+        }
+        if include_images:
+            results[name]["annotated_image"] = await run_in_threadpool(encode_image, annotated_image)
+        priorities[name] = priority
+        total_detections += len(detections)
+        if PRIORITY_RANK.get(priority.lower(), 0) > PRIORITY_RANK[overall_priority]:
+            overall_priority = priority.lower()
+
+    result_log.log({
+        "model": "analyze",
+        "filename": file.filename,
+        "shape": list(image.shape),
+        "priorities": priorities,
+        "overall_priority": overall_priority,
+        "total_detections": total_detections,
+        "timings": {"total_ms": elapsed_ms(started)},
+    })
+
+    return JSONResponse(content={
+        "results": results,
+        "priorities": priorities,
+        "overall_priority": overall_priority,
+        "total_detections": total_detections,
+    })
+
+class UploadTooLarge(Exception):
+    pass
+
+async def spool_video(request):
+    """
+    Copies the video in a request to a temporary file, chunk by chunk, and returns its path.
+    Accepts a multipart upload with a 'file' field or a raw (optionally chunked) request body.
+    """
+    content_type = request.headers.get("content-type", "")
+    upload = None
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        upload = form.get("file")
+        if upload is None or isinstance(upload, str):
+            raise ValueError("Multipart video uploads need a 'file' field")
+        suffix = os.path.splitext(upload.filename or "")[1] or ".mp4"
+    else:
+        suffix = ".mp4"
+
+    async def chunks():
+        if upload is not None:
+            while chunk := await upload.read(VIDEO_CHUNK_BYTES):
+                yield chunk
+        else:
+            async for chunk in request.stream():
+                yield chunk
+
+    fd, path = tempfile.mkstemp(suffix=suffix, prefix="video-")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            size = 0
+            async for chunk in chunks():
+                size += len(chunk)
+                if size > VIDEO_MAX_BYTES:
+                    raise UploadTooLarge(f"Video exceeds {VIDEO_MAX_BYTES} bytes")
+                await run_in_threadpool(out.write, chunk)
+        return path
+    except BaseException:
+        os.remove(path)
+        raise
+
+@app.post("/{detector}/video")
+async def detect_video(
+    detector: str,
+    request: Request,
+    interval: float = 1.0,
+    scene_threshold: float = 0.0,
+    max_frames: int = 0,
+    conf: Optional[float] = None,
+    iou: float = 0.3,
+    max_gap: int = 2,
+    min_frames: int = 1,
+    batch_size: int = 0,
+    nms_iou: Optional[float] = None,
+    imgsz: Optional[int] = None,
+    max_det: Optional[int] = None,
+    variant: Optional[str] = None,
+):
+    """
+    Runs a video (multipart 'file' field or raw body) through one detector and returns a
+    per-object timeline. Frames are sampled every `interval` seconds, or on scene change when
+    `scene_threshold` > 0, decoded one batch ahead of inference; detections of the same object
+    in neighbouring samples (same class, IoU >= `iou`, at most `max_gap` samples apart) merge
+    into one object. Memory stays bounded by two batches of frames plus the open tracks.
+    conf, nms_iou (the detector's NMS IoU), imgsz, max_det and variant are the InferenceOptions
+    of the image endpoints, as query parameters.
+    """
+    inference = InferenceOptions(conf, nms_iou, imgsz, max_det, variant)
+    invalid = await check_video_request(detector, interval, inference)
+    if invalid is None:
+        try:
+            path = await spool_video(request)
+        except UploadTooLarge as e:
+            invalid = JSONResponse(content={"error": str(e)}, status_code=413)
+        except ValueError as e:
+            invalid = JSONResponse(content={"error": str(e)}, status_code=400)
+    if invalid is not None:
+        record_request([detector], invalid.status_code)
+        return invalid
+    try:
+        return await process_video(
+            detector, path, interval, scene_threshold, max_frames, conf, iou, max_gap, min_frames, batch_size,
+            nms_iou, imgsz, max_det, variant,
+        )
+    finally:
+        # process_video keeps the file when it answers 503 (a job retries with it)
+        if os.path.exists(path):
+            os.remove(path)
+
+async def check_video_request(detector, interval, inference=None):
+    """An error response for a video request that cannot run, else None."""
+    if detector not in DETECTOR_SPECS:
+        return JSONResponse(content={"error": f"Unknown detector: {detector}"}, status_code=404)
+    unavailable = await wait_for_model(detector)
+    if unavailable is not None:
+        content, status_code, headers = unavailable
+        return JSONResponse(content=content, status_code=status_code, headers=headers)
+    if interval <= 0:
+        return JSONResponse(content={"error": "interval must be positive"}, status_code=400)
+    if inference is not None:
+        try:
+            await load_variant(detector, inference.resolve(detector)["variant"])
+        except InferenceOptionError as e:
+            return JSONResponse(content={"error": str(e)}, status_code=400)
+        except VariantUnavailable as e:
+            return variant_unavailable_response(e)
+    return None
+
+async def process_video(detector, path, *args, **kwargs):
+    """
+    Runs a spooled video file through one detector (see run_video), counted in its request metrics.
+    The file is removed afterwards, except on a 503 for a variant that is not loaded yet, which the caller retries.
+    """
+    return await tracked([detector], run_video(detector, path, *args, **kwargs))
+
+async def run_video(
+    detector, path, interval=1.0, scene_threshold=0.0, max_frames=0, conf=None,
+    iou=0.3, max_gap=2, min_frames=1, batch_size=0, nms_iou=None, imgsz=None, max_det=None, variant=None,
+):
+    """The timeline response for a spooled video file (see detect_video and process_video)."""
+    started = time.perf_counter()
+    try:
+        options = InferenceOptions(conf, nms_iou, imgsz, max_det, variant).resolve(detector)
+        await load_variant(detector, options["variant"])
+    except InferenceOptionError as e:
+        os.remove(path)
+        return JSONResponse(content={"error": str(e)}, status_code=400)
+    except VariantUnavailable as e:
+        return variant_unavailable_response(e)
+    # The whole video runs on the version it started with, even if a swap happens meanwhile
+    deployment, _ = lease_model(detector, options["variant"])
+    executor = deployment.executor
+    batch_size = batch_size if batch_size > 0 else max(1, deployment.batcher.max_batch)
+    tracker = ObjectTracker(iou_threshold=iou, max_gap=max_gap, min_frames=min_frames)
+
+    async def infer(frames):
+        # A video is one long job: wait for queue space instead of failing with 503
+        while True:
+            try:
+                metrics.BATCH_SIZE.observe(len(frames), detector=detector)
+                return await executor.submit(
+                    "predict_batch", [f.image for f in frames], options["conf"], annotate=False, **predict_options(options),
+                )
+            except ExecutorSaturated as e:
+                await asyncio.sleep(e.retry_after)
+
+    capture = None
+    try:
+        try:
+            capture = await run_in_threadpool(open_video, path)
+        except ValueError:
+            return JSONResponse(content={"error": "Unreadable video file"}, status_code=400)
+        info = video_info(capture)
+        frames = sample_frames(capture, interval, scene_threshold, max_frames=max_frames)
+
+        # Decode the next batch while the current one is being inferred
+        batch = await run_in_threadpool(take, frames, batch_size)
+        while batch:
+            inference = asyncio.ensure_future(infer(batch))
+            next_batch = await run_in_threadpool(take, frames, batch_size)
+            for frame, (_, priority, detections) in zip(batch, await inference):
+                tracker.update(frame, detections, priority)
+            batch = next_batch
+    except InferenceOptionError as e:
+        return JSONResponse(content={"error": str(e)}, status_code=400)
+    except Exception as e:
+        logger.error(f"{DETECTOR_SPECS[detector]['label']} video error: {e}")
+        return JSONResponse(content={"error": str(e)}, status_code=500)
+    finally:
+        deployment.release()
+        if capture is not None:
+            capture.release()
+        os.remove(path)
+
+    objects = tracker.finish()
+    processing_ms = elapsed_ms(started)
+    result_log.log({
+        "model": DETECTOR_SPECS[detector]["label"],
+        "video": info,
+        "sampled_frames": tracker.frames,
+        "objects": len(objects),
+        "priority": tracker.priority,
+        "timings": {"total_ms": processing_ms},
+    })
+    return JSONResponse(content={
+        "detector": detector,
+        "video": info,
+        "sampled_frames": tracker.frames,
+        "priority": tracker.priority,
+        "objects": objects,
+        "total_objects": len(objects),
+        "processing_time_ms": processing_ms,
+    })
+
+# Options accepted by POST /jobs per kind: the form fields of the matching synchronous endpoint
+INFERENCE_FIELDS = ("conf", "iou", "imgsz", "max_det", "variant")
+JOB_OPTIONS = {
+    "image": ("annotate", "image_format", "jpeg_quality", "max_dimension", "tiled", "geohash", "latitude", "longitude") + INFERENCE_FIELDS,
+    "batch": ("include_images", "tiled") + INFERENCE_FIELDS,
+    "analyze": ("include_images", "tiled") + INFERENCE_FIELDS,
+    "video": (
+        "interval", "scene_threshold", "max_frames", "conf", "iou", "max_gap", "min_frames", "batch_size",
+        "nms_iou", "imgsz", "max_det", "variant",
+    ),
+}
+
+def create_job_store():
+    if JOB_STORE == "sqlite":
+        return SQLiteJobStore(JOB_DB_PATH)
+    if JOB_STORE == "memory":
+        return MemoryJobStore()
+    raise ValueError(f"Unsupported JOB_STORE: {JOB_STORE}. Supported: sqlite, memory")
+
+async def run_job(job):
+    """
+    Runs a stored job through the same code as its synchronous endpoint and returns
+    (status_code, content). Busy detectors (503 with Retry-After) are waited for, not failed.
+    """
+    options = job["options"]
+    inference = InferenceOptions(*(options.get(field) for field in INFERENCE_FIELDS))
+    while True:
+        uploads = [(role, UploadFile(open(path, "rb"), filename=name)) for name, path, role in job["inputs"]]
+        files = [upload for role, upload in uploads if role == "file"]
+        archive = next((upload for role, upload in uploads if role == "archive"), None)
+        try:
+            if job["kind"] == "image":
+                delivery = DeliveryOptions(
+                    annotate=options.get("annotate", True), image_format=options.get("image_format", "base64"),
+                    jpeg_quality=options.get("jpeg_quality", 95), max_dimension=options.get("max_dimension", 0),
+                )
+                location = ReportLocation(options.get("geohash"), options.get("latitude"), options.get("longitude"))
+                response = await process_request(files[0], job["detectors"][0], delivery, options.get("tiled", False), location, inference)
+            elif job["kind"] == "batch":
+                response = await process_batch_request(
+                    job["detectors"], files, archive, options.get("include_images", False), options.get("tiled", False), inference,
+                )
+            elif job["kind"] == "analyze":
+                response = await analyze(
+                    files[0], ",".join(job["detectors"]), options.get("include_images", False), options.get("tiled", False), inference,
+                )
+            else:
+                response = await check_video_request(job["detectors"][0], options.get("interval", 1.0))
+                if response is not None:
+                    record_request(job["detectors"], response.status_code)
+                else:
+                    # process_video removes the file once it is done with it; a 503 leaves it for the
+                    # retry, and the job queue removes the job's inputs when it finishes either way
+                    response = await process_video(job["detectors"][0], job["inputs"][0][1], **options)
+        finally:
+            for _, upload in uploads:
+                upload.file.close()
+
+        retry_after = response.headers.get("Retry-After")
+        if response.status_code != 503 or retry_after is None:
+            return response.status_code, json.loads(response.body)
+        await asyncio.sleep(float(retry_after))
+
+job_queue = JobQueue(
+    create_job_store, run_job, JOB_DIR,
+    limits={name: job_settings(name)["concurrency"] for name in DETECTOR_SPECS},
+    retention=JOB_RETENTION_SECONDS,
+    lease=JOB_LEASE_SECONDS,
+    callback_hosts=JOB_CALLBACK_ALLOWED_HOSTS,
+)
+
+@app.on_event("startup")
+async def start_job_queue():
+    """Opens the job store in this worker and starts running queued jobs, including interrupted ones."""
+    await job_queue.start()
+
+async def spool_upload(upload, path, budget, limit_message=None):
+    """Copies an upload to `path` in chunks and returns its size; raises UploadTooLarge past `budget` bytes."""
+    size = 0
+    with open(path, "wb") as out:
+        while chunk := await upload.read(VIDEO_CHUNK_BYTES):
+            size += len(chunk)
+            if size > budget:
+                raise UploadTooLarge(limit_message or f"Job uploads exceed {JOB_UPLOAD_MAX_BYTES} bytes")
+            await run_in_threadpool(out.write, chunk)
+    return size
+
+@app.post("/jobs", status_code=202)
+async def create_job(
+    kind: str = Form("image"),
+    detectors: str = Form(...),
+    files: Optional[List[UploadFile]] = File(None),
+    archive: Optional[UploadFile] = File(None),
+    options: str = Form("{}"),
+    callback_url: Optional[str] = Form(None),
+    priority: Optional[int] = Form(None),
+):
+    """
+    Queues an image, batch, analyze or video request and returns its id straight away; the
+    result is fetched from GET /jobs/{id} or POSTed to `callback_url` when the job finishes.
+    `detectors` is one detector for image and video jobs, a comma-separated list (or "all")
+    for batch and analyze jobs. `options` is a JSON object of the matching endpoint's form
+    fields (see JOB_OPTIONS). Jobs run by priority (default: the most urgent detector's).
+    """
+    if kind not in JOB_OPTIONS:
+        return JSONResponse(content={"error": f"Unsupported kind: {kind}. Supported: {', '.join(JOB_OPTIONS)}"}, status_code=400)
+    names = parse_detector_names(detectors)
+    unknown = [name for name in names if name not in DETECTOR_SPECS]
+    if unknown or not names:
+        return JSONResponse(content={"error": f"Unknown detector: {', '.join(unknown) or detectors}"}, status_code=404)
+    if kind in ("image", "video") and len(names) != 1:
+        return JSONResponse(content={"error": f"{kind} jobs run exactly one detector"}, status_code=400)
+
+    try:
+        options = json.loads(options)
+    except ValueError as e:
+        return JSONResponse(content={"error": f"options is not valid JSON: {e}"}, status_code=400)
+    if not isinstance(options, dict):
+        return JSONResponse(content={"error": "options must be a JSON object"}, status_code=400)
+    unsupported = sorted(set(options) - set(JOB_OPTIONS[kind]))
+    if unsupported:
+        return JSONResponse(content={"error": f"Unsupported {kind} job options: {', '.join(unsupported)}"}, status_code=400)
+    # ref links expire after ANNOTATED_CACHE_TTL and only resolve on this worker, well before a
+    # job result is fetched or delivered to its callback
+    if options.get("image_format") in ("multipart", "ref"):
+        return JSONResponse(content={"error": "Jobs return base64 annotated images"}, status_code=400)
+    if callback_url is not None:
+        rejected = await run_in_threadpool(callback_url_error, callback_url, JOB_CALLBACK_ALLOWED_HOSTS)
+        if rejected is not None:
+            return JSONResponse(content={"error": rejected}, status_code=400)
+
+    files = files or []
+    if kind == "batch" and not files and archive is None:
+        return JSONResponse(content={"error": "No images provided"}, status_code=400)
+    if kind != "batch" and (len(files) != 1 or archive is not None):
+        return JSONResponse(content={"error": f"{kind} jobs take exactly one file"}, status_code=400)
+
+    job_id = uuid.uuid4().hex
+    directory = job_queue.input_dir(job_id)
+    os.makedirs(directory, exist_ok=True)
+    inputs, budget = [], JOB_UPLOAD_MAX_BYTES
+    try:
+        for i, (role, upload) in enumerate([("file", f) for f in files] + ([("archive", archive)] if archive is not None else [])):
+            name = upload.filename or f"upload-{i}"
+            path = os.path.join(directory, f"{i}-{os.path.basename(name)}")
+            budget -= await spool_upload(upload, path, budget)
+            inputs.append([name, path, role])
+    except UploadTooLarge as e:
+        shutil.rmtree(directory, ignore_errors=True)
+        return JSONResponse(content={"error": str(e)}, status_code=413)
+
+    if priority is None:
+        priority = min(job_settings(name)["priority"] for name in names)
+    job = new_job(kind, names, options, inputs, priority, callback_url, job_id)
+    await job_queue.submit(job)
+    return JSONResponse(
+        content={"id": job_id, "status": job["status"], "status_url": f"/jobs/{job_id}", "queue_position": job_queue.position(job_id)},
+        status_code=202,
+        headers={"Location": f"/jobs/{job_id}"},
+    )
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Status of a background job, with its result (the synchronous endpoint's response body) once finished."""
+    job = await run_in_threadpool(job_queue.store.get, job_id)
+    if job is None:
+        return JSONResponse(content={"error": f"Unknown job: {job_id}"}, status_code=404)
+    return JSONResponse(content=public_view(job, job_queue.position(job_id)))
+
+def admin_denied(request):
+    """An error response unless the request carries the ADMIN_TOKEN bearer token, else None."""
+    if not ADMIN_TOKEN:
+        return JSONResponse(content={"error": "Admin endpoints are disabled; set ADMIN_TOKEN to enable them"}, status_code=403)
+    if not secrets.compare_digest(request.headers.get("authorization", "").encode(), f"Bearer {ADMIN_TOKEN}".encode()):
+        return JSONResponse(content={"error": "Invalid or missing admin token"}, status_code=401)
+    return None
+
+def describe_detector(name):
+    return {"state": model_loader.state(name), **model_registry.describe(name)}
+
+@app.get("/admin/models")
+async def list_models(request: Request):
+    """Every detector's registered versions, serving version, canary/shadow traffic and last swap."""
+    denied = admin_denied(request)
+    if denied is not None:
+        return denied
+    return {name: describe_detector(name) for name in DETECTOR_SPECS}
+
+@app.get("/admin/models/{detector}")
+async def get_model(detector: str, request: Request):
+    denied = admin_denied(request)
+    if denied is not None:
+        return denied
+    if detector not in DETECTOR_SPECS:
+        return JSONResponse(content={"error": f"Unknown detector: {detector}"}, status_code=404)
+    return describe_detector(detector)
+
+@app.post("/admin/models/{detector}/versions", status_code=201)
+async def register_model_version(
+    detector: str,
+    request: Request,
+    version: str = Form(...),
+    path: Optional[str] = Form(None),
+    file: Optional[UploadFile] = File(None),
+    activate: bool = Form(False),
+):
+    """
+    Registers a new version of a detector's model: a model file already on the server (`path`)
+    or an uploaded .pt/.onnx `file`, stored under MODEL_UPLOAD_DIR. Versions are immutable;
+    activate=true also starts swapping it in (see POST /admin/models/{detector}/activate).
+    """
+    denied = admin_denied(request)
+    if denied is not None:
+        return denied
+    if detector not in DETECTOR_SPECS:
+        return JSONResponse(content={"error": f"Unknown detector: {detector}"}, status_code=404)
+    if version in model_registry.versions(detector):
+        return JSONResponse(content={"error": f"Version {version} of {detector} already exists"}, status_code=409)
+    if (path is None) == (file is None):
+        return JSONResponse(content={"error": "Provide either a server-side path or an uploaded file"}, status_code=400)
+
+    if file is not None:
+        ext = os.path.splitext(file.filename or "")[1].lower()
+        if ext not in (".pt", ".onnx"):
+            return JSONResponse(content={"error": f"Unsupported model format: {ext or file.filename}. Supported: .pt, .onnx"}, status_code=400)
+        path = os.path.join(MODEL_UPLOAD_DIR, detector, f"{version}{ext}")
+        partial = f"{path}.part"
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            await spool_upload(file, partial, MODEL_UPLOAD_MAX_BYTES, f"Model uploads are limited to {MODEL_UPLOAD_MAX_BYTES} bytes")
+        except UploadTooLarge as e:
+            os.remove(partial)
+            return JSONResponse(content={"error": str(e)}, status_code=413)
+        os.replace(partial, path)
+
+    try:
+        await run_in_threadpool(model_registry.register, detector, version, path)
+    except ValueError as e:
+        return JSONResponse(content={"error": str(e)}, status_code=400)
+    logger.info(f"{detector}: registered version {version} ({path})")
+    if activate:
+        activate_version(detector, version)
+    return JSONResponse(content=describe_detector(detector), status_code=201)
+
+def activate_version(name, version):
+    """Starts swapping in a version; a detector that failed to load is retried with it."""
+    model_registry.activate(name, version)
+    if model_loader.state(name) == FAILED:
+        model_loader.retry(name)
+        model_loader.load(name)
+
+@app.post("/admin/models/{detector}/activate", status_code=202)
+async def activate_model_version(detector: str, request: Request, version: str = Form(...)):
+    """
+    Loads `version` in the background, warms it up and swaps it in; requests already running
+    finish on the old version, which is unloaded once they are done. A version that fails to
+    load leaves the serving one in place (see last_change in GET /admin/models/{detector}).
+    Activating the serving version again reloads its file.
+    """
+    denied = admin_denied(request)
+    if denied is not None:
+        return denied
+    if detector not in DETECTOR_SPECS:
+        return JSONResponse(content={"error": f"Unknown detector: {detector}"}, status_code=404)
+    try:
+        activate_version(detector, version)
+    except ValueError as e:
+        return JSONResponse(content={"error": str(e)}, status_code=400)
+    return JSONResponse(content=describe_detector(detector), status_code=202, headers={"Location": f"/admin/models/{detector}"})
+
+@app.post("/admin/models/{detector}/traffic", status_code=202)
+async def set_model_traffic(
+    detector: str,
+    request: Request,
+    role: str = Form(...),
+    version: Optional[str] = Form(None),
+    percent: float = Form(0.0),
+):
+    """
+    Splits traffic with a candidate version: role=canary answers `percent` of the detector's
+    requests with it (X-Model-Version tells which one did); role=shadow also runs `percent` of
+    single-image requests through it in the background and records latency and agreement
+    (model_inference_seconds, shadow_comparisons_total and the result log). percent=0 or no
+    version turns the role off.
+    """
+    denied = admin_denied(request)
+    if denied is not None:
+        return denied
+    if detector not in DETECTOR_SPECS:
+        return JSONResponse(content={"error": f"Unknown detector: {detector}"}, status_code=404)
+    try:
+        model_registry.set_traffic(detector, role, version, percent)
+    except ValueError as e:
+        return JSONResponse(content={"error": str(e)}, status_code=400)
+    return JSONResponse(content=describe_detector(detector), status_code=202)
+
+@app.get("/inference-config")
+async def get_inference_config(detector: Optional[str] = None):
+    """Inference defaults in force per detector, with the loaded INFERENCE_CONFIG file."""
+    if detector is not None and detector not in DETECTOR_SPECS:
+        return JSONResponse(content={"error": f"Unknown detector: {detector}"}, status_code=404)
+    names = [detector] if detector is not None else list(DETECTOR_SPECS)
+    return {"effective": {name: inference_config.defaults(name) for name in names}, "config": inference_config.snapshot()}
+
+@app.get("/annotated/{image_id}")
+async def annotated_image(image_id: str):
+    """Annotated JPEG stored by a request made with image_format=ref."""
+    data = annotated_cache.get(image_id)
+    if data is None:
+        return JSONResponse(content={"error": "Annotated image not found or expired"}, status_code=404)
+    return Response(data, media_type="image/jpeg")
+
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the process is up and serving requests."""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz(detector: Optional[str] = None):
+    """
+    Readiness with per-detector state (pending/loading/ready/failed) and load time.
+    Ready once every eager detector has finished loading and at least one of them is usable
+    (always, when every detector is lazy); ?detector=<name> reports that detector alone.
+    """
+    status = model_loader.status()
+    if detector is not None:
+        if detector not in status:
+            return JSONResponse(content={"error": f"Unknown detector: {detector}"}, status_code=404)
+        ready = status[detector]["state"] == READY
+        status = {detector: status[detector]}
+    else:
+        eager = eager_detectors()
+        ready = (all(status[name]["state"] in (READY, FAILED) for name in eager)
+                 and (not eager or any(status[name]["state"] == READY for name in eager)))
+    return JSONResponse(content={"ready": ready, "detectors": status}, status_code=200 if ready else 503)
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus text-format metrics."""
+    for name, deployment in model_registry.deployments().items():
+        metrics.QUEUE_DEPTH.set(deployment.executor.pending, detector=name)
+    metrics.RESULT_LOG_DROPPED.set(result_log.dropped)
+    metrics.JOBS_QUEUED.set(job_queue.queued)
+    if result_cache is not None:
+        metrics.RESULT_CACHE_ENTRIES.set(len(result_cache))
+        metrics.RESULT_CACHE_DISK_HITS.set(result_cache.disk_hits)
+    if duplicate_index is not None:
+        metrics.DUPLICATE_INDEX_ENTRIES.set(len(duplicate_index))
+    return PlainTextResponse(metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
 
 @app.get("/")
 async def root():
-    return {"message": "ML Detection API", "endpoints": ["/pothole", "/fallentree", "/brokensignage", "/garbage", "/streetlight"]}
+    return {
+        "message": "ML Detection API",
+        "endpoints": ["/pothole", "/fallentree", "/brokensignage", "/garbage", "/streetlight", "/{detector}/batch", "/batch", "/{detector}/video", "/analyze", "/inference-config", "/admin/models", "/annotated/{image_id}", "/healthz", "/readyz", "/metrics"],
+    }
@@ -0,0 +1,177 @@
+import glob
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from detection_code.export import serving_model_path
+from detection_code.registry import DETECTOR_SPECS, MODEL_DIR
+
+from .stub_models import write_stub_models
+
+# Sample uploads shipped next to the server
+SAMPLE_IMAGES = "*_test_*.webp"
+
+SCHEMA_VERSION = 1
+
+
+def summarize(samples_ms):
+    """Latency summary (milliseconds) of a list of per-call timings."""
+    samples = np.asarray(samples_ms, dtype=np.float64)
+    if samples.size == 0:
+        return {"n": 0}
+    p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+    return {
+        "n": int(samples.size),
+        "mean_ms": round(float(samples.mean()), 3),
+        "p50_ms": round(float(p50), 3),
+        "p95_ms": round(float(p95), 3),
+        "p99_ms": round(float(p99), 3),
+        "min_ms": round(float(samples.min()), 3),
+        "max_ms": round(float(samples.max()), 3),
+    }
+
+
+def time_call(fn, repeat=20, warmup=3, min_seconds=0.0):
+    """
+    Calls fn() warmup times untimed, then at least `repeat` times (and for at least
+    min_seconds) and returns the per-call wall times in milliseconds.
+    """
+    for _ in range(warmup):
+        fn()
+    samples = []
+    started = time.perf_counter()
+    while len(samples) < repeat or time.perf_counter() - started < min_seconds:
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return samples
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def current_rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return round(int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024), 1)
+    except (OSError, ValueError):
+        return None
+
+
+def git_revision():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5)
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def environment():
+    """What a result depends on besides the code: versions, CPUs and runtime tuning variables."""
+    import onnxruntime
+
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "onnxruntime": onnxruntime.__version__,
+        "git": git_revision(),
+        "env": {k: v for k, v in sorted(os.environ.items()) if k.startswith(("ORT_", "OMP_", "MODEL_", "BATCH_"))},
+    }
+
+
+def real_models_available(model_dir):
+    """True when every registered detector has a servable model file in model_dir."""
+    for spec in DETECTOR_SPECS.values():
+        model_path = os.path.join(model_dir, os.path.basename(spec["model_path"]))
+        if not os.path.exists(serving_model_path(model_path)):
+            return False
+    return True
+
+
+def resolve_models(mode, model_dir=MODEL_DIR, detections=10):
+    """
+    Returns (model_dir, kind) for mode 'real', 'stub' or 'auto'. 'auto' falls back to stand-in
+    models written to a temporary directory when any real model is missing.
+    """
+    if mode == "real" or (mode == "auto" and real_models_available(model_dir)):
+        if not real_models_available(model_dir):
+            raise FileNotFoundError(f"Not every detector has a model in {model_dir}")
+        return model_dir, "real"
+    stub_dir = tempfile.mkdtemp(prefix="stub_models_")
+    write_stub_models(stub_dir, detections)
+    return stub_dir, "stub"
+
+
+def use_model_dir(model_dir):
+    """Points every registered detector at the models in model_dir, before they are loaded."""
+    for spec in DETECTOR_SPECS.values():
+        spec["model_path"] = os.path.join(model_dir, os.path.basename(spec["model_path"]))
+
+
+def synthetic_image(width, height, seed=0):
+    """Deterministic BGR test image: smooth gradients with noise and a few dark blobs."""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    base = 128 + 60 * np.sin(x / max(width, 1) * 6.0) * np.cos(y / max(height, 1) * 4.0)
+    image = np.repeat(base[:, :, None], 3, axis=2) + rng.normal(0, 12, (height, width, 3))
+    for _ in range(6):
+        center = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+        axes = (int(rng.integers(10, max(11, width // 8))), int(rng.integers(10, max(11, height // 8))))
+        cv2.ellipse(image, center, axes, 0, 0, 360, (40, 40, 40), -1)
+    return np.clip(image, 0, 255).astype(np.uint8)
+
+
+def sample_images(pattern=SAMPLE_IMAGES):
+    images = {}
+    for path in sorted(glob.glob(pattern)):
+        image = cv2.imread(path, cv2.IMREAD_COLOR)
+        if image is not None:
+            images[os.path.basename(path)] = image
+    return images
+
+
+def parse_sizes(text):
+    """'640x480,1920x1080' -> [(640, 480), (1920, 1080)]."""
+    sizes = []
+    for item in filter(None, (s.strip() for s in text.split(","))):
+        width, height = item.lower().split("x")
+        sizes.append((int(width), int(height)))
+    return sizes
+
+
+def parse_ints(text):
+    return [int(s) for s in text.split(",") if s.strip()]
+
+
+def write_results(path, suite, config, results):
+    report = {
+        "schema": SCHEMA_VERSION,
+        "suite": suite,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "environment": environment(),
+        "config": config,
+        "peak_rss_mb": peak_rss_mb(),
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if path in (None, "-"):
+        print(text)
+    else:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    return report
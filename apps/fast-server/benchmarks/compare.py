@@ -0,0 +1,70 @@
+"""
+Compares two benchmark result files (from benchmarks.micro or benchmarks.macro) case by case
+and exits with status 1 when any case regressed by more than --threshold.
+
+    python -m benchmarks.compare results/baseline.json results/candidate.json
+    python -m benchmarks.compare base.json new.json --metric p95_ms --threshold 0.05
+
+Latency metrics (*_ms) regress when they grow and throughput (images_per_s) when it shrinks.
+Cases present in only one file are listed but never fail the comparison.
+"""
+import argparse
+import json
+import sys
+
+
+def load(path):
+    with open(path, encoding="utf-8") as f:
+        report = json.load(f)
+    return report, {entry["name"]: entry for entry in report["results"]}
+
+
+def change(metric, before, after):
+    """Relative change, positive when `after` is worse."""
+    if not before:
+        return 0.0
+    delta = (after - before) / before
+    return -delta if metric == "images_per_s" else delta
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--metric", action="append",
+                        help="metric(s) to compare (default: p50_ms, plus images_per_s for macro results)")
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed relative slowdown (0.10 = 10%%)")
+    args = parser.parse_args(argv)
+
+    base_report, baseline = load(args.baseline)
+    cand_report, candidate = load(args.candidate)
+    if base_report["suite"] != cand_report["suite"]:
+        parser.error(f"cannot compare a {base_report['suite']} run with a {cand_report['suite']} run")
+    metrics = args.metric or (["p50_ms", "images_per_s"] if base_report["suite"] == "macro" else ["p50_ms"])
+    for label, report in (("baseline", base_report), ("candidate", cand_report)):
+        env = report["environment"]
+        print(f"{label}: {report['created']} git={env.get('git')} cpus={env.get('cpus')} models={report['config'].get('models')}")
+
+    regressions = 0
+    width = max((len(name) for name in baseline), default=10)
+    for name in sorted(baseline.keys() & candidate.keys()):
+        for metric in metrics:
+            before, after = baseline[name].get(metric), candidate[name].get(metric)
+            if before is None or after is None:
+                continue
+            worse = change(metric, before, after)
+            flag = "REGRESSION" if worse > args.threshold else ("improved" if worse < -args.threshold else "")
+            regressions += worse > args.threshold
+            print(f"{name:<{width}}  {metric:>12}  {before:>10.3f} -> {after:>10.3f}  {worse * 100:+7.1f}%  {flag}")
+
+    for name in sorted(baseline.keys() - candidate.keys()):
+        print(f"{name:<{width}}  only in baseline")
+    for name in sorted(candidate.keys() - baseline.keys()):
+        print(f"{name:<{width}}  only in candidate")
+
+    print(f"{regressions} regression(s) over {args.threshold * 100:.0f}%")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,185 @@
+"""
+Macro benchmark: load-tests the FastAPI endpoints in-process (httpx over ASGI, no sockets)
+with a sweep of concurrency levels and reports latency percentiles, images/sec and memory.
+
+    python -m benchmarks.macro --output results/macro.json
+    python -m benchmarks.macro --endpoints pothole,analyze --concurrency 1,4,16 --requests 200
+    python -m benchmarks.compare results/macro-before.json results/macro.json
+
+The whole server stack runs: upload parsing, model loading, executors and micro-batching,
+postprocessing and response encoding. Only the network is skipped. The result cache is
+turned off (RESULT_CACHE_ENABLED=0) so repeated uploads are really scored. With --models stub
+(or auto when weights are missing) the detectors use tiny generated ONNX models.
+
+503 responses (full executor queues) are counted as rejected, not as latency samples.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import time
+
+import cv2
+
+from .common import (
+    current_rss_mb, parse_ints, parse_sizes, peak_rss_mb, resolve_models, sample_images, summarize,
+    synthetic_image, use_model_dir, write_results,
+)
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("benchmarks.macro")
+
+
+def build_payloads(sizes):
+    """[(label, jpeg bytes)]: synthetic images of each size plus the sample images."""
+    payloads = []
+    for i, (w, h) in enumerate(sizes):
+        payloads.append((f"{w}x{h}", cv2.imencode(".jpg", synthetic_image(w, h, seed=i))[1].tobytes()))
+    for name, image in sample_images().items():
+        payloads.append((name, cv2.imencode(".jpg", image)[1].tobytes()))
+    return payloads
+
+
+class RssSampler:
+    """Tracks the highest resident set size seen while a load step runs."""
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.max_mb = current_rss_mb()
+        self._task = None
+
+    async def _run(self):
+        while True:
+            rss = current_rss_mb()
+            if rss is not None:
+                self.max_mb = max(self.max_mb or 0.0, rss)
+            await asyncio.sleep(self.interval)
+
+    def __enter__(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        return self
+
+    def __exit__(self, *exc):
+        self._task.cancel()
+
+
+async def run_step(client, endpoint, payloads, concurrency, total, form):
+    """Sends `total` requests to `endpoint` from `concurrency` concurrent clients."""
+    latencies, statuses = [], {}
+    counter = iter(range(total))
+
+    async def worker():
+        for i in counter:
+            label, data = payloads[i % len(payloads)]
+            started = time.perf_counter()
+            try:
+                response = await client.post(endpoint, files={"file": (f"{label}.jpg", data, "image/jpeg")}, data=form)
+                status = response.status_code
+            except Exception as e:
+                logger.error(f"{endpoint}: {e}")
+                status = "exception"
+            elapsed = (time.perf_counter() - started) * 1000
+            statuses[status] = statuses.get(status, 0) + 1
+            if status == 200:
+                latencies.append(elapsed)
+
+    with RssSampler() as rss:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        wall = time.perf_counter() - started
+
+    ok = statuses.get(200, 0)
+    return {
+        "requests": total,
+        "ok": ok,
+        "rejected": statuses.get(503, 0),
+        "errors": total - ok - statuses.get(503, 0),
+        "statuses": {str(k): v for k, v in sorted(statuses.items(), key=str)},
+        "wall_s": round(wall, 3),
+        "images_per_s": round(ok / wall, 2) if wall > 0 else None,
+        "rss_max_mb": rss.max_mb,
+        "peak_rss_mb": peak_rss_mb(),
+        **summarize(latencies),
+    }
+
+
+async def wait_ready(client, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        response = await client.get("/readyz")
+        if response.status_code == 200:
+            return response.json()
+        await asyncio.sleep(0.2)
+    raise TimeoutError(f"Server not ready after {timeout}s: {response.json()}")
+
+
+async def run(args, app_module):
+    import httpx
+
+    app = app_module.app
+    payloads = build_payloads(args.sizes)
+    results = []
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=args.timeout) as client:
+            started = time.perf_counter()
+            readiness = await wait_ready(client, args.timeout)
+            logger.info(f"Models ready in {time.perf_counter() - started:.1f}s, RSS {current_rss_mb()} MB")
+
+            for endpoint in args.endpoints:
+                path = f"/{endpoint}"
+                form = {"detectors": "all"} if endpoint == "analyze" else {"annotate": str(args.annotate).lower()}
+                await run_step(client, path, payloads, 1, min(len(payloads), args.warmup), form)
+                for concurrency in args.concurrency:
+                    step = await run_step(client, path, payloads, concurrency, args.requests, form)
+                    entry = {"name": f"{endpoint}[concurrency={concurrency}]", "endpoint": path, "concurrency": concurrency, **step}
+                    logger.info(
+                        f"{entry['name']}: {step['images_per_s']} img/s, p50 {step.get('p50_ms')} ms, "
+                        f"p99 {step.get('p99_ms')} ms, rejected {step['rejected']}, errors {step['errors']}"
+                    )
+                    results.append(entry)
+    return results, readiness
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--models", default="auto", choices=("auto", "real", "stub"))
+    parser.add_argument("--detections", type=int, default=10, help="boxes per image predicted by stand-in models")
+    parser.add_argument("--endpoints", default="pothole,garbage,analyze", help="comma-separated detector names and/or 'analyze'")
+    parser.add_argument("--concurrency", type=parse_ints, default="1,4,16", help="concurrency levels to sweep")
+    parser.add_argument("--requests", type=int, default=100, help="requests per concurrency level")
+    parser.add_argument("--warmup", type=int, default=5, help="untimed requests per endpoint")
+    parser.add_argument("--sizes", type=parse_sizes, default="640x480,1920x1080", help="synthetic upload sizes, WxH,...")
+    parser.add_argument("--no-annotate", dest="annotate", action="store_false", help="send annotate=false")
+    parser.add_argument("--timeout", type=float, default=120.0, help="per-request and model-loading timeout (s)")
+    parser.add_argument("--output", default="-", help="JSON results file ('-' for stdout)")
+    args = parser.parse_args(argv)
+    args.endpoints = [e.strip() for e in args.endpoints.split(",") if e.strip()]
+
+    # Read by app.py at import time
+    os.environ.setdefault("RESULT_CACHE_ENABLED", "0")
+    os.environ.setdefault("RESULT_LOG_PATH", os.path.join(tempfile.mkdtemp(prefix="bench_logs_"), "model_outputs.jsonl"))
+
+    model_dir, kind = resolve_models(args.models, detections=args.detections)
+    use_model_dir(model_dir)
+    import app as app_module
+
+    unknown = [e for e in args.endpoints if e != "analyze" and e not in app_module.DETECTOR_SPECS]
+    if unknown:
+        parser.error(f"unknown endpoint(s): {', '.join(unknown)}")
+
+    results, readiness = asyncio.run(run(args, app_module))
+    config = {
+        "models": kind, "detections": args.detections if kind == "stub" else None, "endpoints": args.endpoints,
+        "concurrency": args.concurrency, "requests": args.requests, "sizes": [f"{w}x{h}" for w, h in args.sizes],
+        "annotate": args.annotate,
+        "load_seconds": {name: state["load_seconds"] for name, state in readiness["detectors"].items()},
+    }
+    write_results(args.output, "macro", config, results)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
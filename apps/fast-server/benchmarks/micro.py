@@ -0,0 +1,179 @@
+"""
+Micro benchmarks: times the detector building blocks in-process on synthetic images of
+several sizes and on the sample images.
+
+    python -m benchmarks.micro --output results/micro.json
+    python -m benchmarks.micro --models stub --detections 0,10,50 --only predict_array
+    python -m benchmarks.compare results/micro-before.json results/micro.json
+
+Groups (--only): predict_onnx, predict_array, estimate_pothole_depth, determine_road_priority.
+With --models stub (or auto when weights are missing) every detector is replaced by a tiny
+generated ONNX model per --detections count, so postprocessing cost can be swept
+independently of the image content; with real models the detection count is whatever the
+model finds.
+"""
+import argparse
+import logging
+import os
+import sys
+
+import cv2
+import numpy as np
+
+from detection_code.base_detector import BaseDetector
+from detection_code.export import serving_model_path
+from detection_code.pothole_detector import determine_road_priority, estimate_pothole_depth
+from detection_code.registry import DETECTOR_SPECS
+
+from .common import (
+    parse_ints, parse_sizes, resolve_models, sample_images, summarize, synthetic_image, time_call, write_results,
+)
+from .stub_models import write_stub_models
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("benchmarks.micro")
+
+GROUPS = ("predict_onnx", "predict_array", "estimate_pothole_depth", "determine_road_priority")
+DEFAULT_SIZES = "320x240,640x480,1280x720,1920x1080,4032x3024"
+
+
+def result(group, params, samples, **extra):
+    key = ",".join(f"{k}={v}" for k, v in params.items())
+    entry = {"name": f"{group}[{key}]", "group": group, "params": params, **summarize(samples), **extra}
+    logger.info(f"{entry['name']}: p50 {entry['p50_ms']} ms, p95 {entry['p95_ms']} ms")
+    return entry
+
+
+def benchmark_images(sizes):
+    images = {f"{w}x{h}": synthetic_image(w, h, seed=i) for i, (w, h) in enumerate(sizes)}
+    images.update(sample_images())
+    return images
+
+
+def model_sets(args):
+    """[(detections label, model_dir)]: one stand-in set per --detections count, or the real models."""
+    model_dir, kind = resolve_models(args.models, detections=0)
+    if kind == "real":
+        return kind, [("model", model_dir)]
+    sets = []
+    for count in args.detections:
+        directory = os.path.join(model_dir, f"det{count}")
+        write_stub_models(directory, count)
+        sets.append((count, directory))
+    return kind, sets
+
+
+def detector_path(model_dir, name):
+    return serving_model_path(os.path.join(model_dir, os.path.basename(DETECTOR_SPECS[name]["model_path"])))
+
+
+def bench_predict_onnx(sets, images, args):
+    results = []
+    for detections, model_dir in sets:
+        onnx_models = [(n, p) for n, p in ((n, detector_path(model_dir, n)) for n in DETECTOR_SPECS) if p.endswith(".onnx")]
+        if not onnx_models:
+            logger.warning(f"No ONNX model in {model_dir}; skipping predict_onnx")
+            continue
+        name, path = onnx_models[0]
+        detector = BaseDetector(path)
+        for label, image in images.items():
+            samples = time_call(lambda: detector.predict_onnx(image, args.conf), args.repeat, args.warmup, args.min_seconds)
+            found = len(detector.predict_onnx(image, args.conf)[0])
+            results.append(result("predict_onnx", {"model": name, "image": label, "detections": detections}, samples, found=found))
+    return results
+
+
+def bench_predict_array(sets, images, args):
+    results = []
+    for detections, model_dir in sets:
+        for name, spec in DETECTOR_SPECS.items():
+            detector = spec["cls"](detector_path(model_dir, name))
+            for label, image in images.items():
+                samples = time_call(lambda: detector.predict_array(image, args.conf), args.repeat, args.warmup, args.min_seconds)
+                found = len(detector.predict_array(image, args.conf, annotate=False)[2])
+                params = {"detector": name, "image": label, "detections": detections}
+                results.append(result("predict_array", params, samples, found=found, model=os.path.basename(detector.model_path)))
+    return results
+
+
+def bench_depth(sizes, args):
+    """estimate_pothole_depth for an elliptical contour covering a fraction of the image."""
+    results = []
+    for i, (w, h) in enumerate(sizes):
+        image = synthetic_image(w, h, seed=i)
+        for fraction in (0.001, 0.01, 0.1):
+            # Ellipse area = pi * a * b; keep the image's aspect ratio
+            scale = np.sqrt(fraction * w * h / (np.pi * w * h / 4))
+            axes = (max(1, int(w / 2 * scale)), max(1, int(h / 2 * scale)))
+            contour = cv2.ellipse2Poly((w // 2, h // 2), axes, 0, 0, 360, 5).astype(np.int32)
+            samples = time_call(lambda: estimate_pothole_depth(image, contour), args.repeat, args.warmup, args.min_seconds)
+            results.append(result("estimate_pothole_depth", {"image": f"{w}x{h}", "area_fraction": fraction}, samples))
+    return results
+
+
+def synthetic_potholes(count, shape, seed=0):
+    rng = np.random.default_rng(seed)
+    h, w = shape
+    potholes = []
+    for i in range(count):
+        x1, y1 = int(rng.integers(0, w - 50)), int(rng.integers(0, h - 50))
+        potholes.append({
+            "id": i,
+            "bbox": [x1, y1, x1 + int(rng.integers(20, 50)), y1 + int(rng.integers(20, 50))],
+            "area_ratio": float(rng.uniform(0.0005, 0.01)),
+            "priority": str(rng.choice(["High", "Medium", "Low"])),
+        })
+    return potholes
+
+
+def bench_road_priority(args):
+    results = []
+    shape = (1080, 1920)
+    for count in (1, 10, 50, 200):
+        potholes = synthetic_potholes(count, shape)
+        samples = time_call(lambda: determine_road_priority(potholes, 150, shape), args.repeat, args.warmup, args.min_seconds)
+        results.append(result("determine_road_priority", {"potholes": count}, samples))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--models", default="auto", choices=("auto", "real", "stub"))
+    parser.add_argument("--sizes", type=parse_sizes, default=DEFAULT_SIZES, help="synthetic image sizes, WxH,...")
+    parser.add_argument("--detections", type=parse_ints, default="0,10,50", help="stand-in model detection counts")
+    parser.add_argument("--only", help=f"comma-separated groups ({', '.join(GROUPS)})")
+    parser.add_argument("--conf", type=float, default=0.25)
+    parser.add_argument("--repeat", type=int, default=20, help="timed calls per case")
+    parser.add_argument("--warmup", type=int, default=3, help="untimed calls per case")
+    parser.add_argument("--min-seconds", type=float, default=0.0, help="keep timing each case for at least this long")
+    parser.add_argument("--output", default="-", help="JSON results file ('-' for stdout)")
+    args = parser.parse_args(argv)
+
+    groups = GROUPS if not args.only else [g.strip() for g in args.only.split(",")]
+    unknown = set(groups) - set(GROUPS)
+    if unknown:
+        parser.error(f"unknown group(s): {', '.join(sorted(unknown))}")
+
+    results, kind = [], None
+    if {"predict_onnx", "predict_array"} & set(groups):
+        kind, sets = model_sets(args)
+        images = benchmark_images(args.sizes)
+        if "predict_onnx" in groups:
+            results += bench_predict_onnx(sets, images, args)
+        if "predict_array" in groups:
+            results += bench_predict_array(sets, images, args)
+    if "estimate_pothole_depth" in groups:
+        results += bench_depth(args.sizes, args)
+    if "determine_road_priority" in groups:
+        results += bench_road_priority(args)
+
+    config = {
+        "models": kind, "groups": list(groups), "sizes": [f"{w}x{h}" for w, h in args.sizes],
+        "detections": args.detections, "conf": args.conf, "repeat": args.repeat, "warmup": args.warmup,
+    }
+    write_results(args.output, "micro", config, results)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
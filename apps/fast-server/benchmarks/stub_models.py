@@ -0,0 +1,126 @@
+"""
+Tiny stand-in ONNX models with the same inputs and outputs as the ultralytics exports, so the
+benchmarks run offline when the real weights are absent.
+
+Each model runs one strided convolution over the input (so the forward pass still scales with
+the batch) and then emits a fixed prediction tensor holding `detections` non-overlapping boxes.
+That makes the postprocessing cost controllable: a model built with detections=50 produces
+exactly 50 detections on every image at the default confidence threshold.
+
+    python -m benchmarks.stub_models /tmp/stub_models --detections 20
+    MODEL_DIR=/tmp/stub_models python serve.py --workers 2
+"""
+import argparse
+import os
+
+import numpy as np
+import onnx
+from onnx import TensorProto, helper, numpy_helper
+
+from detection_code.export import exported_path
+from detection_code.registry import DETECTOR_SPECS
+
+# Detectors served from segmentation exports (boxes + 32 mask coefficients, plus protos)
+SEGMENTATION_DETECTORS = {"pothole"}
+
+NUM_MASKS = 32
+OPSET = 17
+
+
+def stub_predictions(detections, num_classes=1, num_masks=0, imgsz=640, seed=0):
+    """(4 + num_classes + num_masks, anchors) raw prediction tensor with `detections` boxes set."""
+    rng = np.random.default_rng(seed)
+    anchors = sum((imgsz // stride) ** 2 for stride in (8, 16, 32))
+    output = np.zeros((4 + num_classes + num_masks, anchors), dtype=np.float32)
+    output[2:4] = 1.0
+
+    # Boxes sit in a grid of cells so none of them suppress each other in NMS
+    per_row = max(1, int(np.ceil(np.sqrt(max(detections, 1)))))
+    cell = imgsz / per_row
+    slots = rng.choice(anchors, size=detections, replace=False)
+    for i, anchor in enumerate(slots):
+        row, col = divmod(i, per_row)
+        output[0, anchor] = (col + 0.5) * cell
+        output[1, anchor] = (row + 0.5) * cell
+        output[2, anchor] = cell * rng.uniform(0.4, 0.8)
+        output[3, anchor] = cell * rng.uniform(0.4, 0.8)
+        output[4 + i % num_classes, anchor] = rng.uniform(0.5, 0.95)
+        if num_masks:
+            output[4 + num_classes:, anchor] = rng.normal(0.0, 1.0, num_masks)
+            output[4 + num_classes, anchor] = 0.5
+    return output
+
+
+def stub_protos(num_masks=NUM_MASKS, imgsz=640, seed=0):
+    """Mask prototypes: a constant first channel and smooth random patterns for the rest."""
+    rng = np.random.default_rng(seed)
+    size = imgsz // 4
+    y, x = np.mgrid[0:size, 0:size].astype(np.float32) / size
+    protos = np.empty((num_masks, size, size), dtype=np.float32)
+    protos[0] = 1.0
+    for k in range(1, num_masks):
+        fx, fy, phase = rng.uniform(1, 6), rng.uniform(1, 6), rng.uniform(0, np.pi)
+        protos[k] = 0.5 * np.sin(2 * np.pi * (fx * x + fy * y) + phase)
+    return protos
+
+
+def make_stub_model(path, detections=10, num_classes=1, num_masks=0, imgsz=640, seed=0):
+    """Writes a stand-in YOLO export to `path` (dynamic batch, fixed imgsz x imgsz input)."""
+    predictions = stub_predictions(detections, num_classes, num_masks, imgsz, seed)
+    weight = np.random.default_rng(seed).normal(0.0, 0.1, (8, 3, 8, 8)).astype(np.float32)
+
+    initializers = [
+        numpy_helper.from_array(weight, "conv_w"),
+        numpy_helper.from_array(np.array(0.0, dtype=np.float32), "zero"),
+        numpy_helper.from_array(predictions[np.newaxis], "predictions"),
+        numpy_helper.from_array(np.array([-1, 1, 1], dtype=np.int64), "shape3"),
+    ]
+    nodes = [
+        helper.make_node("Conv", ["images", "conv_w"], ["features"], strides=[8, 8]),
+        helper.make_node("ReduceMean", ["features"], ["pooled"], axes=[1, 2, 3], keepdims=1),
+        # Zero with the batch dimension, so the constant outputs follow the input batch size
+        helper.make_node("Mul", ["pooled", "zero"], ["batch_zero"]),
+        helper.make_node("Reshape", ["batch_zero", "shape3"], ["batch_zero3"]),
+        helper.make_node("Add", ["batch_zero3", "predictions"], ["output0"]),
+    ]
+    outputs = [helper.make_tensor_value_info("output0", TensorProto.FLOAT, ["batch", predictions.shape[0], predictions.shape[1]])]
+    if num_masks:
+        initializers.append(numpy_helper.from_array(stub_protos(num_masks, imgsz, seed)[np.newaxis], "protos"))
+        nodes.append(helper.make_node("Add", ["batch_zero", "protos"], ["output1"]))
+        outputs.append(helper.make_tensor_value_info("output1", TensorProto.FLOAT, ["batch", num_masks, imgsz // 4, imgsz // 4]))
+
+    graph = helper.make_graph(
+        nodes, "stub_yolo",
+        [helper.make_tensor_value_info("images", TensorProto.FLOAT, ["batch", 3, imgsz, imgsz])],
+        outputs, initializers,
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", OPSET)], producer_name="stub_models")
+    model.ir_version = 8
+    onnx.checker.check_model(model)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    onnx.save(model, path)
+    return path
+
+
+def stub_model_path(directory, name):
+    """Where a stand-in for detector `name` goes so that MODEL_DIR=directory serves it."""
+    model_path = os.path.join(directory, os.path.basename(DETECTOR_SPECS[name]["model_path"]))
+    return exported_path(model_path) if model_path.endswith(".pt") else model_path
+
+
+def write_stub_models(directory, detections=10, names=None, seed=0):
+    """Writes a stand-in for every registered detector (or `names`); returns {name: path}."""
+    paths = {}
+    for i, name in enumerate(names or DETECTOR_SPECS):
+        num_masks = NUM_MASKS if name in SEGMENTATION_DETECTORS else 0
+        paths[name] = make_stub_model(stub_model_path(directory, name), detections, num_masks=num_masks, seed=seed + i)
+    return paths
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory")
+    parser.add_argument("--detections", type=int, default=10, help="boxes every stand-in model predicts")
+    args = parser.parse_args()
+    for name, path in write_stub_models(args.directory, args.detections).items():
+        print(f"{name}: {path}")
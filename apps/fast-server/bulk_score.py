@@ -0,0 +1,306 @@
+"""
+Scores a backlog of images offline, without the HTTP server: walks directories, globs or
+CSV/JSONL manifests, decodes ahead on a thread pool, runs the detectors in batches and
+writes one JSON line per (image, detector).
+
+    python bulk_score.py archive/ --detector pothole --output pothole.jsonl
+    python bulk_score.py "uploads/2024-*/*.jpg" manifest.csv --detector pothole,garbage --processes 4
+    python bulk_score.py manifest.jsonl --detector all --output scores.parquet --annotate annotated/
+
+Manifests list one image per row under a `path` column/key (--path-field); relative paths
+are resolved against the manifest's directory.
+
+The JSONL output doubles as the checkpoint: rerunning the same command after an interruption
+skips every (image, detector) already written. Use --overwrite to start again. For a
+.parquet output the lines are journalled to <output>.jsonl and converted once every image is
+scored (needs pyarrow or fastparquet).
+
+--processes N starts N worker processes, each with its own copy of the models and
+ORT_INTRA_OP_THREADS=1, which scales better across cores than one process with N threads.
+"""
+import argparse
+import csv
+import glob
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import get_context
+
+import cv2
+
+from detection_code.registry import DETECTOR_SPECS, load_detector
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".bmp", ".tif", ".tiff"}
+
+# Per-process state for the worker pool, set by _init_worker
+_worker = {}
+
+
+def manifest_paths(path, path_field):
+    base = os.path.dirname(os.path.abspath(path))
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.lower().endswith(".csv"):
+            rows = (row.get(path_field) for row in csv.DictReader(f))
+        else:
+            rows = (json.loads(line).get(path_field) for line in f if line.strip())
+        for value in rows:
+            if value:
+                yield value if os.path.isabs(value) else os.path.join(base, value)
+
+
+def iter_images(sources, path_field="path"):
+    """Yields image paths from directories (recursive), globs and .csv/.jsonl manifests, without duplicates."""
+    seen = set()
+    for source in sources:
+        if os.path.isdir(source):
+            paths = (
+                os.path.join(root, name)
+                for root, dirs, files in sorted(os.walk(source))
+                for name in sorted(files)
+                if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS
+            )
+        elif source.lower().endswith((".csv", ".jsonl")) and os.path.isfile(source):
+            paths = manifest_paths(source, path_field)
+        else:
+            paths = sorted(p for p in glob.glob(source, recursive=True) if os.path.isfile(p))
+        for path in paths:
+            path = os.path.normpath(path)
+            if path not in seen:
+                seen.add(path)
+                yield path
+
+
+def load_checkpoint(journal_path):
+    """
+    Returns the (path, detector) pairs already written to the journal. A line cut short by an
+    interruption is dropped and the file rewritten without it.
+    """
+    done, valid, broken = set(), [], False
+    if not os.path.exists(journal_path):
+        return done
+    with open(journal_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                broken = True
+                continue
+            done.add((record["path"], record["detector"]))
+            valid.append(line if line.endswith("\n") else line + "\n")
+    if broken:
+        logger.warning(f"Dropping incomplete lines from {journal_path}")
+        with open(journal_path, "w", encoding="utf-8") as f:
+            f.writelines(valid)
+    return done
+
+
+def chunked(iterator, size):
+    chunk = []
+    for item in iterator:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def read_image(path):
+    try:
+        return cv2.imread(path, cv2.IMREAD_COLOR)
+    except cv2.error:
+        return None
+
+
+def annotated_path(annotate_dir, name, path):
+    stem = os.path.splitext(os.path.splitdrive(os.path.abspath(path))[1].lstrip(os.sep))[0]
+    return os.path.join(annotate_dir, name, stem + ".jpg")
+
+
+def score_chunk(detectors, chunk, images, conf_threshold, annotate_dir=None):
+    """Runs every detector over one decoded chunk of (path, pending detector names); returns JSON records."""
+    records = []
+    loaded = [(path, names, image) for (path, names), image in zip(chunk, images) if image is not None]
+    for (path, names), image in zip(chunk, images):
+        if image is None:
+            records.extend({"path": path, "detector": name, "error": "unreadable image"} for name in names)
+
+    for name, detector in detectors.items():
+        todo = [(path, image) for path, names, image in loaded if name in names]
+        if not todo:
+            continue
+        started = time.perf_counter()
+        try:
+            outputs = detector.predict_batch([image for _, image in todo], conf_threshold, annotate=annotate_dir is not None)
+        except Exception as e:
+            logger.error(f"❌ {name} failed on a batch of {len(todo)}: {e}")
+            records.extend({"path": path, "detector": name, "error": str(e)[:200]} for path, _ in todo)
+            continue
+        per_image_ms = round((time.perf_counter() - started) * 1000 / len(todo), 2)
+
+        for (path, image), (annotated, priority, detections) in zip(todo, outputs):
+            if annotate_dir is not None and annotated is not None:
+                target = annotated_path(annotate_dir, name, path)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                cv2.imwrite(target, annotated)
+            records.append({
+                "path": path,
+                "detector": name,
+                "width": image.shape[1],
+                "height": image.shape[0],
+                "priority": priority,
+                "detections": detections,
+                "total_detections": len(detections),
+                "inference_ms": per_image_ms,
+            })
+    return records
+
+
+def _init_worker(names, model_format, precision, conf_threshold, annotate_dir, decode_threads):
+    # One intra-op thread per process; the processes provide the parallelism
+    os.environ.setdefault("ORT_INTRA_OP_THREADS", "1")
+    os.environ.setdefault("OMP_NUM_THREADS", "1")
+    cv2.setNumThreads(1)
+    _worker.update(
+        detectors={name: load_detector(name, model_format, precision) for name in names},
+        conf=conf_threshold,
+        annotate_dir=annotate_dir,
+        pool=ThreadPoolExecutor(max_workers=decode_threads, thread_name_prefix="decode"),
+    )
+
+
+def _score_in_worker(chunk):
+    images = list(_worker["pool"].map(read_image, [path for path, _ in chunk]))
+    return score_chunk(_worker["detectors"], chunk, images, _worker["conf"], _worker["annotate_dir"])
+
+
+def prefetched(chunks, pool, depth):
+    """Yields (chunk, images) with up to `depth` further chunks decoding in the background."""
+    pending = []
+    for chunk in chunks:
+        pending.append((chunk, [pool.submit(read_image, path) for path, _ in chunk]))
+        if len(pending) > depth:
+            chunk, futures = pending.pop(0)
+            yield chunk, [f.result() for f in futures]
+    for chunk, futures in pending:
+        yield chunk, [f.result() for f in futures]
+
+
+def parquet_available():
+    try:
+        import pandas  # noqa: F401
+    except ImportError:
+        return False
+    for engine in ("pyarrow", "fastparquet"):
+        try:
+            __import__(engine)
+            return True
+        except ImportError:
+            pass
+    return False
+
+
+def write_parquet(journal_path, output):
+    import pandas as pd
+
+    with open(journal_path, encoding="utf-8") as f:
+        records = [json.loads(line) for line in f]
+    frame = pd.DataFrame.from_records(records)
+    # Detections vary in shape between detectors, so they are stored as JSON text
+    if "detections" in frame:
+        frame["detections"] = frame["detections"].map(lambda d: json.dumps(d, default=str) if isinstance(d, list) else None)
+    frame.to_parquet(output, index=False)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("sources", nargs="+", help="directories, globs, or .csv/.jsonl manifests")
+    parser.add_argument("--detector", required=True, help=f"comma-separated detectors or 'all' ({', '.join(DETECTOR_SPECS)})")
+    parser.add_argument("--output", default="scores.jsonl", help=".jsonl or .parquet file")
+    parser.add_argument("--path-field", default="path", help="manifest column/key holding the image path")
+    parser.add_argument("--conf", type=float, default=0.25, help="confidence threshold")
+    parser.add_argument("--batch-size", type=int, default=16, help="images per forward pass")
+    parser.add_argument("--decode-threads", type=int, default=4, help="threads reading and decoding images")
+    parser.add_argument("--prefetch", type=int, default=2, help="batches decoded ahead of inference")
+    parser.add_argument("--processes", type=int, default=1, help="inference processes, each with its own models")
+    parser.add_argument("--model-format", default="auto", choices=("auto", "onnx", "pt"))
+    parser.add_argument("--precision", default="fp32", choices=("fp32", "int8"))
+    parser.add_argument("--annotate", metavar="DIR", help="also write annotated images under DIR/<detector>/")
+    parser.add_argument("--overwrite", action="store_true", help="ignore and replace existing results")
+    args = parser.parse_args(argv)
+
+    names = list(DETECTOR_SPECS) if args.detector == "all" else [n.strip() for n in args.detector.split(",") if n.strip()]
+    unknown = [n for n in names if n not in DETECTOR_SPECS]
+    if unknown or not names:
+        parser.error(f"unknown detector(s): {', '.join(unknown)}. Available: {', '.join(DETECTOR_SPECS)}")
+    if args.batch_size < 1 or args.processes < 1 or args.decode_threads < 1:
+        parser.error("--batch-size, --processes and --decode-threads must be at least 1")
+    parquet = args.output.lower().endswith(".parquet")
+    if parquet and not parquet_available():
+        parser.error("a .parquet output needs pandas with pyarrow or fastparquet installed")
+    journal_path = args.output + ".jsonl" if parquet else args.output
+
+    if args.overwrite and os.path.exists(journal_path):
+        os.remove(journal_path)
+    done = load_checkpoint(journal_path)
+    if done:
+        logger.info(f"♻️  Resuming: {len(done)} results already in {journal_path}")
+
+    def pending():
+        for path in iter_images(args.sources, args.path_field):
+            todo = [name for name in names if (path, name) not in done]
+            if todo:
+                yield path, todo
+
+    started = time.perf_counter()
+    scored = failed = batches = 0
+    chunks = chunked(pending(), args.batch_size)
+    with open(journal_path, "a", encoding="utf-8") as journal:
+        if args.processes > 1:
+            pool = get_context("spawn").Pool(
+                args.processes, _init_worker,
+                (names, args.model_format, args.precision, args.conf, args.annotate, args.decode_threads),
+            )
+            results = pool.imap(_score_in_worker, chunks)
+        else:
+            detectors = {name: load_detector(name, args.model_format, args.precision) for name in names}
+            pool = ThreadPoolExecutor(max_workers=args.decode_threads, thread_name_prefix="decode")
+            results = (
+                score_chunk(detectors, chunk, images, args.conf, args.annotate)
+                for chunk, images in prefetched(chunks, pool, args.prefetch)
+            )
+
+        try:
+            for records in results:
+                for record in records:
+                    journal.write(json.dumps(record, default=str) + "\n")
+                    failed += "error" in record
+                scored += len(records)
+                batches += 1
+                # One flush per batch keeps the checkpoint at most one batch behind
+                journal.flush()
+                if batches % 20 == 0:
+                    rate = scored / (time.perf_counter() - started)
+                    logger.info(f"📊 {scored} results ({failed} errors), {rate:.1f}/s")
+        finally:
+            if args.processes > 1:
+                pool.terminate()
+            else:
+                pool.shutdown(cancel_futures=True)
+
+    elapsed = time.perf_counter() - started
+    logger.info(f"✅ Scored {scored} (image, detector) pairs in {elapsed:.1f}s, {failed} errors -> {journal_path}")
+    if parquet:
+        write_parquet(journal_path, args.output)
+        logger.info(f"✅ Wrote {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
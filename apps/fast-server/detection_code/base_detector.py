@@ -1,22 +1,47 @@
-import cv2
 import numpy as np
-import onnxruntime as ort
-from ultralytics import YOLO
-import torch
-import ultralytics.nn
 import os
+import time
 import logging
+from .instrumentation import stage
+from .ops import decode_predictions, mask_contours, scale_boxes
+from .postprocess import DEFAULT_CONFIG, box_table, detection_records, draw_detections, overall_priority
+from .preprocess import InputBuffers, fill_batch
+from .runtime import SessionBinding, create_session, io_binding_enabled
+from .tiling import merge_tiles, tile_windows, tiling_settings
 
-# Safe loading is handled by ultralytics internally
+# ultralytics (and with it torch) is only imported when a .pt model is loaded
 
 logger = logging.getLogger(__name__)
 
+class InferenceError(RuntimeError):
+    """The model could not run on a batch (broken model, shape mismatch, out of memory...)."""
+
+class InferenceOptionError(ValueError):
+    """A request's inference option the model cannot run with, e.g. another imgsz for a fixed-size export."""
+
 class BaseDetector:
+    # Inference defaults, matching ultralytics' predict() defaults; requests can override them
+    iou_threshold = 0.7
+    max_det = 300
+    imgsz = 640
+    # Declarative postprocessing settings, merged over postprocess.DEFAULT_CONFIG
+    config = {}
+
     def __init__(self, model_path):
         self.model_path = model_path
+        self.config = {**DEFAULT_CONFIG, **type(self).config}
+        self.classes = self.config['classes']
         self.model = None
         self.model_type = None
+        self.io_binding = False
+        self.binding = None
+        self.fixed_imgsz = None
+        self.buffers = InputBuffers(self.imgsz)
+        self.tiling = tiling_settings()
+        self.load_seconds = None
+        started = time.perf_counter()
         self.load_model()
+        self.load_seconds = time.perf_counter() - started
 
     def load_model(self):
         """
@@ -30,6 +55,7 @@ class BaseDetector:
 
         if ext == '.pt':
             try:
+                from ultralytics import YOLO
                 self.model = YOLO(self.model_path)
                 self.model_type = 'pytorch'
                 logger.info(f"✅ Successfully loaded PyTorch model: {os.path.basename(self.model_path)}")
@@ -38,8 +64,13 @@ class BaseDetector:
                 raise
         elif ext == '.onnx':
             try:
-                self.model = ort.InferenceSession(self.model_path, providers=['CPUExecutionProvider'])
+                self.model = create_session(self.model_path)
                 self.model_type = 'onnx'
+                self.io_binding = io_binding_enabled()
+                self.binding = SessionBinding(self.model) if self.io_binding else None
+                # Exports without dynamic axes only accept the size they were exported at
+                input_size = self.model.get_inputs()[0].shape[2]
+                self.fixed_imgsz = input_size if isinstance(input_size, int) else None
                 logger.info(f"✅ Successfully loaded ONNX model: {os.path.basename(self.model_path)}")
             except Exception as e:
                 logger.error(f"❌ ONNX model loading failed: {e}")
@@ -47,116 +78,203 @@ class BaseDetector:
         else:
             raise ValueError(f"Unsupported model format: {ext}. Supported: .pt, .onnx")
 
+    def input_size(self, imgsz=None):
+        """
+        The model input size for a request: `imgsz` when given, else the model's own.
+        Raises InferenceOptionError when an ONNX export with a fixed input size is asked for another one.
+        """
+        if imgsz is None:
+            return self.fixed_imgsz or self.imgsz
+        if self.fixed_imgsz and imgsz != self.fixed_imgsz:
+            raise InferenceOptionError(f"{os.path.basename(self.model_path)} only accepts imgsz={self.fixed_imgsz}, got {imgsz}")
+        return imgsz
+
+    @staticmethod
+    def preprocess(images, size=640):
+        """
+        Letterboxes BGR images into an RGB float32 (N,3,size,size) batch.
+        Returns (batch, letterbox) where letterbox holds each image's (ratio, pad).
+        The result only depends on the images, so ONNX detectors can share it; it is freshly
+        allocated, unlike a detector's own InputBuffers.
+        """
+        batch = np.empty((len(images), 3, size, size), dtype=np.float32)
+        return batch, fill_batch(images, batch, np.empty((size, size, 3), dtype=np.uint8))
+
     def predict_onnx(self, image_array, conf_threshold=0.25):
         """
         Prediction logic for standard YOLOv8/v11 ONNX models exported from ultralytics.
         """
+        boxes, scores, class_indices, _ = self.predict_onnx_batch([image_array], conf_threshold)[0]
+        return boxes, scores, class_indices
+
+    def predict_onnx_batch(self, images, conf_threshold=0.25, batch=None, iou_threshold=None, max_det=None, imgsz=None):
+        """
+        Runs a list of images through the ONNX model as one (N,3,imgsz,imgsz) batch.
+        Models exported with a fixed batch size of 1 are run image by image.
+        `batch` is the preprocess() output for `images`, when already computed; otherwise the
+        images are written into the detector's reusable InputBuffers.
+        iou_threshold, max_det and imgsz default to the class settings.
+        Returns (boxes, scores, class_indices, contours) per image, boxes in original pixels;
+        contours is None unless the model is a segmentation export.
+        Raises InferenceError when the model fails on the batch.
+        """
+        size = self.input_size(imgsz)
+        iou_threshold = self.iou_threshold if iou_threshold is None else iou_threshold
+        max_det = max_det or self.max_det
         try:
-            h, w = image_array.shape[:2]
+            # Only the detector's own buffers are stable enough to keep bound between calls
+            binding = self.binding if batch is None else None
+            if batch is None:
+                with stage('preprocess'):
+                    batch = self.buffers.preprocess(images, size)
+            tensor, meta = batch
 
-            # Preprocess image
-            img_resized = cv2.resize(image_array, (640, 640))
-            img_norm = img_resized.transpose(2, 0, 1).astype('float32') / 255.0
-            img_batch = np.expand_dims(img_norm, axis=0)
+            def run(inputs):
+                return binding.run(inputs) if binding is not None else self.model.run(None, inputs)
 
             # Run inference
-            outputs = self.model.run(None, {'images': img_batch})
-            output_data = outputs[0]  # Shape: (1, 4+num_classes+1, num_detections) or similar
+            batch_dim = self.model.get_inputs()[0].shape[0]
+            with stage('forward'):
+                if isinstance(batch_dim, int) and batch_dim != len(images):
+                    runs = [run({'images': tensor[i:i + 1]}) for i in range(len(images))]
+                    outputs = [np.concatenate(parts) for parts in zip(*runs)]
+                else:
+                    outputs = run({'images': tensor})
+
+            output_data = outputs[0]
+            logger.debug(f"ONNX output shape: {output_data.shape} for model {self.model_path}")
+
+            if len(output_data.shape) == 2:
+                # Legacy exports without a batch dimension: (5, 8400) or (14, 8400)
+                output_data = output_data[np.newaxis]
+            # Segmentation exports append 32 mask coefficients per anchor plus a protos output
+            num_masks = outputs[1].shape[1] if len(outputs) > 1 else 0
 
-            print(f"DEBUG: ONNX output shape: {output_data.shape} for model {self.model_path}")
+            results = []
+            with stage('decode_output'):
+                for i, (output, image_array, (ratio, pad)) in enumerate(zip(output_data, images, meta)):
+                    boxes, scores, class_indices, coefficients = decode_predictions(
+                        output, conf_threshold, iou_threshold, max_det, num_masks
+                    )
+                    contours = None
+                    if num_masks and len(boxes) > 0:
+                        contours = mask_contours(coefficients, outputs[1][i], boxes, ratio, pad, image_array.shape, tensor.shape[2])
+                    boxes = scale_boxes(boxes, ratio, pad, image_array.shape)
+                    results.append((boxes, scores, class_indices, contours))
+            return results
 
-            # Handle different output formats from ultralytics ONNX export
-            if len(output_data.shape) == 3:  # (1, 84, 8400) or (1, 5, 8400) format
-                output = output_data[0]  # Remove batch dimension -> (84/5, 8400)
+        except Exception as e:
+            raise InferenceError(f"{os.path.basename(self.model_path)} failed on a batch of {len(images)}: {e}") from e
 
-                num_classes = 1  # Based on training code (single class: garbage/bad_streetlight)
+    def predict_pytorch_batch(self, images, conf_threshold=0.25, iou_threshold=None, max_det=None, imgsz=None):
+        """
+        Runs a list of images through the ultralytics model in a single call.
+        Returns (boxes, scores, class_indices, contours) per image; contours is None
+        unless the model produces segmentation masks.
+        """
+        settings = {
+            'conf': conf_threshold,
+            'iou': self.iou_threshold if iou_threshold is None else iou_threshold,
+            'max_det': max_det or self.max_det,
+        }
+        if imgsz is not None:
+            # Otherwise ultralytics keeps the size the checkpoint was trained at
+            settings['imgsz'] = imgsz
+        with stage('forward'):
+            outputs = self.model(images, **settings)
 
-                if output.shape[0] == 5:  # [x,y,w,h,conf]
-                    boxes_xywh = output[:4, :]  # (4, 8400)
-                    conf_scores = output[4:5, :]  # (1, 8400)
-                    class_probs = np.zeros((1, 8400))  # No class probs for single class
+        results = []
+        for result in outputs:
+            if result.boxes is None or len(result.boxes) == 0:
+                results.append((np.array([]), np.array([]), np.array([]), None))
+                continue
 
-                elif output.shape[0] == 84:  # Standard COCO format [x,y,w,h] + 80 classes
-                    boxes_xywh = output[:4, :]
-                    conf_scores = np.max(output[4:, :], axis=0, keepdims=True)  # Max over classes
-                    class_indices_temp = np.argmax(output[4:, :], axis=0)
-                    class_probs = output[4:, :]
+            boxes = result.boxes.xyxy.cpu().numpy()
+            scores = result.boxes.conf.cpu().numpy()
+            classes = result.boxes.cls.cpu().numpy()
 
-                else:
-                    # Try to detect (5*num_detections) flattened or other formats
-                    if output.shape[1] % 5 == 0:  # Check if divisible by 5 (x,y,w,h,conf per detection)
-                        num_dets = output.shape[1] // 5
-                        output_reshaped = output.reshape(output.shape[0], 5, num_dets)
-                        if output_reshaped.shape[0] == 1:  # Single row?
-                            boxes_xywh = output_reshaped[0, :4, :]
-                            conf_scores = output_reshaped[0, 4:5, :]
-                            class_probs = np.zeros((1, num_dets))
-                        else:
-                            logger.error(f"Unexpected reshaped output shape: {output_reshaped.shape}")
-                            return np.array([]), np.array([]), np.array([])
-                    else:
-                        logger.error(f"Unsupported output format shape: {output.shape}")
-                        return np.array([]), np.array([]), np.array([])
-
-                # Transpose to (num_detections, features)
-                boxes_xywh = boxes_xywh.T  # (8400, 4)
-                conf_scores = conf_scores.T  # (8400, 1)
-
-                # For single class models, class index is always 0
-                class_indices = np.zeros(len(boxes_xywh), dtype=int)
-
-                # Use object confidence directly (since single class)
-                scores = conf_scores.flatten()
-
-            elif len(output_data.shape) == 2 and output_data.shape[1] == 8400:
-                # Legacy format: (2, 8400) or (14, 8400) - from older exports
-                output_data = output_data[0]  # Take first batch
-                if output_data.shape[0] == 5:  # [x,y,w,h,conf]
-                    boxes_xywh = output_data[:4, :].T
-                    scores = output_data[4, :]
-                    class_indices = np.zeros(len(scores), dtype=int)
-                elif output_data.shape[0] == 14:  # Better format with classes
-                    boxes_xywh = output_data[:4, :].T
-                    conf_scores = output_data[4:, :].T
-                    class_indices = np.argmax(conf_scores, axis=1)
-                    scores = np.max(conf_scores, axis=1)
-                else:
-                    logger.error(f"Unsupported legacy shape[0]: {output_data.shape[0]}")
-                    return np.array([]), np.array([]), np.array([])
+            # Check for instance segmentation masks
+            if hasattr(result, 'masks') and result.masks is not None and len(result.masks.xy) > 0:
+                contours = [c.astype(np.int32) for c in result.masks.xy]
             else:
-                logger.error(f"Unsupported output shape: {output_data.shape}")
-                return np.array([]), np.array([]), np.array([])
+                contours = None
+            results.append((boxes, scores, classes, contours))
+        return results
 
-            # Apply confidence threshold
-            valid_idx = scores > conf_threshold
-            boxes_xywh = boxes_xywh[valid_idx]
-            scores = scores[valid_idx]
-            class_indices = class_indices[valid_idx]
+    def predict_raw(self, images, conf_threshold=0.25, batch=None, **options):
+        """
+        (boxes, scores, class_indices, contours) per image, from whichever runtime holds the model.
+        `options` are iou_threshold, max_det and imgsz overrides.
+        """
+        if self.model_type == 'pytorch':
+            return self.predict_pytorch_batch(images, conf_threshold, **options)
+        return self.predict_onnx_batch(images, conf_threshold, batch, **options)
 
-            if len(boxes_xywh) == 0:
-                return np.array([]), np.array([]), np.array([])
+    def predict_tiled(self, images, conf_threshold=0.25, **options):
+        """
+        Sliced inference for large images: each image is cut into overlapping tiles (see
+        tiling.tile_windows) plus one full view for objects larger than a tile, all crops run
+        through the model `batch` at a time, and the boxes are merged back per image.
+        Returns the same per-image tuples as predict_raw.
+        """
+        settings = self.tiling
+        crops, owners = [], []
+        for i, image_array in enumerate(images):
+            h, w = image_array.shape[:2]
+            windows = [(0, 0, w, h)] + tile_windows(image_array.shape, settings['size'], settings['overlap'], settings['max_tiles'])
+            for x0, y0, x1, y1 in windows:
+                crops.append(image_array[y0:y1, x0:x1])
+                owners.append((i, (x0, y0)))
 
-            # Convert from normalized xywh to pixel xyxy coordinates
-            x_scale = boxes_xywh[:, 0] * w
-            y_scale = boxes_xywh[:, 1] * h
-            w_scale = boxes_xywh[:, 2] * w
-            h_scale = boxes_xywh[:, 3] * h
+        parts = [[] for _ in images]
+        step = max(1, settings['batch'])
+        for start in range(0, len(crops), step):
+            raw_outputs = self.predict_raw(crops[start:start + step], conf_threshold, **options)
+            for (i, offset), raw in zip(owners[start:start + step], raw_outputs):
+                parts[i].append((raw, offset))
 
-            # Center-based to corner-based
-            x1 = np.maximum(0, x_scale - w_scale / 2)
-            y1 = np.maximum(0, y_scale - h_scale / 2)
-            x2 = np.minimum(w, x_scale + w_scale / 2)
-            y2 = np.minimum(h, y_scale + h_scale / 2)
+        with stage('merge_tiles'):
+            max_det = options.get('max_det') or self.max_det
+            return [merge_tiles(image_parts, settings['merge_ios'], max_det) for image_parts in parts]
 
-            boxes_xyxy = np.column_stack([x1, y1, x2, y2]).astype(np.float32)
+    def predict_batch(self, images, conf_threshold=0.25, batch=None, annotate=True, tiled=False, **options):
+        """
+        Runs detection on several images with one forward pass.
+        ONNX models reuse `batch` when given; ultralytics models preprocess on their own.
+        With annotate=False no image copy is made or drawn on and annotated_image is None.
+        With tiled=True images larger than the tiling min_side go through predict_tiled.
+        `options` (iou_threshold, max_det, imgsz) override the class defaults for this call.
+        Returns a list of (annotated_image, overall_priority, detections), one per image.
+        """
+        large = [i for i, image in enumerate(images) if max(image.shape[:2]) > self.tiling['min_side']] if tiled else []
+        if large:
+            raw_outputs = [None] * len(images)
+            for i, raw in zip(large, self.predict_tiled([images[i] for i in large], conf_threshold, **options)):
+                raw_outputs[i] = raw
+            small = [i for i in range(len(images)) if raw_outputs[i] is None]
+            if small:
+                for i, raw in zip(small, self.predict_raw([images[i] for i in small], conf_threshold, **options)):
+                    raw_outputs[i] = raw
+        else:
+            raw_outputs = self.predict_raw(images, conf_threshold, batch, **options)
+        with stage('postprocess'):
+            return [self.postprocess(image, *raw, annotate=annotate) for image, raw in zip(images, raw_outputs)]
 
-            return boxes_xyxy, scores, class_indices
+    def predict_array(self, image_array, conf_threshold=0.25, annotate=True, tiled=False, **options):
+        return self.predict_batch([image_array], conf_threshold, annotate=annotate, tiled=tiled, **options)[0]
 
-        except Exception as e:
-            logger.error(f"ONNX prediction error: {e}")
-            import traceback
-            traceback.print_exc()
-            return np.array([]), np.array([]), np.array([])
+    def postprocess(self, image_array, boxes, scores, classes, contours=None, annotate=True):
+        """
+        Config-driven postprocessing shared by the detectors (see postprocess.DEFAULT_CONFIG):
+        all boxes are filtered, sized and prioritised as arrays, then turned into detections.
+        Detectors with their own logic (potholes) override this.
+        """
+        table = box_table(boxes, scores, classes, image_array.shape, self.config)
+        priority = overall_priority(table, self.config)
+        detections = detection_records(table, self.config)
 
-    def predict_array(self, image_array, conf_threshold=0.25):
-        raise NotImplementedError("Each detector must implement its own predict_array method.")
+        annotated = None
+        if annotate:
+            with stage('annotate'):
+                annotated = draw_detections(image_array.copy(), table, self.config, self.config['colors'].get(priority, (0, 255, 0)))
+        return annotated, priority, detections
@@ -0,0 +1,135 @@
+import numpy as np
+
+# Neighbouring grid cells that can hold a point within one cell size: the cell itself plus
+# half of its 8 neighbours (the other half is covered when those cells are visited)
+_FORWARD_NEIGHBOURS = ((0, 0), (1, -1), (1, 0), (1, 1), (0, 1))
+
+# Distances computed at once between two cells, and edges kept before they are folded into
+# component labels: together they bound memory when many points pile up in a few cells
+_BLOCK_DISTANCES = 1 << 20
+_MAX_EDGES = 1 << 22
+
+
+def _components(n, first, second):
+    """
+    Connected-component labels for n nodes and the edges first[k]-second[k]: each node ends up
+    labelled with the smallest index in its component. Alternates min-label hooking along the
+    edges with pointer jumping, all in numpy, so dense clusters with many edges stay cheap.
+    """
+    labels = np.arange(n)
+    while True:
+        lowest = np.minimum(labels[first], labels[second])
+        hooked = labels.copy()
+        np.minimum.at(hooked, first, lowest)
+        np.minimum.at(hooked, second, lowest)
+        # Follow the label chains to their roots
+        while True:
+            jumped = hooked[hooked]
+            if np.array_equal(jumped, hooked):
+                break
+            hooked = jumped
+        if np.array_equal(hooked, labels):
+            return labels
+        labels = hooked
+
+
+def _close_pairs(points, members, others, threshold):
+    """
+    Yields (members, others) index arrays of the pairs between two cells closer than
+    `threshold`, computing the distance matrix a block of rows at a time.
+    """
+    rows = max(1, _BLOCK_DISTANCES // len(others))
+    targets = points[others]
+    for start in range(0, len(members), rows):
+        block = members[start:start + rows]
+        diff = points[block][:, None, :] - targets[None, :, :]
+        a, b = np.nonzero(np.sqrt((diff ** 2).sum(axis=2)) < threshold)
+        yield block[a], others[b]
+
+
+def _fold_edges(n, first, second):
+    """
+    Folds edge lists into one edge from each node to its component's label: the same
+    components, in at most n edges.
+    """
+    labels = _components(n, np.concatenate(first), np.concatenate(second))
+    linked = np.nonzero(labels != np.arange(n))[0]
+    return [linked], [labels[linked]]
+
+
+def cluster_points(points, threshold):
+    """
+    Single-linkage clustering: two points share a cluster when a chain of points links them
+    with every hop shorter than `threshold` (Euclidean, strictly less).
+
+    Points are bucketed into a grid of threshold-sized cells, so each point is only compared
+    with the points in its own and the adjacent cells, and each pair of cells is compared in
+    vectorised blocks of rows. Runs in near-linear time unless points pile up in a few cells;
+    memory stays bounded even then, as edges are folded into component labels as they accumulate.
+    Returns clusters as lists of indices into `points`, ordered by their smallest index.
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    n = len(points)
+    if n == 0:
+        return []
+    first, second, edges = [], [], 0
+    if threshold > 0:
+        cells = {}
+        for i, cell in enumerate(map(tuple, np.floor(points / threshold).astype(np.int64))):
+            cells.setdefault(cell, []).append(i)
+        cells = {cell: np.array(members) for cell, members in cells.items()}
+
+        for (cx, cy), members in cells.items():
+            for dx, dy in _FORWARD_NEIGHBOURS:
+                others = cells.get((cx + dx, cy + dy))
+                if others is None:
+                    continue
+                for a, b in _close_pairs(points, members, others, threshold):
+                    first.append(a)
+                    second.append(b)
+                    edges += len(a)
+                    if edges > _MAX_EDGES:
+                        first, second = _fold_edges(n, first, second)
+                        edges = len(first[0])
+
+    labels = _components(n, np.concatenate(first), np.concatenate(second)) if first else np.arange(n)
+    clusters = {}
+    for i, label in enumerate(labels.tolist()):
+        clusters.setdefault(label, []).append(i)
+    return list(clusters.values())
+
+
+def detection_points(detections, anchor="top_left"):
+    """(N, 2) points for detections with an [x1, y1, x2, y2] 'bbox': top-left corners or centres."""
+    boxes = np.asarray([d["bbox"][:4] for d in detections], dtype=np.float64).reshape(-1, 4)
+    if anchor == "center":
+        return (boxes[:, :2] + boxes[:, 2:]) / 2
+    if anchor == "top_left":
+        return boxes[:, :2]
+    raise ValueError(f"Unsupported anchor: {anchor}. Supported: top_left, center")
+
+
+def cluster_detections(detections, threshold, anchor="top_left", points=None):
+    """
+    Groups detections lying within `threshold` of each other (chained), e.g. the potholes of
+    one image, or the detections of a whole survey once their positions share one frame of
+    reference. `points` overrides the bbox-derived positions, such as projected map
+    coordinates for detections gathered across many images.
+    Returns a list of clusters, each a list of indices into `detections`.
+    """
+    if points is None:
+        points = detection_points(detections, anchor)
+    return cluster_points(points, threshold)
+
+
+def summarize_clusters(detections, clusters):
+    """Per-cluster size, member indices and the box enclosing all members' bboxes."""
+    summaries = []
+    for members in clusters:
+        boxes = np.asarray([detections[i]["bbox"][:4] for i in members], dtype=np.float64)
+        summaries.append({
+            "size": len(members),
+            "members": list(members),
+            "bbox": [float(boxes[:, 0].min()), float(boxes[:, 1].min()), float(boxes[:, 2].max()), float(boxes[:, 3].max())],
+        })
+    return summaries
@@ -0,0 +1,172 @@
+import logging
+import os
+
+import cv2
+import numpy as np
+
+from .base_detector import BaseDetector
+
+logger = logging.getLogger(__name__)
+
+PRECISIONS = ('fp32', 'int8')
+
+
+def exported_path(model_path, precision='fp32'):
+    """models/x.pt -> models/x.onnx, or models/x.int8.onnx for precision='int8'."""
+    stem = os.path.splitext(model_path)[0]
+    return f"{stem}.int8.onnx" if precision == 'int8' else f"{stem}.onnx"
+
+
+def is_current(source, target):
+    """True when target exists and is not older than source."""
+    return os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(source)
+
+
+def serving_model_path(model_path, model_format='auto', precision='fp32'):
+    """
+    Model file to serve for a configured model path.
+    'auto' uses the exported ONNX next to a .pt model when it is up to date and falls back
+    to the .pt otherwise; 'onnx' requires the export; 'pt' always serves the original.
+    """
+    if not model_path.endswith('.pt') or model_format == 'pt':
+        return model_path
+    if model_format not in ('auto', 'onnx'):
+        raise ValueError(f"Unsupported model format: {model_format}. Supported: auto, onnx, pt")
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unsupported precision: {precision}. Supported: {', '.join(PRECISIONS)}")
+
+    onnx_path = exported_path(model_path, precision)
+    if os.path.exists(onnx_path) and (not os.path.exists(model_path) or is_current(model_path, onnx_path)):
+        return onnx_path
+    if model_format == 'onnx':
+        raise FileNotFoundError(f"No up-to-date ONNX export for {model_path}; run prepare_models.py first")
+    return model_path
+
+
+def export_onnx(model_path, imgsz=640, force=False):
+    """Exports an ultralytics .pt model to ONNX with a dynamic batch dimension (cached by mtime)."""
+    onnx_path = exported_path(model_path)
+    if not force and is_current(model_path, onnx_path):
+        logger.info(f"♻️  {onnx_path} is up to date")
+        return onnx_path
+
+    from ultralytics import YOLO
+    exported = YOLO(model_path).export(format='onnx', imgsz=imgsz, dynamic=True, simplify=False)
+    if os.path.abspath(exported) != os.path.abspath(onnx_path):
+        os.replace(exported, onnx_path)
+    logger.info(f"✅ Exported {model_path} -> {onnx_path}")
+    return onnx_path
+
+
+class _CalibrationReader:
+    """Feeds preprocessed calibration images to onnxruntime's static quantizer one at a time."""
+
+    def __init__(self, image_paths, imgsz):
+        self._paths = iter(image_paths)
+        self.imgsz = imgsz
+
+    def get_next(self):
+        for path in self._paths:
+            image = cv2.imread(path, cv2.IMREAD_COLOR)
+            if image is not None:
+                batch, _ = BaseDetector.preprocess([image], self.imgsz)
+                return {'images': batch}
+        return None
+
+
+def quantize_onnx(model_path, calibration_images, imgsz=640, force=False):
+    """
+    Writes an INT8 (QDQ, per-channel weights) copy of the ONNX export of model_path, calibrated
+    on calibration_images. Static quantisation is used because dynamic quantisation leaves
+    the convolutions, which dominate YOLO, in float.
+    """
+    from onnxruntime.quantization import CalibrationMethod, QuantFormat, QuantType, quantize_static
+
+    onnx_path = exported_path(model_path)
+    int8_path = exported_path(model_path, 'int8')
+    if not force and is_current(onnx_path, int8_path):
+        logger.info(f"♻️  {int8_path} is up to date")
+        return int8_path
+    if not calibration_images:
+        raise ValueError("INT8 quantisation needs at least one calibration image")
+
+    quantize_static(
+        onnx_path, int8_path, _CalibrationReader(calibration_images, imgsz),
+        quant_format=QuantFormat.QDQ, per_channel=True,
+        activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8,
+        calibrate_method=CalibrationMethod.MinMax,
+    )
+    logger.info(f"✅ Quantised {onnx_path} -> {int8_path} ({len(calibration_images)} calibration images)")
+    return int8_path
+
+
+def _box_iou_matrix(a, b):
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-9)
+
+
+def _mask_iou(contour_a, contour_b, shape):
+    mask_a = np.zeros(shape[:2], dtype=np.uint8)
+    mask_b = np.zeros(shape[:2], dtype=np.uint8)
+    if len(contour_a):
+        cv2.drawContours(mask_a, [contour_a], -1, 1, -1)
+    if len(contour_b):
+        cv2.drawContours(mask_b, [contour_b], -1, 1, -1)
+    union = np.count_nonzero(mask_a | mask_b)
+    return np.count_nonzero(mask_a & mask_b) / union if union else 1.0
+
+
+def match_boxes(ref_boxes, ref_classes, cand_boxes, cand_classes, match_iou=0.5):
+    """Greedily pairs same-class boxes of two outputs by IoU; returns [(ref_index, cand_index, iou)]."""
+    if len(ref_boxes) == 0 or len(cand_boxes) == 0:
+        return []
+    ious = _box_iou_matrix(np.asarray(ref_boxes, dtype=np.float64).reshape(-1, 4), np.asarray(cand_boxes, dtype=np.float64).reshape(-1, 4))
+    ious[np.asarray(ref_classes)[:, None] != np.asarray(cand_classes)[None, :]] = 0.0
+    pairs = []
+    while True:
+        i, j = np.unravel_index(np.argmax(ious), ious.shape)
+        if ious[i, j] < match_iou:
+            return pairs
+        pairs.append((int(i), int(j), float(ious[i, j])))
+        ious[i, :] = 0.0
+        ious[:, j] = 0.0
+
+
+def compare_models(reference_path, candidate_path, images, conf_threshold=0.25, match_iou=0.5):
+    """
+    Runs both models on the images and matches their detections greedily by box IoU.
+    Returns totals plus mean box/mask IoU and the largest confidence difference of matched pairs.
+    """
+    reference, candidate = BaseDetector(reference_path), BaseDetector(candidate_path)
+    stats = {'images': 0, 'reference': 0, 'candidate': 0, 'matched': 0, 'box_iou': [], 'mask_iou': [], 'max_conf_delta': 0.0}
+
+    for image in images:
+        ref_boxes, ref_scores, ref_classes, ref_contours = _raw_predictions(reference, image, conf_threshold)
+        cand_boxes, cand_scores, cand_classes, cand_contours = _raw_predictions(candidate, image, conf_threshold)
+        stats['images'] += 1
+        stats['reference'] += len(ref_boxes)
+        stats['candidate'] += len(cand_boxes)
+        for i, j, iou in match_boxes(ref_boxes, ref_classes, cand_boxes, cand_classes, match_iou):
+            stats['matched'] += 1
+            stats['box_iou'].append(iou)
+            stats['max_conf_delta'] = max(stats['max_conf_delta'], abs(float(ref_scores[i]) - float(cand_scores[j])))
+            if ref_contours is not None and cand_contours is not None:
+                stats['mask_iou'].append(_mask_iou(ref_contours[i], cand_contours[j], image.shape))
+
+    stats['box_iou'] = float(np.mean(stats['box_iou'])) if stats['box_iou'] else None
+    stats['mask_iou'] = float(np.mean(stats['mask_iou'])) if stats['mask_iou'] else None
+    total = max(stats['reference'], stats['candidate'])
+    stats['agreement'] = stats['matched'] / total if total else 1.0
+    return stats
+
+
+def _raw_predictions(detector, image, conf_threshold):
+    if detector.model_type == 'pytorch':
+        return detector.predict_pytorch_batch([image], conf_threshold)[0]
+    return detector.predict_onnx_batch([image], conf_threshold)[0]
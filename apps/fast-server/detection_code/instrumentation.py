@@ -0,0 +1,30 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# Per-thread {stage: seconds} collector, active only inside collect_stages()
+_local = threading.local()
+
+
+@contextmanager
+def stage(name):
+    """Times a block of detector code; a no-op unless collect_stages() is active on this thread."""
+    timings = getattr(_local, 'timings', None)
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0.0) + time.perf_counter() - started
+
+
+@contextmanager
+def collect_stages():
+    """Collects the stage() timings recorded by the calling thread into a dict."""
+    _local.timings = {}
+    try:
+        yield _local.timings
+    finally:
+        _local.timings = None
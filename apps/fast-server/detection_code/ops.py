@@ -0,0 +1,160 @@
+import cv2
+import numpy as np
+
+# Masks thresholded and cropped together in mask_contours; bounds the (chunk, size, size)
+# float32 working set to ~26 MB
+MASK_CHUNK = 16
+
+
+def letterbox(image_array, size=640, color=(114, 114, 114)):
+    """
+    Resizes keeping the aspect ratio and pads to size x size, matching ultralytics' LetterBox.
+    Returns (padded_image, (ratio_x, ratio_y), (pad_x, pad_y)); the per-axis ratios
+    account for each side being rounded to whole pixels.
+    """
+    h, w = image_array.shape[:2]
+    ratio = min(size / h, size / w)
+    new_w, new_h = int(round(w * ratio)), int(round(h * ratio))
+    pad_x, pad_y = (size - new_w) / 2, (size - new_h) / 2
+
+    if (new_w, new_h) != (w, h):
+        image_array = cv2.resize(image_array, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    top, bottom = int(round(pad_y - 0.1)), int(round(pad_y + 0.1))
+    left, right = int(round(pad_x - 0.1)), int(round(pad_x + 0.1))
+    padded = cv2.copyMakeBorder(image_array, top, bottom, left, right, cv2.BORDER_CONSTANT, value=color)
+    return padded, (new_w / w, new_h / h), (left, top)
+
+
+def xywh_to_xyxy(boxes):
+    xyxy = np.empty_like(boxes)
+    half_w, half_h = boxes[:, 2] / 2, boxes[:, 3] / 2
+    xyxy[:, 0] = boxes[:, 0] - half_w
+    xyxy[:, 1] = boxes[:, 1] - half_h
+    xyxy[:, 2] = boxes[:, 0] + half_w
+    xyxy[:, 3] = boxes[:, 1] + half_h
+    return xyxy
+
+
+def box_iou(box, boxes):
+    """IoU of one xyxy box against an (N, 4) array of xyxy boxes."""
+    x1 = np.maximum(box[0], boxes[:, 0])
+    y1 = np.maximum(box[1], boxes[:, 1])
+    x2 = np.minimum(box[2], boxes[:, 2])
+    y2 = np.minimum(box[3], boxes[:, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return inter / np.maximum(area + areas - inter, 1e-9)
+
+
+def box_ios(box, boxes):
+    """Intersection over the smaller box's area, of one xyxy box against an (N, 4) array."""
+    x1 = np.maximum(box[0], boxes[:, 0])
+    y1 = np.maximum(box[1], boxes[:, 1])
+    x2 = np.minimum(box[2], boxes[:, 2])
+    y2 = np.minimum(box[3], boxes[:, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return inter / np.maximum(np.minimum(area, areas), 1e-9)
+
+
+def nms(boxes, scores, iou_threshold=0.7, max_det=300, overlap=box_iou):
+    """
+    Greedy non-maximum suppression; returns kept indices, highest score first.
+    `overlap` measures boxes against each other (box_iou, or box_ios for merging tiles).
+    """
+    order = np.argsort(-scores)
+    keep = []
+    while order.size and len(keep) < max_det:
+        i = order[0]
+        keep.append(i)
+        if order.size == 1:
+            break
+        ious = overlap(boxes[i], boxes[order[1:]])
+        order = order[1:][ious <= iou_threshold]
+    return np.array(keep, dtype=np.int64)
+
+
+def batched_nms(boxes, scores, class_indices, iou_threshold=0.7, max_det=300, overlap=box_iou):
+    """
+    Class-aware NMS: boxes of different classes never suppress each other. Each class is
+    shifted by more than the boxes' coordinate span (ultralytics' max_wh offset, sized to the
+    boxes at hand so it also holds for tiled or uncapped high-resolution images).
+    """
+    if len(boxes) == 0:
+        return np.array([], dtype=np.int64)
+    boxes = boxes.astype(np.float64)
+    span = boxes.max() - min(boxes.min(), 0.0) + 1
+    offset_boxes = boxes + (class_indices * span)[:, None]
+    return nms(offset_boxes, scores, iou_threshold, max_det, overlap)
+
+
+def decode_predictions(output, conf_threshold=0.25, iou_threshold=0.7, max_det=300, num_masks=0):
+    """
+    Decodes one image's raw YOLOv8/v11 head output (4 + num_classes + num_masks, anchors),
+    boxes in input-pixel xywh, into NMS-filtered xyxy boxes in input (letterboxed) pixels.
+    Returns (boxes, scores, class_indices, mask_coefficients); mask_coefficients is None
+    unless num_masks > 0.
+    """
+    num_classes = output.shape[0] - 4 - num_masks
+    # Best score per anchor, read along the contiguous class rows; only anchors above the
+    # threshold (a handful of the 8400) are then gathered and transposed
+    scores = output[4:4 + num_classes].max(axis=0)
+    candidates = np.flatnonzero(scores > conf_threshold)
+    scores = scores[candidates]
+    predictions = output[:, candidates].T  # (candidates, 4 + nc + nm)
+    class_indices = predictions[:, 4:4 + num_classes].argmax(axis=1)
+
+    boxes = xywh_to_xyxy(predictions[:, :4])
+    keep = batched_nms(boxes, scores, class_indices, iou_threshold, max_det)
+    coefficients = predictions[keep, 4 + num_classes:] if num_masks else None
+    return boxes[keep], scores[keep], class_indices[keep], coefficients
+
+
+def scale_boxes(boxes, ratio, pad, image_shape):
+    """Maps xyxy boxes from letterboxed input pixels back to the original image and clips them."""
+    h, w = image_shape[:2]
+    boxes = boxes.copy()
+    boxes[:, [0, 2]] = ((boxes[:, [0, 2]] - pad[0]) / ratio[0]).clip(0, w)
+    boxes[:, [1, 3]] = ((boxes[:, [1, 3]] - pad[1]) / ratio[1]).clip(0, h)
+    return boxes
+
+
+def mask_contours(coefficients, protos, boxes, ratio, pad, image_shape, size=640):
+    """
+    Assembles segmentation masks from mask coefficients (N, nm) and prototypes (nm, mh, mw),
+    as ultralytics' process_mask does, and returns each mask's largest outer contour as an
+    int32 (K, 2) array in original image pixels. `boxes` are xyxy in letterboxed input pixels.
+    Thresholding, box cropping and unpadding run on MASK_CHUNK masks at a time as one array
+    operation. Upsampling stays one cv2.resize per mask, into a shared buffer: cv2's
+    multi-channel resize is slower than that. Resizing to the image size and cv2.findContours
+    also go mask by mask, since a full-resolution stack would take N x height x width bytes.
+    """
+    h, w = image_shape[:2]
+    nm, mh, mw = protos.shape
+    new_w, new_h = int(round(w * ratio[0])), int(round(h * ratio[1]))
+    logits = (coefficients @ protos.reshape(nm, -1)).astype(np.float32).reshape(-1, mh, mw)
+
+    # Each box as unpadded row and column ranges, to clear everything outside it (ultralytics' crop_mask)
+    cols = rows = np.arange(size)
+    inside_x = ((cols >= boxes[:, 0:1]) & (cols < boxes[:, 2:3]))[:, pad[0]:pad[0] + new_w]  # (N, new_w)
+    inside_y = ((rows >= boxes[:, 1:2]) & (rows < boxes[:, 3:4]))[:, pad[1]:pad[1] + new_h]
+
+    upsampled = np.empty((min(MASK_CHUNK, len(boxes)), size, size), dtype=np.float32)
+    contours = []
+    for start in range(0, len(boxes), MASK_CHUNK):
+        end = min(start + MASK_CHUNK, len(boxes))
+        for k in range(start, end):
+            cv2.resize(logits[k], (size, size), dst=upsampled[k - start], interpolation=cv2.INTER_LINEAR)
+        masks = upsampled[:end - start, pad[1]:pad[1] + new_h, pad[0]:pad[0] + new_w] > 0
+        masks &= inside_y[start:end, :, None] & inside_x[start:end, None, :]
+
+        for mask in masks.view(np.uint8):
+            mask = cv2.resize(mask, (w, h), interpolation=cv2.INTER_NEAREST)
+            found, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+            if found:
+                contours.append(max(found, key=cv2.contourArea).reshape(-1, 2).astype(np.int32))
+            else:
+                contours.append(np.zeros((0, 2), dtype=np.int32))
+    return contours
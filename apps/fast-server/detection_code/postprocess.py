@@ -0,0 +1,112 @@
+import cv2
+import numpy as np
+
+# Settings every declarative detector starts from; each detector's `config` overrides them
+DEFAULT_CONFIG = {
+    'classes': {},              # class index -> class name
+    'bbox': 'float',            # 'float' reports model coordinates, 'int' truncates them to pixels
+    'drop_invalid': False,      # drop boxes with x1 >= x2 or y1 >= y2 (checked after the bbox conversion)
+    'clamp': False,             # clamp boxes into the image, keeping them at least 1 pixel wide
+    'area_thresholds': None,    # {'high': ratio, 'medium': ratio}: size category by share of the image area
+    'detection_priority': None, # fixed 'priority' reported on every detection
+    'class_index': False,       # report the raw 'class_index' on every detection
+    'priority_rules': (),       # [(priority, {count: minimum, ...}), ...]: the first rule met wins
+    'default_priority': 'low',
+    'colors': {},               # overall priority -> BGR box colour
+    'line_width': 2,
+    'font_scale': 0.6,
+}
+
+
+def box_table(boxes, scores, class_indices, image_shape, config):
+    """
+    Vectorised per-box bookkeeping for one image: converts, validates and clamps all boxes at
+    once and computes their area ratios and size categories.
+    Returns a dict of arrays ('ids', 'boxes', 'scores', 'class_indices', 'area_ratios',
+    'size_categories'), one row per kept box; 'ids' are indices into the model output.
+    """
+    h, w = image_shape[:2]
+    boxes = np.asarray(boxes).reshape(-1, 4)
+    scores = np.asarray(scores).reshape(-1)
+    class_indices = np.asarray(class_indices).reshape(-1)
+    if config['bbox'] == 'int':
+        # astype truncates towards zero, like int()
+        boxes = boxes.astype(np.int64)
+
+    ids = np.arange(len(boxes))
+    if config['drop_invalid']:
+        valid = (boxes[:, 0] < boxes[:, 2]) & (boxes[:, 1] < boxes[:, 3])
+        ids, boxes = ids[valid], boxes[valid]
+
+    if config['clamp']:
+        boxes = boxes.copy()
+        boxes[:, 0] = boxes[:, 0].clip(0, w - 1)
+        boxes[:, 1] = boxes[:, 1].clip(0, h - 1)
+        boxes[:, 2] = np.maximum(boxes[:, 0] + 1, np.minimum(w, boxes[:, 2]))
+        boxes[:, 3] = np.maximum(boxes[:, 1] + 1, np.minimum(h, boxes[:, 3]))
+
+    corners = boxes.astype(np.float64)
+    area_ratios = (corners[:, 2] - corners[:, 0]) * (corners[:, 3] - corners[:, 1]) / (h * w)
+    thresholds = config['area_thresholds']
+    if thresholds:
+        size_categories = np.where(area_ratios > thresholds['high'], 'high',
+                                   np.where(area_ratios > thresholds['medium'], 'medium', 'low'))
+    else:
+        size_categories = None
+
+    return {
+        'ids': ids,
+        'boxes': boxes,
+        'scores': scores[ids],
+        'class_indices': class_indices[ids],
+        'area_ratios': area_ratios,
+        'size_categories': size_categories,
+    }
+
+
+def overall_priority(table, config):
+    """
+    Applies the config's priority rules to the kept boxes. Rules count boxes per size category
+    ('high', 'medium', 'low') or in total ('total'), e.g. ('high', {'medium': 2}) reads
+    "two or more medium-sized boxes make the image high priority".
+    """
+    counts = {'total': len(table['ids'])}
+    if table['size_categories'] is not None:
+        for category in ('high', 'medium', 'low'):
+            counts[category] = int(np.count_nonzero(table['size_categories'] == category))
+    for priority, minimums in config['priority_rules']:
+        if all(counts.get(key, 0) >= minimum for key, minimum in minimums.items()):
+            return priority
+    return config['default_priority']
+
+
+def detection_records(table, config):
+    """The response's detection dicts for the kept boxes."""
+    classes = config['classes']
+    class_ids = table['class_indices'].astype(np.int64).tolist()
+    records = []
+    for i, class_id, bbox, score in zip(table['ids'].tolist(), class_ids, table['boxes'].tolist(), table['scores'].tolist()):
+        record = {'id': i, 'class': classes.get(class_id, 'unknown'), 'bbox': bbox, 'confidence': score}
+        if config['detection_priority']:
+            record['priority'] = config['detection_priority']
+        if config['class_index']:
+            record['class_index'] = class_id
+        records.append(record)
+    return records
+
+
+def draw_detections(image, table, config, color):
+    """Draws every kept box with a '<Class> (<SIZE or PRIORITY>) <score>' label."""
+    classes = config['classes']
+    tags = table['size_categories'] if table['size_categories'] is not None else [config['detection_priority'] or ''] * len(table['ids'])
+    font_scale, line_width = config['font_scale'], config['line_width']
+    for (x1, y1, x2, y2), score, class_id, tag in zip(
+        table['boxes'].astype(np.int64).tolist(), table['scores'].tolist(), table['class_indices'].astype(np.int64).tolist(), tags
+    ):
+        name = classes.get(class_id, 'unknown').replace('_', ' ').title()
+        label = f"{name} ({str(tag).upper()}) {score:.2f}"
+        cv2.rectangle(image, (x1, y1), (x2, y2), color, line_width)
+        label_size = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, font_scale, 2)[0]
+        cv2.rectangle(image, (x1, y1 - 25), (x1 + label_size[0], y1), color, -1)
+        cv2.putText(image, label, (x1, y1 - 8), cv2.FONT_HERSHEY_SIMPLEX, font_scale, (255, 255, 255), 2)
+    return image
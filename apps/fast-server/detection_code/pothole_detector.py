@@ -3,19 +3,32 @@ import numpy as np
 import logging
 from collections import Counter
 from .base_detector import BaseDetector
+from .clustering import cluster_detections
+from .instrumentation import stage
 
 logger = logging.getLogger(__name__)
 
-def estimate_pothole_depth(image, contour):
+def estimate_pothole_depth(image, contour, gray_image=None):
     """
     Estimates pothole depth score (0-1) based on shadow analysis using contour.
+    Pass gray_image (the image converted once with cv2.COLOR_BGR2GRAY) when scoring several
+    contours of the same image; only the contour's bounding box is masked and read.
     """
     try:
-        gray_image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        mask = np.zeros_like(gray_image)
-        cv2.drawContours(mask, [contour], 0, 255, -1)
+        if gray_image is None:
+            gray_image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        x, y, w, h = cv2.boundingRect(contour)
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x + w, gray_image.shape[1]), min(y + h, gray_image.shape[0])
+        if x1 <= x0 or y1 <= y0:
+            return 0.0
+
+        # Same pixels, in the same order, as masking the full frame
+        roi = gray_image[y0:y1, x0:x1]
+        mask = np.zeros(roi.shape, dtype=np.uint8)
+        cv2.drawContours(mask, [contour], 0, 255, -1, offset=(-x0, -y0))
 
-        pixel_values = gray_image[mask == 255]
+        pixel_values = roi[mask == 255]
         if pixel_values.size == 0:
             return 0.0
 
@@ -24,7 +37,7 @@ def estimate_pothole_depth(image, contour):
         return max(0.0, min(1.0, (0.7 * darkness_score) + (0.3 * contrast_score)))
 
     except Exception as e:
-        print(f"Could not estimate depth: {e}")
+        logger.warning(f"Could not estimate depth: {e}")
         return 0.0
 
 def get_individual_pothole_priority(area_ratio, depth_score):
@@ -49,19 +62,7 @@ def determine_road_priority(potholes_list, proximity_threshold, image_shape):
     high_count = sum(1 for p in potholes_list if p['priority'] == 'High')
     medium_count = sum(1 for p in potholes_list if p['priority'] == 'Medium')
 
-    clusters, processed = [], set()
-    for i, p1 in enumerate(potholes_list):
-        if i in processed: continue
-        cluster, q = [i], [i]
-        processed.add(i)
-        while q:
-            curr = q.pop(0)
-            for j, p2 in enumerate(potholes_list):
-                if j not in processed and np.linalg.norm(np.array(p1['bbox'][:2]) - np.array(p2['bbox'][:2])) < proximity_threshold:
-                    processed.add(j)
-                    cluster.append(j)
-                    q.append(j)
-        clusters.append(cluster)
+    clusters = cluster_detections(potholes_list, proximity_threshold)
 
     total_area_ratio = sum(p['area_ratio'] for p in potholes_list)
 
@@ -79,38 +80,24 @@ class PotholeDetector(BaseDetector):
     def __init__(self, model_path='models/Pothole-Detector.pt'):
         super().__init__(model_path)
 
-    def predict_array(self, image_array, conf_threshold=0.25):
-        """Predict on image array with pothole priority analysis"""
+    def postprocess(self, image_array, boxes, scores, classes, contours=None, annotate=True):
+        """Pothole priority analysis on raw model output; contours=None falls back to boxes"""
         h, w = image_array.shape[:2]
         image_area = h * w
         detections = []
-        annotated = image_array.copy()
-
-        if self.model_type == 'pytorch':
-            results = self.model(image_array, conf=conf_threshold)
-            result = results[0]
-            if result.boxes is not None and len(result.boxes) > 0:
-                boxes = result.boxes.xyxy.cpu().numpy()
-                scores = result.boxes.conf.cpu().numpy()
-
-                # Check for instance segmentation masks
-                if hasattr(result, 'masks') and result.masks is not None and len(result.masks.xy) > 0:
-                    contours = [c.astype(np.int32) for c in result.masks.xy]
-                else:
-                    contours = None  # Will use box fallback
-            else:
-                boxes, scores, contours = [], [], None
-        elif self.model_type == 'onnx':
-            boxes, scores, _ = self.predict_onnx(image_array, conf_threshold)
-            contours = None  # ONNX fallback to boxes
+        annotated = image_array.copy() if annotate else None
 
         if len(boxes) > 0 and len(scores) > 0:
+            # Converted once and shared by every pothole's depth estimate
+            gray_image = cv2.cvtColor(image_array, cv2.COLOR_BGR2GRAY)
             for i, (box, score) in enumerate(zip(boxes, scores)):
                 x1b, y1b, x2b, y2b = map(int, box)
 
                 # Calculate priority first to get color
-                # Create contour for area calculation - use mask if available for better area
-                if contours and i < len(contours):
+                # Create contour for area calculation - use mask if available for better area.
+                # Tiled merges give crops without masks an empty contour, so those use the box too
+                precise = bool(contours) and i < len(contours) and len(contours[i]) >= 3
+                if precise:
                     contour = contours[i]
                     contour_area = cv2.contourArea(contour)
                 else:
@@ -119,15 +106,9 @@ class PotholeDetector(BaseDetector):
                     contour_area = cv2.contourArea(contour)
 
                 area_ratio = contour_area / image_area
-                depth_score = estimate_pothole_depth(image_array, contour)
+                depth_score = estimate_pothole_depth(image_array, contour, gray_image)
                 priority, color = get_individual_pothole_priority(area_ratio, depth_score)
 
-                # Now draw with correct color
-                if contours and i < len(contours):
-                    cv2.drawContours(annotated, [contour], -1, color, 2)  # Draw precise contour
-                else:
-                    cv2.rectangle(annotated, (x1b, y1b), (x2b, y2b), color, 2)  # Draw bounding box
-
                 detections.append({
                     'id': i,
                     'class': 'pothole',
@@ -138,15 +119,23 @@ class PotholeDetector(BaseDetector):
                     'priority': priority
                 })
 
-                # Still draw priority label with confidence
-                label = f"Pothole ({priority.upper()}) ({score:.2f})"
-                label_y = min(y1b - 8, y2b - 10) if contour is None else y1b - 8
-                if label_y < 20:
-                    label_y = y2b + 20  # Below box if too high
-
-                label_size = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.6, 2)[0]
-                cv2.rectangle(annotated, (x1b, label_y - 20), (x1b + label_size[0], label_y), color, -1)
-                cv2.putText(annotated, label, (x1b, label_y), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
+                if annotate:
+                    with stage('annotate'):
+                        # Now draw with correct color
+                        if precise:
+                            cv2.drawContours(annotated, [contour], -1, color, 2)  # Draw precise contour
+                        else:
+                            cv2.rectangle(annotated, (x1b, y1b), (x2b, y2b), color, 2)  # Draw bounding box
+
+                        # Still draw priority label with confidence
+                        label = f"Pothole ({priority.upper()}) ({score:.2f})"
+                        label_y = min(y1b - 8, y2b - 10) if contour is None else y1b - 8
+                        if label_y < 20:
+                            label_y = y2b + 20  # Below box if too high
+
+                        label_size = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.6, 2)[0]
+                        cv2.rectangle(annotated, (x1b, label_y - 20), (x1b + label_size[0], label_y), color, -1)
+                        cv2.putText(annotated, label, (x1b, label_y), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
 
         # Prioritize based on detections but don't draw text
         road_priority, _, _ = determine_road_priority(detections, 150, (h, w))
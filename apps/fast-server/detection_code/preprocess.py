@@ -0,0 +1,70 @@
+import threading
+
+import cv2
+import numpy as np
+
+# Letterbox padding value, as ultralytics uses
+PAD_VALUE = 114
+
+
+def letterbox_into(image_array, canvas, color=PAD_VALUE):
+    """
+    Letterboxes a BGR image into `canvas`, a preallocated (size, size, 3) uint8 array: the
+    image is resized straight into its slot and only the borders are filled, so no resized or
+    padded copy is made. Pixels are identical to ops.letterbox.
+    Returns ((ratio_x, ratio_y), (pad_x, pad_y)) like ops.letterbox.
+    """
+    size = canvas.shape[0]
+    h, w = image_array.shape[:2]
+    ratio = min(size / h, size / w)
+    new_w, new_h = int(round(w * ratio)), int(round(h * ratio))
+    left, top = int(round((size - new_w) / 2 - 0.1)), int(round((size - new_h) / 2 - 0.1))
+
+    slot = canvas[top:top + new_h, left:left + new_w]
+    if (new_w, new_h) != (w, h):
+        cv2.resize(image_array, (new_w, new_h), dst=slot, interpolation=cv2.INTER_LINEAR)
+    else:
+        slot[...] = image_array
+    canvas[:top] = color
+    canvas[top + new_h:] = color
+    canvas[top:top + new_h, :left] = color
+    canvas[top:top + new_h, left + new_w:] = color
+    return (new_w / w, new_h / h), (left, top)
+
+
+def fill_batch(images, tensor, canvas):
+    """
+    Writes letterboxed images into `tensor` (N, 3, size, size) float32. BGR->RGB, HWC->CHW,
+    uint8->float32 and the /255 scaling happen in one pass straight into the tensor.
+    `canvas` is a (size, size, 3) uint8 scratch image. Returns each image's (ratio, pad).
+    """
+    meta = []
+    for i, image_array in enumerate(images):
+        meta.append(letterbox_into(image_array, canvas))
+        np.divide(canvas[:, :, ::-1].transpose(2, 0, 1), np.float32(255.0), out=tensor[i], dtype=np.float32)
+    return meta
+
+
+class InputBuffers:
+    """
+    Preallocated preprocessing buffers for one detector, one set per thread (thread executors
+    share a detector between workers) and input size. The input tensor grows to the largest
+    batch seen and is reused for every call, so steady-state preprocessing allocates nothing
+    per image. A batch returned by `preprocess` is only valid until the same thread's next call.
+    """
+
+    def __init__(self, size=640):
+        self.size = size
+        self._local = threading.local()
+
+    def preprocess(self, images, size=None):
+        """(tensor, meta) like BaseDetector.preprocess, written into this thread's buffers."""
+        size = size or self.size
+        buffers = self._local.__dict__.setdefault('buffers', {})
+        tensor, canvas = buffers.get(size, (None, None))
+        if tensor is None or tensor.shape[0] < len(images):
+            tensor = np.empty((len(images), 3, size, size), dtype=np.float32)
+            canvas = np.empty((size, size, 3), dtype=np.uint8)
+            buffers[size] = (tensor, canvas)
+        batch = tensor[:len(images)]
+        return batch, fill_batch(images, batch, canvas)
@@ -0,0 +1,32 @@
+import os
+
+from .brokensignage import BrokenSignageDetector
+from .export import serving_model_path
+from .fallentree import FallenTreeDetector
+from .garbage_detection import GarbageDetector
+from .pothole_detector import PotholeDetector
+from .streetlight_detector import StreetlightDetector
+
+# Model paths (MODEL_DIR points the server at another weights directory, e.g. benchmark stand-ins)
+MODEL_DIR = os.environ.get("MODEL_DIR", "models")
+POTHOLE_MODEL_PATH = os.path.join(MODEL_DIR, "Pothole-Detector.pt")
+FALLEN_TREE_MODEL_PATH = os.path.join(MODEL_DIR, "fallenTree.onnx")
+BROKEN_SIGNAGE_MODEL_PATH = os.path.join(MODEL_DIR, "bad_sign_detector.onnx")
+GARBAGE_MODEL_PATH = os.path.join(MODEL_DIR, "garbage_detection.pt")
+STREETLIGHT_MODEL_PATH = os.path.join(MODEL_DIR, "streetlight.pt")
+
+# Detector registry: endpoint -> detector class, model file, response keys and background
+# job priority (lower runs first: a fallen tree blocking a road before a garbage report)
+DETECTOR_SPECS = {
+    "pothole": {"cls": PotholeDetector, "model_path": POTHOLE_MODEL_PATH, "label": "Pothole detection", "priority_key": "road_priority", "job_priority": 1},
+    "fallentree": {"cls": FallenTreeDetector, "model_path": FALLEN_TREE_MODEL_PATH, "label": "Fallen tree detection", "priority_key": "fallentree_priority", "job_priority": 0},
+    "brokensignage": {"cls": BrokenSignageDetector, "model_path": BROKEN_SIGNAGE_MODEL_PATH, "label": "Broken signage detection", "priority_key": "brokensignage_priority", "job_priority": 2},
+    "garbage": {"cls": GarbageDetector, "model_path": GARBAGE_MODEL_PATH, "label": "Garbage detection", "priority_key": "garbage_priority", "job_priority": 3},
+    "streetlight": {"cls": StreetlightDetector, "model_path": STREETLIGHT_MODEL_PATH, "label": "Streetlight detection", "priority_key": "streetlight_priority", "job_priority": 2},
+}
+
+
+def load_detector(name, model_format="auto", precision="fp32"):
+    """Instantiates a registered detector in this process, for the command-line tools."""
+    spec = DETECTOR_SPECS[name]
+    return spec["cls"](serving_model_path(spec["model_path"], model_format, precision))
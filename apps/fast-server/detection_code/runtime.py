@@ -0,0 +1,127 @@
+import logging
+import os
+import threading
+
+import numpy as np
+import onnxruntime as ort
+
+logger = logging.getLogger(__name__)
+
+GRAPH_OPTIMIZATION_LEVELS = {
+    "disable": ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    "basic": ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    "extended": ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    "all": ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+
+
+def session_options():
+    """
+    ONNX Runtime session options from the environment:
+    ORT_INTRA_OP_THREADS / ORT_INTER_OP_THREADS (0 = ORT default), ORT_GRAPH_OPTIMIZATION
+    (disable/basic/extended/all, default all), ORT_ENABLE_MEM_ARENA (default 1) and
+    ORT_EXECUTION_MODE (sequential/parallel, default sequential).
+    Read in every worker process, so executors started with spawn see the same settings.
+    """
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = int(os.environ.get("ORT_INTRA_OP_THREADS", "0"))
+    options.inter_op_num_threads = int(os.environ.get("ORT_INTER_OP_THREADS", "0"))
+
+    level = os.environ.get("ORT_GRAPH_OPTIMIZATION", "all").lower()
+    if level not in GRAPH_OPTIMIZATION_LEVELS:
+        raise ValueError(f"Unsupported ORT_GRAPH_OPTIMIZATION: {level}. Supported: {', '.join(GRAPH_OPTIMIZATION_LEVELS)}")
+    options.graph_optimization_level = GRAPH_OPTIMIZATION_LEVELS[level]
+
+    options.enable_cpu_mem_arena = os.environ.get("ORT_ENABLE_MEM_ARENA", "1") != "0"
+    if os.environ.get("ORT_EXECUTION_MODE", "sequential").lower() == "parallel":
+        options.execution_mode = ort.ExecutionMode.ORT_PARALLEL
+    return options
+
+
+def io_binding_enabled():
+    """
+    ORT_IO_BINDING=1 runs ONNX models through SessionBinding: the input tensor is handed to ONNX
+    Runtime without a copy and outputs are written into reusable arrays instead of session.run().
+    """
+    return os.environ.get("ORT_IO_BINDING", "0") == "1"
+
+
+def create_session(model_path):
+    session = ort.InferenceSession(model_path, sess_options=session_options(), providers=['CPUExecutionProvider'])
+    options = session.get_session_options()
+    logger.info(
+        f"ONNX Runtime session for {os.path.basename(model_path)}: "
+        f"intra_op={options.intra_op_num_threads} inter_op={options.inter_op_num_threads} "
+        f"opt={options.graph_optimization_level.name} mem_arena={options.enable_cpu_mem_arena}"
+    )
+    return session
+
+
+# Output element types SessionBinding can preallocate
+_OUTPUT_DTYPES = {"tensor(float)": np.float32, "tensor(float16)": np.float16}
+
+
+class SessionBinding:
+    """
+    Reusable IO bindings for one session, one set per thread and input buffer.
+
+    The input is wrapped in an OrtValue over the caller's numpy buffer, so ONNX Runtime reads it
+    in place; outputs whose shape is known from the model (a symbolic leading dim is the batch
+    size) are written into preallocated arrays that are reused by every later run. Works with
+    the reusable buffers of preprocess.InputBuffers: the same buffer maps to the same binding.
+    Returned arrays are only valid until the same thread's next run with that input buffer.
+    """
+
+    max_bindings = 32
+
+    def __init__(self, session):
+        self.session = session
+        self._outputs = session.get_outputs()
+        self._local = threading.local()
+
+    def _output_shape(self, output, batch):
+        shape = list(output.shape)
+        if shape and not isinstance(shape[0], int):
+            shape[0] = batch
+        if output.type not in _OUTPUT_DTYPES or not all(isinstance(dim, int) for dim in shape):
+            return None
+        return tuple(shape)
+
+    def _bind(self, inputs):
+        binding = self.session.io_binding()
+        values = []
+        for name, array in inputs.items():
+            value = ort.OrtValue.ortvalue_from_numpy(np.ascontiguousarray(array))
+            binding.bind_ortvalue_input(name, value)
+            values.append(value)
+        batch = next(iter(inputs.values())).shape[0]
+        buffers = []
+        for output in self._outputs:
+            shape = self._output_shape(output, batch)
+            if shape is None:
+                # Dynamic shape: let ONNX Runtime allocate it on every run
+                binding.bind_output(output.name, 'cpu')
+                buffers.append(None)
+                continue
+            buffer = np.empty(shape, dtype=_OUTPUT_DTYPES[output.type])
+            binding.bind_output(output.name, 'cpu', element_type=buffer.dtype, shape=shape, buffer_ptr=buffer.ctypes.data)
+            buffers.append(buffer)
+        return binding, values, buffers
+
+    def run(self, inputs):
+        """Runs the session on {input_name: array} and returns every output as a numpy array."""
+        cache = getattr(self._local, 'bindings', None)
+        if cache is None:
+            cache = self._local.bindings = {}
+        key = tuple((name, array.__array_interface__['data'][0], array.shape) for name, array in inputs.items())
+        entry = cache.get(key)
+        if entry is None:
+            if len(cache) >= self.max_bindings:
+                cache.clear()
+            entry = cache[key] = self._bind(inputs)
+        binding, _, buffers = entry
+        self.session.run_with_iobinding(binding)
+        if all(buffer is not None for buffer in buffers):
+            return list(buffers)
+        allocated = binding.get_outputs()
+        return [buffer if buffer is not None else allocated[i].numpy() for i, buffer in enumerate(buffers)]
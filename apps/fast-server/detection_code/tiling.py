@@ -0,0 +1,78 @@
+import math
+import os
+
+import numpy as np
+
+from .ops import batched_nms, box_ios
+
+
+def tiling_settings():
+    """
+    Tiled inference settings from the environment:
+    TILE_SIZE (640), TILE_OVERLAP (fraction shared by neighbouring tiles, 0.2), TILE_MAX (tiles
+    per image, 16), TILE_MIN_SIDE (images whose longer side is at most this are not tiled,
+    960), TILE_BATCH (crops per forward pass, 8) and TILE_MERGE_IOS (intersection over the
+    smaller box above which overlapping boxes from different tiles are merged, 0.6).
+    """
+    return {
+        "size": int(os.environ.get("TILE_SIZE", "640")),
+        "overlap": float(os.environ.get("TILE_OVERLAP", "0.2")),
+        "max_tiles": int(os.environ.get("TILE_MAX", "16")),
+        "min_side": int(os.environ.get("TILE_MIN_SIDE", "960")),
+        "batch": int(os.environ.get("TILE_BATCH", "8")),
+        "merge_ios": float(os.environ.get("TILE_MERGE_IOS", "0.6")),
+    }
+
+
+def _starts(length, size, overlap):
+    if length <= size:
+        return [0]
+    stride = max(1, int(size * (1 - overlap)))
+    count = math.ceil((length - size) / stride) + 1
+    # Spread the tiles evenly so the last one ends exactly at the border
+    return [int(round(x)) for x in np.linspace(0, length - size, count)]
+
+
+def tile_windows(image_shape, tile_size=640, overlap=0.2, max_tiles=16):
+    """
+    (x0, y0, x1, y1) windows covering an image with overlapping tiles of tile_size pixels.
+    When more than max_tiles would be needed, the tiles are enlarged until they fit, so the
+    cost per image stays bounded (each tile is still resized to the model's input size).
+    """
+    h, w = image_shape[:2]
+    size = tile_size
+    while True:
+        xs, ys = _starts(w, size, overlap), _starts(h, size, overlap)
+        if len(xs) * len(ys) <= max(1, max_tiles):
+            break
+        size = int(math.ceil(size * 1.25))
+    return [(x, y, min(x + size, w), min(y + size, h)) for y in ys for x in xs]
+
+
+def merge_tiles(parts, merge_ios=0.6, max_det=300):
+    """
+    Combines per-crop predictions [((boxes, scores, class_indices, contours), (x0, y0))] of one
+    image into a single (boxes, scores, class_indices, contours) in image pixels. Boxes of the
+    same class that mostly cover one another (a full box and the part of it seen by a
+    neighbouring tile, or duplicates from overlapping tiles) keep only the highest score.
+    """
+    boxes, scores, classes, contours = [], [], [], []
+    has_masks = any(raw[3] is not None for raw, _ in parts if len(raw[0]))
+    for (part_boxes, part_scores, part_classes, part_contours), (x0, y0) in parts:
+        if len(part_boxes) == 0:
+            continue
+        boxes.append(np.asarray(part_boxes, dtype=np.float32) + np.array([x0, y0, x0, y0], dtype=np.float32))
+        scores.append(np.asarray(part_scores))
+        classes.append(np.asarray(part_classes))
+        if has_masks:
+            offset = np.array([x0, y0], dtype=np.int32)
+            if part_contours is None:
+                contours.extend(np.zeros((0, 2), dtype=np.int32) for _ in range(len(part_boxes)))
+            else:
+                contours.extend(np.asarray(c, dtype=np.int32).reshape(-1, 2) + offset for c in part_contours)
+
+    if not boxes:
+        return np.array([]), np.array([]), np.array([]), None
+    boxes, scores, classes = np.concatenate(boxes), np.concatenate(scores), np.concatenate(classes)
+    keep = batched_nms(boxes, scores, classes, merge_ios, max_det, overlap=box_ios)
+    return boxes[keep], scores[keep], classes[keep], [contours[i] for i in keep] if has_masks else None
@@ -0,0 +1,201 @@
+import logging
+from collections import namedtuple
+from itertools import islice
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SampledFrame = namedtuple("SampledFrame", ["index", "time_s", "image"])
+
+# Per-detection / per-frame priorities are 'High'/'medium'/... depending on the detector
+PRIORITY_RANK = {"low": 0, "medium": 1, "high": 2}
+
+
+def priority_rank(priority):
+    return PRIORITY_RANK.get(str(priority).lower(), -1) if priority is not None else -1
+
+
+def open_video(source):
+    capture = cv2.VideoCapture(source)
+    if not capture.isOpened():
+        raise ValueError(f"Cannot open video: {source}")
+    return capture
+
+
+def video_info(capture):
+    fps = capture.get(cv2.CAP_PROP_FPS) or 0.0
+    frames = int(capture.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+    return {
+        "fps": round(fps, 3),
+        "frames": frames,
+        "duration_s": round(frames / fps, 3) if fps > 0 else None,
+        "width": int(capture.get(cv2.CAP_PROP_FRAME_WIDTH)),
+        "height": int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+    }
+
+
+def sample_frames(capture, interval_s=1.0, scene_threshold=0.0, scene_check_s=0.2, max_frames=0):
+    """
+    Yields SampledFrame(index, time_s, image) from an opened cv2.VideoCapture, one frame at a time.
+
+    Without scene_threshold a frame is sampled every interval_s seconds. With it, frames are
+    checked every scene_check_s seconds and sampled when their 64x36 grey thumbnail differs from
+    the last sampled one by at least scene_threshold (mean absolute difference, 0-255), or
+    when interval_s has passed regardless. Skipped frames are only grabbed, never converted.
+    """
+    fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+    step = max(1, int(round(interval_s * fps)))
+    check_step = max(1, int(round(scene_check_s * fps))) if scene_threshold > 0 else step
+
+    index, sampled, last_index, last_thumb = -1, 0, None, None
+    while not max_frames or sampled < max_frames:
+        if not capture.grab():
+            break
+        index += 1
+        if index % check_step:
+            continue
+        due = last_index is None or index - last_index >= step
+        if scene_threshold <= 0 and not due:
+            continue
+        ok, image = capture.retrieve()
+        if not ok:
+            continue
+
+        if scene_threshold > 0:
+            thumb = cv2.resize(cv2.cvtColor(image, cv2.COLOR_BGR2GRAY), (64, 36), interpolation=cv2.INTER_AREA)
+            changed = last_thumb is None or np.abs(thumb.astype(np.int16) - last_thumb).mean() >= scene_threshold
+            if not (changed or due):
+                continue
+            last_thumb = thumb.astype(np.int16)
+
+        last_index = index
+        sampled += 1
+        yield SampledFrame(index, round(index / fps, 3), image)
+
+
+def take(iterator, size):
+    """Next `size` items of an iterator as a list (empty once exhausted)."""
+    return list(islice(iterator, size))
+
+
+def _iou(a, b):
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0.0, x2 - x1) * max(0.0, y2 - y1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+class ObjectTracker:
+    """
+    Merges per-frame detections of the same object across neighbouring sampled frames.
+
+    Detections are greedily matched to open tracks of the same class by box IoU. A track
+    closes once it goes unmatched for more than max_gap sampled frames; only open tracks are
+    compared against, so the work per frame does not grow with the length of the video.
+    Tracks seen in fewer than min_frames sampled frames are dropped as flicker.
+    """
+
+    def __init__(self, iou_threshold=0.3, max_gap=2, min_frames=1):
+        self.iou_threshold = iou_threshold
+        self.max_gap = max_gap
+        self.min_frames = min_frames
+        self.objects = []
+        self.frames = 0
+        self.priority = None
+        self._open = []
+        self._next_id = 0
+
+    def update(self, frame, detections, frame_priority=None):
+        self.frames += 1
+        if priority_rank(frame_priority) > priority_rank(self.priority):
+            self.priority = frame_priority
+
+        candidates = []
+        for d, detection in enumerate(detections):
+            for t, track in enumerate(self._open):
+                if track["class"] == detection["class"]:
+                    iou = _iou(track["last_bbox"], detection["bbox"])
+                    if iou >= self.iou_threshold:
+                        candidates.append((iou, d, t))
+
+        matched_detections, matched_tracks = set(), set()
+        for iou, d, t in sorted(candidates, reverse=True):
+            if d in matched_detections or t in matched_tracks:
+                continue
+            matched_detections.add(d)
+            matched_tracks.add(t)
+            self._extend(self._open[t], frame, detections[d])
+
+        for d, detection in enumerate(detections):
+            if d not in matched_detections:
+                self._open.append(self._start(frame, detection))
+
+        still_open = []
+        for track in self._open:
+            if self.frames - track["last_sample"] > self.max_gap:
+                self._close(track)
+            else:
+                still_open.append(track)
+        self._open = still_open
+
+    def finish(self):
+        """Closes every open track and returns all objects ordered by first appearance."""
+        for track in self._open:
+            self._close(track)
+        self._open = []
+        return sorted(self.objects, key=lambda o: (o["first_seen_s"], o["id"]))
+
+    def _start(self, frame, detection):
+        track = {
+            "id": self._next_id,
+            "class": detection["class"],
+            "first_seen_s": frame.time_s,
+            "first_frame": frame.index,
+            "frames": 0,
+            "max_confidence": 0.0,
+            "priority": None,
+        }
+        self._next_id += 1
+        self._extend(track, frame, detection)
+        return track
+
+    def _extend(self, track, frame, detection):
+        track["last_seen_s"] = frame.time_s
+        track["last_frame"] = frame.index
+        track["last_bbox"] = [float(v) for v in detection["bbox"]]
+        track["last_sample"] = self.frames
+        track["frames"] += 1
+        confidence = float(detection.get("confidence", 0.0))
+        if confidence >= track["max_confidence"]:
+            track["max_confidence"] = round(confidence, 4)
+            track["best_bbox"] = [int(round(v)) for v in detection["bbox"]]
+            track["best_time_s"] = frame.time_s
+        if priority_rank(detection.get("priority")) > priority_rank(track["priority"]):
+            track["priority"] = detection.get("priority")
+
+    def _close(self, track):
+        if track["frames"] < self.min_frames:
+            return
+        track.pop("last_bbox")
+        track.pop("last_sample")
+        self.objects.append(track)
+
+
+def analyze_video(capture, detector, conf_threshold=0.25, batch_size=8, tracker=None, **sampling):
+    """
+    Runs sampled frames through detector.predict_batch in batches and returns the tracker.
+    Only one batch of frames is held in memory at a time.
+    """
+    tracker = tracker or ObjectTracker()
+    frames = sample_frames(capture, **sampling)
+    while True:
+        batch = take(frames, batch_size)
+        if not batch:
+            break
+        outputs = detector.predict_batch([f.image for f in batch], conf_threshold, annotate=False)
+        for frame, (_, priority, detections) in zip(batch, outputs):
+            tracker.update(frame, detections, priority)
+    return tracker
@@ -0,0 +1,75 @@
+"""
+Exports the ultralytics .pt models to ONNX so the server can run them on ONNX Runtime
+without importing torch, optionally writes INT8 copies, and checks that the exports
+agree with the originals.
+
+    python prepare_models.py                      # export models/*.pt -> models/*.onnx
+    python prepare_models.py --int8 --check       # also quantise, then compare against the .pt
+    python prepare_models.py models/streetlight.pt --force
+
+The server picks the exports up automatically (MODEL_FORMAT=auto, MODEL_PRECISION=fp32|int8).
+"""
+import argparse
+import glob
+import json
+import logging
+import os
+import sys
+
+import cv2
+
+from detection_code.export import compare_models, export_onnx, exported_path, quantize_onnx
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# The sample images shipped next to the server double as calibration and parity inputs
+DEFAULT_IMAGES = "*_test_*.webp"
+
+
+def image_paths(pattern):
+    if os.path.isdir(pattern):
+        pattern = os.path.join(pattern, "*")
+    return sorted(p for p in glob.glob(pattern) if os.path.isfile(p))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("models", nargs="*", help="ultralytics .pt files (default: models/*.pt)")
+    parser.add_argument("--imgsz", type=int, default=640, help="export input size")
+    parser.add_argument("--int8", action="store_true", help="also write statically quantised <model>.int8.onnx files")
+    parser.add_argument("--images", default=DEFAULT_IMAGES, help="glob or directory of calibration / parity images")
+    parser.add_argument("--force", action="store_true", help="re-export even when the exports are up to date")
+    parser.add_argument("--check", action="store_true", help="compare each export against its .pt model")
+    parser.add_argument("--conf", type=float, default=0.25, help="confidence threshold used by --check")
+    parser.add_argument("--min-agreement", type=float, default=0.9,
+                        help="fail --check when fewer matched detections than this fraction")
+    args = parser.parse_args(argv)
+
+    models = args.models or sorted(glob.glob("models/*.pt"))
+    if not models:
+        parser.error("no .pt models found")
+    images = image_paths(args.images)
+    if (args.int8 or args.check) and not images:
+        parser.error(f"no images match {args.images}")
+
+    failed = False
+    for model_path in models:
+        export_onnx(model_path, args.imgsz, args.force)
+        candidates = [exported_path(model_path)]
+        if args.int8:
+            candidates.append(quantize_onnx(model_path, images, args.imgsz, args.force))
+
+        if args.check:
+            loaded = [image for image in (cv2.imread(p, cv2.IMREAD_COLOR) for p in images) if image is not None]
+            for candidate in candidates:
+                stats = compare_models(model_path, candidate, loaded, args.conf)
+                ok = stats["agreement"] >= args.min_agreement
+                failed |= not ok
+                print(json.dumps({"reference": model_path, "candidate": candidate, "ok": ok, **stats}))
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
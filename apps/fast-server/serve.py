@@ -0,0 +1,192 @@
+"""
+Production entry point: a pre-fork server running several uvicorn worker processes on one
+shared listening socket, in place of the single `uvicorn app:app --reload` dev process.
+
+    python serve.py --workers 4                       # 4 workers, cores split evenly between them
+    python serve.py --workers 4 --preload             # load ONNX models once, share them copy-on-write
+    python serve.py --workers 2 --cpus-per-worker 4   # pin each worker to 4 cores, 4 ORT threads each
+
+Every option can also be set through the environment (SERVE_WORKERS, SERVE_PRELOAD=1,
+SERVE_CPUS_PER_WORKER, SERVE_THREADS_PER_WORKER, SERVE_PIN_CPUS=0, HOST, PORT).
+
+--preload loads the eager ONNX models in this process before forking, so every worker maps
+the same weight pages instead of holding its own copy. ONNX Runtime thread pools do not
+survive fork(), so preloaded sessions run with one intra-op thread (ORT_INTRA_OP_THREADS=1)
+and the parallelism comes from the workers; .pt models and process executors are always
+loaded inside each worker after the fork. Without --preload each worker loads its own models
+and runs ORT (and torch, for .pt models) with --threads-per-worker threads.
+
+Each worker writes its own result log (model_outputs.w<N>.jsonl) and keeps its own caches
+and /metrics counters; image_format=ref links are only valid on the worker that made them,
+so use sticky routing for them or set RESULT_CACHE_DIR to share cached results.
+"""
+import argparse
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("serve")
+
+# Thread-count variables read by ONNX Runtime (see detection_code/runtime.py), torch and BLAS
+THREAD_ENV_VARS = ("ORT_INTRA_OP_THREADS", "OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS")
+
+
+def cpu_sets(workers, cpus_per_worker):
+    """Splits the CPUs this process may run on into one disjoint set per worker (round-robin when short)."""
+    cpus = sorted(os.sched_getaffinity(0))
+    per_worker = cpus_per_worker or max(1, len(cpus) // workers)
+    sets = []
+    for i in range(workers):
+        start = (i * per_worker) % len(cpus)
+        sets.append([cpus[(start + j) % len(cpus)] for j in range(min(per_worker, len(cpus)))])
+    return sets
+
+
+def worker_log_path(path, worker_id):
+    root, ext = os.path.splitext(path)
+    return f"{root}.w{worker_id}{ext}"
+
+
+def bind_socket(host, port, backlog=2048):
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def preload_models(app_module):
+    """Loads the eager models that are safe to share across fork() into this process."""
+    names = []
+    for name in app_module.eager_detectors():
+        try:
+            model_path = app_module.serving_model_path(app_module.active_model_source(name), app_module.MODEL_FORMAT, app_module.MODEL_PRECISION)
+        except (FileNotFoundError, ValueError):
+            continue
+        if model_path.endswith(".onnx") and app_module.executor_settings(name, model_path)["kind"] == "thread":
+            names.append(name)
+        else:
+            logger.info(f"{name}: not preloaded ({model_path} is loaded in each worker)")
+    app_module.model_loader.preload(names)
+    return names
+
+
+def run_worker(worker_id, sock, args, cpus, app_module):
+    """Body of one forked worker process; never returns."""
+    os.environ["SERVE_WORKER_ID"] = str(worker_id)
+    if cpus is not None:
+        os.sched_setaffinity(0, cpus)
+
+    # Read when each runtime is first imported / a session is created, so after the fork;
+    # with --preload ORT_INTRA_OP_THREADS is already pinned to 1
+    for var in THREAD_ENV_VARS:
+        os.environ.setdefault(var, str(args.threads_per_worker))
+    if app_module is None:
+        import app as app_module
+
+    log_path = worker_log_path(app_module.result_log.path, worker_id)
+    app_module.result_log.reopen(log_path)
+    logger.info(f"Worker {worker_id} (pid {os.getpid()}): cpus={cpus or 'all'}, result log {log_path}")
+
+    import uvicorn
+    config = uvicorn.Config(app_module.app, log_level=args.log_level, timeout_keep_alive=args.keep_alive)
+    uvicorn.Server(config).run(sockets=[sock])
+    os._exit(0)
+
+
+def main(argv=None):
+    env = os.environ.get
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=env("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(env("PORT", "8001")))
+    parser.add_argument("--workers", type=int, default=int(env("SERVE_WORKERS", "0")),
+                        help="worker processes (default: one per available CPU)")
+    parser.add_argument("--preload", action="store_true", default=env("SERVE_PRELOAD", "0") == "1",
+                        help="load ONNX models before forking and share them copy-on-write")
+    parser.add_argument("--cpus-per-worker", type=int, default=int(env("SERVE_CPUS_PER_WORKER", "0")),
+                        help="CPUs pinned to each worker (default: available CPUs / workers)")
+    parser.add_argument("--threads-per-worker", type=int, default=int(env("SERVE_THREADS_PER_WORKER", "0")),
+                        help="intra-op threads per worker without --preload (default: CPUs per worker)")
+    parser.add_argument("--no-pin", action="store_true", default=env("SERVE_PIN_CPUS", "1") == "0",
+                        help="do not pin workers to CPUs")
+    parser.add_argument("--log-level", default=env("LOG_LEVEL", "info"))
+    parser.add_argument("--keep-alive", type=int, default=int(env("KEEP_ALIVE", "5")))
+    args = parser.parse_args(argv)
+
+    available = len(os.sched_getaffinity(0))
+    args.workers = args.workers or available
+    sets = cpu_sets(args.workers, args.cpus_per_worker)
+    args.threads_per_worker = args.threads_per_worker or len(sets[0])
+
+    sock = bind_socket(args.host, args.port)
+    logger.info(f"🚀 Listening on http://{args.host}:{args.port} with {args.workers} worker(s)")
+
+    app_module = None
+    if args.preload:
+        if env("ORT_INTRA_OP_THREADS", "1") != "1":
+            logger.warning("--preload runs ONNX sessions with ORT_INTRA_OP_THREADS=1 (thread pools do not survive fork)")
+        os.environ["ORT_INTRA_OP_THREADS"] = "1"
+        os.environ["ORT_EXECUTION_MODE"] = "sequential"
+        import app as app_module
+        started = time.perf_counter()
+        preloaded = preload_models(app_module)
+        logger.info(f"📦 Preloaded {', '.join(preloaded) or 'no models'} in {time.perf_counter() - started:.1f}s")
+
+    children = {}
+
+    def spawn(worker_id):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            try:
+                run_worker(worker_id, sock, args, None if args.no_pin else sets[worker_id], app_module)
+            except BaseException:
+                logger.exception(f"Worker {worker_id} crashed")
+            finally:
+                os._exit(1)
+        children[pid] = worker_id
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    for worker_id in range(args.workers):
+        spawn(worker_id)
+
+    # Supervise: restart workers that die unexpectedly, exit once all have stopped on shutdown
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        worker_id = children.pop(pid, None)
+        if worker_id is None:
+            continue
+        if not stopping:
+            logger.warning(f"Worker {worker_id} (pid {pid}) exited with status {status}; restarting")
+            time.sleep(1)
+            spawn(worker_id)
+
+    logger.info("🛑 All workers stopped")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,54 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+
+class AnnotatedImageCache:
+    """
+    Short-lived store of encoded annotated images served by GET /annotated/{image_id}.
+
+    Entries expire after `ttl` seconds; the oldest entries are evicted first once either
+    `max_items` or `max_bytes` would be exceeded.
+    """
+
+    def __init__(self, ttl=120, max_items=256, max_bytes=64 * 1024 * 1024):
+        self.ttl = ttl
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # image_id -> (expires_at, data)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def put(self, data):
+        """Stores encoded image bytes and returns their id."""
+        image_id = uuid.uuid4().hex
+        with self._lock:
+            self._evict(len(data))
+            self._entries[image_id] = (time.monotonic() + self.ttl, data)
+            self._bytes += len(data)
+        return image_id
+
+    def get(self, image_id):
+        with self._lock:
+            entry = self._entries.get(image_id)
+            if entry is None:
+                return None
+            expires_at, data = entry
+            if expires_at < time.monotonic():
+                self._remove(image_id)
+                return None
+            return data
+
+    def _remove(self, image_id):
+        _, data = self._entries.pop(image_id)
+        self._bytes -= len(data)
+
+    def _evict(self, incoming):
+        now = time.monotonic()
+        while self._entries:
+            oldest_id, (expires_at, _) = next(iter(self._entries.items()))
+            full = len(self._entries) >= self.max_items or self._bytes + incoming > self.max_bytes
+            if expires_at >= now and not full:
+                break
+            self._remove(oldest_id)
@@ -0,0 +1,91 @@
+import asyncio
+import logging
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """
+    Gathers predict calls for one detector that arrive within a short window and runs
+    them as a single `predict_batch` job on the detector's executor.
+
+    With max_batch=1 or window_ms=0 every call goes straight to `predict_array`.
+    """
+
+    def __init__(self, executor, window_ms=10, max_batch=8):
+        self.executor = executor
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self._queue = None
+        self._task = None
+        self._loop = None
+        self._dispatches = set()
+
+    @property
+    def enabled(self):
+        return self.max_batch > 1 and self.window > 0
+
+    async def predict(self, image, conf_threshold=0.25, annotate=True, tiled=False, **options):
+        """
+        Returns (annotated_image, overall_priority, detections) for one image.
+        `options` are the detector's per-call overrides (iou_threshold, max_det, imgsz).
+        """
+        if not self.enabled:
+            metrics.BATCH_SIZE.observe(1, detector=self.executor.name)
+            return await self.executor.submit("predict_array", image, conf_threshold, annotate=annotate, tiled=tiled, **options)
+
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._task = loop.create_task(self._collect())
+
+        future = loop.create_future()
+        self._queue.put_nowait((image, (conf_threshold, annotate, tiled, tuple(sorted(options.items()))), future))
+        return await future
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.window
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            # Requests can only share a job when they use the same threshold, flags and options
+            groups = {}
+            for item in batch:
+                groups.setdefault(item[1], []).append(item)
+            for (conf_threshold, annotate, tiled, options), items in groups.items():
+                task = loop.create_task(self._dispatch(items, conf_threshold, annotate, tiled, dict(options)))
+                self._dispatches.add(task)
+                task.add_done_callback(self._dispatches.discard)
+
+    async def _dispatch(self, items, conf_threshold, annotate, tiled, options):
+        images = [image for image, _, _ in items]
+        metrics.BATCH_SIZE.observe(len(images), detector=self.executor.name)
+        try:
+            results = await self.executor.submit("predict_batch", images, conf_threshold, annotate=annotate, tiled=tiled, **options)
+        except Exception as e:
+            for _, _, future in items:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        logger.debug(f"{self.executor.name}: ran batch of {len(images)}")
+        for (_, _, future), result in zip(items, results):
+            # The caller may have gone away (client disconnect) while we waited
+            if not future.done():
+                future.set_result(result)
+
+    def shutdown(self):
+        if self._task is not None:
+            self._task.cancel()
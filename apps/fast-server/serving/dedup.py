@@ -0,0 +1,271 @@
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+from .images import image_dimensions
+
+_GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+_GEOHASH_INDEX = {c: i for i, c in enumerate(_GEOHASH_ALPHABET)}
+# Cell ids pack 5 bits per character into an int64
+MAX_GEOHASH_PRECISION = 12
+
+if hasattr(np, "bitwise_count"):
+    _popcount = np.bitwise_count
+else:
+    # numpy < 2.0: count bits byte by byte
+    _BYTE_BITS = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+    def _popcount(values):
+        return _BYTE_BITS[values.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+def dhash(image):
+    """64-bit difference hash of a BGR or grayscale image: one bit per horizontally adjacent pixel pair of a 9x8 thumbnail."""
+    small = cv2.resize(image, (9, 8), interpolation=cv2.INTER_AREA)
+    if small.ndim == 3:
+        small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    bits = np.packbits(small[:, 1:] > small[:, :-1])
+    return int.from_bytes(bits.tobytes(), "big")
+
+
+def fingerprint(contents):
+    """
+    (dhash, (width, height)) of uploaded image bytes, or None when they do not decode.
+    The hash only needs a thumbnail, so the image is decoded at reduced resolution (cheap for
+    JPEG); the size is that of the full image as the detectors see it (EXIF orientation applied).
+    """
+    size = image_dimensions(contents)
+    flag = cv2.IMREAD_GRAYSCALE
+    if size is not None:
+        for factor, reduced in ((8, cv2.IMREAD_REDUCED_GRAYSCALE_8), (4, cv2.IMREAD_REDUCED_GRAYSCALE_4), (2, cv2.IMREAD_REDUCED_GRAYSCALE_2)):
+            if min(size) // factor >= 64:
+                flag = reduced
+                break
+    gray = cv2.imdecode(np.frombuffer(contents, np.uint8), flag)
+    if gray is None:
+        return None
+    h, w = gray.shape[:2]
+    if size is None:
+        size = (w, h)
+    elif (size[0] > size[1]) != (w > h):
+        size = (size[1], size[0])
+    return dhash(gray), size
+
+
+def geohash_encode(latitude, longitude, precision=7):
+    """Standard base-32 geohash of a position."""
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    code, value, bits, even = [], 0, 0, True
+    while len(code) < precision:
+        span, coordinate = (lon_range, longitude) if even else (lat_range, latitude)
+        middle = (span[0] + span[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            span[0] = middle
+        else:
+            span[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            code.append(_GEOHASH_ALPHABET[value])
+            value, bits = 0, 0
+    return "".join(code)
+
+
+def geohash_bounds(code):
+    """(lat_min, lat_max, lon_min, lon_max) of a geohash cell."""
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    even = True
+    for char in code:
+        value = _GEOHASH_INDEX[char]
+        for shift in range(4, -1, -1):
+            span = lon_range if even else lat_range
+            middle = (span[0] + span[1]) / 2
+            if (value >> shift) & 1:
+                span[0] = middle
+            else:
+                span[1] = middle
+            even = not even
+    return lat_range[0], lat_range[1], lon_range[0], lon_range[1]
+
+
+def geohash_neighbours(code):
+    """The cell itself and the (up to) 8 cells around it, so reports just across a border still meet."""
+    lat_min, lat_max, lon_min, lon_max = geohash_bounds(code)
+    dlat, dlon = lat_max - lat_min, lon_max - lon_min
+    lat, lon = (lat_min + lat_max) / 2, (lon_min + lon_max) / 2
+    cells = set()
+    for i in (-1, 0, 1):
+        neighbour_lat = lat + i * dlat
+        if not -90.0 <= neighbour_lat <= 90.0:
+            continue
+        for j in (-1, 0, 1):
+            neighbour_lon = (lon + j * dlon + 180.0) % 360.0 - 180.0
+            cells.add(geohash_encode(neighbour_lat, neighbour_lon, len(code)))
+    return sorted(cells)
+
+
+def normalize_geohash(code, precision):
+    """A request's geohash cut to `precision` characters; raises ValueError when it is malformed or too coarse."""
+    code = code.strip().lower()
+    if not code or any(c not in _GEOHASH_INDEX for c in code):
+        raise ValueError(f"Invalid geohash: {code!r}")
+    if len(code) < precision:
+        raise ValueError(f"Geohash {code!r} is too coarse: at least {precision} characters are needed")
+    return code[:precision]
+
+
+def _cell_id(code):
+    value = 0
+    for char in code:
+        value = value * 32 + _GEOHASH_INDEX[char]
+    return value
+
+
+class DuplicateIndex:
+    """
+    Near-duplicate index of report images: 64-bit dHashes, optionally tagged with a geohash cell.
+
+    A report is a duplicate when an earlier one is within `max_distance` differing hash bits
+    and, if both have a location, lies in the same or a neighbouring cell of `precision`
+    characters. Duplicates are linked to the earlier report's id instead of being stored again.
+
+    Hashes live in fixed-width numpy arrays (32 bytes per report) used as a ring: past
+    `max_items` the oldest reports are evicted first, and with `ttl` seconds set, older reports
+    no longer match. Report ids are also bucketed by cell (8 more bytes per report), so a
+    located lookup only XORs/popcounts the reports in its 9 cells and those without a
+    location; a lookup without a location is one vectorised pass over every report, a few
+    milliseconds per million. Detection results kept for reuse are a separate LRU of `max_results`.
+    """
+
+    NO_CELL = -1
+
+    def __init__(self, max_distance=6, max_items=1_000_000, max_results=10000, ttl=0, precision=7):
+        if not 1 <= precision <= MAX_GEOHASH_PRECISION:
+            raise ValueError(f"Geohash precision must be between 1 and {MAX_GEOHASH_PRECISION}")
+        self.max_distance = max_distance
+        self.max_items = max_items
+        self.max_results = max_results
+        self.ttl = ttl
+        self.precision = precision
+        self.duplicates = 0
+        self._capacity = min(max_items, 1024)
+        self._hashes = np.zeros(self._capacity, dtype=np.uint64)
+        self._cells = np.full(self._capacity, self.NO_CELL, dtype=np.int64)
+        self._ids = np.zeros(self._capacity, dtype=np.int64)
+        self._stamps = np.zeros(self._capacity, dtype=np.float64)
+        self._count = 0  # reports ever stored; report ids are 1..count
+        # cell id (or NO_CELL) -> [report ids in ascending order, index of the oldest one still stored]
+        self._buckets = {}
+        self._results = OrderedDict()  # (report_id, detector) -> value
+        # Reentrant so register() can look up and add under one hold
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return min(self._count, self.max_items)
+
+    def _grow(self):
+        capacity = min(self.max_items, self._capacity * 2)
+        for name in ("_hashes", "_cells", "_ids", "_stamps"):
+            old = getattr(self, name)
+            new = np.full(capacity, self.NO_CELL if name == "_cells" else 0, dtype=old.dtype)
+            new[:self._capacity] = old
+            setattr(self, name, new)
+        self._capacity = capacity
+
+    def _bucket_slots(self, cells):
+        """Ring slots of the reports stored in `cells` or without a cell."""
+        buckets = [self._buckets.get(cell) for cell in (*cells, self.NO_CELL)]
+        ids = [np.frombuffer(bucket[0], dtype=np.int64)[bucket[1]:] for bucket in buckets if bucket is not None]
+        if not ids:
+            return np.empty(0, dtype=np.int64)
+        return (np.concatenate(ids) - 1) % self.max_items
+
+    def _match(self, image_hash, cells):
+        size = len(self)
+        if size == 0:
+            return None
+        if cells is None:
+            slots, hashes, stamps = None, self._hashes[:size], self._stamps[:size]
+        else:
+            slots = self._bucket_slots(cells)
+            hashes, stamps = self._hashes[slots], self._stamps[slots]
+        distances = _popcount(hashes ^ np.uint64(image_hash))
+        candidates = np.flatnonzero(distances <= self.max_distance)
+        if self.ttl and len(candidates):
+            candidates = candidates[stamps[candidates] >= time.monotonic() - self.ttl]
+        if not len(candidates):
+            return None
+        best = candidates[np.argmin(distances[candidates])]
+        slot = best if slots is None else slots[best]
+        return int(self._ids[slot]), int(distances[best])
+
+    def lookup(self, image_hash, geohash=None):
+        """(report_id, distance) of the closest earlier report this one duplicates, or None."""
+        cells = None
+        if geohash is not None:
+            cells = [_cell_id(c) for c in geohash_neighbours(geohash)]
+        with self._lock:
+            match = self._match(image_hash, cells)
+            if match is not None:
+                self.duplicates += 1
+            return match
+
+    def add(self, image_hash, geohash=None):
+        """Stores a new report (evicting the oldest past max_items) and returns its id."""
+        cell = _cell_id(geohash) if geohash is not None else self.NO_CELL
+        with self._lock:
+            if self._count < self.max_items and self._count >= self._capacity:
+                self._grow()
+            slot = self._count % self.max_items
+            if self._count >= self.max_items:
+                self._evict(slot)
+            self._count += 1
+            self._hashes[slot] = image_hash
+            self._cells[slot] = cell
+            self._ids[slot] = self._count
+            self._stamps[slot] = time.monotonic()
+            self._buckets.setdefault(cell, [array("q"), 0])[0].append(self._count)
+            return self._count
+
+    def _evict(self, slot):
+        # The slot holds the oldest report, which is therefore the first one left in its bucket
+        cell = int(self._cells[slot])
+        bucket = self._buckets[cell]
+        bucket[1] += 1
+        ids, head = bucket
+        if head == len(ids):
+            del self._buckets[cell]
+        elif head > 1024 and head * 2 > len(ids):
+            bucket[0], bucket[1] = ids[head:], 0
+
+    def register(self, image_hash, geohash=None):
+        """
+        Looks a report up and stores it when it is new.
+        Returns (report_id, distance): the earlier report's id and the hash distance to it for
+        a duplicate, or a new id and None.
+        """
+        with self._lock:
+            match = self.lookup(image_hash, geohash)
+            if match is not None:
+                return match
+            return self.add(image_hash, geohash), None
+
+    def get_result(self, report_id, detector):
+        with self._lock:
+            value = self._results.get((report_id, detector))
+            if value is not None:
+                self._results.move_to_end((report_id, detector))
+            return value
+
+    def put_result(self, report_id, detector, value):
+        with self._lock:
+            self._results[(report_id, detector)] = value
+            self._results.move_to_end((report_id, detector))
+            while len(self._results) > self.max_results:
+                self._results.popitem(last=False)
@@ -0,0 +1,120 @@
+import asyncio
+import functools
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from detection_code.instrumentation import collect_stages
+
+logger = logging.getLogger(__name__)
+
+# Detector instance owned by a process-pool worker (one per worker process)
+_worker_detector = None
+
+
+def _init_worker(detector_cls, model_path):
+    global _worker_detector
+    _worker_detector = detector_cls(model_path)
+
+
+def _ping_worker():
+    return _worker_detector.load_seconds, _worker_detector.input_size()
+
+
+def _call_with_stages(fn, args, kwargs):
+    """Runs fn and returns (result, {stage: seconds}) recorded by the detector while it ran."""
+    with collect_stages() as timings:
+        result = fn(*args, **kwargs)
+    return result, timings
+
+
+def _call_in_worker(method, args, kwargs):
+    return _call_with_stages(getattr(_worker_detector, method), args, kwargs)
+
+
+class ExecutorSaturated(Exception):
+    """Raised when a detector already has its maximum number of queued jobs."""
+
+    def __init__(self, name, retry_after):
+        super().__init__(f"{name} is busy, retry in {retry_after}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class DetectorExecutor:
+    """
+    Runs detector calls off the event loop with a bounded queue.
+
+    'thread' executors share one detector instance between worker threads (ONNX Runtime
+    releases the GIL during inference). 'process' executors build a private detector in
+    every worker process, which keeps ultralytics/torch models away from the server's GIL.
+
+    `stage_observer(timings)` is called with the detector's per-stage timings of every job.
+    """
+
+    def __init__(self, name, detector_cls, model_path, kind='thread', workers=1, max_queue=8, retry_after=2,
+                 stage_observer=None):
+        if kind not in ('thread', 'process'):
+            raise ValueError(f"Unsupported executor kind: {kind}. Supported: thread, process")
+
+        self.name = name
+        self.model_path = model_path
+        self.kind = kind
+        self.workers = workers
+        self.max_queue = max_queue
+        self.retry_after = retry_after
+        self.detector = None
+        self.load_seconds = None
+        # The model's default input size (BaseDetector.input_size), for sharing preprocessed batches
+        self.input_size = None
+        self.stage_observer = stage_observer
+        self._pending = 0
+
+        if kind == 'process':
+            self._pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+                initargs=(detector_cls, model_path),
+            )
+            # Surface model loading errors now instead of on the first request
+            try:
+                self.load_seconds, self.input_size = self._pool.submit(_ping_worker).result()
+            except Exception:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                raise
+        else:
+            self.detector = detector_cls(model_path)
+            self.load_seconds = self.detector.load_seconds
+            self.input_size = self.detector.input_size()
+            self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"{name}-infer")
+
+        logger.info(f"{name}: {kind} executor with {workers} worker(s), queue depth {max_queue}")
+
+    @property
+    def pending(self):
+        """Jobs currently running or waiting for a worker."""
+        return self._pending
+
+    async def submit(self, method, *args, **kwargs):
+        """Call `method` on the detector in the pool and await its result."""
+        if self._pending >= self.workers + self.max_queue:
+            raise ExecutorSaturated(self.name, self.retry_after)
+
+        loop = asyncio.get_running_loop()
+        self._pending += 1
+        try:
+            if self.kind == 'process':
+                result, timings = await loop.run_in_executor(self._pool, _call_in_worker, method, args, kwargs)
+            else:
+                call = functools.partial(_call_with_stages, getattr(self.detector, method), args, kwargs)
+                result, timings = await loop.run_in_executor(self._pool, call)
+        finally:
+            self._pending -= 1
+
+        if self.stage_observer is not None:
+            self.stage_observer(timings)
+        return result
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
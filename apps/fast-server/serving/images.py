@@ -0,0 +1,90 @@
+import io
+import math
+
+import cv2
+import numpy as np
+
+# Reduced-resolution decode flags, by downscale factor. For JPEG, libjpeg decodes straight
+# to the smaller size (DCT scaling), so the full-resolution pixels are never allocated.
+REDUCED_FLAGS = ((2, cv2.IMREAD_REDUCED_COLOR_2), (4, cv2.IMREAD_REDUCED_COLOR_4), (8, cv2.IMREAD_REDUCED_COLOR_8))
+
+
+class ImageTooLarge(Exception):
+    """Raised for uploads over the configured byte or pixel limits (HTTP 413)."""
+
+
+async def read_upload(file, max_bytes=0):
+    """Reads an UploadFile, at most max_bytes of it (0 = no limit); None when it is larger."""
+    if not max_bytes:
+        return await file.read()
+    data = await file.read(max_bytes + 1)
+    return None if len(data) > max_bytes else data
+
+
+def image_dimensions(contents):
+    """(width, height) read from the image header without decoding pixels, or None if unknown."""
+    from PIL import Image
+
+    try:
+        with Image.open(io.BytesIO(contents)) as header:
+            return header.size
+    except Image.DecompressionBombError as e:
+        raise ImageTooLarge(str(e))
+    except Exception:
+        return None
+
+
+def decode_image(contents, max_pixels=0, max_source_pixels=0):
+    """
+    Decodes uploaded bytes to a BGR image of at most max_pixels pixels (0 = full size).
+    Large images are decoded at 1/2, 1/4 or 1/8 resolution straight away and resized further
+    only when even 1/8 is too big. Raises ImageTooLarge when the header reports more than
+    max_source_pixels (0 = no limit).
+    Returns (image, scale): scale = (sx, sy) maps decoded pixel coordinates back to the
+    original image, (1.0, 1.0) at full size; image is None when the bytes do not decode.
+    """
+    size = image_dimensions(contents) if (max_pixels or max_source_pixels) else None
+    if size is not None and max_source_pixels and size[0] * size[1] > max_source_pixels:
+        raise ImageTooLarge(f"Image has {size[0]}x{size[1]} pixels, more than the {max_source_pixels} allowed")
+
+    flag = cv2.IMREAD_COLOR
+    if size is not None and max_pixels and size[0] * size[1] > max_pixels:
+        flag = REDUCED_FLAGS[-1][1]
+        for factor, reduced in REDUCED_FLAGS:
+            if (size[0] / factor) * (size[1] / factor) <= max_pixels:
+                flag = reduced
+                break
+
+    image = cv2.imdecode(np.frombuffer(contents, np.uint8), flag)
+    if image is None:
+        return None, (1.0, 1.0)
+
+    h, w = image.shape[:2]
+    if max_pixels and h * w > max_pixels:
+        shrink = math.sqrt(max_pixels / (h * w))
+        image = cv2.resize(image, (max(1, int(w * shrink)), max(1, int(h * shrink))), interpolation=cv2.INTER_AREA)
+
+    if size is None:
+        width, height = w, h
+    else:
+        width, height = size
+        # The decoder applies the EXIF orientation, which the header size does not
+        if (width > height) != (w > h):
+            width, height = height, width
+    return image, (width / image.shape[1], height / image.shape[0])
+
+
+def scale_detections(detections, scale):
+    """Maps each detection's 'bbox' from decoded to original pixels, keeping ints as ints."""
+    sx, sy = scale
+    if sx == 1.0 and sy == 1.0:
+        return detections
+    factors = (sx, sy, sx, sy)
+    for detection in detections:
+        bbox = detection.get("bbox")
+        if bbox is not None:
+            detection["bbox"] = [
+                int(round(v * f)) if isinstance(v, (int, np.integer)) else float(v * f)
+                for v, f in zip(bbox, factors)
+            ]
+    return detections
@@ -0,0 +1,128 @@
+import copy
+import json
+import logging
+import os
+import threading
+import time
+
+from detection_code.base_detector import InferenceOptionError
+
+logger = logging.getLogger(__name__)
+
+# Built-in inference settings; imgsz None uses the model's own input size
+BUILTIN_DEFAULTS = {"conf": 0.25, "iou": 0.7, "imgsz": None, "max_det": 300, "variant": "full"}
+OPTION_NAMES = tuple(BUILTIN_DEFAULTS)
+
+
+def validate_options(options):
+    """Raises InferenceOptionError for an unknown or out-of-range inference option; returns the options."""
+    for key in options:
+        if key not in BUILTIN_DEFAULTS:
+            raise InferenceOptionError(f"Unknown inference option: {key}. Supported: {', '.join(OPTION_NAMES)}")
+    for key in ("conf", "iou"):
+        value = options.get(key)
+        if value is not None and not 0 < float(value) <= 1:
+            raise InferenceOptionError(f"{key} must be in (0, 1], got {value}")
+    max_det = options.get("max_det")
+    if max_det is not None and not 1 <= int(max_det) <= 1000:
+        raise InferenceOptionError(f"max_det must be between 1 and 1000, got {max_det}")
+    imgsz = options.get("imgsz")
+    if imgsz is not None and (not 32 <= int(imgsz) <= 4096 or int(imgsz) % 32):
+        raise InferenceOptionError(f"imgsz must be a multiple of 32 between 32 and 4096, got {imgsz}")
+    variant = options.get("variant")
+    if variant is not None and (not isinstance(variant, str) or not variant):
+        raise InferenceOptionError(f"variant must be a non-empty string, got {variant!r}")
+    return options
+
+
+def validate_variants(variants):
+    """Raises ValueError unless `variants` maps variant names (not "full") to model file paths; returns it."""
+    if not isinstance(variants, dict):
+        raise ValueError(f"variants must be an object of name -> model path, got {variants!r}")
+    for name, path in variants.items():
+        if name == "full":
+            raise ValueError('"full" is the served model and cannot be a configured variant')
+        if not name or not isinstance(path, str) or not path:
+            raise ValueError(f"variant {name!r} must map to a model path, got {path!r}")
+    return variants
+
+
+class InferenceConfig:
+    """
+    Per-detector inference defaults: BUILTIN_DEFAULTS, overridden by an optional JSON file,
+    overridden per request. The file looks like
+
+        {"defaults": {"conf": 0.25},
+         "detectors": {"garbage": {"conf": 0.4, "variant": "fast"},
+                       "pothole": {"max_det": 100, "variants": {"nano": "models/pothole-n.onnx"}}}}
+
+    where "variants" names extra model files a request can pick with variant=<name>. The
+    file is re-read when its modification time changes (checked at most every
+    `check_interval` seconds); a file that fails to parse or validate is logged and the
+    previous settings stay in force.
+    """
+
+    def __init__(self, path=None, check_interval=2.0):
+        self.path = path
+        self.check_interval = check_interval
+        self.loaded_at = None
+        self._config = {"defaults": {}, "detectors": {}}
+        self._mtime = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+        if path:
+            self._reload()
+
+    def _reload(self):
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            if self._mtime is not None:
+                logger.warning(f"Inference config {self.path} is gone; keeping the last settings")
+            return
+        if mtime == self._mtime:
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                config = json.load(f)
+            config = {"defaults": config.get("defaults", {}), "detectors": config.get("detectors", {})}
+            validate_options(config["defaults"])
+            for name, settings in config["detectors"].items():
+                if not isinstance(settings, dict):
+                    raise ValueError(f"settings for {name} must be an object, got {settings!r}")
+                validate_options({k: v for k, v in settings.items() if k != "variants"})
+                validate_variants(settings.get("variants", {}))
+        except (OSError, ValueError, AttributeError, TypeError) as e:
+            logger.error(f"❌ Inference config {self.path} not applied: {e}")
+            self._mtime = mtime
+            return
+        self._config, self._mtime, self.loaded_at = config, mtime, time.time()
+        logger.info(f"🔄 Inference config loaded from {self.path}")
+
+    def _current(self):
+        if self.path and time.monotonic() - self._checked >= self.check_interval:
+            with self._lock:
+                if time.monotonic() - self._checked >= self.check_interval:
+                    self._checked = time.monotonic()
+                    self._reload()
+        return self._config
+
+    def defaults(self, detector):
+        """Server-side settings for one detector."""
+        config = self._current()
+        settings = {k: v for k, v in config["detectors"].get(detector, {}).items() if k != "variants"}
+        return {**BUILTIN_DEFAULTS, **config["defaults"], **settings}
+
+    def resolve(self, detector, **overrides):
+        """The detector's defaults with the request's options (None = unset) applied; raises InferenceOptionError."""
+        options = self.defaults(detector)
+        options.update(validate_options({k: v for k, v in overrides.items() if v is not None}))
+        return options
+
+    def variant_path(self, detector, variant):
+        """The model file configured for a named variant of a detector, or None."""
+        return self._current()["detectors"].get(detector, {}).get("variants", {}).get(variant)
+
+    def snapshot(self):
+        """The loaded file contents and where they came from, for GET /inference-config."""
+        return {"path": self.path, "loaded_at": self.loaded_at, **copy.deepcopy(self._current())}
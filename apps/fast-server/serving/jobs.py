@@ -0,0 +1,514 @@
+import asyncio
+import bisect
+import ipaddress
+import json
+import logging
+import os
+import shutil
+import socket
+import sqlite3
+import threading
+import time
+import urllib.parse
+import urllib.request
+import uuid
+
+logger = logging.getLogger(__name__)
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+# Job fields stored as JSON text by SQLiteJobStore
+_JSON_FIELDS = ("detectors", "options", "inputs", "result")
+_COLUMNS = (
+    "id", "kind", "detectors", "options", "inputs", "priority", "status", "created_at", "started_at",
+    "finished_at", "status_code", "result", "callback_url", "callback_status", "owner", "lease_until",
+)
+
+
+def new_job(kind, detectors, options, inputs, priority, callback_url=None, job_id=None):
+    """
+    A job record: `inputs` are [name, path, role] entries for the spooled uploads, `priority`
+    orders the queue (lower runs first).
+    """
+    return {
+        "id": job_id or uuid.uuid4().hex,
+        "kind": kind,
+        "detectors": list(detectors),
+        "options": options,
+        "inputs": inputs,
+        "priority": priority,
+        "status": QUEUED,
+        "created_at": time.time(),
+        "started_at": None,
+        "finished_at": None,
+        "status_code": None,
+        "result": None,
+        "callback_url": callback_url,
+        "callback_status": None,
+        "owner": None,
+        "lease_until": None,
+    }
+
+
+class MemoryJobStore:
+    """Job records kept in this process only: queued work is lost on restart."""
+
+    def __init__(self):
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def create(self, job):
+        with self._lock:
+            self._jobs[job["id"]] = dict(job)
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def update(self, job_id, **fields):
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id].update(fields)
+
+    def queued(self):
+        with self._lock:
+            return [dict(job) for job in self._jobs.values() if job["status"] == QUEUED]
+
+    def claim(self, job_id, owner, lease_until):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job["status"] != QUEUED:
+                return False
+            job.update(status=RUNNING, owner=owner, lease_until=lease_until, started_at=time.time())
+            return True
+
+    def renew(self, job_id, owner, lease_until):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job["status"] != RUNNING or job["owner"] != owner:
+                return False
+            job["lease_until"] = lease_until
+            return True
+
+    def finish(self, job_id, owner, **fields):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job["status"] != RUNNING or job["owner"] != owner:
+                return False
+            job.update(fields)
+            return True
+
+    def release(self, job_id, owner):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and job["status"] == RUNNING and job["owner"] == owner:
+                job.update(status=QUEUED, owner=None, lease_until=None, started_at=None)
+
+    def requeue_expired(self, now):
+        with self._lock:
+            expired = [job for job in self._jobs.values() if job["status"] == RUNNING and (job["lease_until"] or 0) < now]
+            for job in expired:
+                job.update(status=QUEUED, owner=None, lease_until=None, started_at=None)
+            return len(expired)
+
+    def finished_before(self, timestamp):
+        with self._lock:
+            return [job_id for job_id, job in self._jobs.items() if job["finished_at"] is not None and job["finished_at"] < timestamp]
+
+    def delete(self, job_id):
+        with self._lock:
+            self._jobs.pop(job_id, None)
+
+    def close(self):
+        pass
+
+
+class SQLiteJobStore:
+    """
+    Job records in a SQLite file, so queued and interrupted jobs are picked up again after a
+    restart. Several worker processes may share the file: a job runs on the one worker whose
+    claim() flips it from queued to running, and stays theirs while they renew its lease.
+    """
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, kind TEXT, detectors TEXT, options TEXT, inputs TEXT, priority INTEGER, "
+            "status TEXT, created_at REAL, started_at REAL, finished_at REAL, status_code INTEGER, "
+            "result TEXT, callback_url TEXT, callback_status TEXT, owner TEXT, lease_until REAL)"
+        )
+        # Files created before job leases existed
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        for column, kind in (("owner", "TEXT"), ("lease_until", "REAL")):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status)")
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _encode(fields):
+        return {k: json.dumps(v) if k in _JSON_FIELDS and v is not None else v for k, v in fields.items()}
+
+    @staticmethod
+    def _decode(row):
+        job = dict(zip(_COLUMNS, row))
+        for field in _JSON_FIELDS:
+            if job[field] is not None:
+                job[field] = json.loads(job[field])
+        return job
+
+    def create(self, job):
+        fields = self._encode(job)
+        with self._lock:
+            self._conn.execute(
+                f"INSERT INTO jobs ({', '.join(_COLUMNS)}) VALUES ({', '.join('?' for _ in _COLUMNS)})",
+                [fields[column] for column in _COLUMNS],
+            )
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._conn.execute(f"SELECT {', '.join(_COLUMNS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._decode(row) if row is not None else None
+
+    def update(self, job_id, **fields):
+        fields = self._encode(fields)
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE jobs SET {', '.join(f'{k} = ?' for k in fields)} WHERE id = ?",
+                [*fields.values(), job_id],
+            )
+
+    def queued(self):
+        with self._lock:
+            rows = self._conn.execute(f"SELECT {', '.join(_COLUMNS)} FROM jobs WHERE status = ?", (QUEUED,)).fetchall()
+        return [self._decode(row) for row in rows]
+
+    def claim(self, job_id, owner, lease_until):
+        """Marks a queued job as running on `owner`; False when another worker got it first."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, owner = ?, lease_until = ?, started_at = ? WHERE id = ? AND status = ?",
+                (RUNNING, owner, lease_until, time.time(), job_id, QUEUED),
+            )
+        return cursor.rowcount == 1
+
+    def renew(self, job_id, owner, lease_until):
+        """Extends the lease on a job `owner` is running; False when it has lost the job."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET lease_until = ? WHERE id = ? AND owner = ? AND status = ?",
+                (lease_until, job_id, owner, RUNNING),
+            )
+        return cursor.rowcount == 1
+
+    def finish(self, job_id, owner, **fields):
+        """Records the outcome of a job `owner` is running; False when it has lost the job meanwhile."""
+        fields = self._encode(fields)
+        with self._lock:
+            cursor = self._conn.execute(
+                f"UPDATE jobs SET {', '.join(f'{k} = ?' for k in fields)} WHERE id = ? AND owner = ? AND status = ?",
+                [*fields.values(), job_id, owner, RUNNING],
+            )
+        return cursor.rowcount == 1
+
+    def release(self, job_id, owner):
+        """Puts a job `owner` is running back in the queue (the worker is shutting down)."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, owner = NULL, lease_until = NULL, started_at = NULL WHERE id = ? AND owner = ? AND status = ?",
+                (QUEUED, job_id, owner, RUNNING),
+            )
+
+    def requeue_expired(self, now):
+        """Queues running jobs whose worker stopped renewing their lease; returns how many."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, owner = NULL, lease_until = NULL, started_at = NULL "
+                "WHERE status = ? AND (lease_until IS NULL OR lease_until < ?)",
+                (QUEUED, RUNNING, now),
+            )
+        return cursor.rowcount
+
+    def finished_before(self, timestamp):
+        with self._lock:
+            rows = self._conn.execute("SELECT id FROM jobs WHERE finished_at < ?", (timestamp,)).fetchall()
+        return [row[0] for row in rows]
+
+    def delete(self, job_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def callback_url_error(url, allowed_hosts=()):
+    """
+    Why a job's callback URL must not be used, None when it may. Callbacks are requests made by
+    the server, so they may only go to public addresses: with `allowed_hosts` set the URL's host
+    must be one of them, otherwise every address the host resolves to must be globally routable
+    (no private, loopback, link-local or reserved ranges such as 169.254.169.254).
+    """
+    parsed = urllib.parse.urlsplit(url)
+    if parsed.scheme not in ("http", "https") or not parsed.hostname:
+        return "callback_url must be an http(s) URL"
+    host = parsed.hostname.lower()
+    if allowed_hosts:
+        return None if host in allowed_hosts else f"callback_url host {host} is not allowed"
+    try:
+        port = parsed.port or (443 if parsed.scheme == "https" else 80)
+        addresses = {info[4][0] for info in socket.getaddrinfo(host, port, proto=socket.IPPROTO_TCP)}
+    except (OSError, ValueError) as e:
+        return f"callback_url host {host} cannot be resolved: {e}"
+    for address in addresses:
+        ip = ipaddress.ip_address(address.split("%")[0])
+        if isinstance(ip, ipaddress.IPv6Address) and ip.ipv4_mapped is not None:
+            ip = ip.ipv4_mapped
+        if not ip.is_global or ip.is_multicast:
+            return f"callback_url host {host} resolves to a non-public address ({ip})"
+    return None
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    """Callbacks do not follow redirects, which could point them at an address callback_url_error rejects."""
+
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+_callback_opener = urllib.request.build_opener(_NoRedirect)
+
+
+def post_callback(url, payload, attempts=3, timeout=10, allowed_hosts=()):
+    """
+    POSTs the job as JSON to its callback URL, retrying with backoff. Returns a status string.
+    The URL is checked again before every attempt, as the host may resolve elsewhere by now.
+    """
+    body = json.dumps(payload).encode()
+    error = None
+    for attempt in range(attempts):
+        if attempt:
+            time.sleep(2 ** (attempt - 1))
+        rejected = callback_url_error(url, allowed_hosts)
+        if rejected is not None:
+            logger.warning(f"Job callback to {url} refused: {rejected}")
+            return f"refused: {rejected}"
+        request = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"}, method="POST")
+        try:
+            with _callback_opener.open(request, timeout=timeout) as response:
+                return f"delivered ({response.status})"
+        except Exception as e:
+            error = e
+    logger.warning(f"Job callback to {url} failed: {error}")
+    return f"failed: {error}"
+
+
+class JobQueue:
+    """
+    Runs stored jobs in the background, highest priority (lowest number) first, with at most
+    limit(detector) jobs running per detector; a job holds a slot on each of its detectors.
+    `runner(job)` does the work and returns (status_code, content). Finished jobs and their
+    spooled inputs are removed after `retention` seconds.
+
+    The store is opened by `create_store()` in start(), so forked workers never share a
+    connection. Every worker may see every queued job, but one runs only after store.claim()
+    made it theirs; while it runs its lease is renewed every lease/3 seconds. A worker that
+    fails to renew (the lease expired and another worker took the job over) abandons the run,
+    and a result is only stored by the worker that still owns the job. Every
+    `poll_interval` seconds jobs whose lease expired (their worker died) are queued again and
+    queued jobs submitted through other workers are picked up. Callbacks only go to hosts
+    that pass callback_url_error(url, callback_hosts).
+    """
+
+    def __init__(
+        self, create_store, runner, job_dir, limits=None, default_limit=1, retention=86400, lease=60.0, poll_interval=5.0,
+        callback_hosts=(),
+    ):
+        self.create_store = create_store
+        self.store = None
+        self.runner = runner
+        self.job_dir = job_dir
+        self.limits = limits or {}
+        self.default_limit = default_limit
+        self.retention = retention
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.callback_hosts = callback_hosts
+        self.owner = None
+        self._pending = []  # sorted (priority, created_at, id, detectors)
+        self._running = {}  # detector -> running jobs
+        self._tasks = set()
+        self._wake = None
+        self._dispatcher = None
+        self._poller = None
+        self._active = set()  # ids of jobs this worker is claiming or running
+        self._last_prune = 0.0
+
+    def limit(self, detector):
+        return max(1, self.limits.get(detector, self.default_limit))
+
+    def input_dir(self, job_id):
+        return os.path.join(self.job_dir, job_id)
+
+    @property
+    def queued(self):
+        return len(self._pending)
+
+    def position(self, job_id):
+        """0-based place of a queued job in the queue, None once it has started."""
+        for i, entry in enumerate(self._pending):
+            if entry[2] == job_id:
+                return i
+        return None
+
+    async def start(self):
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.store = await asyncio.to_thread(self.create_store)
+        self._wake = asyncio.Event()
+        self._pending = []
+        requeued = await self._refresh()
+        if requeued:
+            logger.info(f"📋 Requeued {requeued} interrupted job(s)")
+        if self._pending:
+            logger.info(f"📋 {len(self._pending)} job(s) waiting in the queue")
+        loop = asyncio.get_running_loop()
+        self._dispatcher = loop.create_task(self._dispatch())
+        self._poller = loop.create_task(self._poll())
+
+    async def submit(self, job):
+        await asyncio.to_thread(self.store.create, job)
+        self._enqueue(job)
+
+    def _enqueue(self, job):
+        if job["id"] in self._active or self.position(job["id"]) is not None:
+            return
+        bisect.insort(self._pending, (job["priority"], job["created_at"], job["id"], tuple(job["detectors"])))
+        if self._wake is not None:
+            self._wake.set()
+
+    async def _refresh(self):
+        """Requeues jobs with expired leases and queues every job waiting in the store; returns the requeued count."""
+        requeued = await asyncio.to_thread(self.store.requeue_expired, time.time())
+        for job in await asyncio.to_thread(self.store.queued):
+            self._enqueue(job)
+        return requeued
+
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                requeued = await self._refresh()
+            except Exception as e:
+                logger.error(f"Job queue refresh failed: {e}")
+                continue
+            if requeued:
+                logger.warning(f"📋 Requeued {requeued} job(s) whose worker stopped renewing the lease")
+
+    async def _keep_lease(self, job_id):
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            if not await asyncio.to_thread(self.store.renew, job_id, self.owner, time.time() + self.lease):
+                logger.warning(f"Job {job_id}: lease lost; another worker may run it again")
+                return
+
+    async def _dispatch(self):
+        while True:
+            await self._wake.wait()
+            self._wake.clear()
+            for entry in list(self._pending):
+                detectors = entry[3]
+                if all(self._running.get(d, 0) < self.limit(d) for d in detectors):
+                    self._pending.remove(entry)
+                    for d in detectors:
+                        self._running[d] = self._running.get(d, 0) + 1
+                    self._active.add(entry[2])
+                    task = asyncio.get_running_loop().create_task(self._run(entry[2], detectors))
+                    self._tasks.add(task)
+                    task.add_done_callback(self._tasks.discard)
+            if time.time() - self._last_prune > min(self.retention, 3600):
+                self._last_prune = time.time()
+                task = asyncio.get_running_loop().create_task(asyncio.to_thread(self._prune))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, job_id, detectors):
+        heartbeat, work = None, None
+        try:
+            started = time.time()
+            # Another worker may have claimed it since it was queued here
+            if not await asyncio.to_thread(self.store.claim, job_id, self.owner, started + self.lease):
+                return
+            heartbeat = asyncio.get_running_loop().create_task(self._keep_lease(job_id))
+            job = await asyncio.to_thread(self.store.get, job_id)
+            work = asyncio.get_running_loop().create_task(self.runner(job))
+            await asyncio.wait((work, heartbeat), return_when=asyncio.FIRST_COMPLETED)
+            if not work.done():
+                # The lease was lost: another worker runs the job now, and its inputs are theirs
+                logger.warning(f"Job {job_id}: abandoned after losing the lease")
+                return
+            try:
+                status_code, content = work.result()
+            except Exception as e:
+                logger.error(f"Job {job_id} failed: {e}")
+                status_code, content = 500, {"error": str(e)}
+            fields = {
+                "status": DONE if status_code < 400 else FAILED,
+                "status_code": status_code,
+                "result": content,
+                "finished_at": time.time(),
+                "lease_until": None,
+            }
+            heartbeat.cancel()
+            if not await asyncio.to_thread(self.store.finish, job_id, self.owner, **fields):
+                logger.warning(f"Job {job_id}: lease lost before the result was stored; discarding it")
+                return
+            await asyncio.to_thread(shutil.rmtree, self.input_dir(job_id), True)
+            logger.info(f"Job {job_id} ({job['kind']}) {fields['status']} in {fields['finished_at'] - started:.1f}s")
+            if job["callback_url"]:
+                job.update(fields)
+                callback_status = await asyncio.to_thread(post_callback, job["callback_url"], public_view(job), allowed_hosts=self.callback_hosts)
+                await asyncio.to_thread(self.store.update, job_id, callback_status=callback_status)
+        finally:
+            for task in (heartbeat, work):
+                if task is not None:
+                    task.cancel()
+            self._active.discard(job_id)
+            for d in detectors:
+                self._running[d] -= 1
+            self._wake.set()
+
+    def _prune(self):
+        for job_id in self.store.finished_before(time.time() - self.retention):
+            self.store.delete(job_id)
+            shutil.rmtree(self.input_dir(job_id), ignore_errors=True)
+
+    def shutdown(self):
+        """Stops dispatching and puts the jobs this worker was running back in the queue."""
+        for task in (self._dispatcher, self._poller):
+            if task is not None:
+                task.cancel()
+        for task in list(self._tasks):
+            task.cancel()
+        if self.store is None:
+            return
+        for job_id in list(self._active):
+            self.store.release(job_id, self.owner)
+        self.store.close()
+
+
+def public_view(job, position=None):
+    """The job as returned by GET /jobs/{id} and posted to callbacks (no local file paths)."""
+    view = {k: job[k] for k in (
+        "id", "kind", "detectors", "status", "priority", "created_at", "started_at", "finished_at",
+        "status_code", "result", "callback_url", "callback_status",
+    )}
+    if position is not None:
+        view["queue_position"] = position
+    return view
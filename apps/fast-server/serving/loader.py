@@ -0,0 +1,89 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+PENDING, LOADING, READY, FAILED = "pending", "loading", "ready", "failed"
+
+
+class ModelLoader:
+    """
+    Loads detectors in background threads and tracks their state for /readyz.
+
+    `load_fn(name)` does the actual loading and raises on failure. start() kicks off the
+    eager set at startup; any other detector is loaded by the first request that wait()s
+    for it. A failed detector stays failed (disabled) until retry() is called, e.g. after
+    another model version has been activated for it.
+    """
+
+    def __init__(self, names, load_fn, max_workers=None):
+        self.load_fn = load_fn
+        self._states = {name: {"state": PENDING, "load_seconds": None, "error": None} for name in names}
+        self._futures = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers or max(1, len(self._states)), thread_name_prefix="model-load")
+
+    def start(self, names):
+        for name in names:
+            self.load(name)
+
+    def preload(self, names):
+        """
+        Loads detectors synchronously on the calling thread. Used by serve.py before forking
+        workers, so no loader thread exists yet and the loaded models are shared copy-on-write.
+        """
+        for name in names:
+            future = Future()
+            with self._lock:
+                self._states[name]["state"] = LOADING
+                self._futures[name] = future
+            future.set_result(self._load(name))
+
+    def load(self, name):
+        """Starts loading `name` if nothing has yet and returns its concurrent future."""
+        with self._lock:
+            future = self._futures.get(name)
+            if future is None:
+                self._states[name]["state"] = LOADING
+                future = self._futures[name] = self._pool.submit(self._load, name)
+            return future
+
+    def retry(self, name):
+        """Forgets a failed load so the next load() or wait() tries again."""
+        with self._lock:
+            if self._states[name]["state"] == FAILED:
+                self._futures.pop(name, None)
+                self._states[name].update(state=PENDING, error=None)
+
+    def _load(self, name):
+        started = time.perf_counter()
+        try:
+            self.load_fn(name)
+        except Exception as e:
+            self._states[name].update(state=FAILED, error=str(e)[:200], load_seconds=round(time.perf_counter() - started, 3))
+            return FAILED
+        self._states[name].update(state=READY, load_seconds=round(time.perf_counter() - started, 3))
+        return READY
+
+    def state(self, name):
+        return self._states[name]["state"]
+
+    async def wait(self, name, timeout):
+        """Loads `name` if needed and waits up to `timeout` seconds; returns its state."""
+        if self.state(name) in (READY, FAILED):
+            return self.state(name)
+        future = asyncio.wrap_future(self.load(name))
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self.state(name)
+
+    def status(self):
+        return {name: dict(state) for name, state in self._states.items()}
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,166 @@
+import bisect
+import threading
+
+# Prometheus text exposition format served by GET /metrics
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.extend(self._render_sample(key, value))
+        return lines
+
+    def _render_sample(self, key, value):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    def _render_sample(self, key, value):
+        counts, total = value
+        lines, cumulative = [], 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            labels = _format_labels(self.labelnames, key, [("le", _format_value(float(bound)))])
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+STAGE_SECONDS = registry.histogram(
+    "inference_stage_seconds",
+    "Time spent per request stage: read, decode, inference (queue + model), encode, serialize, and the detector-side preprocess, forward, decode_output, postprocess, annotate.",
+    ("detector", "stage"),
+)
+BATCH_SIZE = registry.histogram(
+    "inference_batch_size",
+    "Images per forward-pass job.",
+    ("detector",),
+    buckets=(1, 2, 4, 8, 16, 32, 64),
+)
+REQUESTS = registry.counter("detector_requests_total", "Detection requests by HTTP status.", ("detector", "status"))
+ERRORS = registry.counter("detector_errors_total", "Detection requests that failed.", ("detector",))
+IN_FLIGHT = registry.gauge("detector_requests_in_flight", "Detection requests currently being handled.", ("detector",))
+QUEUE_DEPTH = registry.gauge("detector_queue_depth", "Executor jobs running or waiting for a worker.", ("detector",))
+MODEL_LOAD_SECONDS = registry.gauge("model_load_seconds", "Time taken to load each model.", ("detector",))
+RESULT_CACHE_LOOKUPS = registry.counter("result_cache_lookups_total", "Result cache lookups by outcome (hit/miss).", ("detector", "result"))
+RESULT_CACHE_ENTRIES = registry.gauge("result_cache_entries", "Results held in the in-memory cache tier.")
+RESULT_CACHE_DISK_HITS = registry.gauge("result_cache_disk_hits", "Result cache hits served from the on-disk tier since startup.")
+DUPLICATE_LOOKUPS = registry.counter("duplicate_lookups_total", "Near-duplicate index lookups by outcome (new/duplicate/reused).", ("detector", "result"))
+DUPLICATE_INDEX_ENTRIES = registry.gauge("duplicate_index_entries", "Report hashes held in the near-duplicate index.")
+MODEL_SWAPS = registry.counter("model_swaps_total", "Model version swaps by outcome (ok/failed).", ("detector", "result"))
+INFERENCE_SECONDS = registry.histogram(
+    "model_inference_seconds",
+    "Inference time (queue + model) per model version and traffic role (primary/canary/shadow/variant).",
+    ("detector", "version", "role"),
+)
+SHADOW_COMPARISONS = registry.counter(
+    "shadow_comparisons_total", "Shadow model runs by outcome against the serving version (match/mismatch/error).", ("detector", "result"),
+)
+JOBS_QUEUED = registry.gauge("jobs_queued", "Background jobs waiting for a detector slot.")
+RESULT_LOG_DROPPED = registry.gauge("result_log_dropped_records", "Result log records dropped because the queue was full.")
+
+
+def observe_stages(detector, timings):
+    """Records a {stage: seconds} mapping from one executor job."""
+    for stage, seconds in timings.items():
+        STAGE_SECONDS.observe(seconds, detector=detector, stage=stage)
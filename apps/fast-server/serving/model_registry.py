@@ -0,0 +1,397 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import re
+import time
+
+import numpy as np
+
+from detection_code.export import match_boxes
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# Version name of a detector's configured model (DETECTOR_SPECS model_path)
+DEFAULT_VERSION = "default"
+VERSION_PATTERN = re.compile(r"^[A-Za-z0-9][A-Za-z0-9._-]{0,63}$")
+ROLES = ("canary", "shadow")
+
+
+def file_stamp(path):
+    """(size, mtime_ns) of a file, None when it is missing: changes whenever the file is replaced."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def compare_outputs(primary, candidate, match_iou=0.5):
+    """
+    How far a candidate model's (priority, detections) for an image agree with the primary's:
+    detections are matched greedily by class and box IoU (export.match_boxes); agreement is
+    matched / max(count), 1.0 when both found nothing.
+    """
+    (primary_priority, primary_detections), (candidate_priority, candidate_detections) = primary, candidate
+    pairs = match_boxes(
+        [d["bbox"] for d in primary_detections], [d["class"] for d in primary_detections],
+        [d["bbox"] for d in candidate_detections], [d["class"] for d in candidate_detections], match_iou,
+    )
+    total = max(len(primary_detections), len(candidate_detections))
+    return {
+        "priority_match": primary_priority == candidate_priority,
+        "primary_detections": len(primary_detections),
+        "candidate_detections": len(candidate_detections),
+        "agreement": round(len(pairs) / total, 4) if total else 1.0,
+        "box_iou": round(float(np.mean([iou for _, _, iou in pairs])), 4) if pairs else None,
+    }
+
+
+class Deployment:
+    """
+    One loaded version of a detector: its executor and micro-batcher. Requests hold a lease
+    while they use it; a deployment retired by a swap shuts down once its last lease is
+    released, so in-flight requests finish on the version they started with.
+    `source` is the registered model file, `path` the file actually served (e.g. its ONNX export).
+    """
+
+    def __init__(self, name, version, source, path, executor, batcher, fingerprint):
+        self.name = name
+        self.version = version
+        self.source = source
+        self.path = path
+        self.executor = executor
+        self.batcher = batcher
+        self.fingerprint = fingerprint
+        self.stamp = (file_stamp(source), file_stamp(path))
+        self.loaded_at = time.time()
+        self.leases = 0
+        self.retired = False
+
+    def acquire(self):
+        self.leases += 1
+        return self
+
+    def release(self):
+        self.leases -= 1
+        if self.retired and self.leases == 0:
+            self._close()
+
+    def retire(self):
+        """Stops taking new requests; the executor shuts down once in-flight ones are done."""
+        if not self.retired:
+            self.retired = True
+            if self.leases == 0:
+                self._close()
+
+    def _close(self):
+        logger.info(f"{self.name}: version {self.version} drained and unloaded")
+        self.batcher.shutdown()
+        self.executor.shutdown()
+
+    async def warm_up(self, size=640):
+        """Runs a blank image through every worker, so the first real requests do not pay for lazy initialisation."""
+        image = np.full((size, size, 3), 114, dtype=np.uint8)
+        await asyncio.gather(*(
+            self.executor.submit("predict_array", image, annotate=False) for _ in range(self.executor.workers)
+        ))
+
+    def describe(self):
+        return {
+            "version": self.version,
+            "source": self.source,
+            "path": self.path,
+            "fingerprint": self.fingerprint,
+            "loaded_at": self.loaded_at,
+            "in_flight": self.leases,
+        }
+
+
+class ModelRegistry:
+    """
+    Versioned models per detector, kept in a JSON file so every server process (serve.py
+    workers) converges on the same deployment:
+
+        {"garbage": {"active": "2024-06", "versions": {"2024-06": {"path": "models/versions/garbage/2024-06.pt"}},
+                     "canary": {"version": "2024-07", "percent": 10},
+                     "shadow": {"version": "2024-07", "percent": 100}}}
+
+    A detector without an entry serves its configured model as version "default".
+
+    - activate() loads a version in the background, warms it up and swaps it in; the old
+      version drains (see Deployment) and a version that fails to load never replaces the
+      serving one.
+    - A canary takes `percent` of a detector's requests; a shadow additionally runs `percent`
+      of its single-image requests in the background so latency and outputs can be compared
+      without affecting responses.
+    - watch() polls the registry file and the active model files: edits made by another
+      process are applied, and a model file replaced in place is reloaded once it has stopped
+      changing between two polls.
+
+    `build(name, version, source)` loads a Deployment (blocking) and `defaults` maps each
+    detector to its configured model path.
+    """
+
+    def __init__(self, defaults, build, path=None):
+        self.defaults = defaults
+        self.build = build
+        self.path = path
+        self.entries = {}
+        self.status = {name: {"state": "idle", "version": None, "error": None, "updated_at": None} for name in defaults}
+        self._active = {}
+        self._candidates = {}  # (name, version) -> Deployment serving canary/shadow traffic
+        self._locks = {name: asyncio.Lock() for name in defaults}
+        self._failed = {}  # (name, version) -> stamp of the model file that failed to load
+        self._seen = {}  # name -> stamp observed on the previous poll
+        self._mtime = None
+        self._tasks = set()
+        self._watcher = None
+        self._loop = None
+        self._read()
+
+    def _read(self):
+        """Reloads the registry file; returns True when it changed. An invalid file is logged and ignored."""
+        if not self.path:
+            return False
+        stamp = file_stamp(self.path)
+        if stamp is None or stamp == self._mtime:
+            return False
+        self._mtime = stamp
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+            if not isinstance(entries, dict):
+                raise ValueError("the registry must be a JSON object")
+        except ValueError as e:
+            logger.error(f"❌ Model registry {self.path} not applied: {e}")
+            return False
+        self.entries = {name: entry for name, entry in entries.items() if name in self.defaults}
+        return True
+
+    def _save(self):
+        if not self.path:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, indent=2, sort_keys=True)
+        os.replace(temp, self.path)
+        self._mtime = file_stamp(self.path)
+
+    def _entry(self, name):
+        return self.entries.setdefault(name, {"active": DEFAULT_VERSION, "versions": {}})
+
+    def versions(self, name):
+        """{version: model path} for a detector, including "default"."""
+        versions = {DEFAULT_VERSION: self.defaults[name]}
+        versions.update({version: info["path"] for version, info in self.entries.get(name, {}).get("versions", {}).items()})
+        return versions
+
+    def version_path(self, name, version):
+        path = self.versions(name).get(version)
+        if path is None:
+            raise ValueError(f"Unknown version of {name}: {version}")
+        return path
+
+    def active_version(self, name):
+        """The version the registry says `name` should serve."""
+        return self.entries.get(name, {}).get("active", DEFAULT_VERSION)
+
+    def active(self, name):
+        """The serving Deployment of a loaded detector, else None."""
+        return self._active.get(name)
+
+    def deployments(self):
+        return dict(self._active)
+
+    def install(self, name, deployment):
+        """
+        Makes a detector's first loaded deployment the serving one (called from loader threads);
+        its canary and shadow versions are then loaded on the event loop.
+        """
+        self._swap(name, deployment)
+        entry = self.entries.get(name, {})
+        if self._loop is not None and any(entry.get(role) for role in ROLES):
+            self._loop.call_soon_threadsafe(self._spawn, self.sync(name))
+
+    def _swap(self, name, deployment):
+        previous = self._active.get(name)
+        self._active[name] = deployment
+        if previous is not None and previous is not deployment:
+            previous.retire()
+
+    def register(self, name, version, path):
+        """Adds (or repoints) a version; raises ValueError for a bad name or a missing file."""
+        if not VERSION_PATTERN.match(version) or version == DEFAULT_VERSION:
+            raise ValueError(f"Invalid version name: {version!r}")
+        if not os.path.exists(path):
+            raise ValueError(f"Model file not found: {path}")
+        if not path.endswith((".pt", ".onnx")):
+            raise ValueError(f"Unsupported model format: {path}. Supported: .pt, .onnx")
+        self._read()
+        self._entry(name)["versions"][version] = {"path": path, "registered_at": time.time()}
+        self._save()
+
+    def route(self, name):
+        """(deployment, role) for a request: the canary for its share of traffic, else the serving version."""
+        canary = self.entries.get(name, {}).get("canary")
+        if canary and random.random() * 100 < canary.get("percent", 0):
+            deployment = self._candidates.get((name, canary["version"]))
+            if deployment is not None:
+                return deployment, "canary"
+        return self._active.get(name), "primary"
+
+    def shadow(self, name):
+        """The shadow deployment for this request when it is sampled, else None."""
+        shadow = self.entries.get(name, {}).get("shadow")
+        if shadow and random.random() * 100 < shadow.get("percent", 0):
+            return self._candidates.get((name, shadow["version"]))
+        return None
+
+    def describe(self, name):
+        entry = self.entries.get(name, {})
+        active = self._active.get(name)
+        return {
+            "active_version": self.active_version(name),
+            "serving": active.describe() if active is not None else None,
+            "versions": self.versions(name),
+            "traffic": {role: entry[role] for role in ROLES if entry.get(role)},
+            "candidates": [d.describe() for (n, _), d in self._candidates.items() if n == name],
+            "last_change": dict(self.status[name]),
+        }
+
+    def _spawn(self, coroutine):
+        task = asyncio.get_running_loop().create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def activate(self, name, version):
+        """
+        Marks `version` as the one to serve and starts loading it in the background (the same
+        version again reloads it). Raises ValueError for an unknown version.
+        """
+        self._read()
+        self.version_path(name, version)
+        self._entry(name)["active"] = version
+        self._save()
+        self._failed.pop((name, version), None)
+        self.status[name].update(state="pending", version=version, error=None, updated_at=time.time())
+        return self._spawn(self.sync(name, reload=True))
+
+    def set_traffic(self, name, role, version=None, percent=0.0):
+        """Sends `percent` of traffic to a canary or shadow version (None or 0 turns it off)."""
+        if role not in ROLES:
+            raise ValueError(f"Unsupported role: {role}. Supported: {', '.join(ROLES)}")
+        if not 0 <= percent <= 100:
+            raise ValueError(f"percent must be between 0 and 100, got {percent}")
+        self._read()
+        entry = self._entry(name)
+        if version and percent > 0:
+            self.version_path(name, version)
+            entry[role] = {"version": version, "percent": percent}
+        else:
+            entry.pop(role, None)
+        self._save()
+        return self._spawn(self.sync(name))
+
+    def _failed_before(self, name, version):
+        """True when the current file of this version has already failed to load."""
+        return self._failed.get((name, version), False) == file_stamp(self.version_path(name, version))
+
+    async def _load(self, name, version):
+        """Builds and warms up a version; None (logged and remembered) when it fails."""
+        source = self.version_path(name, version)
+        stamp = file_stamp(source)
+        if self._failed.get((name, version), False) == stamp:
+            return None
+        started = time.perf_counter()
+        deployment = None
+        try:
+            deployment = await asyncio.to_thread(self.build, name, version, source)
+            await deployment.warm_up()
+        except Exception as e:
+            if deployment is not None:
+                deployment.retire()
+            self._failed[(name, version)] = stamp
+            self.status[name].update(state="failed", version=version, error=str(e)[:200], updated_at=time.time())
+            logger.error(f"❌ {name}: version {version} failed to load: {e}")
+            return None
+        self._failed.pop((name, version), None)
+        logger.info(f"{name}: version {version} loaded and warmed up in {time.perf_counter() - started:.1f}s")
+        return deployment
+
+    async def sync(self, name, reload=False):
+        """
+        Brings a loaded detector in line with the registry: swaps in the active version when
+        another one is serving (or its file changed, or `reload`), and loads or unloads canary
+        and shadow versions. Detectors that have not loaded yet pick the active version when they do.
+        A version whose model file already failed to load is not retried until that file or the
+        registry changes, or it is activated again.
+        """
+        async with self._locks[name]:
+            entry = self.entries.get(name, {})
+            current = self._active.get(name)
+            if current is None and reload:
+                # Not loaded yet: the active version is what it will load
+                self.status[name].update(state="deferred", updated_at=time.time())
+            if current is not None:
+                version = self.active_version(name)
+                changed = current.version != version or current.stamp != (file_stamp(current.source), file_stamp(current.path))
+                if reload or (changed and not self._failed_before(name, version)):
+                    self.status[name].update(state="loading", version=version, updated_at=time.time())
+                    deployment = await self._load(name, version)
+                    metrics.MODEL_SWAPS.inc(detector=name, result="ok" if deployment is not None else "failed")
+                    if deployment is not None:
+                        self._swap(name, deployment)
+                        self.status[name].update(state="active", version=version, error=None, updated_at=time.time())
+                        logger.info(f"🔄 {name}: now serving version {version} (was {current.version})")
+
+            wanted = {entry[role]["version"] for role in ROLES if entry.get(role)} if current is not None else set()
+            for key in [key for key in self._candidates if key[0] == name and key[1] not in wanted]:
+                self._candidates.pop(key).retire()
+            for version in wanted:
+                if (name, version) not in self._candidates:
+                    deployment = await self._load(name, version)
+                    if deployment is not None:
+                        self._candidates[(name, version)] = deployment
+
+    async def watch(self, interval):
+        """Applies registry file edits and reloads replaced model files every `interval` seconds."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                changed = self._read()
+                if changed:
+                    # Someone edited the registry: failed versions get another chance
+                    self._failed.clear()
+                for name, deployment in list(self._active.items()):
+                    stamp = (file_stamp(deployment.source), file_stamp(deployment.path))
+                    # Only reload once a replaced file has stopped changing (not mid-copy)
+                    settled = stamp != deployment.stamp and stamp == self._seen.get(name) and None not in stamp
+                    self._seen[name] = stamp
+                    if changed or settled:
+                        await self.sync(name)
+            except Exception as e:
+                logger.error(f"Model registry watch error: {e}")
+
+    def start(self, interval):
+        """Starts watching (interval > 0) and brings detectors loaded before the event loop existed (serve.py --preload) up to date."""
+        self._loop = asyncio.get_running_loop()
+        for name in list(self._active):
+            self._spawn(self.sync(name))
+        if interval > 0:
+            self._watcher = self._loop.create_task(self.watch(interval))
+
+    def shutdown(self):
+        if self._watcher is not None:
+            self._watcher.cancel()
+        for task in list(self._tasks):
+            task.cancel()
+        for deployment in list(self._active.values()) + list(self._candidates.values()):
+            deployment.retire()
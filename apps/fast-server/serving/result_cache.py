@@ -0,0 +1,156 @@
+import base64
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def content_key(contents, *parts):
+    """Cache key for uploaded bytes plus everything else that changes the result."""
+    digest = hashlib.sha256(contents)
+    for part in parts:
+        digest.update(b"|" + str(part).encode())
+    return digest.hexdigest()
+
+
+def model_version(model_path):
+    """Cheap version tag for a model file: changes whenever the file is replaced."""
+    stat = os.stat(model_path)
+    return f"{stat.st_size:x}-{stat.st_mtime_ns:x}"
+
+
+class ResultCache:
+    """
+    LRU + TTL cache of detection results keyed by content_key().
+
+    Values are (overall_priority, detections, jpeg_bytes_or_None). The in-memory tier is
+    bounded by item count and approximate bytes; when `directory` is set, entries are also
+    written there as JSON files and looked up on a memory miss (at most `max_disk_items`
+    files are kept).
+    """
+
+    def __init__(self, ttl=600, max_items=1024, max_bytes=128 * 1024 * 1024, directory=None, max_disk_items=100000):
+        self.ttl = ttl
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.max_disk_items = max_disk_items
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (expires_at, size, value)
+        self._bytes = 0
+        self._disk_writes = 0
+        self._lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def _size(value):
+        priority, detections, jpeg = value
+        return len(json.dumps(detections, default=str)) + (len(jpeg) if jpeg else 0) + 64
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, size, value = entry
+                if expires_at >= time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                self._entries.pop(key)
+                self._bytes -= size
+
+        value = self._read_disk(key) if self.directory else None
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._store(key, value)
+        return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._store(key, value)
+        if self.directory:
+            self._write_disk(key, value)
+
+    def _store(self, key, value):
+        size = self._size(value)
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._bytes -= self._entries.pop(key)[1]
+        while self._entries and (len(self._entries) >= self.max_items or self._bytes + size > self.max_bytes):
+            _, (_, evicted_size, _) = self._entries.popitem(last=False)
+            self._bytes -= evicted_size
+        self._entries[key] = (time.monotonic() + self.ttl, size, value)
+        self._bytes += size
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def _read_disk(self, key):
+        path = self._path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                os.remove(path)
+                return None
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        jpeg = base64.b64decode(data["jpeg"]) if data.get("jpeg") else None
+        return data["priority"], data["detections"], jpeg
+
+    def _write_disk(self, key, value):
+        priority, detections, jpeg = value
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({
+                    "priority": priority,
+                    "detections": detections,
+                    "jpeg": base64.b64encode(jpeg).decode("ascii") if jpeg else None,
+                }, f, default=str)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Result cache disk write failed: {e}")
+            return
+
+        self._disk_writes += 1
+        if self._disk_writes % 100 == 0:
+            self._prune_disk()
+
+    def _prune_disk(self):
+        """Drops expired files, then the oldest ones beyond max_disk_items."""
+        files = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    files.append((os.path.getmtime(path), path))
+                except OSError:
+                    continue
+        files.sort()
+        cutoff = time.time() - self.ttl
+        excess = len(files) - self.max_disk_items
+        for i, (mtime, path) in enumerate(files):
+            if mtime >= cutoff and i >= excess:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
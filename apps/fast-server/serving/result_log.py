@@ -0,0 +1,91 @@
+import json
+import logging
+import os
+import queue
+import random
+import time
+from datetime import datetime
+from logging.handlers import QueueListener, RotatingFileHandler
+
+
+class SizeAndTimeRotatingFileHandler(RotatingFileHandler):
+    """RotatingFileHandler that also rolls the file over once it is `interval` seconds old."""
+
+    def __init__(self, filename, max_bytes=0, interval=0, backup_count=5):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8", delay=True)
+        self.interval = interval
+        self.opened_at = time.time()
+
+    def shouldRollover(self, record):
+        if self.interval and time.time() - self.opened_at >= self.interval:
+            return True
+        return super().shouldRollover(record)
+
+    def doRollover(self):
+        super().doRollover()
+        self.opened_at = time.time()
+
+
+class JsonLineFormatter(logging.Formatter):
+    def format(self, record):
+        return json.dumps(record.msg, default=str, separators=(",", ":"))
+
+
+class ResultLogger:
+    """
+    Non-blocking JSON-lines log of detection results.
+
+    `log()` only samples and enqueues the record; a background QueueListener thread does
+    the file writes and rotation. Records carrying an "error" are never sampled out, and
+    records are dropped (and counted) rather than blocking when the queue is full.
+    """
+
+    def __init__(self, path, max_bytes=50 * 1024 * 1024, rotate_seconds=24 * 3600, backup_count=5,
+                 sample_rate=1.0, max_queue=10000):
+        self.sample_rate = sample_rate
+        self.dropped = 0
+        self._handler_args = (max_bytes, rotate_seconds, backup_count)
+        self._max_queue = max_queue
+        self._start(path)
+
+    def _start(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._queue = queue.Queue(maxsize=self._max_queue)
+        handler = SizeAndTimeRotatingFileHandler(path, *self._handler_args)
+        handler.setFormatter(JsonLineFormatter())
+        self._listener = QueueListener(self._queue, handler)
+        self._listener.start()
+
+    def log(self, record):
+        if "error" not in record and self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return
+        record = {"timestamp": datetime.now().isoformat(timespec="milliseconds"), **record}
+        try:
+            self._queue.put_nowait(logging.makeLogRecord({"msg": record, "levelno": logging.INFO}))
+        except queue.Full:
+            self.dropped += 1
+
+    def reopen(self, path):
+        """
+        Starts a fresh writer thread on `path`. For forked workers: the parent's writer thread
+        does not exist in the child, and several processes must not rotate the same file.
+        The inherited handler is dropped unclosed so the parent's buffered lines aren't written twice.
+        """
+        self._start(path)
+
+    def close(self):
+        """Flushes queued records and stops the writer thread."""
+        self._listener.stop()
+        for handler in self._listener.handlers:
+            handler.close()
+
+
+def summarize_detections(detections):
+    """Compact per-detection fields kept in the result log."""
+    return [
+        {"class": d["class"], "confidence": round(float(d.get("confidence", 0.0)), 3), "bbox": d["bbox"]}
+        for d in detections
+    ]
@@ -35,5 +35,14 @@ echo "🛑 Press Ctrl+C to stop the server"
 echo "======================================"
 
 # Run the FastAPI server
+#   ./start_server.sh          development: single process, auto-reload on code changes
+#   ./start_server.sh --prod   production: pre-fork workers (see serve.py for all options), e.g.
+#       SERVE_WORKERS=4 SERVE_PRELOAD=1 ./start_server.sh --prod
+if [ "$1" = "--prod" ]; then
+    shift
+    echo "🏭 Production mode: python serve.py $*"
+    exec python serve.py --port 8001 "$@"
+fi
+
 uvicorn app:app --host 0.0.0.0 --port 8001 --reload
 
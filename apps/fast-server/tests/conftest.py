@@ -0,0 +1,76 @@
+import os
+import shutil
+import sys
+import tempfile
+
+import cv2
+import numpy as np
+import pytest
+
+# The server modules read their settings from the environment when first imported, so the
+# test settings go in before any of them: stand-in models (benchmarks/stub_models.py) in a
+# scratch directory, in-memory jobs, no result cache and no files left in the source tree.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+WORK_DIR = tempfile.mkdtemp(prefix="fast-server-tests-")
+STUB_MODEL_DIR = os.path.join(WORK_DIR, "models")
+os.environ.update({
+    "MODEL_DIR": STUB_MODEL_DIR,
+    "MODEL_EAGER": "none",
+    "MODEL_WATCH_SECONDS": "0",
+    "MODEL_REGISTRY_PATH": os.path.join(WORK_DIR, "registry.json"),
+    "MODEL_UPLOAD_DIR": os.path.join(WORK_DIR, "versions"),
+    "INFERENCE_CONFIG": os.path.join(WORK_DIR, "inference.json"),
+    "INFERENCE_CONFIG_RELOAD": "0",
+    "JOB_STORE": "memory",
+    "JOB_DIR": os.path.join(WORK_DIR, "jobs"),
+    "RESULT_CACHE_ENABLED": "0",
+    "RESULT_LOG_PATH": os.path.join(WORK_DIR, "logs", "model_outputs.jsonl"),
+    "ADMIN_TOKEN": "test-token",
+})
+
+# Boxes every stand-in model predicts on every image
+STUB_DETECTIONS = 6
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(WORK_DIR, ignore_errors=True)
+
+
+@pytest.fixture(scope="session")
+def stub_models():
+    """{detector name: model path} of the stand-in models served from MODEL_DIR."""
+    from benchmarks.stub_models import write_stub_models
+    return write_stub_models(STUB_MODEL_DIR, STUB_DETECTIONS)
+
+
+@pytest.fixture(scope="session")
+def image_bytes():
+    """A test photo shipped with the repo, as uploaded."""
+    with open(os.path.join(ROOT, "garbage_test_1.webp"), "rb") as f:
+        return f.read()
+
+
+@pytest.fixture
+def bgr_image():
+    """A random 480x720 BGR image."""
+    return np.random.default_rng(0).integers(0, 256, (480, 720, 3), dtype=np.uint8)
+
+
+@pytest.fixture
+def jpeg_bytes(bgr_image):
+    """`bgr_image` encoded as a JPEG upload."""
+    ok, buffer = cv2.imencode(".jpg", bgr_image)
+    assert ok
+    return buffer.tobytes()
+
+
+@pytest.fixture(scope="session")
+def client(stub_models):
+    """A TestClient for the FastAPI app, running its startup and shutdown hooks."""
+    from fastapi.testclient import TestClient
+
+    import app
+    with TestClient(app.app) as test_client:
+        yield test_client
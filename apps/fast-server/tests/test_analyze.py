@@ -0,0 +1,45 @@
+import app
+from detection_code.base_detector import BaseDetector
+
+
+def test_analyze_matches_the_single_detector_endpoints(client, jpeg_bytes):
+    response = client.post("/analyze", data={"detectors": "garbage,fallentree,pothole"}, files={"file": ("street.jpg", jpeg_bytes, "image/jpeg")})
+    assert response.status_code == 200
+    body = response.json()
+    assert set(body["results"]) == {"garbage", "fallentree", "pothole"}
+    for name, result in body["results"].items():
+        single = client.post(f"/{name}", data={"annotate": "false"}, files={"file": ("street.jpg", jpeg_bytes, "image/jpeg")}).json()
+        assert result["detections"] == single["detections"]
+        assert body["priorities"][name] == result["priority"]
+    highest = max(body["priorities"].values(), key=lambda priority: app.PRIORITY_RANK[priority.lower()])
+    assert body["overall_priority"] == highest.lower()
+    assert body["total_detections"] == sum(result["total_detections"] for result in body["results"].values())
+
+
+def test_analyze_preprocesses_once_per_input_size(client, jpeg_bytes, monkeypatch):
+    sizes = []
+    original = BaseDetector.preprocess
+
+    def counting_preprocess(images, size=640):
+        sizes.append(size)
+        return original(images, size)
+
+    monkeypatch.setattr(BaseDetector, "preprocess", staticmethod(counting_preprocess))
+    response = client.post("/analyze", data={"detectors": "garbage,fallentree,brokensignage"}, files={"file": ("street.jpg", jpeg_bytes, "image/jpeg")})
+    assert response.status_code == 200
+    assert sizes == [640]
+
+    sizes.clear()
+    response = client.post(
+        "/analyze", data={"detectors": "garbage,fallentree", "tiled": "true"}, files={"file": ("street.jpg", jpeg_bytes, "image/jpeg")},
+    )
+    assert response.status_code == 200
+    assert sizes == []
+
+
+def test_analyze_rejects_bad_requests(client, jpeg_bytes):
+    upload = {"file": ("street.jpg", jpeg_bytes, "image/jpeg")}
+    assert client.post("/analyze", data={"detectors": "garbage,nosuch"}, files=upload).status_code == 404
+    assert client.post("/analyze", data={"detectors": "garbage", "conf": "2"}, files=upload).status_code == 400
+    assert client.post("/analyze", files={"file": ("street.jpg", b"not an image", "image/jpeg")}).status_code == 400
+
@@ -0,0 +1,12 @@
+def test_detector_endpoint_runs_the_model(client, jpeg_bytes):
+    response = client.post("/garbage", files={"file": ("street.jpg", jpeg_bytes, "image/jpeg")})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["total_detections"] == len(body["detections"]) > 0
+    assert "garbage_priority" in body
+    assert body["annotated_image"]
+
+
+def test_invalid_image_is_rejected(client):
+    response = client.post("/garbage", files={"file": ("street.jpg", b"not an image", "image/jpeg")})
+    assert response.status_code == 400
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from detection_code.base_detector import BaseDetector, InferenceError
+from detection_code.garbage_detection import GarbageDetector
+from detection_code.ops import decode_predictions, letterbox, scale_boxes
+
+
+@pytest.fixture(scope="module")
+def detector(stub_models):
+    return GarbageDetector(stub_models["garbage"])
+
+
+def test_onnx_predictions_decode_the_raw_output(detector, bgr_image):
+    padded, ratio, pad = letterbox(bgr_image, 640)
+    tensor = padded[:, :, ::-1].transpose(2, 0, 1)[np.newaxis].astype(np.float32) / 255
+    raw = detector.model.run(None, {'images': tensor})[0][0]
+    boxes, scores, class_indices, _ = decode_predictions(raw, 0.25, detector.iou_threshold, detector.max_det)
+
+    (got_boxes, got_scores, got_classes, contours), = detector.predict_onnx_batch([bgr_image], 0.25)
+    assert contours is None
+    np.testing.assert_allclose(got_boxes, scale_boxes(boxes, ratio, pad, bgr_image.shape), rtol=1e-5)
+    np.testing.assert_allclose(got_scores, scores)
+    np.testing.assert_array_equal(got_classes, class_indices)
+
+
+def test_batch_matches_single_images(detector, bgr_image):
+    other = np.ascontiguousarray(bgr_image[:300, :200])
+    batched = detector.predict_batch([bgr_image, other], annotate=False)
+    assert batched == [detector.predict_array(bgr_image, annotate=False), detector.predict_array(other, annotate=False)]
+
+
+def test_shared_preprocess_matches_own_buffers(detector, bgr_image):
+    batch = BaseDetector.preprocess([bgr_image], 640)
+    own = detector.predict_onnx_batch([bgr_image], 0.25)
+    shared = detector.predict_onnx_batch([bgr_image], 0.25, batch)
+    np.testing.assert_array_equal(own[0][0], shared[0][0])
+
+
+def test_max_det_and_threshold_overrides(detector, bgr_image):
+    _, _, detections = detector.predict_array(bgr_image, annotate=False, max_det=2)
+    assert len(detections) == 2
+    _, _, detections = detector.predict_array(bgr_image, 0.99, annotate=False)
+    assert detections == []
+
+
+def test_fixed_size_exports_reject_other_sizes(detector):
+    assert detector.input_size() == 640
+    with pytest.raises(ValueError):
+        detector.input_size(320)
+
+
+def test_model_failures_raise_inference_error(detector, bgr_image, monkeypatch):
+    def broken_run(output_names, inputs):
+        raise RuntimeError("out of memory")
+
+    monkeypatch.setattr(detector, "binding", None)
+    monkeypatch.setattr(detector.model, "run", broken_run)
+    with pytest.raises(InferenceError, match="garbage_detection.onnx failed on a batch of 1: out of memory"):
+        detector.predict_array(bgr_image)
+
+
+def test_unknown_model_formats_are_rejected(tmp_path):
+    path = tmp_path / "model.tflite"
+    path.write_bytes(b"")
+    with pytest.raises(ValueError):
+        GarbageDetector(str(path))
+    with pytest.raises(FileNotFoundError):
+        GarbageDetector(str(tmp_path / "missing.onnx"))
@@ -0,0 +1,113 @@
+import io
+import tarfile
+import zipfile
+
+import app
+
+
+def make_zip(members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as zf:
+        for name, data in members:
+            zf.writestr(name, data)
+    return buffer.getvalue()
+
+
+def make_tar(members):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as tf:
+        for name, data in members:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tf.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+def test_read_archive_keeps_images_only(jpeg_bytes):
+    members = [("a.jpg", jpeg_bytes), ("notes.txt", b"skip me"), ("dir/b.PNG", b"png bytes")]
+    for data in (make_zip(members), make_tar(members)):
+        assert app.read_archive(io.BytesIO(data)) == [("a.jpg", jpeg_bytes), ("dir/b.PNG", b"png bytes")]
+
+
+def test_read_archive_skips_oversized_members(monkeypatch, jpeg_bytes):
+    monkeypatch.setattr(app, "IMAGE_MAX_BYTES", len(jpeg_bytes) - 1)
+    assert app.read_archive(io.BytesIO(make_zip([("a.jpg", jpeg_bytes), ("b.jpg", b"small")]))) == [("a.jpg", None), ("b.jpg", b"small")]
+
+
+def test_read_archive_stops_at_the_file_limit(monkeypatch):
+    monkeypatch.setattr(app, "BATCH_MAX_FILES", 2)
+    members = [(f"{i}.jpg", b"x") for i in range(5)]
+    assert [name for name, _ in app.read_archive(io.BytesIO(make_zip(members)))] == ["0.jpg", "1.jpg"]
+
+
+def test_detector_batch_keeps_upload_order(client, jpeg_bytes):
+    files = [
+        ("files", ("first.jpg", jpeg_bytes, "image/jpeg")),
+        ("files", ("broken.jpg", b"not an image", "image/jpeg")),
+        ("archive", ("more.zip", make_zip([("third.jpg", jpeg_bytes)]), "application/zip")),
+    ]
+    response = client.post("/garbage/batch", files=files)
+    assert response.status_code == 200
+    body = response.json()
+    assert (body["total"], body["failed"]) == (3, 1)
+    assert [result["filename"] for result in body["results"]] == ["first.jpg", "broken.jpg", "third.jpg"]
+    assert "error" in body["results"][1]
+    assert body["results"][0]["detections"] == body["results"][2]["detections"]
+    assert body["results"][0]["total_detections"] > 0
+
+
+def test_multi_detector_batch_groups_results_by_detector(client, jpeg_bytes):
+    response = client.post(
+        "/batch", data={"detectors": "garbage,fallentree"}, files=[("files", ("street.jpg", jpeg_bytes, "image/jpeg"))],
+    )
+    assert response.status_code == 200
+    result = response.json()["results"][0]
+    assert set(result["results"]) == {"garbage", "fallentree"}
+    assert "fallentree_priority" in result["results"]["fallentree"]
+
+
+def test_batch_rejects_unknown_detectors_and_empty_uploads(client):
+    assert client.post("/nosuch/batch", files=[("files", ("a.jpg", b"x", "image/jpeg"))]).status_code == 404
+    assert client.post("/garbage/batch", data={"include_images": "true"}).status_code == 400
+    response = client.post("/garbage/batch", files=[("archive", ("a.zip", b"garbage bytes", "application/zip"))])
+    assert response.status_code == 400
+
+
+def test_batch_checks_the_file_count_before_reading(client, monkeypatch):
+    reads = []
+
+    async def read_upload(file, max_bytes=0):
+        reads.append(file.filename)
+        return b""
+
+    monkeypatch.setattr(app, "BATCH_MAX_FILES", 2)
+    monkeypatch.setattr(app, "read_upload", read_upload)
+    files = [("files", (f"{i}.jpg", b"x", "image/jpeg")) for i in range(3)]
+    assert client.post("/garbage/batch", files=files).status_code == 413
+    assert reads == []
+
+
+def test_batch_is_decoded_and_scored_a_slice_at_a_time(client, jpeg_bytes, monkeypatch):
+    detect_batch, read_upload, sizes, events = app.detect_batch, app.read_upload, [], []
+
+    async def recording_read(file, max_bytes=0):
+        events.append("read")
+        return await read_upload(file, max_bytes)
+
+    async def recording_detect(deployment, name, images, *args):
+        sizes.append(len(images))
+        events.append("detect")
+        return await detect_batch(deployment, name, images, *args)
+
+    monkeypatch.setattr(app, "read_upload", recording_read)
+    monkeypatch.setattr(app, "detect_batch", recording_detect)
+    step = app.batcher_settings("garbage")["max_batch"] * app.executor_settings("garbage", "garbage.onnx")["workers"]
+    files = [("files", (f"{i}.jpg", jpeg_bytes, "image/jpeg")) for i in range(2 * step + 1)]
+    response = client.post("/garbage/batch", files=files)
+    assert response.status_code == 200
+    body = response.json()
+    assert [result["filename"] for result in body["results"]] == [f"{i}.jpg" for i in range(2 * step + 1)]
+    assert all(result["total_detections"] > 0 for result in body["results"])
+    assert sizes == [step, step, 1]
+    # Each slice is read only after the one before it was scored
+    assert events == (["read"] * step + ["detect"]) * 2 + ["read", "detect"]
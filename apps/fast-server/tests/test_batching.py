@@ -0,0 +1,83 @@
+import asyncio
+
+from serving.batching import MicroBatcher
+
+
+class FakeExecutor:
+    """Answers predict_batch with each image's value, recording every job it gets."""
+
+    name = "fake"
+
+    def __init__(self, error=None):
+        self.jobs = []
+        self.error = error
+
+    async def submit(self, method, images, conf_threshold, **options):
+        self.jobs.append((method, images, conf_threshold, options))
+        await asyncio.sleep(0)
+        if self.error is not None:
+            raise self.error
+        if method == "predict_array":
+            return (None, "Low", [images])
+        return [(None, "Low", [image]) for image in images]
+
+
+def run_concurrently(batcher, calls):
+    async def scenario():
+        results = await asyncio.gather(*(batcher.predict(image, **options) for image, options in calls))
+        batcher.shutdown()
+        return results
+    return asyncio.run(scenario())
+
+
+def test_disabled_batcher_calls_predict_array():
+    executor = FakeExecutor()
+    batcher = MicroBatcher(executor, window_ms=0)
+    assert not batcher.enabled
+    assert run_concurrently(batcher, [(1, {}), (2, {})]) == [(None, "Low", [1]), (None, "Low", [2])]
+    assert [job[0] for job in executor.jobs] == ["predict_array", "predict_array"]
+
+
+def test_concurrent_calls_share_one_job():
+    executor = FakeExecutor()
+    batcher = MicroBatcher(executor, window_ms=20, max_batch=8)
+    results = run_concurrently(batcher, [(i, {}) for i in range(5)])
+    assert results == [(None, "Low", [i]) for i in range(5)]
+    assert [(job[0], job[1]) for job in executor.jobs] == [("predict_batch", [0, 1, 2, 3, 4])]
+
+
+def test_batches_are_capped_at_max_batch():
+    executor = FakeExecutor()
+    batcher = MicroBatcher(executor, window_ms=20, max_batch=2)
+    results = run_concurrently(batcher, [(i, {}) for i in range(5)])
+    assert results == [(None, "Low", [i]) for i in range(5)]
+    assert sorted(len(job[1]) for job in executor.jobs) == [1, 2, 2]
+
+
+def test_different_settings_run_as_separate_jobs():
+    executor = FakeExecutor()
+    batcher = MicroBatcher(executor, window_ms=20, max_batch=8)
+    calls = [
+        (0, {"conf_threshold": 0.25}),
+        (1, {"conf_threshold": 0.5}),
+        (2, {"conf_threshold": 0.25}),
+        (3, {"conf_threshold": 0.25, "imgsz": 320}),
+    ]
+    results = run_concurrently(batcher, calls)
+    assert results == [(None, "Low", [i]) for i in range(4)]
+    jobs = sorted((job[1], job[2], job[3].get("imgsz")) for job in executor.jobs)
+    assert jobs == [([0, 2], 0.25, None), ([1], 0.5, None), ([3], 0.25, 320)]
+
+
+def test_job_errors_reach_every_caller():
+    executor = FakeExecutor(error=RuntimeError("model failed"))
+    batcher = MicroBatcher(executor, window_ms=20, max_batch=8)
+
+    async def scenario():
+        results = await asyncio.gather(batcher.predict(0), batcher.predict(1), return_exceptions=True)
+        batcher.shutdown()
+        return results
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert len(executor.jobs) == 1
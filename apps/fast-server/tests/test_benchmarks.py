@@ -0,0 +1,64 @@
+import json
+
+import numpy as np
+import onnxruntime as ort
+import pytest
+
+from benchmarks import compare
+from benchmarks.common import parse_sizes, summarize, synthetic_image, write_results
+from benchmarks.stub_models import make_stub_model
+from detection_code.ops import decode_predictions
+
+
+@pytest.mark.parametrize("detections", [1, 7, 30])
+def test_stub_model_predicts_exactly_n_boxes(tmp_path, detections):
+    path = make_stub_model(str(tmp_path / "stub.onnx"), detections)
+    session = ort.InferenceSession(path, providers=['CPUExecutionProvider'])
+    outputs = session.run(None, {"images": np.zeros((3, 3, 640, 640), dtype=np.float32)})
+    assert outputs[0].shape == (3, 5, 8400)
+    for output in outputs[0]:
+        boxes, _, _, _ = decode_predictions(output, 0.25, 0.7)
+        assert len(boxes) == detections
+
+
+def test_segmentation_stub_has_protos(tmp_path):
+    path = make_stub_model(str(tmp_path / "seg.onnx"), 4, num_masks=32, imgsz=320)
+    session = ort.InferenceSession(path, providers=['CPUExecutionProvider'])
+    predictions, protos = session.run(None, {"images": np.zeros((2, 3, 320, 320), dtype=np.float32)})
+    assert predictions.shape == (2, 5 + 32, 2100)
+    assert protos.shape == (2, 32, 80, 80)
+
+
+def test_summarize():
+    summary = summarize([1.0, 2.0, 3.0, 4.0])
+    assert summary["n"] == 4
+    assert (summary["mean_ms"], summary["p50_ms"], summary["min_ms"], summary["max_ms"]) == (2.5, 2.5, 1.0, 4.0)
+    assert summarize([]) == {"n": 0}
+
+
+def test_parse_sizes_and_synthetic_images():
+    assert parse_sizes("640x480, 1920X1080,") == [(640, 480), (1920, 1080)]
+    image = synthetic_image(64, 48, seed=3)
+    assert image.shape == (48, 64, 3) and image.dtype == np.uint8
+    np.testing.assert_array_equal(image, synthetic_image(64, 48, seed=3))
+
+
+def write_report(path, suite, results):
+    write_results(str(path), suite, {"models": "stub"}, results)
+    return str(path)
+
+
+def test_compare_flags_regressions(tmp_path, capsys):
+    baseline = write_report(tmp_path / "base.json", "micro", [{"name": "a", "p50_ms": 10.0}, {"name": "b", "p50_ms": 10.0}])
+    faster = write_report(tmp_path / "fast.json", "micro", [{"name": "a", "p50_ms": 10.5}, {"name": "b", "p50_ms": 5.0}])
+    slower = write_report(tmp_path / "slow.json", "micro", [{"name": "a", "p50_ms": 12.0}, {"name": "c", "p50_ms": 1.0}])
+    assert compare.main([baseline, faster]) == 0
+    assert compare.main([baseline, slower]) == 1
+    assert "only in candidate" in capsys.readouterr().out
+    assert compare.change("images_per_s", 100.0, 80.0) == pytest.approx(0.2)
+
+    with open(baseline, encoding="utf-8") as f:
+        assert json.load(f)["suite"] == "micro"
+    macro = write_report(tmp_path / "macro.json", "macro", [])
+    with pytest.raises(SystemExit):
+        compare.main([baseline, macro])
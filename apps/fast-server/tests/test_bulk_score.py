@@ -0,0 +1,61 @@
+import json
+import os
+
+import cv2
+
+import bulk_score
+
+
+def write_images(directory, names, image):
+    for name in names:
+        path = directory / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        cv2.imwrite(str(path), image)
+
+
+def test_iter_images_reads_directories_globs_and_manifests(tmp_path, bgr_image):
+    write_images(tmp_path, ["a/1.jpg", "a/2.png", "a/sub/3.jpg", "b/4.jpg"], bgr_image)
+    (tmp_path / "a" / "notes.txt").write_text("skip")
+    (tmp_path / "list.csv").write_text("path,site\nb/4.jpg,x\na/1.jpg,y\n,z\n")
+    (tmp_path / "list.jsonl").write_text(json.dumps({"file": str(tmp_path / "b" / "4.jpg")}) + "\n\n")
+
+    sources = [str(tmp_path / "a"), str(tmp_path / "b" / "*.jpg"), str(tmp_path / "list.csv")]
+    assert [os.path.relpath(p, tmp_path) for p in bulk_score.iter_images(sources)] == [
+        os.path.join("a", "1.jpg"), os.path.join("a", "2.png"), os.path.join("a", "sub", "3.jpg"), os.path.join("b", "4.jpg"),
+    ]
+    assert list(bulk_score.iter_images([str(tmp_path / "list.jsonl")], "file")) == [str(tmp_path / "b" / "4.jpg")]
+
+
+def test_load_checkpoint_drops_a_cut_off_line(tmp_path):
+    journal = tmp_path / "scores.jsonl"
+    assert bulk_score.load_checkpoint(str(journal)) == set()
+    journal.write_text('{"path": "a.jpg", "detector": "garbage"}\n{"path": "b.jpg", "detector": "garb')
+    assert bulk_score.load_checkpoint(str(journal)) == {("a.jpg", "garbage")}
+    assert journal.read_text() == '{"path": "a.jpg", "detector": "garbage"}\n'
+
+
+def test_chunked():
+    assert list(bulk_score.chunked(iter(range(5)), 2)) == [[0, 1], [2, 3], [4]]
+
+
+def test_main_scores_and_resumes(tmp_path, stub_models, bgr_image):
+    write_images(tmp_path / "images", ["1.jpg", "2.jpg", "3.jpg"], bgr_image)
+    (tmp_path / "images" / "4.jpg").write_bytes(b"not an image")
+    output = str(tmp_path / "scores.jsonl")
+    args = [str(tmp_path / "images"), "--detector", "garbage,fallentree", "--output", output, "--batch-size", "2"]
+
+    assert bulk_score.main(args) == 0
+    with open(output, encoding="utf-8") as f:
+        records = [json.loads(line) for line in f]
+    assert len(records) == 8
+    assert sum("error" in record for record in records) == 2
+    assert all(record["total_detections"] > 0 for record in records if "error" not in record)
+
+    # A rerun finds every pair in the checkpoint and adds nothing
+    assert bulk_score.main(args) == 0
+    with open(output, encoding="utf-8") as f:
+        assert len(f.readlines()) == 8
+
+    assert bulk_score.main(args + ["--detector", "garbage,brokensignage"]) == 0
+    with open(output, encoding="utf-8") as f:
+        assert len(f.readlines()) == 12
@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+from detection_code import clustering
+from detection_code.clustering import cluster_detections, cluster_points, summarize_clusters
+from detection_code.pothole_detector import determine_road_priority
+
+
+def brute_force_clusters(points, threshold):
+    """All-pairs breadth-first search, as determine_road_priority used to cluster."""
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    seen, clusters = set(), []
+    for start in range(len(points)):
+        if start in seen:
+            continue
+        seen.add(start)
+        cluster, queue = [], [start]
+        while queue:
+            i = queue.pop()
+            cluster.append(i)
+            for j in range(len(points)):
+                if j not in seen and np.linalg.norm(points[i] - points[j]) < threshold:
+                    seen.add(j)
+                    queue.append(j)
+        clusters.append(sorted(cluster))
+    return clusters
+
+
+@pytest.mark.parametrize("seed,count,threshold", [(0, 50, 150), (1, 300, 40), (2, 400, 5), (3, 200, 1000)])
+def test_grid_clusters_match_brute_force(seed, count, threshold):
+    rng = np.random.default_rng(seed)
+    points = rng.uniform(-500, 1500, (count, 2))
+    assert cluster_points(points, threshold) == brute_force_clusters(points, threshold)
+
+
+def test_dense_pile_and_chains():
+    rng = np.random.default_rng(4)
+    pile = rng.uniform(0, 3, (300, 2))
+    chain = np.column_stack([np.arange(10) * 9.0 + 100, np.full(10, 100.0)])
+    points = np.vstack([pile, chain])
+    assert cluster_points(points, 10) == brute_force_clusters(points, 10)
+    assert [len(c) for c in cluster_points(points, 10)] == [300, 10]
+
+
+def test_dense_pile_in_small_blocks(monkeypatch):
+    # Tiny limits force many distance blocks per cell pair and repeated edge folding
+    monkeypatch.setattr(clustering, "_BLOCK_DISTANCES", 64)
+    monkeypatch.setattr(clustering, "_MAX_EDGES", 100)
+    rng = np.random.default_rng(5)
+    points = np.vstack([rng.uniform(0, 3, (200, 2)), rng.uniform(50, 53, (150, 2)), rng.uniform(-500, 500, (100, 2))])
+    assert cluster_points(points, 8) == brute_force_clusters(points, 8)
+
+
+def test_distance_must_be_strictly_below_the_threshold():
+    assert cluster_points([[0, 0], [10, 0]], 10) == [[0], [1]]
+    assert cluster_points([[0, 0], [9.999, 0]], 10) == [[0, 1]]
+    assert cluster_points([[0, 0], [0, 0]], 0) == [[0], [1]]
+    assert cluster_points([], 10) == []
+
+
+def pothole(x, y, priority='Low', area_ratio=0.001):
+    return {'bbox': [x, y, x + 20, y + 20], 'priority': priority, 'area_ratio': area_ratio}
+
+
+def test_cluster_detections_by_corner_or_centre():
+    detections = [{'bbox': [0, 0, 10, 10]}, {'bbox': [15, 0, 100, 100]}]
+    assert cluster_detections(detections, 10) == [[0], [1]]
+    assert cluster_detections(detections, 10, anchor="center") == [[0], [1]]
+    assert cluster_detections(detections, 20) == [[0, 1]]
+    assert cluster_detections(detections, 10, points=[[0, 0], [1, 1]]) == [[0, 1]]
+    with pytest.raises(ValueError):
+        cluster_detections(detections, 10, anchor="corner")
+    assert summarize_clusters(detections, [[0, 1]]) == [{"size": 2, "members": [0, 1], "bbox": [0.0, 0.0, 100.0, 100.0]}]
+
+
+def test_road_priority_from_clusters():
+    assert determine_road_priority([], 150, (720, 1280))[0] == 'Low'
+    apart = [pothole(0, 0), pothole(500, 500)]
+    assert determine_road_priority(apart, 150, (720, 1280))[0] == 'Low'
+    pair = [pothole(0, 0), pothole(100, 0)]
+    assert determine_road_priority(pair, 150, (720, 1280))[0] == 'Medium'
+    three = [pothole(0, 0), pothole(100, 0), pothole(200, 0)]
+    priority, _, clusters = determine_road_priority(three, 150, (720, 1280))
+    assert (priority, clusters) == ('High', [[0, 1, 2]])
@@ -0,0 +1,172 @@
+from types import SimpleNamespace
+
+import cv2
+import numpy as np
+import pytest
+
+import app
+from serving import dedup
+from serving.dedup import (
+    DuplicateIndex, dhash, fingerprint, geohash_bounds, geohash_encode, geohash_neighbours, normalize_geohash,
+)
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+def brute_force_lookup(reports, image_hash, max_distance, cells=None):
+    """(report_id, distance) of the closest report within max_distance, by comparing against every one."""
+    best = None
+    for report_id, stored_hash, cell in reports:
+        if cells is not None and cell is not None and cell not in cells:
+            continue
+        distance = hamming(stored_hash, image_hash)
+        if distance <= max_distance and (best is None or distance < best[1]):
+            best = (report_id, distance)
+    return best
+
+
+def test_lookup_matches_brute_force():
+    rng = np.random.default_rng(0)
+    index = DuplicateIndex(max_distance=12)
+    bases = [int(h) for h in rng.integers(0, 2**63, 20, dtype=np.int64)]
+    reports = []
+    for _ in range(500):
+        # Near copies of a few base hashes, so matches at many distances exist
+        image_hash = bases[rng.integers(len(bases))]
+        for bit in rng.choice(64, rng.integers(0, 16), replace=False):
+            image_hash ^= 1 << int(bit)
+        reports.append((index.add(image_hash), image_hash, None))
+    for _ in range(200):
+        probe = bases[rng.integers(len(bases))] ^ (1 << int(rng.integers(64)))
+        expected = brute_force_lookup(reports, probe, 12)
+        match = index.lookup(probe)
+        if expected is None:
+            assert match is None
+        else:
+            # Ties may pick either report; the distance and the matched report's hash must agree
+            assert match[1] == expected[1]
+            assert hamming(reports[match[0] - 1][1], probe) == match[1]
+
+
+def test_located_lookup_only_sees_nearby_cells():
+    rng = np.random.default_rng(1)
+    index = DuplicateIndex(max_distance=64, precision=5)
+    reports = []
+    for _ in range(300):
+        image_hash = int(rng.integers(0, 2**63))
+        cell = None if rng.random() < 0.1 else geohash_encode(rng.uniform(40.0, 40.2), rng.uniform(-74.2, -74.0), 5)
+        reports.append((index.add(image_hash, cell), image_hash, cell))
+    for _ in range(100):
+        probe = int(rng.integers(0, 2**63))
+        cell = geohash_encode(rng.uniform(40.0, 40.2), rng.uniform(-74.2, -74.0), 5)
+        expected = brute_force_lookup(reports, probe, 64, set(geohash_neighbours(cell)))
+        match = index.lookup(probe, cell)
+        assert match[1] == expected[1]
+        matched_cell = reports[match[0] - 1][2]
+        assert matched_cell is None or matched_cell in geohash_neighbours(cell)
+
+
+def test_geohash_cells_and_neighbours():
+    assert geohash_encode(57.64911, 10.40744, 11) == "u4pruydqqvj"
+    lat_min, lat_max, lon_min, lon_max = geohash_bounds("u4pruyd")
+    assert lat_min <= 57.64911 <= lat_max and lon_min <= 10.40744 <= lon_max
+
+    neighbours = geohash_neighbours("u4pruyd")
+    assert len(neighbours) == 9 and "u4pruyd" in neighbours
+    # A point just across each edge and corner of the cell lands in one of its neighbours
+    eps = 1e-9
+    for lat in (lat_min - eps, (lat_min + lat_max) / 2, lat_max + eps):
+        for lon in (lon_min - eps, (lon_min + lon_max) / 2, lon_max + eps):
+            assert geohash_encode(lat, lon, 7) in neighbours
+    # Cells on the antimeridian wrap around; cells at the pole have no neighbours beyond it
+    assert geohash_encode(0.0, 179.99, 3) in geohash_neighbours(geohash_encode(0.0, -179.99, 3))
+    assert len(geohash_neighbours(geohash_encode(89.99, 0.0, 2))) == 6
+
+
+def test_normalize_geohash():
+    assert normalize_geohash(" U4PRUYDQQ ", 7) == "u4pruyd"
+    with pytest.raises(ValueError):
+        normalize_geohash("u4pr", 7)
+    with pytest.raises(ValueError):
+        normalize_geohash("u4pruyda", 7)  # 'a' is not in the geohash alphabet
+    with pytest.raises(ValueError):
+        DuplicateIndex(precision=13)
+
+
+def test_oldest_reports_are_evicted():
+    index = DuplicateIndex(max_distance=0, max_items=4)
+    hashes = [1 << i for i in range(10)]
+    cells = ["u4pruyd", None, "u4pruyd", "ezs42gx"] * 3
+    ids = [index.add(h, c) for h, c in zip(hashes, cells)]
+    assert ids == list(range(1, 11))
+    assert len(index) == 4
+    for image_hash, cell, report_id in zip(hashes, cells, ids):
+        match = index.lookup(image_hash, cell)
+        assert match == ((report_id, 0) if report_id > 6 else None)
+    # Every evicted report has left its cell's bucket too
+    assert sum(len(ids) - head for ids, head in index._buckets.values()) == 4
+
+
+def test_ttl_expires_reports(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(dedup, "time", SimpleNamespace(monotonic=lambda: now[0]))
+    index = DuplicateIndex(max_distance=2, ttl=60)
+    index.add(0b1111)
+    now[0] += 30
+    assert index.lookup(0b1110) == (1, 1)
+    now[0] += 31
+    assert index.lookup(0b1110) is None
+
+
+def test_register_and_results():
+    index = DuplicateIndex(max_distance=3, max_results=2)
+    assert index.register(0xFF) == (1, None)
+    assert index.register(0xFE) == (1, 1)
+    assert index.register(0xFF00) == (2, None)
+    assert len(index) == 2 and index.duplicates == 1
+
+    index.put_result(1, "garbage", "a")
+    index.put_result(2, "garbage", "b")
+    assert index.get_result(1, "garbage") == "a"
+    index.put_result(2, "pothole", "c")
+    assert index.get_result(2, "garbage") is None  # least recently used
+    assert index.get_result(1, "garbage") == "a"
+
+
+def test_fingerprint_survives_recompression(bgr_image, jpeg_bytes):
+    image_hash, size = fingerprint(jpeg_bytes)
+    assert size == (720, 480)
+    assert hamming(image_hash, dhash(bgr_image)) <= 6
+    ok, smaller = cv2.imencode(".jpg", cv2.resize(bgr_image, (360, 240)), [cv2.IMWRITE_JPEG_QUALITY, 60])
+    assert hamming(fingerprint(smaller.tobytes())[0], image_hash) <= 6
+    assert fingerprint(b"not an image") is None
+
+
+@pytest.fixture
+def reuse_index(monkeypatch):
+    index = DuplicateIndex()
+    monkeypatch.setattr(app, "duplicate_index", index)
+    monkeypatch.setattr(app, "DEDUP_MODE", "reuse")
+    return index
+
+
+def test_endpoint_reuses_earlier_results(client, reuse_index, jpeg_bytes):
+    upload = {"file": ("a.jpg", jpeg_bytes, "image/jpeg")}
+    first = client.post("/garbage", data={"annotate": "false", "geohash": "u4pruydqq"}, files=upload).json()
+    assert (first["report_id"], first["duplicate"]) == (1, False)
+    second = client.post("/garbage", data={"annotate": "false", "latitude": "57.64911", "longitude": "10.40744"}, files=upload).json()
+    assert (second["report_id"], second["duplicate"], second["reused_result"]) == (1, True, True)
+    assert second["detections"] == first["detections"]
+    assert len(reuse_index) == 1
+
+    bad = client.post("/garbage", data={"geohash": "u4p"}, files=upload)
+    assert bad.status_code == 400
+
+
+def test_endpoint_indexes_only_successful_reports(client, reuse_index, jpeg_bytes, monkeypatch):
+    monkeypatch.setattr(app, "decode_upload", lambda contents: (None, (1.0, 1.0)))
+    response = client.post("/garbage", files={"file": ("a.jpg", jpeg_bytes, "image/jpeg")})
+    assert response.status_code == 400
+    assert len(reuse_index) == 0
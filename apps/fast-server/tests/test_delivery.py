@@ -0,0 +1,82 @@
+import base64
+import json
+
+import cv2
+import numpy as np
+
+import app
+from serving.annotated_cache import AnnotatedImageCache
+
+
+def test_cache_evicts_oldest_by_count_and_bytes():
+    cache = AnnotatedImageCache(max_items=2, max_bytes=10)
+    first, second = cache.put(b"aaaa"), cache.put(b"bbbb")
+    third = cache.put(b"cccc")
+    assert cache.get(first) is None
+    assert (cache.get(second), cache.get(third)) == (b"bbbb", b"cccc")
+    fourth = cache.put(b"dddddddd")
+    assert [cache.get(i) for i in (second, third, fourth)] == [None, None, b"dddddddd"]
+
+
+def test_cache_entries_expire(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("serving.annotated_cache.time.monotonic", lambda: now[0])
+    cache = AnnotatedImageCache(ttl=10)
+    image_id = cache.put(b"jpeg")
+    now[0] += 5
+    assert cache.get(image_id) == b"jpeg"
+    now[0] += 10
+    assert cache.get(image_id) is None
+    assert cache.get("unknown") is None
+
+
+def test_encode_jpeg_limits_the_longest_side(bgr_image):
+    jpeg = app.encode_jpeg(bgr_image, quality=80, max_dimension=360)
+    decoded = cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR)
+    assert decoded.shape[:2] == (240, 360)
+
+
+def upload(jpeg_bytes):
+    return {"file": ("street.jpg", jpeg_bytes, "image/jpeg")}
+
+
+def test_annotate_false_skips_the_image(client, jpeg_bytes):
+    body = client.post("/garbage", data={"annotate": "false"}, files=upload(jpeg_bytes)).json()
+    assert body["annotated_image"] is None
+    assert body["total_detections"] > 0
+
+
+def test_base64_image_decodes(client, jpeg_bytes):
+    body = client.post("/garbage", data={"max_dimension": "320"}, files=upload(jpeg_bytes)).json()
+    image = cv2.imdecode(np.frombuffer(base64.b64decode(body["annotated_image"]), np.uint8), cv2.IMREAD_COLOR)
+    assert max(image.shape[:2]) == 320
+
+
+def test_ref_image_is_served_once_stored(client, jpeg_bytes):
+    body = client.post("/garbage", data={"image_format": "ref"}, files=upload(jpeg_bytes)).json()
+    assert "annotated_image" not in body
+    response = client.get(body["annotated_image_url"])
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/jpeg"
+    assert response.content[:2] == b"\xff\xd8"
+    assert client.get("/annotated/unknown").status_code == 404
+
+
+def test_multipart_response_holds_json_then_jpeg(client, jpeg_bytes):
+    response = client.post("/garbage", data={"image_format": "multipart"}, files=upload(jpeg_bytes))
+    assert response.status_code == 200
+    content_type = response.headers["content-type"]
+    assert content_type.startswith("multipart/mixed; boundary=")
+    boundary = content_type.split("boundary=")[1].encode()
+    parts = response.content.split(b"--" + boundary)
+    assert parts[-1].strip() == b"--"
+    headers, body = parts[1].split(b"\r\n\r\n", 1)
+    assert b"application/json" in headers
+    assert json.loads(body)["total_detections"] > 0
+    headers, body = parts[2].split(b"\r\n\r\n", 1)
+    assert b"image/jpeg" in headers
+    assert body[:2] == b"\xff\xd8"
+
+
+def test_unknown_image_format_is_rejected(client, jpeg_bytes):
+    assert client.post("/garbage", data={"image_format": "png"}, files=upload(jpeg_bytes)).status_code == 400
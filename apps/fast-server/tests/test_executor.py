@@ -0,0 +1,85 @@
+import asyncio
+import threading
+
+import pytest
+
+from detection_code.instrumentation import stage
+from serving.executor import DetectorExecutor, ExecutorSaturated
+
+
+class FakeDetector:
+    """Records the threads it runs on; `wait` blocks until the test releases it."""
+
+    release = None
+
+    def __init__(self, model_path):
+        self.model_path = model_path
+        self.load_seconds = 0.5
+        self.threads = set()
+
+    def input_size(self):
+        return 320
+
+    def predict_array(self, value, scale=1):
+        self.threads.add(threading.current_thread().name)
+        with stage('forward'):
+            pass
+        return value * scale
+
+    def wait(self):
+        FakeDetector.release.wait(5)
+        return "done"
+
+    def fail(self):
+        raise RuntimeError("broken model")
+
+
+def test_rejects_unknown_kind():
+    with pytest.raises(ValueError):
+        DetectorExecutor("fake", FakeDetector, "model.onnx", kind='fiber')
+
+
+def test_runs_off_the_event_loop_and_reports_stages():
+    observed = []
+    executor = DetectorExecutor("fake", FakeDetector, "model.onnx", stage_observer=observed.append)
+    try:
+        assert executor.load_seconds == 0.5
+        assert executor.input_size == 320
+        assert asyncio.run(executor.submit("predict_array", 3, scale=2)) == 6
+        assert executor.detector.threads == {"fake-infer_0"}
+        assert list(observed[0]) == ['forward']
+        assert executor.pending == 0
+    finally:
+        executor.shutdown()
+
+
+def test_errors_reach_the_caller():
+    executor = DetectorExecutor("fake", FakeDetector, "model.onnx")
+    try:
+        with pytest.raises(RuntimeError, match="broken model"):
+            asyncio.run(executor.submit("fail"))
+        assert executor.pending == 0
+    finally:
+        executor.shutdown()
+
+
+def test_saturates_beyond_workers_plus_queue():
+    FakeDetector.release = threading.Event()
+    executor = DetectorExecutor("fake", FakeDetector, "model.onnx", workers=1, max_queue=2, retry_after=7)
+
+    async def scenario():
+        jobs = [asyncio.create_task(executor.submit("wait")) for _ in range(3)]
+        await asyncio.sleep(0.05)
+        assert executor.pending == 3
+        with pytest.raises(ExecutorSaturated) as raised:
+            await executor.submit("wait")
+        assert raised.value.retry_after == 7
+        FakeDetector.release.set()
+        return await asyncio.gather(*jobs)
+
+    try:
+        assert asyncio.run(scenario()) == ["done"] * 3
+        assert executor.pending == 0
+    finally:
+        FakeDetector.release.set()
+        executor.shutdown()
@@ -0,0 +1,78 @@
+import os
+
+import numpy as np
+import onnxruntime as ort
+import pytest
+
+from detection_code.export import compare_models, exported_path, match_boxes, serving_model_path
+from detection_code.runtime import session_options
+
+
+def touch(path, mtime):
+    path.write_bytes(b"")
+    os.utime(path, (mtime, mtime))
+    return str(path)
+
+
+def test_exported_path():
+    assert exported_path("models/garbage.pt") == "models/garbage.onnx"
+    assert exported_path("models/garbage.pt", "int8") == "models/garbage.int8.onnx"
+
+
+def test_serving_model_path_prefers_an_up_to_date_export(tmp_path):
+    pt = touch(tmp_path / "garbage.pt", 1000)
+    assert serving_model_path(pt) == pt
+    with pytest.raises(FileNotFoundError):
+        serving_model_path(pt, "onnx")
+
+    onnx_path = touch(tmp_path / "garbage.onnx", 2000)
+    assert serving_model_path(pt) == onnx_path
+    assert serving_model_path(pt, "pt") == pt
+
+    # A retrained .pt makes the export stale
+    touch(tmp_path / "garbage.pt", 3000)
+    assert serving_model_path(pt) == pt
+
+
+def test_serving_model_path_without_the_pt(tmp_path):
+    touch(tmp_path / "garbage.int8.onnx", 1000)
+    pt = str(tmp_path / "garbage.pt")
+    assert serving_model_path(pt, precision="int8") == str(tmp_path / "garbage.int8.onnx")
+    assert serving_model_path(str(tmp_path / "tree.onnx"), "onnx") == str(tmp_path / "tree.onnx")
+    with pytest.raises(ValueError):
+        serving_model_path(pt, "tflite")
+    with pytest.raises(ValueError):
+        serving_model_path(pt, precision="fp16")
+
+
+def test_session_options_from_the_environment(monkeypatch):
+    monkeypatch.setenv("ORT_INTRA_OP_THREADS", "2")
+    monkeypatch.setenv("ORT_GRAPH_OPTIMIZATION", "basic")
+    monkeypatch.setenv("ORT_ENABLE_MEM_ARENA", "0")
+    options = session_options()
+    assert options.intra_op_num_threads == 2
+    assert options.graph_optimization_level == ort.GraphOptimizationLevel.ORT_ENABLE_BASIC
+    assert not options.enable_cpu_mem_arena
+
+    monkeypatch.setenv("ORT_GRAPH_OPTIMIZATION", "maximum")
+    with pytest.raises(ValueError):
+        session_options()
+
+
+def test_match_boxes_pairs_same_class_boxes_by_iou():
+    ref = [[0, 0, 10, 10], [20, 20, 30, 30], [50, 50, 60, 60]]
+    cand = [[21, 21, 30, 30], [0, 0, 10, 9], [50, 50, 60, 60]]
+    pairs = match_boxes(ref, [0, 0, 1], cand, [0, 0, 0])
+    assert [(i, j) for i, j, _ in pairs] == [(0, 1), (1, 0)]
+    assert pairs[0][2] == pytest.approx(0.9)
+    assert match_boxes([], [], cand, [0, 0, 0]) == []
+
+
+def test_compare_models_agrees_with_itself(stub_models, bgr_image):
+    path = stub_models["fallentree"]
+    stats = compare_models(path, path, [bgr_image, np.ascontiguousarray(bgr_image[:, :400])])
+    assert stats["images"] == 2
+    assert stats["matched"] == stats["reference"] == stats["candidate"] > 0
+    assert stats["agreement"] == 1.0
+    assert stats["box_iou"] == pytest.approx(1.0)
+    assert stats["max_conf_delta"] == 0.0
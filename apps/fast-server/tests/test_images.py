@@ -0,0 +1,94 @@
+import asyncio
+import io
+
+import cv2
+import numpy as np
+import pytest
+
+import app
+from serving.images import ImageTooLarge, decode_image, image_dimensions, read_upload, scale_detections
+
+
+def encoded(width, height, ext=".jpg"):
+    y, x = np.mgrid[0:height, 0:width]
+    image = np.dstack([x % 256, y % 256, (x + y) % 256]).astype(np.uint8)
+    ok, buffer = cv2.imencode(ext, image)
+    assert ok
+    return buffer.tobytes()
+
+
+def test_full_size_decode():
+    image, scale = decode_image(encoded(640, 480))
+    assert image.shape == (480, 640, 3)
+    assert scale == (1.0, 1.0)
+    assert image_dimensions(encoded(640, 480)) == (640, 480)
+
+
+@pytest.mark.parametrize("max_pixels,shape", [
+    (1280 * 960, (960, 1280, 3)),  # fits at 1/2 straight from the decoder
+    (640 * 480, (480, 640, 3)),  # 1/4
+    (320 * 240, (240, 320, 3)),  # 1/8
+    (2000, (38, 51, 3)),  # even 1/8 is too big: resized further
+])
+def test_large_images_decode_at_reduced_resolution(max_pixels, shape):
+    image, scale = decode_image(encoded(2560, 1920), max_pixels)
+    assert image.shape == shape
+    assert image.shape[0] * image.shape[1] <= max_pixels
+    assert scale == (2560 / shape[1], 1920 / shape[0])
+
+
+def test_png_is_scaled_too():
+    image, scale = decode_image(encoded(1600, 1200, ".png"), 400 * 300)
+    assert image.shape == (300, 400, 3)
+    assert scale == (4.0, 4.0)
+
+
+def test_source_pixel_limit():
+    with pytest.raises(ImageTooLarge):
+        decode_image(encoded(1000, 1000), max_source_pixels=999_999)
+    assert decode_image(encoded(1000, 1000), max_source_pixels=1_000_000)[0] is not None
+
+
+def test_undecodable_bytes():
+    assert decode_image(b"not an image", 1000) == (None, (1.0, 1.0))
+    assert image_dimensions(b"not an image") is None
+
+
+def test_scale_detections_maps_boxes_back():
+    detections = [{"bbox": [10, 20, 30, 40]}, {"bbox": [1.5, 2.0, 3.0, 4.0]}, {"class": "no box"}]
+    assert scale_detections(detections, (2.0, 4.0)) == [
+        {"bbox": [20, 80, 60, 160]}, {"bbox": [3.0, 8.0, 6.0, 16.0]}, {"class": "no box"},
+    ]
+
+
+def test_read_upload_stops_at_the_limit():
+    class Upload:
+        def __init__(self, data):
+            self.stream = io.BytesIO(data)
+
+        async def read(self, size=-1):
+            return self.stream.read(size)
+
+    assert asyncio.run(read_upload(Upload(b"x" * 10), 10)) == b"x" * 10
+    assert asyncio.run(read_upload(Upload(b"x" * 11), 10)) is None
+    assert asyncio.run(read_upload(Upload(b"x" * 11))) == b"x" * 11
+
+
+def test_endpoint_reports_boxes_in_original_pixels(client, monkeypatch):
+    contents = encoded(2560, 1920)
+    upload = {"file": ("big.jpg", contents, "image/jpeg")}
+    full = client.post("/garbage", data={"annotate": "false"}, files=upload).json()
+    monkeypatch.setattr(app, "IMAGE_DECODE_MAX_PIXELS", 640 * 480)
+    reduced = client.post("/garbage", data={"annotate": "false"}, files=upload).json()
+    assert len(reduced["detections"]) == len(full["detections"])
+    for small, large in zip(reduced["detections"], full["detections"]):
+        # The decoded image is 1/2 size, so boxes agree to within a couple of original pixels
+        assert np.allclose(small["bbox"], large["bbox"], atol=4)
+
+
+def test_endpoint_rejects_oversized_uploads(client, monkeypatch):
+    contents = encoded(1000, 1000)
+    monkeypatch.setattr(app, "IMAGE_MAX_PIXELS", 999_999)
+    assert client.post("/garbage", files={"file": ("big.jpg", contents, "image/jpeg")}).status_code == 413
+    monkeypatch.setattr(app, "IMAGE_MAX_BYTES", len(contents) - 1)
+    assert client.post("/garbage", files={"file": ("big.jpg", contents, "image/jpeg")}).status_code == 413
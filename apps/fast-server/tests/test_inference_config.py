@@ -0,0 +1,153 @@
+import json
+import os
+
+import pytest
+
+import app
+from benchmarks.stub_models import make_stub_model
+from serving.inference_config import BUILTIN_DEFAULTS, InferenceConfig, validate_options, validate_variants
+
+
+@pytest.mark.parametrize("options", [
+    {"conf": 0}, {"conf": 1.5}, {"iou": -0.1}, {"max_det": 0}, {"max_det": 1001},
+    {"imgsz": 16}, {"imgsz": 650}, {"imgsz": 8192}, {"variant": ""}, {"variant": 3}, {"tiled": True},
+])
+def test_invalid_options(options):
+    with pytest.raises(ValueError):
+        validate_options(options)
+
+
+def test_valid_options():
+    options = {"conf": 1, "iou": 0.5, "max_det": 1000, "imgsz": 1280, "variant": "nano"}
+    assert validate_options(options) is options
+    assert validate_variants({"nano": "models/n.onnx"}) == {"nano": "models/n.onnx"}
+    for variants in ([], {"full": "a.onnx"}, {"nano": ""}, {"nano": None}, {"": "a.onnx"}):
+        with pytest.raises(ValueError):
+            validate_variants(variants)
+
+
+def write_config(path, config):
+    """Writes the file and moves its mtime on, so the change is seen even within the clock's resolution."""
+    previous = os.path.getmtime(path) if os.path.exists(path) else 0
+    with open(path, "w", encoding="utf-8") as f:
+        if isinstance(config, str):
+            f.write(config)
+        else:
+            json.dump(config, f)
+    os.utime(path, (previous + 10, previous + 10))
+
+
+def test_defaults_layering(tmp_path):
+    path = str(tmp_path / "inference.json")
+    write_config(path, {
+        "defaults": {"conf": 0.3},
+        "detectors": {"garbage": {"conf": 0.4, "max_det": 50, "variants": {"nano": "models/n.onnx"}}},
+    })
+    config = InferenceConfig(path, check_interval=0)
+    assert config.defaults("pothole") == {**BUILTIN_DEFAULTS, "conf": 0.3}
+    assert config.defaults("garbage") == {**BUILTIN_DEFAULTS, "conf": 0.4, "max_det": 50}
+    assert config.resolve("garbage", conf=0.6, iou=None) == {**BUILTIN_DEFAULTS, "conf": 0.6, "max_det": 50}
+    assert config.variant_path("garbage", "nano") == "models/n.onnx"
+    assert config.variant_path("pothole", "nano") is None
+    with pytest.raises(ValueError):
+        config.resolve("garbage", imgsz=100)
+    assert InferenceConfig().defaults("garbage") == BUILTIN_DEFAULTS
+
+
+def test_reload_and_bad_files_keep_the_last_settings(tmp_path):
+    path = str(tmp_path / "inference.json")
+    write_config(path, {"defaults": {"conf": 0.3}})
+    config = InferenceConfig(path, check_interval=0)
+    loaded_at = config.loaded_at
+    assert config.defaults("garbage")["conf"] == 0.3
+
+    write_config(path, {"detectors": {"garbage": {"conf": 0.5}}})
+    assert config.defaults("garbage")["conf"] == 0.5
+    assert config.defaults("pothole")["conf"] == 0.25
+    assert config.loaded_at >= loaded_at
+
+    for bad in ("{not json", {"defaults": {"conf": 7}}, {"detectors": {"garbage": 0.5}},
+                {"detectors": {"garbage": {"variants": {"full": "x.onnx"}}}}, []):
+        write_config(path, bad)
+        assert config.defaults("garbage")["conf"] == 0.5
+    os.remove(path)
+    assert config.defaults("garbage")["conf"] == 0.5
+    assert config.snapshot()["detectors"] == {"garbage": {"conf": 0.5}}
+
+
+def test_changes_wait_for_the_check_interval(tmp_path):
+    path = str(tmp_path / "inference.json")
+    write_config(path, {"defaults": {"conf": 0.3}})
+    config = InferenceConfig(path, check_interval=3600)
+    assert config.defaults("garbage")["conf"] == 0.3
+    write_config(path, {"defaults": {"conf": 0.9}})
+    assert config.defaults("garbage")["conf"] == 0.3
+
+
+@pytest.fixture
+def served_config(tmp_path, stub_models, monkeypatch):
+    """A reloading inference config for the app, with a fresh set of loaded variants."""
+    path = str(tmp_path / "inference.json")
+    write_config(path, {})
+    monkeypatch.setattr(app, "inference_config", InferenceConfig(path, check_interval=0))
+    loaded = {}
+    for name, value in (("variants", loaded), ("variant_locks", {}), ("variant_failures", {}), ("variants_checked_at", None)):
+        monkeypatch.setattr(app, name, value)
+    yield path
+    for deployment in loaded.values():
+        deployment.retire()
+
+
+def post(client, jpeg_bytes, **data):
+    return client.post("/garbage", data={"annotate": "false", **data}, files={"file": ("a.jpg", jpeg_bytes, "image/jpeg")})
+
+
+def test_endpoint_applies_config_and_request_options(client, jpeg_bytes, served_config):
+    assert len(post(client, jpeg_bytes).json()["detections"]) == 6
+    assert len(post(client, jpeg_bytes, max_det="2").json()["detections"]) == 2
+    write_config(served_config, {"detectors": {"garbage": {"max_det": 3}}})
+    assert len(post(client, jpeg_bytes).json()["detections"]) == 3
+    assert len(post(client, jpeg_bytes, max_det="4").json()["detections"]) == 4
+    assert client.get("/inference-config", params={"detector": "garbage"}).json()["effective"]["garbage"]["max_det"] == 3
+    assert client.get("/inference-config", params={"detector": "unicorn"}).status_code == 404
+
+    for data in ({"conf": "1.5"}, {"imgsz": "100"}, {"variant": "nano"}):
+        assert post(client, jpeg_bytes, **data).status_code == 400
+
+
+def test_endpoint_loads_configured_variants(client, jpeg_bytes, served_config, tmp_path):
+    nano = make_stub_model(str(tmp_path / "nano.onnx"), 2)
+    broken = tmp_path / "broken.onnx"
+    broken.write_bytes(b"not a model")
+    write_config(served_config, {"detectors": {"garbage": {"variants": {"nano": nano, "broken": str(broken)}}}})
+
+    response = post(client, jpeg_bytes, variant="nano")
+    assert response.status_code == 200 and len(response.json()["detections"]) == 2
+    assert ("garbage", "nano") in app.variants
+
+    for _ in range(2):
+        # The failed load is remembered for VARIANT_RETRY_SECONDS rather than retried per request
+        response = post(client, jpeg_bytes, variant="broken")
+        assert response.status_code == 503 and "Retry-After" in response.headers
+    assert ("garbage", "broken") in app.variant_failures
+
+    # Dropping the variant from the config unloads it
+    write_config(served_config, {})
+    assert post(client, jpeg_bytes, variant="nano").status_code == 400
+    assert ("garbage", "nano") not in app.variants
+
+
+def test_only_option_errors_are_client_errors(client, jpeg_bytes, served_config, monkeypatch):
+    # The stand-in models are fixed-size 640 exports
+    response = post(client, jpeg_bytes, imgsz="320")
+    assert response.status_code == 400 and "only accepts imgsz=640" in response.json()["error"]
+
+    def broken_decode(contents):
+        raise ValueError("corrupt buffer")
+
+    monkeypatch.setattr(app, "decode_upload", broken_decode)
+    errors = app.metrics.ERRORS._values.get(("garbage",), 0)
+    response = post(client, jpeg_bytes)
+    # A ValueError from the server's own code is a server error, not a bad option
+    assert response.status_code == 500 and response.json()["error"] == "corrupt buffer"
+    assert app.metrics.ERRORS._values[("garbage",)] == errors + 1
@@ -0,0 +1,324 @@
+import asyncio
+import json
+import os
+import time
+
+import pytest
+
+from serving.jobs import (
+    DONE, FAILED, QUEUED, RUNNING, JobQueue, MemoryJobStore, SQLiteJobStore, callback_url_error, new_job, post_callback, public_view,
+)
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    store = MemoryJobStore() if request.param == "memory" else SQLiteJobStore(str(tmp_path / "db" / "jobs.sqlite3"))
+    yield store
+    store.close()
+
+
+def test_store_round_trip(store):
+    job = new_job("batch", ["garbage", "pothole"], {"tiled": True}, [["a.jpg", "/tmp/a.jpg", "file"]], 2)
+    store.create(job)
+    assert store.get(job["id"]) == job
+    store.update(job["id"], result={"ok": [1, 2]}, status_code=200)
+    assert store.get(job["id"])["result"] == {"ok": [1, 2]}
+    assert [j["id"] for j in store.queued()] == [job["id"]]
+    assert store.get("missing") is None
+
+
+def test_claim_renew_release(store):
+    job = new_job("image", ["garbage"], {}, [], 3)
+    store.create(job)
+    assert store.claim(job["id"], "a", 100.0)
+    assert not store.claim(job["id"], "b", 100.0)
+    assert store.get(job["id"])["status"] == RUNNING and store.queued() == []
+
+    assert store.renew(job["id"], "a", 200.0)
+    assert not store.renew(job["id"], "b", 300.0)
+    assert store.get(job["id"])["lease_until"] == 200.0
+
+    store.release(job["id"], "b")  # not theirs
+    assert store.get(job["id"])["owner"] == "a"
+    store.release(job["id"], "a")
+    released = store.get(job["id"])
+    assert (released["status"], released["owner"], released["lease_until"], released["started_at"]) == (QUEUED, None, None, None)
+    assert store.claim(job["id"], "b", 100.0)
+
+
+def test_requeue_expired(store):
+    jobs = [new_job("image", ["garbage"], {}, [], 3) for _ in range(3)]
+    for job in jobs:
+        store.create(job)
+    store.claim(jobs[0]["id"], "a", 50.0)
+    store.claim(jobs[1]["id"], "a", 150.0)
+    assert store.requeue_expired(100.0) == 1
+    assert store.get(jobs[0]["id"])["status"] == QUEUED
+    assert store.get(jobs[1]["id"])["status"] == RUNNING
+    assert not store.renew(jobs[0]["id"], "a", 200.0)
+
+
+def test_finish_needs_the_current_owner(store):
+    job = new_job("image", ["garbage"], {}, [], 3)
+    store.create(job)
+    store.claim(job["id"], "a", 50.0)
+    store.requeue_expired(100.0)
+    store.claim(job["id"], "b", 200.0)
+    # Worker a lost the lease: its late result must not overwrite b's run
+    assert not store.finish(job["id"], "a", status=DONE, result={"by": "a"})
+    assert store.get(job["id"])["status"] == RUNNING
+    assert store.finish(job["id"], "b", status=DONE, result={"by": "b"}, lease_until=None)
+    assert store.get(job["id"])["result"] == {"by": "b"}
+    assert not store.finish(job["id"], "b", status=FAILED)
+
+
+def test_finished_before_and_delete(store):
+    old, new = new_job("image", ["garbage"], {}, [], 3), new_job("image", ["garbage"], {}, [], 3)
+    for job in (old, new):
+        store.create(job)
+    store.update(old["id"], finished_at=10.0)
+    store.update(new["id"], finished_at=30.0)
+    assert store.finished_before(20.0) == [old["id"]]
+    store.delete(old["id"])
+    assert store.get(old["id"]) is None
+
+
+def test_sqlite_store_survives_reopening(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    store = SQLiteJobStore(path)
+    job = new_job("video", ["pothole"], {"interval": 0.5}, [], 1)
+    store.create(job)
+    store.claim(job["id"], "worker", 0.0)
+    store.close()
+    reopened = SQLiteJobStore(path)
+    assert reopened.get(job["id"])["options"] == {"interval": 0.5}
+    assert reopened.requeue_expired(time.time()) == 1
+    reopened.close()
+
+
+async def wait_for(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+def test_jobs_run_once_across_workers_sharing_a_store(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    runs = []
+
+    async def runner(job):
+        runs.append(job["id"])
+        await asyncio.sleep(0.005)
+        return 200, {"id": job["id"]}
+
+    async def main():
+        queues = [
+            JobQueue(lambda: SQLiteJobStore(path), runner, str(tmp_path / "inputs"), default_limit=2, poll_interval=0.02)
+            for _ in range(4)
+        ]
+        for queue in queues:
+            await queue.start()
+        jobs = [new_job("image", ["garbage"], {}, [], i % 3) for i in range(40)]
+        # Submitted through different workers; every worker's poll sees every job
+        for i, job in enumerate(jobs):
+            await queues[i % len(queues)].submit(job)
+        store = queues[0].store
+        await wait_for(lambda: all(store.get(job["id"])["status"] == DONE for job in jobs))
+        results = [store.get(job["id"])["result"] for job in jobs]
+        for queue in queues:
+            queue.shutdown()
+        return jobs, results
+
+    jobs, results = asyncio.run(main())
+    assert sorted(runs) == sorted(job["id"] for job in jobs)
+    assert results == [{"id": job["id"]} for job in jobs]
+
+
+def test_priority_limits_and_failures(tmp_path):
+    order, running, peak = [], {"n": 0}, {"n": 0}
+
+    async def runner(job):
+        running["n"] += 1
+        peak["n"] = max(peak["n"], running["n"])
+        order.append(job["priority"])
+        await asyncio.sleep(0.01)
+        running["n"] -= 1
+        if job["options"].get("fail"):
+            raise RuntimeError("model exploded")
+        return 404 if job["options"].get("missing") else 200, {}
+
+    async def main():
+        store = MemoryJobStore()
+        jobs = [new_job("image", ["garbage"], {}, [], p) for p in (3, 1, 2, 0)]
+        jobs.append(new_job("image", ["garbage"], {"fail": True}, [], 5))
+        jobs.append(new_job("image", ["garbage"], {"missing": True}, [], 5))
+        for job in jobs:
+            store.create(job)
+            os.makedirs(os.path.join(tmp_path, job["id"]))
+        queue = JobQueue(lambda: store, runner, str(tmp_path), limits={"garbage": 1})
+        await queue.start()
+        assert queue.queued == len(jobs) and queue.position(jobs[3]["id"]) == 0
+        await wait_for(lambda: all(store.get(job["id"])["finished_at"] for job in jobs))
+        queue.shutdown()
+        return [store.get(job["id"]) for job in jobs]
+
+    finished = asyncio.run(main())
+    assert order == [0, 1, 2, 3, 5, 5]
+    assert peak["n"] == 1
+    assert [job["status"] for job in finished] == [DONE] * 4 + [FAILED, FAILED]
+    assert finished[4]["result"] == {"error": "model exploded"} and finished[4]["status_code"] == 500
+    assert finished[5]["status_code"] == 404
+    # Spooled inputs go once the job is done
+    assert os.listdir(tmp_path) == []
+
+
+def test_interrupted_jobs_are_picked_up_again(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    dead = SQLiteJobStore(path)
+    job = new_job("image", ["garbage"], {}, [], 3)
+    dead.create(job)
+    dead.claim(job["id"], "crashed-worker", time.time() - 1)
+    dead.close()
+
+    async def runner(job):
+        return 200, {"ran": True}
+
+    async def main():
+        queue = JobQueue(lambda: SQLiteJobStore(path), runner, str(tmp_path / "inputs"))
+        await queue.start()
+        await wait_for(lambda: queue.store.get(job["id"])["status"] == DONE)
+        finished = queue.store.get(job["id"])
+        queue.shutdown()
+        return finished
+
+    finished = asyncio.run(main())
+    assert finished["result"] == {"ran": True}
+    assert finished["owner"] != "crashed-worker"
+
+
+def test_a_worker_that_loses_its_lease_abandons_the_run(tmp_path):
+    store = MemoryJobStore()
+    cancelled = []
+
+    async def runner(job):
+        try:
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            cancelled.append(job["id"])
+            raise
+        return 200, {"by": "stale worker"}
+
+    async def main():
+        queue = JobQueue(lambda: store, runner, str(tmp_path), lease=0.15)
+        await queue.start()
+        job = new_job("image", ["garbage"], {}, [], 3)
+        os.makedirs(queue.input_dir(job["id"]))
+        await queue.submit(job)
+        await wait_for(lambda: store.get(job["id"])["status"] == RUNNING)
+        # The lease expires (say the worker stalled) and another worker takes the job over
+        store.requeue_expired(time.time() + 60)
+        store.claim(job["id"], "other-worker", time.time() + 60)
+        await wait_for(lambda: cancelled)
+        await asyncio.sleep(0.05)
+        running = queue._running.get("garbage")
+        queue.shutdown()
+        return job, running
+
+    job, running = asyncio.run(main())
+    stored = store.get(job["id"])
+    assert (stored["status"], stored["owner"], stored["result"]) == (RUNNING, "other-worker", None)
+    assert running == 0
+    # The new owner still needs the spooled inputs
+    assert os.path.isdir(os.path.join(tmp_path, job["id"]))
+
+
+def test_shutdown_releases_running_jobs(tmp_path):
+    store = MemoryJobStore()
+    started = []
+
+    async def runner(job):
+        started.append(job["id"])
+        await asyncio.sleep(60)
+
+    async def main():
+        queue = JobQueue(lambda: store, runner, str(tmp_path))
+        await queue.start()
+        job = new_job("image", ["garbage"], {}, [], 3)
+        await queue.submit(job)
+        await wait_for(lambda: started)
+        queue.shutdown()
+        return job
+
+    job = asyncio.run(main())
+    assert store.get(job["id"])["status"] == QUEUED
+
+
+def test_public_view_hides_inputs():
+    job = new_job("image", ["garbage"], {}, [["a.jpg", "/spool/a.jpg", "file"]], 3, "http://example.com/hook")
+    view = public_view(job, 2)
+    assert "inputs" not in view and "owner" not in view
+    assert (view["queue_position"], view["callback_url"]) == (2, "http://example.com/hook")
+
+
+@pytest.mark.parametrize("url", [
+    "http://127.0.0.1:8000/admin", "http://localhost/hook", "http://10.0.0.7/hook", "http://169.254.169.254/latest",
+    "http://[::1]/hook", "http://[::ffff:192.168.1.1]/hook", "http://0.0.0.0/hook", "https://224.0.0.1/hook",
+    "ftp://example.com/hook", "http:///hook",
+])
+def test_callbacks_to_internal_addresses_are_rejected(url):
+    assert callback_url_error(url) is not None
+
+
+def test_callback_hosts_are_resolved(monkeypatch):
+    addresses = {"hooks.example.com": ["93.184.216.34"], "sneaky.example.com": ["93.184.216.34", "10.1.2.3"]}
+
+    def getaddrinfo(host, port, *args, **kwargs):
+        return [(None, None, None, "", (address, port)) for address in addresses[host]]
+
+    monkeypatch.setattr("socket.getaddrinfo", getaddrinfo)
+    assert callback_url_error("https://hooks.example.com/done") is None
+    assert "10.1.2.3" in callback_url_error("https://sneaky.example.com/done")
+
+
+def test_callback_allowlist():
+    allowed = frozenset({"hooks.internal"})
+    assert callback_url_error("http://HOOKS.internal:9000/done", allowed) is None
+    assert callback_url_error("http://example.com/done", allowed) is not None
+    # Delivery checks the URL again, so an internal address is never contacted
+    assert post_callback("http://127.0.0.1:1/done", {}, attempts=1).startswith("refused")
+
+
+def test_job_endpoints(client, jpeg_bytes):
+    upload = {"files": ("a.jpg", jpeg_bytes, "image/jpeg")}
+    response = client.post("/jobs", data={"detectors": "garbage", "options": json.dumps({"annotate": False})}, files=upload)
+    assert response.status_code == 202
+    status_url = response.json()["status_url"]
+    assert response.headers["Location"] == status_url
+
+    deadline = time.monotonic() + 10
+    while (job := client.get(status_url).json())["status"] in (QUEUED, RUNNING):
+        assert time.monotonic() < deadline
+        time.sleep(0.02)
+    assert (job["status"], job["status_code"]) == (DONE, 200)
+    direct = client.post("/garbage", data={"annotate": "false"}, files={"file": ("a.jpg", jpeg_bytes, "image/jpeg")}).json()
+    assert job["result"]["detections"] == direct["detections"]
+    assert client.get("/jobs/missing").status_code == 404
+
+
+@pytest.mark.parametrize("data,status", [
+    ({"detectors": "garbage", "options": json.dumps({"image_format": "ref"})}, 400),
+    ({"detectors": "garbage", "options": json.dumps({"image_format": "multipart"})}, 400),
+    ({"detectors": "garbage", "options": json.dumps({"include_images": True})}, 400),
+    ({"detectors": "garbage", "options": "[1]"}, 400),
+    ({"detectors": "garbage", "options": "{"}, 400),
+    ({"detectors": "garbage,pothole"}, 400),
+    ({"detectors": "garbage", "kind": "nightly"}, 400),
+    ({"detectors": "garbage", "callback_url": "ftp://example.com"}, 400),
+    ({"detectors": "garbage", "callback_url": "http://127.0.0.1:8000/admin/models"}, 400),
+    ({"detectors": "garbage", "callback_url": "http://169.254.169.254/latest/meta-data"}, 400),
+    ({"detectors": "unicorn"}, 404),
+])
+def test_job_requests_are_validated(client, jpeg_bytes, data, status):
+    response = client.post("/jobs", data=data, files={"files": ("a.jpg", jpeg_bytes, "image/jpeg")})
+    assert response.status_code == status
@@ -0,0 +1,96 @@
+import asyncio
+import threading
+
+from serving.loader import FAILED, LOADING, PENDING, READY, ModelLoader
+
+
+class FakeLoads:
+    """load_fn that fails for names in `broken` and blocks on `gate` for names in `slow`."""
+
+    def __init__(self, broken=(), slow=()):
+        self.broken = set(broken)
+        self.slow = set(slow)
+        self.gate = threading.Event()
+        self.calls = []
+
+    def __call__(self, name):
+        self.calls.append(name)
+        if name in self.slow:
+            self.gate.wait(5)
+        if name in self.broken:
+            raise RuntimeError(f"{name} weights are corrupt")
+
+
+def test_start_loads_in_the_background():
+    loads = FakeLoads(broken={"pothole"})
+    loader = ModelLoader(["garbage", "pothole", "streetlight"], loads)
+    loader.start(["garbage", "pothole"])
+    loader.load("garbage").result(5)
+    loader.load("pothole").result(5)
+    status = loader.status()
+    assert (status["garbage"]["state"], status["pothole"]["state"], status["streetlight"]["state"]) == (READY, FAILED, PENDING)
+    assert status["pothole"]["error"] == "pothole weights are corrupt"
+    assert status["garbage"]["load_seconds"] is not None
+    loader.shutdown()
+
+
+def test_wait_loads_lazily_once():
+    loads = FakeLoads()
+    loader = ModelLoader(["garbage"], loads)
+
+    async def scenario():
+        return await asyncio.gather(*(loader.wait("garbage", 5) for _ in range(4)))
+
+    assert asyncio.run(scenario()) == [READY] * 4
+    assert loads.calls == ["garbage"]
+    loader.shutdown()
+
+
+def test_wait_times_out_while_loading():
+    loads = FakeLoads(slow={"garbage"})
+    loader = ModelLoader(["garbage"], loads)
+    try:
+        assert asyncio.run(loader.wait("garbage", 0.05)) == LOADING
+        loads.gate.set()
+        assert asyncio.run(loader.wait("garbage", 5)) == READY
+    finally:
+        loads.gate.set()
+        loader.shutdown()
+
+
+def test_failed_loads_stay_failed_until_retried():
+    loads = FakeLoads(broken={"garbage"})
+    loader = ModelLoader(["garbage"], loads)
+    assert asyncio.run(loader.wait("garbage", 5)) == FAILED
+    assert asyncio.run(loader.wait("garbage", 5)) == FAILED
+    assert loads.calls == ["garbage"]
+
+    loads.broken.clear()
+    loader.retry("garbage")
+    assert loader.state("garbage") == PENDING
+    assert asyncio.run(loader.wait("garbage", 5)) == READY
+    assert loads.calls == ["garbage", "garbage"]
+    loader.shutdown()
+
+
+def test_preload_runs_on_the_calling_thread():
+    threads = []
+    loader = ModelLoader(["garbage"], lambda name: threads.append(threading.current_thread()))
+    loader.preload(["garbage"])
+    assert threads == [threading.current_thread()]
+    assert loader.state("garbage") == READY
+    loader.shutdown()
+
+
+def test_health_and_readiness_endpoints(client, jpeg_bytes):
+    assert client.get("/healthz").json() == {"status": "ok"}
+    # Every detector is lazy in the tests, so the server is ready before any is loaded
+    response = client.get("/readyz")
+    assert response.status_code == 200
+    assert set(response.json()["detectors"]) >= {"garbage", "pothole"}
+    assert client.get("/readyz", params={"detector": "nosuch"}).status_code == 404
+
+    client.post("/garbage", files={"file": ("street.jpg", jpeg_bytes, "image/jpeg")})
+    response = client.get("/readyz", params={"detector": "garbage"})
+    assert response.status_code == 200
+    assert response.json()["detectors"]["garbage"]["state"] == "ready"
@@ -0,0 +1,101 @@
+import pytest
+
+import app
+from detection_code.instrumentation import collect_stages, stage
+from serving.metrics import Registry
+
+
+def test_counter_and_gauge_render_per_label_set():
+    registry = Registry()
+    requests = registry.counter("requests_total", "Requests.", ("detector", "status"))
+    in_flight = registry.gauge("in_flight", "In flight.", ("detector",))
+    requests.inc(detector="garbage", status=200)
+    requests.inc(2, detector="garbage", status=200)
+    requests.inc(detector="pothole", status=503)
+    in_flight.inc(detector="garbage")
+    in_flight.inc(detector="garbage")
+    in_flight.dec(detector="garbage")
+
+    lines = registry.render().splitlines()
+    assert lines[:2] == ["# HELP requests_total Requests.", "# TYPE requests_total counter"]
+    assert 'requests_total{detector="garbage",status="200"} 3' in lines
+    assert 'requests_total{detector="pothole",status="503"} 1' in lines
+    assert 'in_flight{detector="garbage"} 1' in lines
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    latency = registry.histogram("latency_seconds", "Latency.", ("stage",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        latency.observe(value, stage="forward")
+
+    lines = registry.render().splitlines()
+    assert 'latency_seconds_bucket{stage="forward",le="0.1"} 2' in lines
+    assert 'latency_seconds_bucket{stage="forward",le="1.0"} 3' in lines
+    assert 'latency_seconds_bucket{stage="forward",le="+Inf"} 4' in lines
+    assert 'latency_seconds_sum{stage="forward"} 3.65' in lines
+    assert 'latency_seconds_count{stage="forward"} 4' in lines
+
+
+def test_labels_are_checked_and_escaped():
+    registry = Registry()
+    errors = registry.counter("errors_total", "Errors.", ("detector",))
+    with pytest.raises(ValueError):
+        errors.inc(model="garbage")
+    errors.inc(detector='say "hi"\n')
+    assert 'errors_total{detector="say \\"hi\\"\\n"} 1' in registry.render()
+
+
+def test_stages_are_only_timed_while_collecting():
+    with stage('forward'):
+        pass
+    with collect_stages() as timings:
+        with stage('forward'):
+            pass
+        with stage('forward'):
+            pass
+        with stage('annotate'):
+            pass
+    assert set(timings) == {'forward', 'annotate'}
+    assert all(seconds >= 0 for seconds in timings.values())
+
+
+def test_metrics_endpoint_reports_requests(client, jpeg_bytes):
+    assert client.post("/garbage", files={"file": ("street.jpg", jpeg_bytes, "image/jpeg")}).status_code == 200
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'detector_requests_total{detector="garbage",status="200"}' in response.text
+    assert 'inference_stage_seconds_count{detector="garbage",stage="forward"}' in response.text
+
+
+def counts(detector):
+    metrics = app.metrics
+    return {
+        "ok": metrics.REQUESTS._values.get((detector, "200"), 0),
+        "bad": metrics.REQUESTS._values.get((detector, "400"), 0),
+        "errors": metrics.ERRORS._values.get((detector,), 0),
+        "in_flight": metrics.IN_FLIGHT._values.get((detector,), 0),
+    }
+
+
+def test_batch_and_analyze_requests_are_counted(client, jpeg_bytes, monkeypatch):
+    seen = []
+    detect_batch = app.detect_batch
+
+    async def recording_detect(deployment, name, *args):
+        seen.append(counts(name)["in_flight"])
+        return await detect_batch(deployment, name, *args)
+
+    monkeypatch.setattr(app, "detect_batch", recording_detect)
+    before = counts("fallentree")
+    upload = [("files", ("a.jpg", jpeg_bytes, "image/jpeg"))]
+    assert client.post("/fallentree/batch", files=upload).status_code == 200
+    assert client.post("/fallentree/batch", data={"conf": "2"}, files=upload).status_code == 400
+    assert client.post("/analyze", data={"detectors": "fallentree"}, files={"file": ("a.jpg", jpeg_bytes, "image/jpeg")}).status_code == 200
+    after = counts("fallentree")
+
+    assert seen == [before["in_flight"] + 1]
+    assert (after["ok"], after["bad"], after["errors"], after["in_flight"]) == (
+        before["ok"] + 2, before["bad"] + 1, before["errors"] + 1, before["in_flight"],
+    )
@@ -0,0 +1,239 @@
+import asyncio
+import json
+import os
+import random
+import shutil
+import time
+
+import pytest
+
+import app
+from serving.model_registry import DEFAULT_VERSION, Deployment, ModelRegistry, compare_outputs
+
+
+class FakeExecutor:
+    workers = 2
+
+    def __init__(self):
+        self.warmed = 0
+        self.closed = False
+
+    async def submit(self, method, *args, **kwargs):
+        self.warmed += 1
+
+    def shutdown(self):
+        self.closed = True
+
+
+class FakeBatcher:
+    def shutdown(self):
+        pass
+
+
+class Builds:
+    """build() for ModelRegistry: fake deployments, failing for model files containing 'broken'."""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, name, version, source):
+        self.calls.append(version)
+        with open(source, encoding="utf-8") as f:
+            if "broken" in f.read():
+                raise RuntimeError("not a model")
+        return Deployment(name, version, source, source, FakeExecutor(), FakeBatcher(), f"{version}-fingerprint")
+
+
+def model_file(directory, name, content="weights"):
+    path = os.path.join(directory, name)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(content)
+    return path
+
+
+@pytest.fixture
+def registry(tmp_path):
+    builds = Builds()
+    registry = ModelRegistry({"garbage": model_file(tmp_path, "garbage.onnx")}, builds, str(tmp_path / "registry.json"))
+    registry.install("garbage", builds("garbage", DEFAULT_VERSION, registry.defaults["garbage"]))
+    registry.register("garbage", "v2", model_file(tmp_path, "v2.onnx"))
+    registry.register("garbage", "bad", model_file(tmp_path, "bad.onnx", "broken"))
+    builds.calls.clear()
+    return registry
+
+
+def test_activate_swaps_and_drains_the_old_version(registry):
+    old = registry.active("garbage")
+    lease = old.acquire()  # a request still running on the old version
+
+    async def main():
+        await registry.activate("garbage", "v2")
+
+    asyncio.run(main())
+    new = registry.active("garbage")
+    assert (new.version, registry.status["garbage"]["state"]) == ("v2", "active")
+    assert new.executor.warmed == FakeExecutor.workers
+    assert old.retired and not old.executor.closed
+    lease.release()
+    assert old.executor.closed
+    assert not new.retired
+
+    with open(registry.path, encoding="utf-8") as f:
+        assert json.load(f)["garbage"]["active"] == "v2"
+
+
+def test_failed_versions_keep_the_serving_one(registry, tmp_path):
+    async def main():
+        await registry.activate("garbage", "bad")
+        serving = registry.active("garbage")
+        # The same broken file is not loaded again on every sync...
+        await registry.sync("garbage")
+        await registry.sync("garbage")
+        calls = list(registry.build.calls)
+        # ...but activating it again, or replacing the file, retries once
+        await registry.activate("garbage", "bad")
+        model_file(tmp_path, "bad.onnx", "broken again")
+        await registry.sync("garbage")
+        await registry.sync("garbage")
+        return serving, calls
+
+    serving, calls = asyncio.run(main())
+    assert serving.version == DEFAULT_VERSION and not serving.retired
+    assert registry.status["garbage"]["state"] == "failed"
+    assert "not a model" in registry.status["garbage"]["error"]
+    assert calls == ["bad"]
+    assert registry.build.calls == ["bad"] * 3
+    assert registry.active("garbage") is serving
+
+
+def test_replaced_model_files_are_reloaded(registry):
+    async def main():
+        await registry.activate("garbage", "v2")
+        first = registry.active("garbage")
+        await registry.sync("garbage")
+        unchanged = registry.active("garbage")
+        time.sleep(0.01)
+        model_file(os.path.dirname(first.source), "v2.onnx", "retrained weights")
+        await registry.sync("garbage")
+        return first, unchanged
+
+    first, unchanged = asyncio.run(main())
+    assert unchanged is first
+    assert registry.active("garbage") is not first and first.retired
+
+
+def test_canary_takes_its_share_of_traffic(registry, monkeypatch):
+    async def main():
+        await registry.set_traffic("garbage", "canary", "v2", 30)
+        await registry.set_traffic("garbage", "shadow", "v2", 100)
+
+    asyncio.run(main())
+    random.seed(0)
+    roles = [registry.route("garbage")[1] for _ in range(10000)]
+    assert 0.27 < roles.count("canary") / len(roles) < 0.33
+    assert registry.shadow("garbage").version == "v2"
+    monkeypatch.setattr(random, "random", lambda: 0.0)
+    deployment, role = registry.route("garbage")
+    assert (deployment.version, role) == ("v2", "canary")
+    assert registry.describe("garbage")["traffic"] == {"canary": {"version": "v2", "percent": 30}, "shadow": {"version": "v2", "percent": 100}}
+
+    async def off():
+        await registry.set_traffic("garbage", "canary")
+        await registry.set_traffic("garbage", "shadow", "v2", 0)
+
+    asyncio.run(off())
+    assert registry.route("garbage")[1] == "primary"
+    assert registry.shadow("garbage") is None
+    assert deployment.retired and registry.describe("garbage")["candidates"] == []
+
+
+def test_registry_validation(registry, tmp_path):
+    with pytest.raises(ValueError):
+        registry.register("garbage", "default", registry.defaults["garbage"])
+    with pytest.raises(ValueError):
+        registry.register("garbage", "../v3", registry.defaults["garbage"])
+    with pytest.raises(ValueError):
+        registry.register("garbage", "v3", str(tmp_path / "missing.onnx"))
+    with pytest.raises(ValueError):
+        registry.register("garbage", "v3", model_file(tmp_path, "v3.tflite"))
+    with pytest.raises(ValueError):
+        registry.activate("garbage", "v9")
+    with pytest.raises(ValueError):
+        registry.set_traffic("garbage", "blue", "v2", 10)
+    with pytest.raises(ValueError):
+        registry.set_traffic("garbage", "canary", "v2", 150)
+
+
+def test_other_processes_see_the_same_registry(registry, tmp_path):
+    other = ModelRegistry(registry.defaults, registry.build, registry.path)
+    assert other.versions("garbage") == registry.versions("garbage")
+    assert other.active_version("garbage") == DEFAULT_VERSION
+
+    registry.entries["garbage"]["active"] = "v2"
+    registry._save()
+    assert other._read() and other.active_version("garbage") == "v2"
+    with open(registry.path, "w", encoding="utf-8") as f:
+        f.write("[not an object")
+    assert not other._read()
+    assert other.active_version("garbage") == "v2"
+
+
+def test_compare_outputs():
+    primary = ("high", [{"bbox": [0, 0, 10, 10], "class": "garbage"}, {"bbox": [50, 50, 60, 60], "class": "garbage"}])
+    candidate = ("medium", [{"bbox": [0, 0, 10, 11], "class": "garbage"}])
+    comparison = compare_outputs(primary, candidate)
+    assert comparison["priority_match"] is False
+    assert (comparison["agreement"], comparison["box_iou"]) == (0.5, pytest.approx(0.9091, abs=1e-4))
+    assert compare_outputs(("low", []), ("low", []))["agreement"] == 1.0
+
+
+ADMIN = {"Authorization": "Bearer test-token"}
+
+
+def test_admin_endpoints_need_the_token(client, monkeypatch):
+    assert client.get("/admin/models").status_code == 401
+    assert client.get("/admin/models", headers={"Authorization": "Bearer nope"}).status_code == 401
+    assert client.post("/admin/models/garbage/activate", data={"version": "default"}).status_code == 401
+    assert client.get("/admin/models", headers=ADMIN).status_code == 200
+    monkeypatch.setattr(app, "ADMIN_TOKEN", "")
+    assert client.get("/admin/models", headers=ADMIN).status_code == 403
+
+
+def wait_for_state(client, detector, state):
+    deadline = time.monotonic() + 30
+    while (described := client.get(f"/admin/models/{detector}", headers=ADMIN).json())["last_change"]["state"] != state:
+        assert time.monotonic() < deadline, described
+        time.sleep(0.05)
+    return described
+
+
+def test_version_swap_and_canary_through_the_api(client, jpeg_bytes, stub_models, tmp_path):
+    # A copy of the served stub model, so the swap leaves the detector's outputs unchanged for other tests
+    detector = "brokensignage"
+    copy = str(tmp_path / "signs-v2.onnx")
+    shutil.copyfile(stub_models[detector], copy)
+    upload = {"file": ("a.jpg", jpeg_bytes, "image/jpeg")}
+    assert client.post(f"/{detector}", data={"annotate": "false"}, files=upload).headers["X-Model-Version"] == DEFAULT_VERSION
+
+    response = client.post(f"/admin/models/{detector}/versions", headers=ADMIN, data={"version": "v2", "path": copy})
+    assert response.status_code == 201
+    assert client.post(f"/admin/models/{detector}/versions", headers=ADMIN, data={"version": "v2", "path": copy}).status_code == 409
+    assert client.post(f"/admin/models/{detector}/activate", headers=ADMIN, data={"version": "v9"}).status_code == 400
+    assert client.post("/admin/models/unicorn/activate", headers=ADMIN, data={"version": "v2"}).status_code == 404
+
+    assert client.post(f"/admin/models/{detector}/activate", headers=ADMIN, data={"version": "v2"}).status_code == 202
+    described = wait_for_state(client, detector, "active")
+    assert described["serving"]["version"] == "v2"
+    assert client.post(f"/{detector}", data={"annotate": "false"}, files=upload).headers["X-Model-Version"] == "v2"
+
+    response = client.post(f"/admin/models/{detector}/traffic", headers=ADMIN, data={"role": "canary", "version": DEFAULT_VERSION, "percent": "100"})
+    assert response.status_code == 202
+    deadline = time.monotonic() + 30
+    while not client.get(f"/admin/models/{detector}", headers=ADMIN).json()["candidates"]:
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+    assert client.post(f"/{detector}", data={"annotate": "false"}, files=upload).headers["X-Model-Version"] == DEFAULT_VERSION
+
+    client.post(f"/admin/models/{detector}/traffic", headers=ADMIN, data={"role": "canary"})
+    client.post(f"/admin/models/{detector}/activate", headers=ADMIN, data={"version": DEFAULT_VERSION})
+    assert wait_for_state(client, detector, "active")["serving"]["version"] == DEFAULT_VERSION
@@ -0,0 +1,125 @@
+import cv2
+import numpy as np
+import pytest
+
+from detection_code.ops import MASK_CHUNK, box_iou, decode_predictions, letterbox, mask_contours, nms, scale_boxes, xywh_to_xyxy
+
+
+def reference_decode(output, conf_threshold, iou_threshold, max_det):
+    """Anchor-by-anchor decode with per-class greedy NMS, the way ultralytics' loop reads."""
+    candidates = []
+    for anchor in range(output.shape[1]):
+        class_scores = output[4:, anchor]
+        best = int(np.argmax(class_scores))
+        if class_scores[best] > conf_threshold:
+            x, y, w, h = output[:4, anchor]
+            candidates.append((float(class_scores[best]), best, [x - w / 2, y - h / 2, x + w / 2, y + h / 2]))
+    candidates.sort(key=lambda candidate: -candidate[0])
+
+    kept = []
+    for score, cls, box in candidates:
+        if len(kept) == max_det:
+            break
+        same_class = [kept_box for _, kept_cls, kept_box in kept if kept_cls == cls]
+        if not same_class or box_iou(np.array(box), np.array(same_class)).max() <= iou_threshold:
+            kept.append((score, cls, box))
+    return kept
+
+
+def random_output(num_classes=3, anchors=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    output = np.empty((4 + num_classes, anchors), dtype=np.float32)
+    output[0:2] = rng.uniform(0, 640, (2, anchors))
+    output[2:4] = rng.uniform(10, 120, (2, anchors))
+    output[4:] = rng.uniform(0, 1, (num_classes, anchors)) ** 4
+    return output
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_decode_matches_the_reference(seed):
+    output = random_output(seed=seed)
+    boxes, scores, class_indices, coefficients = decode_predictions(output, 0.25, 0.5, 300)
+    expected = reference_decode(output, 0.25, 0.5, 300)
+    assert coefficients is None
+    assert len(boxes) == len(expected) > 10
+    np.testing.assert_allclose(scores, [score for score, _, _ in expected], rtol=1e-6)
+    np.testing.assert_array_equal(class_indices, [cls for _, cls, _ in expected])
+    np.testing.assert_allclose(boxes, [box for _, _, box in expected], rtol=1e-5)
+
+
+def test_decode_respects_max_det_and_returns_mask_coefficients():
+    output = random_output(num_classes=2)
+    coefficient_rows = np.arange(2 * output.shape[1], dtype=np.float32).reshape(2, -1)
+    boxes, scores, class_indices, coefficients = decode_predictions(np.vstack([output, coefficient_rows]), 0.25, 0.5, 5, num_masks=2)
+    assert len(boxes) == 5
+    assert np.all(np.diff(scores) <= 0)
+    assert coefficients.shape == (5, 2)
+    # Coefficients stay with their anchor: row 0 holds the anchor index
+    anchors = coefficients[:, 0].astype(int)
+    np.testing.assert_allclose(boxes, xywh_to_xyxy(output[:4, anchors].T))
+
+
+def test_decode_with_nothing_above_the_threshold():
+    boxes, scores, class_indices, _ = decode_predictions(random_output() * 0, 0.25)
+    assert boxes.shape == (0, 4) and len(scores) == len(class_indices) == 0
+
+
+def test_nms_keeps_the_best_of_overlapping_boxes():
+    boxes = np.array([[0, 0, 10, 10], [1, 1, 10, 10], [20, 20, 30, 30], [0, 0, 9, 10]], dtype=np.float32)
+    scores = np.array([0.6, 0.9, 0.5, 0.4])
+    assert nms(boxes, scores, 0.5).tolist() == [1, 2]
+    assert nms(boxes, scores, 0.5, max_det=1).tolist() == [1]
+
+
+def test_letterbox_pads_like_ultralytics(bgr_image):
+    padded, ratio, pad = letterbox(bgr_image, 640)
+    assert padded.shape == (640, 640, 3)
+    assert ratio == (640 / 720, 427 / 480)
+    assert pad == (0, 106)
+    assert np.all(padded[:106] == 114) and np.all(padded[106 + 427:] == 114)
+
+
+def test_scale_boxes_undoes_the_letterbox(bgr_image):
+    _, ratio, pad = letterbox(bgr_image, 640)
+    original = np.array([[10.0, 20.0, 300.0, 400.0], [0.0, 0.0, 720.0, 480.0]])
+    letterboxed = original * [ratio[0], ratio[1], ratio[0], ratio[1]] + [pad[0], pad[1], pad[0], pad[1]]
+    np.testing.assert_allclose(scale_boxes(letterboxed, ratio, pad, bgr_image.shape), original, atol=1e-6)
+    # Boxes spilling into the padding are clipped to the image
+    assert scale_boxes(np.array([[-5.0, 0.0, 700.0, 640.0]]), ratio, pad, bgr_image.shape).tolist() == [[0.0, 0.0, 720.0, 480.0]]
+
+
+def reference_mask_contours(coefficients, protos, boxes, ratio, pad, image_shape, size):
+    """mask_contours one mask at a time: upsample, threshold, crop to the box, unpad, resize."""
+    h, w = image_shape[:2]
+    new_w, new_h = int(round(w * ratio[0])), int(round(h * ratio[1]))
+    contours = []
+    for coefficient, box in zip(coefficients, boxes):
+        logits = (coefficient @ protos.reshape(len(protos), -1)).astype(np.float32).reshape(protos.shape[1:])
+        mask = cv2.resize(logits, (size, size), interpolation=cv2.INTER_LINEAR) > 0
+        rows, cols = np.arange(size)[:, None], np.arange(size)[None, :]
+        mask &= (cols >= box[0]) & (cols < box[2]) & (rows >= box[1]) & (rows < box[3])
+        mask = mask[pad[1]:pad[1] + new_h, pad[0]:pad[0] + new_w].astype(np.uint8)
+        mask = cv2.resize(mask, (w, h), interpolation=cv2.INTER_NEAREST)
+        found, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        contours.append(max(found, key=cv2.contourArea).reshape(-1, 2) if found else np.zeros((0, 2), dtype=np.int32))
+    return contours
+
+
+def test_mask_contours_match_mask_by_mask_assembly(bgr_image):
+    from benchmarks.stub_models import stub_protos
+
+    rng = np.random.default_rng(0)
+    count = MASK_CHUNK + 5
+    protos = stub_protos(32, 640)
+    coefficients = rng.normal(0, 1, (count, 32)).astype(np.float32)
+    corners = rng.uniform(0, 500, (count, 2))
+    boxes = np.hstack([corners, corners + rng.uniform(20, 140, (count, 2))]).astype(np.float32)
+    _, ratio, pad = letterbox(bgr_image, 640)
+
+    contours = mask_contours(coefficients, protos, boxes, ratio, pad, bgr_image.shape, 640)
+    expected = reference_mask_contours(coefficients, protos, boxes, ratio, pad, bgr_image.shape, 640)
+    assert len(contours) == count
+    assert sum(len(c) > 0 for c in contours) > count // 2
+    for got, want in zip(contours, expected):
+        np.testing.assert_array_equal(got, want)
+        assert got.dtype == np.int32
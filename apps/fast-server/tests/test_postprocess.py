@@ -0,0 +1,133 @@
+import numpy as np
+import pytest
+
+from detection_code.brokensignage import BrokenSignageDetector
+from detection_code.fallentree import FallenTreeDetector
+from detection_code.garbage_detection import GarbageDetector
+from detection_code.postprocess import DEFAULT_CONFIG, box_table, detection_records, overall_priority
+from detection_code.streetlight_detector import StreetlightDetector
+
+# Reference versions of the per-detector loops the declarative configs replaced
+
+
+def sized_priority(boxes, shape, thresholds, rule):
+    counts = {'high': 0, 'medium': 0, 'low': 0}
+    for box in boxes:
+        ratio = (box[2] - box[0]) * (box[3] - box[1]) / (shape[0] * shape[1])
+        counts['high' if ratio > thresholds[0] else 'medium' if ratio > thresholds[1] else 'low'] += 1
+    return rule(counts)
+
+
+def garbage_reference(shape, boxes, scores, classes):
+    detections = [{'id': i, 'class': 'garbage', 'bbox': box.tolist(), 'confidence': float(score)}
+                  for i, (box, score) in enumerate(zip(boxes, scores))]
+
+    def rule(c):
+        if c['high'] > 0 or c['medium'] >= 2:
+            return 'high'
+        return 'medium' if c['low'] > 2 or c['medium'] > 0 else 'low'
+    return sized_priority(boxes, shape, (0.17, 0.07), rule), detections
+
+
+def fallentree_reference(shape, boxes, scores, classes):
+    h, w = shape[:2]
+    detections = []
+    for i, (box, score) in enumerate(zip(boxes, scores)):
+        x1, y1, x2, y2 = map(int, box)
+        if x1 >= x2 or y1 >= y2:
+            continue
+        x1 = max(0, min(w - 1, x1))
+        y1 = max(0, min(h - 1, y1))
+        x2 = max(x1 + 1, min(w, x2))
+        y2 = max(y1 + 1, min(h, y2))
+        detections.append({'id': i, 'class': 'fallen_tree', 'bbox': [x1, y1, x2, y2], 'confidence': float(score), 'priority': 'high'})
+    return ('high' if detections else 'low'), detections
+
+
+def brokensignage_reference(shape, boxes, scores, classes):
+    detections = [{'id': i, 'class': 'broken_signage', 'bbox': list(map(int, box)), 'confidence': float(score),
+                   'priority': 'medium', 'class_index': int(cls)}
+                  for i, (box, score, cls) in enumerate(zip(boxes, scores, classes))]
+    return ('medium' if detections else 'low'), detections
+
+
+def streetlight_reference(shape, boxes, scores, classes):
+    kept = [(i, box, score) for i, (box, score) in enumerate(zip(boxes, scores)) if box[0] < box[2] and box[1] < box[3]]
+    detections = [{'id': i, 'class': 'broken_streetlight', 'bbox': box.tolist(), 'confidence': float(score)}
+                  for i, box, score in kept]
+
+    def rule(c):
+        if c['high'] > 0 or c['medium'] >= 2:
+            return 'high'
+        return 'medium' if c['medium'] > 0 or c['low'] > 3 else 'low'
+    return sized_priority([box.astype(np.float64) for _, box, _ in kept], shape, (0.20, 0.08), rule), detections
+
+
+DETECTORS = [
+    ("garbage", GarbageDetector, garbage_reference),
+    ("fallentree", FallenTreeDetector, fallentree_reference),
+    ("brokensignage", BrokenSignageDetector, brokensignage_reference),
+    ("streetlight", StreetlightDetector, streetlight_reference),
+]
+
+
+def random_boxes(rng, count, shape):
+    """Model-like float32 boxes, some spilling past the image and some degenerate or inverted."""
+    h, w = shape[:2]
+    x1 = rng.uniform(-50, w, count)
+    y1 = rng.uniform(-50, h, count)
+    boxes = np.column_stack([x1, y1, x1 + rng.uniform(-20, w * 0.6, count), y1 + rng.uniform(-20, h * 0.6, count)])
+    boxes[: count // 5, 2] = boxes[: count // 5, 0]
+    return boxes.astype(np.float32), rng.uniform(0.25, 1.0, count).astype(np.float32), np.zeros(count, dtype=np.int64)
+
+
+@pytest.mark.parametrize("name,cls,reference", DETECTORS)
+def test_declarative_postprocess_matches_the_former_loops(stub_models, name, cls, reference):
+    detector = cls(stub_models[name])
+    shape = (480, 720, 3)
+    image = np.zeros(shape, dtype=np.uint8)
+    rng = np.random.default_rng(0)
+    for count in (0, 1, 2, 3, 5, 12, 40):
+        for _ in range(10):
+            boxes, scores, classes = random_boxes(rng, count, shape)
+            _, priority, detections = detector.postprocess(image, boxes, scores, classes, annotate=False)
+            assert (priority, detections) == reference(shape, boxes, scores, classes)
+
+
+def test_annotation_draws_on_a_copy(stub_models):
+    detector = GarbageDetector(stub_models["garbage"])
+    image = np.zeros((480, 720, 3), dtype=np.uint8)
+    boxes = np.array([[10, 40, 300, 400]], dtype=np.float32)
+    annotated, priority, _ = detector.postprocess(image, boxes, np.array([0.9]), np.array([0]))
+    assert priority == 'high'
+    assert not image.any()
+    assert tuple(annotated[40, 100]) == detector.config['colors']['high']
+
+
+def test_box_table_int_clamp_and_categories():
+    config = {**DEFAULT_CONFIG, 'bbox': 'int', 'drop_invalid': True, 'clamp': True, 'area_thresholds': {'high': 0.5, 'medium': 0.1}}
+    boxes = np.array([[-5.7, -3.2, 60.9, 80.1], [30, 30, 30, 40], [90, 90, 150, 150], [10, 10, 40, 20]], dtype=np.float32)
+    table = box_table(boxes, np.array([0.9, 0.8, 0.7, 0.6]), np.array([0, 0, 1, 0]), (100, 100), config)
+    assert table['ids'].tolist() == [0, 2, 3]
+    # int() truncates towards zero, so -5.7 becomes -5 before clamping to 0
+    assert table['boxes'].tolist() == [[0, 0, 60, 80], [90, 90, 100, 100], [10, 10, 40, 20]]
+    assert table['size_categories'].tolist() == ['medium', 'low', 'low']
+    assert table['scores'].tolist() == pytest.approx([0.9, 0.7, 0.6])
+
+    config['classes'], config['class_index'] = {0: 'sign'}, True
+    records = detection_records(table, config)
+    assert [r['class'] for r in records] == ['sign', 'unknown', 'sign']
+    assert [r['class_index'] for r in records] == [0, 1, 0]
+
+
+def categories_table(*categories):
+    return {'ids': np.arange(len(categories)), 'size_categories': np.array(categories)}
+
+
+def test_priority_rules_apply_in_order():
+    config = {**DEFAULT_CONFIG, 'priority_rules': [('high', {'high': 1}), ('medium', {'low': 2}), ('medium', {'total': 5})], 'default_priority': 'low'}
+    assert overall_priority(categories_table('low', 'high'), config) == 'high'
+    assert overall_priority(categories_table('low', 'low'), config) == 'medium'
+    assert overall_priority(categories_table('medium', 'low'), config) == 'low'
+    assert overall_priority(categories_table(*['medium'] * 5), config) == 'medium'
+    assert overall_priority(categories_table(), config) == 'low'
@@ -0,0 +1,79 @@
+import cv2
+import numpy as np
+import pytest
+
+from detection_code.pothole_detector import PotholeDetector, estimate_pothole_depth, get_individual_pothole_priority
+
+
+def full_frame_depth(image, contour):
+    """Depth score from a mask over the whole frame, as it was computed before the bounding-box crop."""
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    mask = np.zeros(gray.shape, dtype=np.uint8)
+    cv2.drawContours(mask, [contour], 0, 255, -1)
+    pixels = gray[mask == 255]
+    if pixels.size == 0:
+        return 0.0
+    darkness = 1 - (np.mean(pixels) / 255.0)
+    contrast = min(np.std(pixels) / 50.0, 1.0) if pixels.size > 1 else 0.0
+    return max(0.0, min(1.0, 0.7 * darkness + 0.3 * contrast))
+
+
+CONTOURS = [
+    np.array([[10, 10], [200, 30], [150, 220], [20, 180]], dtype=np.int32),
+    np.array([[600, 400], [760, 420], [700, 520]], dtype=np.int32),  # spills past the right and bottom edges
+    np.array([[-20, -20], [40, -10], [30, 50]], dtype=np.int32),  # spills past the top-left corner
+    np.array([[300, 300]], dtype=np.int32),
+    np.array([[900, 900], [950, 900], [950, 950]], dtype=np.int32),  # entirely outside
+]
+
+
+@pytest.mark.parametrize("contour", CONTOURS)
+def test_depth_matches_the_full_frame_mask(bgr_image, contour):
+    gray = cv2.cvtColor(bgr_image, cv2.COLOR_BGR2GRAY)
+    expected = full_frame_depth(bgr_image, contour)
+    assert estimate_pothole_depth(bgr_image, contour) == pytest.approx(expected, abs=1e-12)
+    assert estimate_pothole_depth(bgr_image, contour, gray) == pytest.approx(expected, abs=1e-12)
+
+
+def test_individual_priority():
+    assert get_individual_pothole_priority(0.02, 0.7)[0] == 'High'
+    assert get_individual_pothole_priority(0.006, 0.5)[0] == 'Medium'
+    assert get_individual_pothole_priority(0.001, 0.1)[0] == 'Low'
+
+
+def test_detector_uses_mask_contours(stub_models, bgr_image):
+    detector = PotholeDetector(stub_models["pothole"])
+    annotated, priority, detections = detector.predict_array(bgr_image)
+    assert annotated.shape == bgr_image.shape
+    assert priority in ('High', 'Medium', 'Low')
+    assert detections and all(d['class'] == 'pothole' for d in detections)
+    assert all(0.0 <= d['depth_score'] <= 1.0 for d in detections)
+    assert any(d['area_ratio'] > 0 for d in detections)
+
+
+def test_missing_contours_fall_back_to_the_box(stub_models, bgr_image):
+    detector = PotholeDetector(stub_models["pothole"])
+    boxes = np.array([[100, 100, 200, 160], [300, 200, 340, 260]], dtype=np.float32)
+    contours = [np.zeros((0, 2), dtype=np.int32), np.array([[310, 210]], dtype=np.int32)]
+    _, _, detections = detector.postprocess(bgr_image, boxes, np.array([0.9, 0.8]), np.zeros(2), contours)
+    _, _, boxed = detector.postprocess(bgr_image, boxes, np.array([0.9, 0.8]), np.zeros(2), None)
+    assert [d['area_ratio'] for d in detections] == [d['area_ratio'] for d in boxed]
+    assert detections[0]['area_ratio'] == pytest.approx(100 * 60 / (480 * 720))
+
+
+def test_tiled_potholes_have_an_area(stub_models, monkeypatch):
+    monkeypatch.setenv("TILE_MIN_SIDE", "960")
+    detector = PotholeDetector(stub_models["pothole"])
+    image = np.random.default_rng(1).integers(0, 256, (1200, 2000, 3), dtype=np.uint8)
+    predict_raw = detector.predict_raw
+
+    def tiles_without_masks(crops, *args, **kwargs):
+        # Only the full view keeps its masks: the merge gives tile boxes empty contours
+        outputs = predict_raw(crops, *args, **kwargs)
+        return [(b, s, c, contours if crop.shape == image.shape else None) for crop, (b, s, c, contours) in zip(crops, outputs)]
+
+    monkeypatch.setattr(detector, "predict_raw", tiles_without_masks)
+    annotated, _, detections = detector.predict_array(image, tiled=True)
+    assert annotated.shape == image.shape
+    assert len(detections) > 6
+    assert all(d['area_ratio'] > 0 for d in detections)
@@ -0,0 +1,120 @@
+import threading
+
+import numpy as np
+import onnxruntime as ort
+import pytest
+
+from benchmarks.stub_models import make_stub_model
+from detection_code.garbage_detection import GarbageDetector
+from detection_code.ops import letterbox
+from detection_code.preprocess import InputBuffers, fill_batch, letterbox_into
+from detection_code.runtime import SessionBinding
+
+
+def reference_tensor(image, size):
+    """The letterboxed RGB float32 CHW tensor, built with copies the way preprocessing used to."""
+    padded, ratio, pad = letterbox(image, size)
+    return (padded[:, :, ::-1].transpose(2, 0, 1).astype(np.float32) / 255.0), ratio, pad
+
+
+@pytest.mark.parametrize("shape", [(480, 720), (720, 480), (640, 640), (100, 37), (1080, 1920), (641, 639)])
+def test_letterbox_into_matches_letterbox(shape):
+    image = np.random.default_rng(0).integers(0, 256, (*shape, 3), dtype=np.uint8)
+    padded, ratio, pad = letterbox(image, 640)
+    canvas = np.full((640, 640, 3), 7, dtype=np.uint8)  # stale pixels from an earlier image
+    assert letterbox_into(image, canvas) == (ratio, pad)
+    np.testing.assert_array_equal(canvas, padded)
+
+
+def test_fill_batch_matches_the_copying_pipeline(bgr_image):
+    images = [bgr_image, np.ascontiguousarray(bgr_image[:300, :200]), np.ascontiguousarray(bgr_image[::-1])]
+    tensor = np.empty((3, 3, 320, 320), dtype=np.float32)
+    meta = fill_batch(images, tensor, np.empty((320, 320, 3), dtype=np.uint8))
+    for image, channels, (ratio, pad) in zip(images, tensor, meta):
+        expected, expected_ratio, expected_pad = reference_tensor(image, 320)
+        np.testing.assert_array_equal(channels, expected)
+        assert (ratio, pad) == (expected_ratio, expected_pad)
+
+
+def test_input_buffers_reuse_and_grow(bgr_image):
+    buffers = InputBuffers(640)
+    small = np.ascontiguousarray(bgr_image[:200, :300])
+    first, _ = buffers.preprocess([bgr_image, small])
+    second, _ = buffers.preprocess([small])
+    assert second.base is first.base  # same preallocated tensor, no new allocation
+    expected, _, _ = reference_tensor(small, 640)
+    np.testing.assert_array_equal(second[0], expected)
+
+    bigger, _ = buffers.preprocess([bgr_image] * 3)
+    assert bigger.shape == (3, 3, 640, 640) and bigger.base is not first.base
+    other_size, _ = buffers.preprocess([bgr_image], 320)
+    assert other_size.shape == (1, 3, 320, 320)
+    np.testing.assert_array_equal(buffers.preprocess([bgr_image])[0][0], reference_tensor(bgr_image, 640)[0])
+
+
+def test_input_buffers_are_per_thread(bgr_image):
+    buffers = InputBuffers(320)
+    tensors = {}
+
+    def work(name):
+        tensors[name] = buffers.preprocess([bgr_image])[0]
+
+    threads = [threading.Thread(target=work, args=(i,)) for i in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert tensors[0].base is not tensors[1].base
+
+
+def test_detector_buffers_match_static_preprocess(stub_models, bgr_image):
+    detector = GarbageDetector(stub_models["garbage"])
+    images = [bgr_image, np.ascontiguousarray(bgr_image[:, :300])]
+    shared, shared_meta = GarbageDetector.preprocess(images, 640)
+    own, own_meta = detector.buffers.preprocess(images, 640)
+    np.testing.assert_array_equal(own, shared)
+    assert own_meta == shared_meta
+
+
+@pytest.fixture(scope="module")
+def session(tmp_path_factory):
+    path = make_stub_model(str(tmp_path_factory.mktemp("binding") / "seg.onnx"), 5, num_masks=4, imgsz=320)
+    return ort.InferenceSession(path, providers=['CPUExecutionProvider'])
+
+
+def test_session_binding_matches_session_run(session):
+    binding = SessionBinding(session)
+    rng = np.random.default_rng(0)
+    for batch in (1, 3, 1):
+        tensor = rng.random((batch, 3, 320, 320), dtype=np.float32)
+        expected = session.run(None, {"images": tensor})
+        outputs = binding.run({"images": tensor})
+        assert len(outputs) == len(expected)
+        for output, reference in zip(outputs, expected):
+            np.testing.assert_array_equal(output, reference)
+
+
+def test_session_binding_reads_the_buffer_in_place(session):
+    binding = SessionBinding(session)
+    buffers = InputBuffers(320)
+    images = [np.zeros((240, 320, 3), dtype=np.uint8)]
+    tensor, _ = buffers.preprocess(images)
+    binding.run({"images": tensor})
+    # Refilling the same buffer reuses its binding and its output arrays
+    tensor, _ = buffers.preprocess([np.full((240, 320, 3), 255, dtype=np.uint8)])
+    outputs = binding.run({"images": tensor})
+    assert len(binding._local.bindings) == 1
+    for output, reference in zip(outputs, session.run(None, {"images": tensor})):
+        np.testing.assert_array_equal(output, reference)
+    assert outputs[0] is binding.run({"images": tensor})[0]
+
+
+def test_detector_with_io_binding_matches_plain_run(stub_models, bgr_image, monkeypatch):
+    plain = GarbageDetector(stub_models["garbage"])
+    monkeypatch.setenv("ORT_IO_BINDING", "1")
+    bound = GarbageDetector(stub_models["garbage"])
+    assert bound.binding is not None and plain.binding is None
+    for images in ([bgr_image], [bgr_image, bgr_image[::2, ::2]]):
+        for a, b in zip(bound.predict_onnx_batch(images), plain.predict_onnx_batch(images)):
+            for x, y in zip(a[:3], b[:3]):
+                np.testing.assert_array_equal(x, y)
@@ -0,0 +1,78 @@
+import os
+import time
+
+import app
+from serving.result_cache import ResultCache, content_key, model_version
+
+RESULT = ("High", [{"class": "Garbage", "bbox": [1, 2, 3, 4]}], b"jpeg")
+
+
+def test_content_key_covers_every_part():
+    key = content_key(b"image", "garbage", "v1", 0.25)
+    assert key == content_key(b"image", "garbage", "v1", 0.25)
+    assert key != content_key(b"image", "garbage", "v2", 0.25)
+    assert key != content_key(b"image", "garbage", "v1", 0.5)
+    assert key != content_key(b"other", "garbage", "v1", 0.25)
+
+
+def test_model_version_changes_when_the_file_is_replaced(tmp_path):
+    path = tmp_path / "model.onnx"
+    path.write_bytes(b"one")
+    before = model_version(str(path))
+    path.write_bytes(b"two!")
+    assert model_version(str(path)) != before
+
+
+def test_lru_eviction_and_counters():
+    cache = ResultCache(max_items=2)
+    cache.put("a", RESULT)
+    cache.put("b", RESULT)
+    assert cache.get("a") == RESULT  # "b" is now the least recently used
+    cache.put("c", RESULT)
+    assert cache.get("b") is None
+    assert len(cache) == 2
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_entries_expire(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("serving.result_cache.time.monotonic", lambda: now[0])
+    cache = ResultCache(ttl=10)
+    cache.put("a", RESULT)
+    now[0] += 11
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_oversized_values_are_not_kept():
+    cache = ResultCache(max_bytes=100)
+    cache.put("a", ("Low", [], b"x" * 200))
+    assert cache.get("a") is None
+
+
+def test_disk_tier_survives_a_new_cache(tmp_path):
+    ResultCache(directory=str(tmp_path)).put("ab12", RESULT)
+    cache = ResultCache(directory=str(tmp_path))
+    assert cache.get("ab12") == RESULT
+    assert cache.disk_hits == 1
+    assert ResultCache(directory=str(tmp_path), ttl=0).get("missing") is None
+
+
+def test_expired_disk_entries_are_removed(tmp_path):
+    ResultCache(directory=str(tmp_path)).put("ab12", RESULT)
+    path = tmp_path / "ab" / "ab12.json"
+    old = time.time() - 60
+    os.utime(path, (old, old))
+    assert ResultCache(directory=str(tmp_path), ttl=30).get("ab12") is None
+    assert not path.exists()
+
+
+def test_repeated_upload_is_served_from_the_cache(client, jpeg_bytes, monkeypatch):
+    monkeypatch.setattr(app, "result_cache", ResultCache())
+    upload = {"file": ("street.jpg", jpeg_bytes, "image/jpeg")}
+    first = client.post("/garbage", files=upload)
+    second = client.post("/garbage", files=upload)
+    assert (first.headers["X-Result-Cache"], second.headers["X-Result-Cache"]) == ("miss", "hit")
+    assert first.json() == second.json()
+    other_threshold = client.post("/garbage", data={"conf": "0.5"}, files=upload)
+    assert other_threshold.headers["X-Result-Cache"] == "miss"
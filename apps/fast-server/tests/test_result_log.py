@@ -0,0 +1,55 @@
+import json
+import os
+
+from serving.result_log import ResultLogger, summarize_detections
+
+
+def read_lines(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_records_are_written_as_json_lines(tmp_path):
+    path = str(tmp_path / "logs" / "results.jsonl")
+    result_log = ResultLogger(path)
+    result_log.log({"model": "garbage", "total_detections": 2, "shape": (480, 640, 3)})
+    result_log.log({"model": "pothole", "error": "Invalid image file"})
+    result_log.close()
+
+    records = read_lines(path)
+    assert [record["model"] for record in records] == ["garbage", "pothole"]
+    assert records[0]["shape"] == [480, 640, 3]
+    assert "timestamp" in records[0]
+
+
+def test_sampling_keeps_errors(tmp_path):
+    path = str(tmp_path / "results.jsonl")
+    result_log = ResultLogger(path, sample_rate=0.0)
+    result_log.log({"model": "garbage"})
+    result_log.log({"model": "garbage", "error": "busy"})
+    result_log.close()
+    assert [record.get("error") for record in read_lines(path)] == ["busy"]
+
+
+def test_full_queue_drops_and_counts(tmp_path):
+    result_log = ResultLogger(str(tmp_path / "results.jsonl"), max_queue=1)
+    result_log._listener.stop()  # nothing drains the queue
+    result_log.log({"n": 1})
+    result_log.log({"n": 2})
+    result_log.log({"n": 3})
+    assert result_log.dropped == 2
+
+
+def test_rotates_by_size(tmp_path):
+    path = str(tmp_path / "results.jsonl")
+    result_log = ResultLogger(path, max_bytes=200, backup_count=2)
+    for i in range(20):
+        result_log.log({"n": i, "padding": "x" * 50})
+    result_log.close()
+    assert os.path.exists(path + ".1")
+    assert os.path.getsize(path) <= 200
+
+
+def test_summarize_detections_keeps_compact_fields():
+    detections = [{"class": "Garbage", "confidence": 0.87654, "bbox": [1, 2, 3, 4], "area": 4, "priority": "Low"}]
+    assert summarize_detections(detections) == [{"class": "Garbage", "confidence": 0.877, "bbox": [1, 2, 3, 4]}]
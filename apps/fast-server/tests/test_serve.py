@@ -0,0 +1,47 @@
+import socket
+from types import SimpleNamespace
+
+import serve
+
+
+def test_cpu_sets_are_disjoint_when_cpus_suffice(monkeypatch):
+    monkeypatch.setattr(serve.os, "sched_getaffinity", lambda pid: {0, 1, 2, 3, 4, 5, 6, 7})
+    assert serve.cpu_sets(4, 0) == [[0, 1], [2, 3], [4, 5], [6, 7]]
+    assert serve.cpu_sets(2, 3) == [[0, 1, 2], [3, 4, 5]]
+
+
+def test_cpu_sets_wrap_around_when_short(monkeypatch):
+    monkeypatch.setattr(serve.os, "sched_getaffinity", lambda pid: {2, 3, 5})
+    assert serve.cpu_sets(4, 0) == [[2], [3], [5], [2]]
+    assert serve.cpu_sets(2, 2) == [[2, 3], [5, 2]]
+    assert serve.cpu_sets(1, 8) == [[2, 3, 5]]
+
+
+def test_worker_log_path():
+    assert serve.worker_log_path("logs/model_outputs.jsonl", 3) == "logs/model_outputs.w3.jsonl"
+    assert serve.worker_log_path("results", 0) == "results.w0"
+
+
+def test_bind_socket_is_inheritable():
+    sock = serve.bind_socket("127.0.0.1", 0)
+    try:
+        assert sock.get_inheritable()
+        assert sock.getsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR)
+    finally:
+        sock.close()
+
+
+def test_preload_only_shares_onnx_thread_models(tmp_path):
+    sources = {"garbage": str(tmp_path / "garbage.onnx"), "tree": str(tmp_path / "tree.onnx"), "pothole": str(tmp_path / "pothole.pt")}
+    preloaded = []
+    app_module = SimpleNamespace(
+        eager_detectors=lambda: ["garbage", "tree", "pothole"],
+        active_model_source=sources.get,
+        serving_model_path=lambda path, model_format, precision: path,
+        executor_settings=lambda name, path: {"kind": "process" if name == "tree" else "thread"},
+        model_loader=SimpleNamespace(preload=preloaded.extend),
+        MODEL_FORMAT="auto",
+        MODEL_PRECISION="fp32",
+    )
+    assert serve.preload_models(app_module) == ["garbage"]
+    assert preloaded == ["garbage"]
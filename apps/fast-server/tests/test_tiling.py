@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+from detection_code.garbage_detection import GarbageDetector
+from detection_code.ops import batched_nms
+from detection_code.tiling import merge_tiles, tile_windows
+
+
+def coverage(windows, shape):
+    covered = np.zeros(shape[:2], dtype=np.int32)
+    for x0, y0, x1, y1 in windows:
+        covered[y0:y1, x0:x1] += 1
+    return covered
+
+
+@pytest.mark.parametrize("shape", [(3000, 4000), (1080, 1920), (641, 700), (500, 400)])
+def test_tiles_cover_the_image_with_overlap(shape):
+    windows = tile_windows(shape, 640, 0.2, 16)
+    assert coverage(windows, shape).min() >= 1
+    assert len(windows) <= 16
+    # Neighbouring tiles share at least the overlap fraction of a tile (tiles may have grown)
+    size = windows[0][2] - windows[0][0]
+    for starts in ({x0 for x0, _, _, _ in windows}, {y0 for _, y0, _, _ in windows}):
+        starts = sorted(starts)
+        assert all(b - a <= size * 0.8 for a, b in zip(starts, starts[1:]))
+
+
+def test_small_images_are_one_tile():
+    assert tile_windows((500, 400), 640) == [(0, 0, 400, 500)]
+
+
+def test_tiles_grow_to_respect_max_tiles():
+    windows = tile_windows((6000, 8000), 640, 0.2, 16)
+    assert len(windows) <= 16
+    assert coverage(windows, (6000, 8000)).min() >= 1
+    assert windows[0][2] - windows[0][0] > 640
+
+
+def raw(boxes, scores, classes, contours=None):
+    return np.array(boxes, dtype=np.float32), np.array(scores), np.array(classes), contours
+
+
+def test_merge_keeps_the_best_of_a_box_and_its_partial_view():
+    full_view = (raw([[100, 100, 300, 300]], [0.9], [0]), (0, 0))
+    # The right tile starts at x=200 and sees the right half of the same object
+    right_tile = (raw([[0, 100, 100, 300], [300, 0, 350, 50]], [0.6, 0.7], [0, 0]), (200, 0))
+    boxes, scores, classes, contours = merge_tiles([full_view, right_tile], merge_ios=0.6)
+    assert boxes.tolist() == [[100, 100, 300, 300], [500, 0, 550, 50]]
+    assert scores.tolist() == [0.9, 0.7]
+    assert contours is None
+
+
+def test_merge_keeps_other_classes_and_offsets_contours():
+    contour = np.array([[0, 0], [10, 0], [10, 10]], dtype=np.int32)
+    parts = [
+        (raw([[0, 0, 10, 10]], [0.9], [0], [contour]), (0, 0)),
+        (raw([[0, 0, 10, 10]], [0.8], [1], [contour]), (0, 0)),
+        (raw([[0, 0, 10, 10]], [0.5], [0], [contour]), (100, 50)),
+        (raw([], [], []), (10, 10)),
+    ]
+    boxes, scores, classes, contours = merge_tiles(parts)
+    assert classes.tolist() == [0, 1, 0]
+    assert contours[2].tolist() == [[100, 50], [110, 50], [110, 60]]
+    assert merge_tiles([(raw([], [], []), (0, 0))])[0].size == 0
+
+
+def test_class_offset_holds_for_large_coordinates():
+    # Two classes' boxes that would overlap once shifted by a fixed 7680 px offset
+    boxes = np.array([[9000, 9000, 9500, 9500], [1320, 1320, 1820, 1820]], dtype=np.float32)
+    keep = batched_nms(boxes, np.array([0.9, 0.8]), np.array([0, 1]), 0.5)
+    assert sorted(keep.tolist()) == [0, 1]
+    same_class = batched_nms(boxes[[0, 0]], np.array([0.9, 0.8]), np.array([1, 1]), 0.5)
+    assert same_class.tolist() == [0]
+
+
+def test_tiled_prediction_reports_image_pixels(stub_models, monkeypatch):
+    monkeypatch.setenv("TILE_MIN_SIDE", "960")
+    detector = GarbageDetector(stub_models["garbage"])
+    image = np.random.default_rng(1).integers(0, 256, (1200, 2000, 3), dtype=np.uint8)
+    _, _, tiled = detector.predict_array(image, annotate=False, tiled=True)
+    _, _, whole = detector.predict_array(image, annotate=False)
+    assert len(tiled) > len(whole)
+    assert all(0 <= d['bbox'][0] < d['bbox'][2] <= 2000 and 0 <= d['bbox'][1] < d['bbox'][3] <= 1200 for d in tiled)
+    # Images under TILE_MIN_SIDE go through the model whole even with tiled=True
+    small = np.ascontiguousarray(image[:600, :800])
+    assert detector.predict_array(small, annotate=False, tiled=True) == detector.predict_array(small, annotate=False)
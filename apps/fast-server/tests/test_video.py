@@ -0,0 +1,182 @@
+import os
+import time
+
+import cv2
+import numpy as np
+import pytest
+
+import app
+from detection_code.video import ObjectTracker, SampledFrame, analyze_video, sample_frames
+
+
+class FakeCapture:
+    """cv2.VideoCapture stand-in over a list of frames, counting retrieve() calls."""
+
+    def __init__(self, frames, fps=10.0):
+        self.frames = frames
+        self.fps = fps
+        self.position = -1
+        self.retrieved = 0
+
+    def get(self, prop):
+        return self.fps if prop == cv2.CAP_PROP_FPS else 0
+
+    def grab(self):
+        self.position += 1
+        return self.position < len(self.frames)
+
+    def retrieve(self):
+        self.retrieved += 1
+        return True, self.frames[self.position]
+
+
+def flat_frames(values):
+    return [np.full((36, 64, 3), value, dtype=np.uint8) for value in values]
+
+
+def test_samples_every_interval_and_only_decodes_those():
+    capture = FakeCapture(flat_frames([0] * 35))
+    frames = list(sample_frames(capture, interval_s=1.0))
+    assert [(f.index, f.time_s) for f in frames] == [(0, 0.0), (10, 1.0), (20, 2.0), (30, 3.0)]
+    assert capture.retrieved == 4
+    assert len(list(sample_frames(FakeCapture(flat_frames([0] * 35)), interval_s=1.0, max_frames=2))) == 2
+
+
+def test_scene_changes_are_sampled_between_intervals():
+    values = [0] * 6 + [200] * 20
+    frames = list(sample_frames(FakeCapture(flat_frames(values)), interval_s=1.0, scene_threshold=30, scene_check_s=0.2))
+    # The cut at frame 6 falls on a check and is sampled at once; the interval restarts from it
+    assert [f.index for f in frames] == [0, 6, 16]
+
+
+def detection(bbox, cls="pothole", confidence=0.5, priority="Low"):
+    return {"class": cls, "bbox": bbox, "confidence": confidence, "priority": priority}
+
+
+def frame(n):
+    return SampledFrame(n * 10, float(n), None)
+
+
+def test_tracker_merges_the_same_object_across_frames():
+    tracker = ObjectTracker(iou_threshold=0.3, max_gap=1)
+    tracker.update(frame(0), [detection([0, 0, 10, 10]), detection([50, 50, 60, 60], cls="crack")], "Low")
+    tracker.update(frame(1), [detection([1, 1, 11, 11], confidence=0.9, priority="High")], "High")
+    tracker.update(frame(2), [])
+    tracker.update(frame(3), [])
+    # Same place, but the first track closed after max_gap empty samples
+    tracker.update(frame(4), [detection([1, 1, 11, 11])])
+    objects = tracker.finish()
+
+    assert [(o["class"], o["frames"], o["first_seen_s"], o["last_seen_s"]) for o in objects] == [
+        ("pothole", 2, 0.0, 1.0), ("crack", 1, 0.0, 0.0), ("pothole", 1, 4.0, 4.0),
+    ]
+    assert objects[0]["max_confidence"] == 0.9
+    assert objects[0]["best_bbox"] == [1, 1, 11, 11]
+    assert objects[0]["priority"] == "High"
+    assert tracker.priority == "High"
+    assert tracker.frames == 5
+
+
+def test_tracker_keeps_classes_apart_and_drops_flicker():
+    tracker = ObjectTracker(min_frames=2)
+    tracker.update(frame(0), [detection([0, 0, 10, 10])])
+    tracker.update(frame(1), [detection([0, 0, 10, 10], cls="crack")])
+    tracker.update(frame(2), [detection([0, 0, 10, 10], cls="crack")])
+    assert [(o["class"], o["frames"]) for o in tracker.finish()] == [("crack", 2)]
+
+
+def test_analyze_video_batches_frames():
+    class CountingDetector:
+        batches = []
+
+        def predict_batch(self, images, conf_threshold, annotate=True):
+            self.batches.append(len(images))
+            return [(None, "Low", [detection([0, 0, 10, 10])]) for _ in images]
+
+    detector = CountingDetector()
+    tracker = analyze_video(FakeCapture(flat_frames([0] * 50)), detector, batch_size=2, interval_s=1.0)
+    assert detector.batches == [2, 2, 1]
+    assert [o["frames"] for o in tracker.finish()] == [5]
+
+
+@pytest.fixture
+def video_path(tmp_path):
+    path = str(tmp_path / "drive.avi")
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), 10.0, (160, 120))
+    if not writer.isOpened():
+        pytest.skip("OpenCV was built without an MJPG writer")
+    for value in range(0, 250, 10):
+        writer.write(np.full((120, 160, 3), value, dtype=np.uint8))
+    writer.release()
+    return path
+
+
+def test_video_endpoint_returns_a_timeline(client, video_path):
+    with open(video_path, "rb") as f:
+        data = f.read()
+    response = client.post("/garbage/video", params={"interval": 1.0}, content=data)
+    assert response.status_code == 200
+    body = response.json()
+    assert body["video"]["frames"] == 25
+    assert body["sampled_frames"] == 3
+    # The stand-in model predicts the same boxes on every frame: one object each, seen in every sample
+    assert body["objects"] and all(o["frames"] == 3 for o in body["objects"])
+
+    metrics = app.metrics
+    requests, errors = metrics.REQUESTS._values.get(("garbage", "200"), 0), metrics.ERRORS._values.get(("garbage",), 0)
+    assert client.post("/garbage/video", params={"interval": 1.0}, content=data).status_code == 200
+    assert client.post("/garbage/video", params={"interval": 0}, content=data).status_code == 400
+    assert metrics.REQUESTS._values[("garbage", "200")] == requests + 1
+    assert metrics.ERRORS._values[("garbage",)] == errors + 1
+    assert metrics.IN_FLIGHT._values.get(("garbage",), 0) == 0
+    assert client.post("/nosuch/video", content=data).status_code == 404
+    assert client.post("/garbage/video", content=b"not a video").status_code == 400
+
+
+def test_video_job_waits_out_an_unavailable_variant(client, video_path, monkeypatch):
+    load_variant, calls = app.load_variant, []
+
+    async def flaky_load_variant(name, variant):
+        calls.append(variant)
+        if len(calls) == 1:
+            raise app.VariantUnavailable("Model variant full of garbage failed to load: busy", 1)
+        await load_variant(name, variant)
+
+    monkeypatch.setattr(app, "load_variant", flaky_load_variant)
+    with open(video_path, "rb") as f:
+        upload = {"files": ("drive.avi", f.read(), "video/x-msvideo")}
+    response = client.post("/jobs", data={"kind": "video", "detectors": "garbage", "options": '{"interval": 1.0}'}, files=upload)
+    assert response.status_code == 202
+    status_url = response.json()["status_url"]
+
+    deadline = time.monotonic() + 30
+    while (job := client.get(status_url).json())["status"] in ("queued", "running"):
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+    # The 503 kept the spooled video, so the retry after Retry-After ran it
+    assert (job["status"], job["status_code"]) == ("done", 200), job["result"]
+    assert job["result"]["sampled_frames"] == 3
+    assert len(calls) == 2
+    assert not os.path.exists(app.job_queue.input_dir(job["id"]))
+
+
+def test_video_endpoint_removes_the_upload_on_503(client, video_path, monkeypatch):
+    calls, spooled = [], []
+    spool_video = app.spool_video
+
+    async def recording_spool(request):
+        spooled.append(await spool_video(request))
+        return spooled[-1]
+
+    async def fails_after_the_check(name, variant):
+        # check_video_request loads the variant before spooling; process_video's load then fails
+        calls.append(variant)
+        if len(calls) > 1:
+            raise app.VariantUnavailable("Model variant full of garbage failed to load: busy", 5)
+
+    monkeypatch.setattr(app, "spool_video", recording_spool)
+    monkeypatch.setattr(app, "load_variant", fails_after_the_check)
+    with open(video_path, "rb") as f:
+        response = client.post("/garbage/video", content=f.read())
+    assert response.status_code == 503 and response.headers["Retry-After"] == "5"
+    assert spooled and not os.path.exists(spooled[0])